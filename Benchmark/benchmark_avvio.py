@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    Benchmark dell'avvio del provider MAT
+    -------------------------------------
+    Misura quanto il plugin aggiunge all'avvio di QGIS: importazione del
+    pacchetto, classFactory() e registrazione del provider con i suoi
+    algoritmi (initProcessing), cioe' il lavoro che QGIS fa a ogni avvio
+    anche se MAT non viene usato.
+
+    Ogni ripetizione gira in un sottoprocesso nuovo (import "a freddo"),
+    dopo l'inizializzazione di QGIS e di Processing, cosi' il tempo misurato
+    e' solo quello del plugin. Oltre al tempo si registra quali moduli
+    pesanti (numpy, scipy, sklearn) il plugin ha importato:
+    con il caricamento differito non ne deve comparire nessuno.
+
+    Uso (dalla OSGeo4W Shell o da un ambiente con PyQGIS):
+
+      python Benchmark/benchmark_avvio.py
+      python Benchmark/benchmark_avvio.py --plugin Plugin/MensioAnalysisTools.zip \
+          --ripetizioni 10 --soglia-ms 20 --out Benchmark/risultati/avvio.json
+
+    Termina con codice 1 se la mediana supera la soglia o se il plugin ha
+    importato moduli pesanti all'avvio.
+***************************************************************************
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DEFAULT_PLUGIN = os.path.join(ROOT, 'Plugin', 'MensioAnalysisTools.zip')
+PACKAGE = 'MensioAnalysisTools'
+
+MODULI_PESANTI = ('numpy', 'scipy', 'sklearn')
+
+
+# --------------------------------------------------------------------------
+#  Worker (una misura per processo)
+# --------------------------------------------------------------------------
+def _init_qgis():
+    from qgis.core import QgsApplication
+    QgsApplication.setPrefixPath(os.environ.get('QGIS_PREFIX_PATH', '/usr'), True)
+    app = QgsApplication([], False)
+    app.initQgis()
+    for plugins in (os.path.join(QgsApplication.prefixPath(), 'python', 'plugins'),
+                    os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins')):
+        if os.path.isdir(plugins) and plugins not in sys.path:
+            sys.path.append(plugins)
+    # Processing e' un plugin di base caricato da QGIS comunque: lo si
+    # inizializza prima della misura per attribuire al plugin solo il suo costo
+    from processing.core.Processing import Processing
+    Processing.initialize()
+    return app
+
+
+def measure(plugins_dir):
+    """Tempo di import + registrazione del provider nel processo corrente."""
+    app = _init_qgis()
+    from qgis.core import QgsApplication
+
+    sys.path.insert(0, plugins_dir)
+    before = set(sys.modules)
+    t0 = time.perf_counter()
+    package = __import__(PACKAGE)
+    plugin = package.classFactory(None)
+    plugin.initProcessing()
+    elapsed = time.perf_counter() - t0
+    nuovi = set(sys.modules) - before
+
+    provider = QgsApplication.processingRegistry().providerById('mat')
+    record = {
+        'avvio_ms': elapsed * 1000.0,
+        'algoritmi': len(provider.algorithms()) if provider else 0,
+        'moduli_importati': len(nuovi),
+        'moduli_pesanti': sorted(m for m in nuovi if m in MODULI_PESANTI),
+    }
+    plugin.unload()
+    app.exitQgis()
+    return record
+
+
+def _worker_main(plugins_dir):
+    try:
+        record = measure(plugins_dir)
+        record['stato'] = 'ok'
+    except Exception as e:
+        record = {'stato': 'errore', 'errore': '%s: %s' % (type(e).__name__, e)}
+    sys.stdout.write('\n@@MAT_AVVIO@@' + json.dumps(record) + '\n')
+    sys.stdout.flush()
+
+
+def _spawn(plugins_dir, timeout):
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', plugins_dir]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'stato': 'timeout', 'timeout_s': timeout}
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith('@@MAT_AVVIO@@'):
+            return json.loads(line[len('@@MAT_AVVIO@@'):])
+    return {'stato': 'errore', 'errore': (proc.stderr or '').strip()[-2000:]}
+
+
+def _plugins_dir(plugin, workdir):
+    """Cartella che contiene il pacchetto del plugin (estrae lo ZIP se serve)."""
+    if zipfile.is_zipfile(plugin):
+        with zipfile.ZipFile(plugin) as zf:
+            zf.extractall(workdir)
+        return workdir
+    plugin = os.path.abspath(plugin)
+    if os.path.basename(plugin) == PACKAGE:
+        return os.path.dirname(plugin)
+    return plugin
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark dell'avvio del provider MAT")
+    ap.add_argument('--worker', help=argparse.SUPPRESS)
+    ap.add_argument('--plugin', default=DEFAULT_PLUGIN,
+                    help='ZIP del plugin o cartella che contiene %s' % PACKAGE)
+    ap.add_argument('--ripetizioni', type=int, default=5,
+                    help='numero di avvii a freddo misurati')
+    ap.add_argument('--soglia-ms', type=float, default=20.0,
+                    help='tempo massimo ammesso per la mediana (ms)')
+    ap.add_argument('--timeout', type=float, default=120.0,
+                    help='timeout per ripetizione in secondi')
+    ap.add_argument('--out', help='file JSON dei risultati')
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        _worker_main(args.worker)
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix='mat_avvio_')
+    try:
+        plugins_dir = _plugins_dir(args.plugin, workdir)
+        runs = [_spawn(plugins_dir, args.timeout) for _ in range(args.ripetizioni)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = [r for r in runs if r.get('stato') == 'ok']
+    for i, r in enumerate(runs, 1):
+        if r.get('stato') == 'ok':
+            print('avvio %2d  %8.2f ms  %d algoritmi  %d moduli  pesanti: %s' % (
+                i, r['avvio_ms'], r['algoritmi'], r['moduli_importati'],
+                ', '.join(r['moduli_pesanti']) or '-'))
+        else:
+            print('avvio %2d  %s  %s' % (i, r.get('stato'), r.get('errore', '')))
+
+    report = {
+        'meta': {
+            'data': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'piattaforma': platform.platform(),
+            'plugin': os.path.abspath(args.plugin),
+        },
+        'runs': runs,
+        'soglia_ms': args.soglia_ms,
+    }
+    try:
+        from qgis.core import Qgis
+        report['meta']['qgis'] = Qgis.QGIS_VERSION
+    except ImportError:
+        pass
+
+    status = 0
+    if not ok:
+        print('Nessuna misura riuscita')
+        status = 1
+    else:
+        mediana = statistics.median(r['avvio_ms'] for r in ok)
+        pesanti = sorted({m for r in ok for m in r['moduli_pesanti']})
+        report['mediana_ms'] = mediana
+        report['moduli_pesanti'] = pesanti
+        print('Mediana: %.2f ms (soglia %.1f ms)' % (mediana, args.soglia_ms))
+        if mediana > args.soglia_ms:
+            print('REGRESSIONE: avvio del provider oltre la soglia')
+            status = 1
+        if pesanti:
+            print('REGRESSIONE: moduli pesanti importati all\'avvio: %s' % ', '.join(pesanti))
+            status = 1
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+        print('Risultati salvati in: %s' % args.out)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
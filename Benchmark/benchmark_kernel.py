@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    Benchmark dei kernel delle Statistiche avanzate
+    -----------------------------------------------
+    Confronta, sugli stessi dati, le due implementazioni dei kernel di
+    Script/mat_worker.py (PCA, vicinato, clustering): scikit-learn/SciPy e
+    NumPy integrata (Script/mat_numpy.py). Per ogni scala misura i tempi di
+    calcolo dei due backend e la concordanza dei risultati; a parte misura,
+    in un sottoprocesso nuovo, il tempo di importazione di scikit-learn e
+    SciPy, che il backend NumPy risparmia.
+
+    La soglia consigliata e' la numerosita' piu' piccola a cui il backend
+    NumPy smette di convenire rispetto a scikit-learn/SciPy con la loro
+    importazione: e' il valore da riportare in SOGLIA_NUMPY.
+
+    Uso (serve solo numpy; senza scikit-learn/SciPy misura il solo backend
+    NumPy):
+
+      python Benchmark/benchmark_kernel.py
+      python Benchmark/benchmark_kernel.py --scale 500 2000 8000 \
+          --tessitura rubble --out Benchmark/risultati/kernel.json
+***************************************************************************
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, 'Script'))
+
+import mat_worker  # noqa: E402
+from sintetico import LAYOUTS, generate_facade  # noqa: E402
+
+DEFAULT_SCALE = (500, 1000, 2000, 5000, 10000)
+KNN = 8
+NCLUSTERS = 5
+
+
+def _input(layout, n, seed):
+    """Variabili lineari, centroidi e scarto locale come nell'algoritmo."""
+    f = generate_facade(layout, n, seed)
+    a = f['attrs']
+    L, T, A = a['width_bbox'], a['height_bbox'], a['area_componente']
+    lin = np.column_stack([L, T, A, A / (L * T)])
+    XY = f['rings'][:, :-1].mean(axis=1)
+    dev = np.abs(np.random.default_rng(seed).normal(0.0, 5.0, n))
+    return lin, XY, 3.0 * float(L.mean()), dev
+
+
+def _tempo(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+
+def _kernels(backend, lin, XY, radius, dev):
+    k = min(KNN + 1, len(XY))
+    run = mat_worker.run_kernel
+    tempi, out = {}, {}
+    tempi['pca'], out['pca'] = _tempo(
+        lambda: run('pca', lin=lin, n_components=2, backend=backend))
+    Z = out['pca']['Z']
+    tempi['vicinato'], out['vicinato'] = _tempo(
+        lambda: run('vicinato', XY=XY, radius=radius, k=k, backend=backend))
+    tempi['cluster'], out['cluster'] = _tempo(
+        lambda: run('cluster', Z=Z, dev=dev, nclusters=0, backend=backend))
+    tempi['cluster_k'], out['cluster_k'] = _tempo(
+        lambda: run('cluster', Z=Z, dev=dev, nclusters=NCLUSTERS, backend=backend))
+    return tempi, out
+
+
+def _concordanza(a, b):
+    """Scarti e frazioni di risultati identici tra due backend."""
+    n = len(a['pca']['Z'])
+    va, vb = a['vicinato'], b['vicinato']
+    stessi_r = sum(
+        np.array_equal(np.sort(va['rad_idx'][va['rad_ptr'][i]:va['rad_ptr'][i + 1]]),
+                       np.sort(vb['rad_idx'][vb['rad_ptr'][i]:vb['rad_ptr'][i + 1]]))
+        for i in range(n))
+    return {
+        'Z_max_scarto': float(np.abs(a['pca']['Z'] - b['pca']['Z']).max()),
+        'pcs_max_scarto': float(np.abs(a['pca']['pcs'] - b['pca']['pcs']).max()),
+        'raggio_identici': stessi_r / n,
+        'knn_identici': float(np.mean(np.all(va['knn_idx'] == vb['knn_idx'], axis=1))),
+        'cluster_identici': float(np.mean(a['cluster']['labels'] == b['cluster']['labels'])),
+        'cluster_k_identici': float(np.mean(a['cluster_k']['labels'] == b['cluster_k']['labels'])),
+    }
+
+
+def tempo_importazione():
+    """Secondi per importare scikit-learn/SciPy in un processo nuovo."""
+    codice = ('import sys, time; sys.path.insert(0, %r); import numpy, mat_worker; '
+              't0 = time.perf_counter(); mat_worker.preload(); '
+              'print(time.perf_counter() - t0)' % os.path.join(ROOT, 'Script'))
+    proc = subprocess.run([sys.executable, '-c', codice], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Benchmark dei kernel NumPy e scikit-learn/SciPy')
+    ap.add_argument('--scale', type=int, nargs='+', default=list(DEFAULT_SCALE),
+                    help='numero di componenti per caso')
+    ap.add_argument('--tessitura', default='latericium', choices=LAYOUTS)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', help='file JSON dei risultati')
+    args = ap.parse_args(argv)
+
+    con_sklearn = mat_worker.sklearn_available()
+    t_import = tempo_importazione() if con_sklearn else None
+    if t_import is not None:
+        print('Importazione scikit-learn/SciPy: %.2f s' % t_import)
+        mat_worker.preload()
+    else:
+        print('scikit-learn/SciPy non disponibili: si misura il solo backend NumPy')
+
+    casi = []
+    for n in args.scale:
+        lin, XY, radius, dev = _input(args.tessitura, n, args.seed)
+        caso = {'n': n}
+        t_np, out_np = _kernels(mat_worker.NUMPY, lin, XY, radius, dev)
+        caso['numpy_s'] = t_np
+        riga = 'n=%7d  numpy %7.3f s' % (n, sum(t_np.values()))
+        if t_import is not None:
+            t_sk, out_sk = _kernels(mat_worker.SKLEARN, lin, XY, radius, dev)
+            caso['sklearn_s'] = t_sk
+            caso['concordanza'] = _concordanza(out_np, out_sk)
+            riga += '  sklearn %7.3f s (+%.2f import)  concordanza: %s' % (
+                sum(t_sk.values()), t_import,
+                '  '.join('%s=%.3g' % kv for kv in caso['concordanza'].items()))
+        print(riga)
+        casi.append(caso)
+
+    report = {
+        'meta': {
+            'data': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'piattaforma': platform.platform(),
+            'tessitura': args.tessitura,
+            'seed': args.seed,
+        },
+        'importazione_s': t_import,
+        'casi': casi,
+    }
+    if t_import is not None:
+        # prima scala a cui NumPy costa piu' di scikit-learn/SciPy + importazione
+        perde = [c['n'] for c in casi
+                 if sum(c['numpy_s'].values()) > sum(c['sklearn_s'].values()) + t_import]
+        report['soglia_consigliata'] = min(perde) if perde else None
+        print('Soglia consigliata per il backend NumPy: %s (attuale SOGLIA_NUMPY = %d)' % (
+            report['soglia_consigliata'] or 'oltre le scale misurate', mat_worker.SOGLIA_NUMPY))
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+        print('Risultati salvati in: %s' % args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
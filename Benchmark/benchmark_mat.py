@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    Benchmark degli strumenti MAT
+    -----------------------------
+    Esegue gli algoritmi del provider in modalita' headless (senza interfaccia
+    QGIS) su facciate sintetiche generate da sintetico.py e registra in JSON:
+
+      - tempo totale (wall) dell'algoritmo;
+      - picco di memoria residente (RSS) del processo;
+      - tempi per fase, ricavati dalle intestazioni di log che gli script gia'
+        emettono ('--- FASE ---', '===== FASE =====');
+      - il resoconto per fase prodotto dall'algoritmo stesso (tempo reale e
+        CPU, feature in ingresso e in uscita, variazione RSS; vedi
+        Script/mat_profiling.py).
+
+    Ogni caso (algoritmo x tessitura x scala) gira in un sottoprocesso
+    separato, cosi' il picco RSS e' quello del singolo caso e un errore non
+    interrompe la serie. Confrontando il JSON con quello di un'esecuzione
+    precedente (--confronta) si segnalano le regressioni oltre una soglia.
+
+    Uso (dalla OSGeo4W Shell o da un ambiente con PyQGIS):
+
+      python Benchmark/benchmark_mat.py --scale 1000 10000 \
+          --tessiture latericium rubble --out Benchmark/risultati/oggi.json
+      python Benchmark/benchmark_mat.py --scale 10000 \
+          --confronta Benchmark/risultati/ieri.json --soglia 0.2
+      python Benchmark/benchmark_mat.py --scale 100000 --io-diretto \
+          --algoritmi pattern_reimpiego analisi_corsi --senza-limiti
+      python Benchmark/benchmark_mat.py --scale 100000 1000000 --processi-bbox 16 \
+          --algoritmi mattoni mattoni_senza_campione --senza-limiti
+
+    I dataset generati sono messi in cache in Benchmark/dati/.
+***************************************************************************
+"""
+
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SCRIPT_DIR = os.path.join(ROOT, 'Script')
+DATA_DIR = os.path.join(HERE, 'dati')
+RESULTS_DIR = os.path.join(HERE, 'risultati')
+
+DEFAULT_SCALES = (1000, 10000, 100000, 1000000)
+DEFAULT_SEED = 0
+
+
+def _params_quantitativi(path, modulo=False, campioni=True):
+    p = {
+        'layer_rilievo': path + '|layername=rilievo',
+        'tipo_materiale': '',
+        'includi_non_classificati': True,
+        'width_range_step': 0.01,
+        'height_range_step': 0.01,
+        'output_bbox': 'TEMPORARY_OUTPUT',
+        'output_rilievo': 'TEMPORARY_OUTPUT',
+        'output_width_range': 'TEMPORARY_OUTPUT',
+        'output_height_range': 'TEMPORARY_OUTPUT',
+    }
+    if campioni:
+        p['layer_campioni'] = path + '|layername=campioni'
+        p['output_campioni_table'] = 'TEMPORARY_OUTPUT'
+        p['output_campioni'] = 'TEMPORARY_OUTPUT'
+    else:
+        p['output_statistiche'] = 'TEMPORARY_OUTPUT'
+    if modulo:
+        p['valore_modulo'] = 0.296
+    return p
+
+
+def _params_pattern(path):
+    return {
+        'INPUT': path + '|layername=rilievo_analizzato',
+        'FIELD_ID': 'fid',
+        'FIELD_LEN': 'width_bbox',
+        'FIELD_THK': 'height_bbox',
+        'FIELD_AREA': 'area_componente',  # area reale del poligono, non del bbox
+        'FIELD_ANG': 'angle_bbox',
+        'RADIUS': 0.0,
+        'KNN': 8,
+        'NCLUSTERS': 0,
+        'PERMUTATIONS': 99,
+        'DO_METRO': True,
+        'MODULE': 0.296,
+        'Q_MIN': 0.18,
+        'Q_MAX': 0.60,
+        'Q_STEP': 0.002,
+        'MC_RUNS': 0,
+        'OUTPUT': 'TEMPORARY_OUTPUT',
+    }
+
+
+def _params_corsi(path):
+    return {
+        'INPUT': path + '|layername=rilievo_analizzato',
+        'FIELD_ID': 'fid',
+        'FIELD_LEN': 'width_bbox',
+        'FIELD_HGT': 'height_bbox',
+        'OUTPUT': 'TEMPORARY_OUTPUT',
+        'OUTPUT_COURSES': 'TEMPORARY_OUTPUT',
+    }
+
+
+# chiave -> (file in Script/, classe, costruttore parametri, scala massima).
+# La scala massima limita gli algoritmi con costo superlineare (clustering
+# gerarchico, permutazioni LISA) quando non si passa --senza-limiti.
+ALGORITMI = {
+    'mattoni': (
+        'mattoni_v2_0.py', 'Analisi',
+        lambda p: _params_quantitativi(p), None),
+    'mattoni_senza_campione': (
+        'mattoni_senza_campione_v2_0.py', 'AnalisiSenzaCampione',
+        lambda p: _params_quantitativi(p, campioni=False), None),
+    'componenti_a_secco': (
+        'componenti_a_secco_v2_0.py', 'Analisi',
+        lambda p: _params_quantitativi(p, modulo=True), None),
+    'altri_componenti': (
+        'altri_componenti_v2_0.py', 'Analisi',
+        lambda p: _params_quantitativi(p, modulo=True), None),
+    'secco_altri_senza_campione': (
+        'componenti_a_secco_altri_materiali_senza_campione_v2_0.py',
+        'AnalisiComponentiSeccoAltriMaterialiSenzaCampione',
+        lambda p: _params_quantitativi(p, modulo=True, campioni=False), None),
+    'pattern_reimpiego': (
+        'statistiche_avanzate_pattern_reimpiego.py', 'MasonryPatternAnalysis',
+        _params_pattern, 20000),
+    'analisi_corsi': (
+        'analisi_corsi_paramento.py', 'CourseAnalysis',
+        _params_corsi, None),
+}
+
+
+# --------------------------------------------------------------------------
+#  Misure
+# --------------------------------------------------------------------------
+def peak_rss_mb():
+    """Picco di memoria residente del processo corrente, in MB."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux riporta KB, macOS byte
+        return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss) / (1024.0 * 1024.0)
+        except ImportError:
+            return None
+
+
+def _stage_name(message):
+    """Nome della fase se il messaggio e' un'intestazione di log, altrimenti
+    None. Riconosce '--- NOME ---' e '===== NOME ====='."""
+    text = message.strip()
+    for mark in ('---', '====='):
+        if text.startswith(mark) and text.endswith(mark) and len(text) > 2 * len(mark):
+            name = text.strip('-= ').strip()
+            return name or None
+    return None
+
+
+def _make_feedback():
+    from qgis.core import QgsProcessingFeedback
+
+    class BenchFeedback(QgsProcessingFeedback):
+        """Feedback che marca l'istante di ogni intestazione di fase."""
+
+        def __init__(self):
+            super().__init__()
+            self.marks = []
+            self.warnings = []
+
+        def pushInfo(self, info):
+            name = _stage_name(info)
+            if name is not None:
+                self.marks.append((name, time.perf_counter()))
+
+        def pushWarning(self, warning):
+            self.warnings.append(warning)
+
+        def reportError(self, error, fatalError=False):
+            self.warnings.append(error)
+
+    return BenchFeedback()
+
+
+def stage_timings(marks, t_end):
+    """Durate per fase (s) dalle marcature; fasi ripetute sono sommate."""
+    out = {}
+    for i, (name, t) in enumerate(marks):
+        t_next = marks[i + 1][1] if i + 1 < len(marks) else t_end
+        out[name] = out.get(name, 0.0) + (t_next - t)
+    return out
+
+
+# --------------------------------------------------------------------------
+#  Worker (un caso per processo)
+# --------------------------------------------------------------------------
+def _init_qgis():
+    from qgis.core import QgsApplication
+    QgsApplication.setPrefixPath(os.environ.get('QGIS_PREFIX_PATH', '/usr'), True)
+    app = QgsApplication([], False)
+    app.initQgis()
+    for plugins in (os.path.join(QgsApplication.prefixPath(), 'python', 'plugins'),
+                    os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins')):
+        if os.path.isdir(plugins) and plugins not in sys.path:
+            sys.path.append(plugins)
+    from processing.core.Processing import Processing
+    from qgis.analysis import QgsNativeAlgorithms
+    Processing.initialize()
+    QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+    return app
+
+
+def _load_algorithm(script, class_name):
+    spec = importlib.util.spec_from_file_location(
+        'mat_bench_' + os.path.splitext(script)[0], os.path.join(SCRIPT_DIR, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    alg = getattr(module, class_name)()
+    alg.initAlgorithm()
+    return alg
+
+
+def run_case(case):
+    """Esegue un caso nel processo corrente e ritorna il record dei risultati."""
+    script, class_name, make_params, _ = ALGORITMI[case['algoritmo']]
+    sys.path.insert(0, HERE)
+    import sintetico
+
+    app = _init_qgis()
+    import processing
+    from qgis.core import QgsProcessingContext
+
+    t0 = time.perf_counter()
+    path = sintetico.ensure_dataset(DATA_DIR, case['tessitura'], case['n'], case['seed'])
+    t_data = time.perf_counter() - t0
+
+    alg = _load_algorithm(script, class_name)
+    feedback = _make_feedback()
+    context = QgsProcessingContext()
+    params = make_params(path)
+    out_dir = None
+    if case.get('io_diretto') and alg.parameterDefinition('GPKG_DIRECT') is not None:
+        # lettura e scrittura diretta: serve un output GeoPackage su file
+        import tempfile
+        out_dir = tempfile.mkdtemp(prefix='mat_io_')
+        params['GPKG_DIRECT'] = True
+        params['OUTPUT'] = os.path.join(out_dir, 'output.gpkg')
+    if case.get('processi_bbox') and alg.parameterDefinition('processi_bbox') is not None:
+        params['processi_bbox'] = case['processi_bbox']
+    # resoconto per fase dell'algoritmo stesso (tempo CPU, feature, RSS)
+    report_key = 'REPORT' if alg.parameterDefinition('REPORT') is not None else 'report_fasi'
+    report_path = None
+    if alg.parameterDefinition(report_key) is not None:
+        import tempfile
+        fd, report_path = tempfile.mkstemp(suffix='.json', prefix='mat_fasi_')
+        os.close(fd)
+        params[report_key] = report_path
+    rss_before = peak_rss_mb()
+    t0 = time.perf_counter()
+    processing.run(alg, params, context=context, feedback=feedback)
+    t_end = time.perf_counter()
+    fasi = None
+    if report_path:
+        with open(report_path, encoding='utf-8') as fh:
+            fasi = json.load(fh).get('fasi')
+        os.remove(report_path)
+    if out_dir:
+        import shutil
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    record = dict(case)
+    record.update({
+        'stato': 'ok',
+        'wall_s': t_end - t0,
+        'preparazione_dati_s': t_data,
+        'rss_picco_mb': peak_rss_mb(),
+        'rss_iniziale_mb': rss_before,
+        'fasi_s': stage_timings(feedback.marks, t_end),
+        'fasi': fasi,
+        'avvisi': len(feedback.warnings),
+    })
+    app.exitQgis()
+    return record
+
+
+def _worker_main(case_json):
+    case = json.loads(case_json)
+    try:
+        record = run_case(case)
+    except Exception as e:
+        record = dict(case)
+        record.update({'stato': 'errore', 'errore': '%s: %s' % (type(e).__name__, e)})
+    sys.stdout.write('\n@@MAT_BENCH@@' + json.dumps(record) + '\n')
+    sys.stdout.flush()
+
+
+def _spawn(case, timeout):
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(case)]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        record = dict(case)
+        record.update({'stato': 'timeout', 'timeout_s': timeout})
+        return record
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith('@@MAT_BENCH@@'):
+            return json.loads(line[len('@@MAT_BENCH@@'):])
+    record = dict(case)
+    record.update({'stato': 'errore', 'errore': (proc.stderr or '').strip()[-2000:]})
+    return record
+
+
+# --------------------------------------------------------------------------
+#  Confronto con un'esecuzione precedente
+# --------------------------------------------------------------------------
+def _key(r):
+    return (r['algoritmo'], r['tessitura'], r['n'], r['seed'], r.get('io_diretto', False),
+            r.get('processi_bbox', 0))
+
+
+def compare(runs, previous, soglia):
+    """Ritorna l'elenco delle regressioni (tempo o memoria oltre la soglia
+    relativa) rispetto alle esecuzioni 'previous'."""
+    prev = {_key(r): r for r in previous if r.get('stato') == 'ok'}
+    out = []
+    for r in runs:
+        p = prev.get(_key(r))
+        if r.get('stato') != 'ok' or p is None:
+            continue
+        for metric in ('wall_s', 'rss_picco_mb'):
+            a, b = p.get(metric), r.get(metric)
+            if a and b and b > a * (1.0 + soglia):
+                out.append({'caso': list(_key(r)), 'metrica': metric,
+                            'prima': a, 'dopo': b, 'rapporto': b / a})
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Benchmark degli strumenti MAT')
+    ap.add_argument('--worker', help=argparse.SUPPRESS)
+    ap.add_argument('--scale', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                    help='numero di componenti per facciata')
+    ap.add_argument('--tessiture', nargs='+', default=['latericium', 'ashlar', 'rubble'],
+                    choices=['latericium', 'ashlar', 'rubble'])
+    ap.add_argument('--algoritmi', nargs='+', default=sorted(ALGORITMI),
+                    choices=sorted(ALGORITMI))
+    ap.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    ap.add_argument('--senza-limiti', action='store_true',
+                    help='ignora la scala massima per algoritmo')
+    ap.add_argument('--timeout', type=float, default=3600.0,
+                    help='timeout per caso in secondi')
+    ap.add_argument('--out', help='file JSON dei risultati')
+    ap.add_argument('--confronta', help='JSON di un\'esecuzione precedente')
+    ap.add_argument('--soglia', type=float, default=0.2,
+                    help='rallentamento relativo oltre cui segnalare (0.2 = +20%%)')
+    ap.add_argument('--io-diretto', action='store_true',
+                    help='lettura e scrittura diretta dei GeoPackage negli algoritmi che la offrono')
+    ap.add_argument('--processi-bbox', type=int, default=0,
+                    help='processi paralleli per i bounding box orientati degli '
+                         'strumenti quantitativi (0 = algoritmo di Processing)')
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        _worker_main(args.worker)
+        return 0
+
+    runs = []
+    for n in args.scale:
+        for tessitura in args.tessiture:
+            for algoritmo in args.algoritmi:
+                limit = ALGORITMI[algoritmo][3]
+                case = {'algoritmo': algoritmo, 'tessitura': tessitura,
+                        'n': n, 'seed': args.seed}
+                if args.io_diretto:
+                    case['io_diretto'] = True
+                if args.processi_bbox:
+                    case['processi_bbox'] = args.processi_bbox
+                if limit is not None and n > limit and not args.senza_limiti:
+                    case['stato'] = 'saltato'
+                    runs.append(case)
+                    continue
+                r = _spawn(case, args.timeout)
+                runs.append(r)
+                if r['stato'] == 'ok':
+                    print('%-28s %-10s %8d  %8.2f s  %8.1f MB' % (
+                        algoritmo, tessitura, n, r['wall_s'], r['rss_picco_mb'] or 0.0))
+                else:
+                    print('%-28s %-10s %8d  %s' % (algoritmo, tessitura, n, r['stato']))
+
+    report = {
+        'meta': {
+            'data': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'piattaforma': platform.platform(),
+        },
+        'runs': runs,
+    }
+    try:
+        from qgis.core import Qgis
+        report['meta']['qgis'] = Qgis.QGIS_VERSION
+    except ImportError:
+        pass
+
+    status = 0
+    if args.confronta:
+        with open(args.confronta, encoding='utf-8') as fh:
+            previous = json.load(fh).get('runs', [])
+        regressions = compare(runs, previous, args.soglia)
+        report['regressioni'] = regressions
+        for reg in regressions:
+            print('REGRESSIONE %s %s: %.3g -> %.3g (x%.2f)' % (
+                '/'.join(str(x) for x in reg['caso']), reg['metrica'],
+                reg['prima'], reg['dopo'], reg['rapporto']))
+        status = 1 if regressions else 0
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, 'benchmark_%s.json' % datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2, ensure_ascii=False)
+    print('Risultati salvati in: %s' % out)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
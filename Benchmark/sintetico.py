@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    Generatore di paramenti sintetici per i benchmark di MAT
+    --------------------------------------------------------
+    Produce facciate murarie sintetiche a scala controllata (1k ... 1M
+    componenti) con tre tessiture:
+
+      * 'latericium' - opera laterizia: corsi regolari di mattoni sottili
+                       (lunghezza ~0.28 m, altezza ~0.045 m, letti ~0.015 m);
+      * 'ashlar'     - opera quadrata: blocchi squadrati alti (~0.90 x 0.45 m)
+                       con giunti sottili;
+      * 'rubble'     - opera incerta: pietre irregolari (poligoni a 6 vertici)
+                       di dimensioni e orientamento molto variabili.
+
+    Per ogni facciata genera:
+      - il layer 'rilievo' con i campi attesi dagli strumenti quantitativi
+        (fid, tipo, superficie, area_componente, num_componente, usm);
+      - il layer 'rilievo_analizzato', copia del rilievo con i campi del
+        bounding box (width_bbox, height_bbox, angle_bbox, perimeter_bbox,
+        area_bbox) noti analiticamente, come input per le statistiche
+        avanzate e l'analisi dei corsi;
+      - il layer 'campioni' che tassella la facciata in aree campione
+        (campione, sito, ambiente, usm, area_campione).
+
+    Il campo 'superficie' e' assegnato a caso ('parziale' con probabilita'
+    P_PARZIALE) e una frazione ANOMALY_RATE dei componenti e' un'anomalia di
+    reimpiego (dimensioni fuori scala e rotazione marcata), registrata nel
+    campo 'anomalia' come verita' a terra. Tutto e' deterministico a parita'
+    di seed.
+
+    La generazione (generate_facade) usa solo numpy; la scrittura in
+    GeoPackage (write_gpkg) richiede l'ambiente QGIS.
+***************************************************************************
+"""
+
+import math
+import os
+
+import numpy as np
+
+
+LAYOUTS = ('latericium', 'ashlar', 'rubble')
+
+P_PARZIALE = 0.1          # probabilita' di superficie = 'parziale'
+P_TIPO_NULL = 0.01        # probabilita' di tipo non classificato (NULL)
+ANOMALY_RATE = 0.02       # frazione di componenti di reimpiego
+ASPECT = 2.0              # rapporto larghezza/altezza della facciata
+
+# parametri di tessitura: dimensioni medie e dispersione dei pezzi, giunti
+# verticali e letti di malta, rotazione di posa (gradi), materiali e pesi
+LAYOUT_PARAMS = {
+    'latericium': {
+        'w': (0.28, 0.020), 'h': (0.045, 0.003),
+        'joint': (0.008, 0.014), 'bed': (0.012, 0.018),
+        'rot_sd': 1.0, 'sample': (1.0, 1.0),
+        'tipi': ('laterizio', 'tufo'), 'p_tipi': (0.95, 0.05),
+    },
+    'ashlar': {
+        'w': (0.90, 0.08), 'h': (0.45, 0.02),
+        'joint': (0.003, 0.008), 'bed': (0.003, 0.008),
+        'rot_sd': 0.5, 'sample': (2.0, 2.0),
+        'tipi': ('calcare', 'tufo'), 'p_tipi': (0.8, 0.2),
+    },
+    'rubble': {
+        'w': (0.25, 0.08), 'h': (0.16, 0.05),
+        'joint': (0.02, 0.05), 'bed': (0.02, 0.05),
+        'rot_sd': 12.0, 'sample': (1.0, 1.0),
+        'tipi': ('pietra', 'laterizio', 'tufo'), 'p_tipi': (0.7, 0.2, 0.1),
+    },
+}
+
+
+def _rect_rings(cx, cy, w, h, ang_rad):
+    """Anelli chiusi (n, 5, 2) dei rettangoli w x h ruotati di ang_rad."""
+    dx = np.array([-0.5, 0.5, 0.5, -0.5, -0.5])
+    dy = np.array([-0.5, -0.5, 0.5, 0.5, -0.5])
+    lx = dx[None, :] * w[:, None]
+    ly = dy[None, :] * h[:, None]
+    c = np.cos(ang_rad)[:, None]
+    s = np.sin(ang_rad)[:, None]
+    x = cx[:, None] + lx * c - ly * s
+    y = cy[:, None] + lx * s + ly * c
+    return np.stack([x, y], axis=-1)
+
+
+def _rubble_rings(cx, cy, w, h, ang_rad, rng):
+    """Anelli chiusi (n, 7, 2) di pietre irregolari: esagoni con raggi e
+    angoli perturbati, inscritti nell'ellisse w x h e ruotati di ang_rad."""
+    n = cx.size
+    base = np.linspace(0.0, 2.0 * np.pi, 6, endpoint=False)
+    theta = base[None, :] + rng.uniform(-0.35, 0.35, (n, 6))
+    rad = rng.uniform(0.80, 1.0, (n, 6))
+    lx = 0.5 * w[:, None] * rad * np.cos(theta)
+    ly = 0.5 * h[:, None] * rad * np.sin(theta)
+    c = np.cos(ang_rad)[:, None]
+    s = np.sin(ang_rad)[:, None]
+    x = cx[:, None] + lx * c - ly * s
+    y = cy[:, None] + lx * s + ly * c
+    ring = np.stack([x, y], axis=-1)
+    return np.concatenate([ring, ring[:, :1]], axis=1)
+
+
+def _shoelace(rings):
+    """Area e perimetro di anelli chiusi (n, k, 2)."""
+    x = rings[:, :, 0]
+    y = rings[:, :, 1]
+    area = 0.5 * np.abs(np.sum(x[:, :-1] * y[:, 1:] - x[:, 1:] * y[:, :-1], axis=1))
+    perim = np.sum(np.hypot(np.diff(x, axis=1), np.diff(y, axis=1)), axis=1)
+    return area, perim
+
+
+def generate_facade(layout, n, seed=0):
+    """Genera una facciata sintetica di n componenti.
+
+    Ritorna un dict con:
+      'rings'     array (n, k, 2) degli anelli chiusi dei poligoni;
+      'attrs'     dict di array (n,) per i campi del rilievo e del bbox;
+      'campioni'  dict di array per le aree campione (x0, y0, x1, y1 e campi);
+      'extent'    (larghezza, altezza) della facciata in metri.
+    """
+    if layout not in LAYOUT_PARAMS:
+        raise ValueError("Tessitura sconosciuta: %s (attese: %s)"
+                         % (layout, ', '.join(LAYOUTS)))
+    if n < 1:
+        raise ValueError("Servono almeno 1 componente.")
+    prm = LAYOUT_PARAMS[layout]
+    rng = np.random.default_rng(seed)
+
+    # griglia corsi x pezzi con facciata di rapporto ASPECT
+    w_m, w_sd = prm['w']
+    h_m, h_sd = prm['h']
+    pitch_x = w_m + sum(prm['joint']) / 2.0
+    pitch_y = h_m + sum(prm['bed']) / 2.0
+    per_course = max(2, int(round(math.sqrt(n * ASPECT * pitch_y / pitch_x))))
+    n_courses = int(math.ceil(n / per_course))
+
+    w = np.clip(rng.normal(w_m, w_sd, (n_courses, per_course)), 0.3 * w_m, None)
+    joint = rng.uniform(*prm['joint'], (n_courses, per_course))
+    # altezza di corso comune ai pezzi, con piccola variazione per pezzo
+    h_course = np.clip(rng.normal(h_m, h_sd, n_courses), 0.5 * h_m, None)
+    h = h_course[:, None] * rng.normal(1.0, 0.03, (n_courses, per_course))
+    bed = rng.uniform(*prm['bed'], n_courses)
+
+    # posizioni: X cumulate lungo il corso con sfalsamento casuale iniziale,
+    # Y cumulate dei corsi dal basso (coordinate mappa, Y verso l'alto)
+    step = w + joint
+    x_left = np.cumsum(step, axis=1) - step + rng.uniform(0.0, w_m, (n_courses, 1))
+    cx = x_left + w / 2.0
+    y_base = np.concatenate([[0.0], np.cumsum(h_course + bed)[:-1]])
+    cy = y_base[:, None] + h_course[:, None] / 2.0 \
+        + rng.normal(0.0, 0.05 * h_m, (n_courses, per_course))
+
+    cx = cx.ravel()[:n]
+    cy = cy.ravel()[:n]
+    w = w.ravel()[:n]
+    h = h.ravel()[:n]
+    ang = rng.normal(0.0, prm['rot_sd'], n)
+
+    # anomalie di reimpiego: dimensioni fuori scala e rotazione marcata
+    anomalia = rng.random(n) < ANOMALY_RATE
+    k = int(anomalia.sum())
+    w[anomalia] *= rng.uniform(1.2, 1.5, k)
+    h[anomalia] *= rng.uniform(0.7, 1.3, k)
+    ang[anomalia] += rng.choice([-1.0, 1.0], k) * rng.uniform(8.0, 25.0, k)
+
+    ang_rad = np.deg2rad(ang)
+    if layout == 'rubble':
+        rings = _rubble_rings(cx, cy, w, h, ang_rad, rng)
+    else:
+        rings = _rect_rings(cx, cy, w, h, ang_rad)
+    area, _ = _shoelace(rings)
+
+    # attributi del rilievo
+    tipi = np.asarray(prm['tipi'], dtype=object)
+    tipo = tipi[rng.choice(len(tipi), n, p=prm['p_tipi'])]
+    tipo[rng.random(n) < P_TIPO_NULL] = None
+    superficie = np.where(rng.random(n) < P_PARZIALE, 'parziale', 'intera').astype(object)
+
+    facade_w = float(x_left.max() + w_m * 2.0)
+    facade_h = float(y_base[-1] + h_course[-1] + bed[-1])
+
+    # aree campione: tassellatura regolare della facciata
+    sw, sh = prm['sample']
+    nx = max(1, int(math.ceil(facade_w / sw)))
+    ny = max(1, int(math.ceil(facade_h / sh)))
+    gx, gy = np.meshgrid(np.arange(nx), np.arange(ny))
+    x0 = gx.ravel() * sw
+    y0 = gy.ravel() * sh
+    n_samples = x0.size
+    campione = np.array(['C%05d' % (i + 1) for i in range(n_samples)], dtype=object)
+    usm_s = np.array(['%d' % (100 + i // 10) for i in range(n_samples)], dtype=object)
+
+    # usm del componente = usm del campione che ne contiene il centroide
+    ix = np.clip((cx // sw).astype(np.int64), 0, nx - 1)
+    iy = np.clip((cy // sh).astype(np.int64), 0, ny - 1)
+    usm = usm_s[iy * nx + ix]
+
+    w_box = np.maximum(w, h)
+    h_box = np.minimum(w, h)
+    attrs = {
+        'fid': np.arange(1, n + 1, dtype=np.int64),
+        'tipo': tipo,
+        'superficie': superficie,
+        'area_componente': area,
+        'num_componente': np.arange(1, n + 1, dtype=np.int64),
+        'usm': usm,
+        'anomalia': anomalia.astype(np.int64),
+        'width_bbox': w_box,
+        'height_bbox': h_box,
+        'angle_bbox': np.mod(ang, 180.0),
+        'perimeter_bbox': 2.0 * (w + h),
+        'area_bbox': w * h,
+    }
+    campioni = {
+        'x0': x0, 'y0': y0, 'x1': x0 + sw, 'y1': y0 + sh,
+        'campione': campione,
+        'sito': np.full(n_samples, 'SINTETICO', dtype=object),
+        'ambiente': np.full(n_samples, layout, dtype=object),
+        'usm': usm_s,
+        'area_campione': np.full(n_samples, sw * sh),
+    }
+    return {'rings': rings, 'attrs': attrs, 'campioni': campioni,
+            'extent': (facade_w, facade_h)}
+
+
+def polygon_wkb(rings):
+    """WKB (little endian) dei poligoni a un anello (n, k, 2), costruito in
+    blocco con un dtype strutturato. Ritorna (buffer, dimensione record)."""
+    n, k, _ = rings.shape
+    dt = np.dtype([('bo', 'u1'), ('type', '<u4'), ('nrings', '<u4'),
+                   ('npts', '<u4'), ('xy', '<f8', (k, 2))])
+    rec = np.zeros(n, dtype=dt)
+    rec['bo'] = 1
+    rec['type'] = 3       # Polygon
+    rec['nrings'] = 1
+    rec['npts'] = k
+    rec['xy'] = rings
+    return rec.tobytes(), dt.itemsize
+
+
+# --------------------------------------------------------------------------
+#  Scrittura in GeoPackage (richiede QGIS)
+# --------------------------------------------------------------------------
+RILIEVO_FIELDS = ('fid', 'tipo', 'superficie', 'area_componente',
+                  'num_componente', 'usm', 'anomalia')
+BBOX_FIELDS = ('width_bbox', 'height_bbox', 'angle_bbox',
+               'perimeter_bbox', 'area_bbox')
+CAMPIONI_FIELDS = ('campione', 'sito', 'ambiente', 'usm', 'area_campione')
+
+
+def _qgs_field(name, values):
+    from qgis.PyQt.QtCore import QVariant
+    from qgis.core import QgsField
+    if values.dtype.kind in 'iu':
+        return QgsField(name, QVariant.LongLong)
+    if values.dtype.kind == 'f':
+        return QgsField(name, QVariant.Double)
+    return QgsField(name, QVariant.String)
+
+
+def _write_layer(path, layer_name, columns, wkbs, crs, overwrite_file, batch=5000):
+    """Scrive un layer nel GeoPackage. columns: lista (nome, array); wkbs:
+    (buffer, dimensione record) dei poligoni. Il campo 'fid' e' usato come
+    chiave primaria del GeoPackage."""
+    from qgis.core import (QgsCoordinateTransformContext, QgsFeature, QgsFields,
+                           QgsGeometry, QgsVectorFileWriter, QgsWkbTypes)
+    fields = QgsFields()
+    for name, values in columns:
+        fields.append(_qgs_field(name, values))
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = layer_name
+    options.actionOnExistingFile = (
+        QgsVectorFileWriter.CreateOrOverwriteFile if overwrite_file
+        else QgsVectorFileWriter.CreateOrOverwriteLayer)
+    writer = QgsVectorFileWriter.create(
+        path, fields, QgsWkbTypes.Polygon, crs,
+        QgsCoordinateTransformContext(), options)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise RuntimeError("Scrittura di %s:%s fallita: %s"
+                           % (path, layer_name, writer.errorMessage()))
+    buf, size = wkbs
+    cols = [values.tolist() for _, values in columns]
+    n = len(cols[0])
+    feats = []
+    for i in range(n):
+        f = QgsFeature(fields)
+        g = QgsGeometry()
+        g.fromWkb(buf[i * size:(i + 1) * size])
+        f.setGeometry(g)
+        f.setAttributes([c[i] for c in cols])
+        feats.append(f)
+        if len(feats) >= batch:
+            writer.addFeatures(feats)
+            feats = []
+    if feats:
+        writer.addFeatures(feats)
+    del writer
+
+
+def write_gpkg(facade, path, crs_authid='EPSG:3004'):
+    """Scrive la facciata nel GeoPackage 'path' con i layer 'rilievo',
+    'rilievo_analizzato' e 'campioni'."""
+    from qgis.core import QgsCoordinateReferenceSystem
+    crs = QgsCoordinateReferenceSystem(crs_authid)
+    a = facade['attrs']
+    wkbs = polygon_wkb(facade['rings'])
+    base = [(k, a[k]) for k in RILIEVO_FIELDS]
+    _write_layer(path, 'rilievo', base, wkbs, crs, overwrite_file=True)
+    _write_layer(path, 'rilievo_analizzato',
+                 base + [(k, a[k]) for k in BBOX_FIELDS], wkbs, crs,
+                 overwrite_file=False)
+    c = facade['campioni']
+    x0, y0, x1, y1 = c['x0'], c['y0'], c['x1'], c['y1']
+    rings = np.stack([
+        np.stack([x0, x1, x1, x0, x0], axis=-1),
+        np.stack([y0, y0, y1, y1, y0], axis=-1)], axis=-1)
+    ns = x0.size
+    _write_layer(path, 'campioni',
+                 [('fid', np.arange(1, ns + 1, dtype=np.int64))]
+                 + [(k, c[k]) for k in CAMPIONI_FIELDS],
+                 polygon_wkb(rings), crs, overwrite_file=False)
+
+
+def dataset_path(folder, layout, n, seed):
+    """Percorso del GeoPackage in cache per (tessitura, scala, seed)."""
+    return os.path.join(folder, 'facciata_%s_%d_s%d.gpkg' % (layout, n, seed))
+
+
+def ensure_dataset(folder, layout, n, seed=0):
+    """Genera (se non gia' presente) e ritorna il GeoPackage della facciata."""
+    path = dataset_path(folder, layout, n, seed)
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        tmp = path + '.tmp.gpkg'
+        write_gpkg(generate_facade(layout, n, seed), tmp)
+        os.replace(tmp, path)
+    return path
@@ -76,8 +76,9 @@
 ***************************************************************************
 """
 
+import os
 import math
-import numpy as np
+import zipfile
 
 from qgis.PyQt.QtCore import QCoreApplication, QVariant
 from qgis.core import (
@@ -88,14 +89,56 @@ from qgis.core import (
     QgsProcessingParameterNumber,
     QgsProcessingParameterBoolean,
     QgsProcessingParameterEnum,
+    QgsProcessingParameterFileDestination,
     QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterDefinition,
     QgsField,
     QgsFields,
     QgsFeature,
     QgsFeatureSink,
+    QgsFeatureRequest,
     QgsWkbTypes,
 )
 
+try:
+    from .mat_profiling import StageProfiler, profilable
+    from .mat_lazy import lazy_import
+    from . import mat_algoritmi
+    from . import mat_gpkg
+except ImportError:
+    # caricato come script di Processing, fuori dal pacchetto del plugin
+    import sys
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_profiling import StageProfiler, profilable
+    from mat_lazy import lazy_import
+    import mat_algoritmi
+    import mat_gpkg
+
+# numpy serve solo durante l'elaborazione: importato al primo uso
+np = lazy_import('numpy', globals(), 'np')
+
+
+# Sintesi per corso in forma colonnare: un record per corso, una colonna per
+# grandezza. I campi float usano NaN come NULL; i campi con prefisso '_' sono
+# di lavoro e non vanno in output.
+COURSE_DTYPE = [
+    ('corso_id', 'i4'),
+    ('n_pezzi', 'i4'),
+    ('quota_media', 'f8'),
+    ('altezza_corso', 'f8'),
+    ('lunghezza_corso', 'f8'),
+    ('inclinaz_deg', 'f8'),
+    ('letto_malta_sup', 'f8'),
+    ('sfalso_giunti_sup', 'f8'),
+    ('segmento', 'i4'),
+    ('cesura', 'i4'),
+    ('_sup', 'f8'),      # bordi rappresentativi per il calcolo del letto di malta
+    ('_inf', 'f8'),
+    ('_avg_w', 'f8'),    # larghezza media dei pezzi (per ammorsatura)
+]
+
 
 class CourseAnalysis(QgsProcessingAlgorithm):
 
@@ -111,8 +154,21 @@ class CourseAnalysis(QgsProcessingAlgorithm):
     DO_DAYS = 'DO_DAYS'
     DAYS_SERIES = 'DAYS_SERIES'
     DAYS_PEN = 'DAYS_PEN'
+    STATE_FILE = 'STATE_FILE'
     OUTPUT = 'OUTPUT'
     OUTPUT_COURSES = 'OUTPUT_COURSES'
+    REPORT = 'REPORT'
+    PROFILE = 'PROFILE'
+    GPKG_DIRECT = 'GPKG_DIRECT'
+
+    # feature scritte per ogni chiamata a sink.addFeatures
+    OUTPUT_BATCH = 1000
+    # rianalisi incrementale: oltre questa frazione di componenti modificati
+    # (o rimossi) si ricalcolano tutti i corsi
+    INCREMENTAL_MAX_CHANGED = 0.2
+    STATE_VERSION = 1
+    # array che un file di stato deve contenere (cp_* sono facoltativi)
+    STATE_KEYS = ('version', 'tols', 'fid', 'hash', 'course_fid', 'course_off')
 
     def tr(self, string):
         return QCoreApplication.translate('Processing', string)
@@ -124,50 +180,27 @@ class CourseAnalysis(QgsProcessingAlgorithm):
         return 'analisi_corsi_paramento'
 
     def displayName(self):
-        return 'Analisi dei corsi del paramento'
+        return mat_algoritmi.info(self.name()).titolo
 
     def group(self):
-        return 'Analisi quantitative'
+        return mat_algoritmi.gruppo(self.name())
 
     def groupId(self):
-        return 'analisi'
+        return mat_algoritmi.info(self.name()).id_gruppo
 
     def shortHelpString(self):
-        return self.tr(
-            "Riconosce i corsi (filari orizzontali) di un paramento gia' "
-            "segmentato in componenti poligonali, adattando la logica "
-            "incrementale di TagLab (QtCourseAnalysis).\n\n"
-            "Richiede un rilievo RADDRIZZATO con Y verso l'alto. Usa i campi "
-            "width_bbox (lunghezza) e height_bbox (altezza) prodotti da "
-            "MensioAnalysisTools; il centroide e' ricavato dalla geometria.\n\n"
-            "Un componente si aggancia al corso se, rispetto all'ultimo pezzo "
-            "gia' inserito: il gap in X non supera la larghezza media del corso "
-            "per x_gap_factor; il centroide Y, e i bordi alto e basso, restano "
-            "entro le rispettive tolleranze (relative all'altezza); e l'altezza "
-            "e' simile (rapporto entro 1+-h_tol).\n\n"
-            "Output: i componenti con corso_id/pos_in_corso/corso_n_pezzi (e, "
-            "con l'analisi dei giunti attiva, giunto_vert per ogni pezzo) e una "
-            "tabella di sintesi per corso (n. pezzi, quota, altezza, lunghezza, "
-            "inclinazione e, se richiesto, letto_malta_sup = spessore del letto "
-            "di malta verso il corso superiore, e sfalso_giunti_sup = sfalsamento "
-            "dei giunti verticali rispetto al corso superiore, indice di "
-            "ammorsatura).\n\n"
-            "DIPENDENZE: numpy (sempre presente in QGIS) e' sufficiente. Il "
-            "rilevamento delle discontinuita' usa, se installata, la libreria "
-            "'ruptures' (algoritmo PELT); in sua assenza ricade automaticamente "
-            "su un rilevatore interno in puro numpy che fornisce risultati "
-            "equivalenti. 'ruptures' e' quindi OPZIONALE: conviene solo per "
-            "velocizzare l'analisi su serie molto lunghe (centinaia di corsi). "
-            "Per installarla, dalla OSGeo4W Shell: python -m pip install ruptures"
-        )
+        return self.tr(mat_algoritmi.info(self.name()).aiuto)
 
     def initAlgorithm(self, config=None):
         self.addParameter(QgsProcessingParameterFeatureSource(
             self.INPUT, self.tr('Layer poligonale dei componenti'),
             [QgsProcessing.TypeVectorPolygon]))
+        # non usato dal calcolo: i componenti sono riconosciuti dall'id delle
+        # feature e l'output conserva tutti i campi dell'ingresso. Resta,
+        # facoltativo, per i modelli e gli script che lo impostano.
         self.addParameter(QgsProcessingParameterField(
-            self.FIELD_ID, self.tr('Campo identificativo univoco'),
-            parentLayerParameterName=self.INPUT))
+            self.FIELD_ID, self.tr('Campo identificativo univoco (non usato)'),
+            parentLayerParameterName=self.INPUT, optional=True))
         self.addParameter(QgsProcessingParameterField(
             self.FIELD_LEN, self.tr('Campo lunghezza (width_bbox)'),
             parentLayerParameterName=self.INPUT,
@@ -207,40 +240,123 @@ class CourseAnalysis(QgsProcessingAlgorithm):
             self.DAYS_PEN,
             self.tr('Sensibilita\': alta = poche cesure nette, bassa = piu\' cesure'),
             type=QgsProcessingParameterNumber.Double, defaultValue=2.5, minValue=0.0))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.STATE_FILE,
+            self.tr('File di stato per la rianalisi incrementale (opzionale)'),
+            'NumPy (*.npz)', optional=True, createByDefault=False))
         self.addParameter(QgsProcessingParameterFeatureSink(
             self.OUTPUT, self.tr('Componenti con corso')))
         self.addParameter(QgsProcessingParameterFeatureSink(
             self.OUTPUT_COURSES, self.tr('Sintesi per corso')))
+        report = QgsProcessingParameterFileDestination(
+            self.REPORT, self.tr('Resoconto tempi per fase (JSON/CSV, opzionale)'),
+            'JSON (*.json);;CSV (*.csv)', optional=True, createByDefault=False)
+        report.setFlags(report.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(report)
+        profile = QgsProcessingParameterBoolean(
+            self.PROFILE,
+            self.tr('Profilazione dettagliata (cProfile + pile campionate, accanto agli output)'),
+            defaultValue=False)
+        profile.setFlags(profile.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(profile)
+        direct = QgsProcessingParameterBoolean(
+            self.GPKG_DIRECT,
+            self.tr('Lettura e scrittura diretta dei GeoPackage (SQL in blocco, '
+                    'senza controllo delle geometrie non valide)'),
+            defaultValue=False)
+        direct.setFlags(direct.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(direct)
 
     # ----------------------------------------------------------------------
     #  Raggruppamento incrementale (adattato da TagLab detectCoursesIncremental)
     # ----------------------------------------------------------------------
     @staticmethod
-    def _detect_courses(items, y_tol_f, ytb_tol_f, h_tol_f, x_gap_f):
+    def _detect_courses(cx, cy, w, h, y_tol_f, ytb_tol_f, h_tol_f, x_gap_f):
         """
-        items: lista di dict con chiavi cx, cy, w, h, idx.
+        cx, cy, w, h: array (n,) dei centroidi e delle dimensioni dei pezzi.
                Convenzione coordinate mappa, Y verso l'ALTO:
                  top    = cy + h/2   (bordo superiore)
                  bottom = cy - h/2   (bordo inferiore)
-        Ritorna una lista di corsi; ogni corso e' una lista di item, ordinata
-        per X crescente.
+        Ritorna una lista di corsi; ogni corso e' una lista di indici dei
+        pezzi (posizioni negli array), ordinata per X crescente.
+
+        I candidati all'estensione sono cercati su una griglia uniforme
+        (spatial hash) con celle di larghezza media x altezza media dei pezzi,
+        costruita una sola volta: a ogni passo si visitano solo le celle a
+        destra dell'ultimo pezzo entro x_gap_tol e y_tol, quindi l'estensione
+        costa O(1) in media invece di una scansione di tutti i pezzi liberi.
+        Il pezzo scelto e' lo stesso della scansione lineare di TagLab: il
+        primo compatibile a destra, cioe' quello con X minima (a parita' di X,
+        il primo in ordine di lettura).
         """
-        unassigned = list(items)
-        courses = []
+        cx = np.asarray(cx, dtype=float)
+        cy = np.asarray(cy, dtype=float)
+        w = np.asarray(w, dtype=float)
+        h = np.asarray(h, dtype=float)
+        n = cx.size
+
+        # --- griglia: chiave di cella (cx / w_medio, cy / h_medio) ---
+        cell_w = float(np.mean(w)) if n else 1.0
+        cell_h = float(np.mean(h)) if n else 1.0
+        if not cell_w > 0:
+            cell_w = 1.0
+        if not cell_h > 0:
+            cell_h = 1.0
+        gx = np.floor(cx / cell_w).astype(np.int64).tolist()
+        gy = np.floor(cy / cell_h).astype(np.int64).tolist()
+        grid = {}
+        for i in range(n):
+            grid.setdefault((gx[i], gy[i]), []).append(i)
+
+        # scalari Python: accesso rapido nei test per candidato
+        order = np.argsort(cx, kind='stable').tolist()
+        cx = cx.tolist()
+        cy = cy.tolist()
+        w = w.tolist()
+        h = h.tolist()
+        assigned = bytearray(n)
+
+        def take(i):
+            assigned[i] = 1
+            cell = grid[(gx[i], gy[i])]
+            cell.remove(i)
+            if not cell:
+                del grid[(gx[i], gy[i])]
+
+        def candidates(x0, x1, y0, y1):
+            # margine minimo sui limiti: evita di perdere per arrotondamento
+            # un candidato esattamente sul bordo di una cella
+            ix0 = math.floor(x0 / cell_w)
+            ix1 = math.floor((x1 + 1e-9 * cell_w) / cell_w)
+            iy0 = math.floor((y0 - 1e-9 * cell_h) / cell_h)
+            iy1 = math.floor((y1 + 1e-9 * cell_h) / cell_h)
+            if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > len(grid):
+                # finestra piu' ampia delle celle occupate (tolleranze molto
+                # larghe): conviene scorrere direttamente le celle occupate
+                for (kx, ky), cell in grid.items():
+                    if ix0 <= kx <= ix1 and iy0 <= ky <= iy1:
+                        yield from cell
+            else:
+                for kx in range(ix0, ix1 + 1):
+                    for ky in range(iy0, iy1 + 1):
+                        yield from grid.get((kx, ky), ())
 
-        while unassigned:
-            # nuovo corso: parte dal pezzo piu' a sinistra
-            unassigned.sort(key=lambda b: b['cx'])
-            first = unassigned.pop(0)
+        courses = []
+        for first in order:
+            # nuovo corso: parte dal pezzo libero piu' a sinistra
+            if assigned[first]:
+                continue
+            take(first)
             course = [first]
+            sum_w = w[first]
+            last = first
 
-            while unassigned:
-                last = course[-1]
-                last_y = last['cy']
-                last_h = last['h']
-                last_x = last['cx']
-                last_top = last['cy'] + last['h'] / 2.0
-                last_bottom = last['cy'] - last['h'] / 2.0
+            while grid:
+                last_y = cy[last]
+                last_h = h[last]
+                last_x = cx[last]
+                last_top = last_y + last_h / 2.0
+                last_bottom = last_y - last_h / 2.0
 
                 if last_h <= 0:
                     # altezza non valida: niente tolleranze sensate, chiudi corso
@@ -248,82 +364,297 @@ class CourseAnalysis(QgsProcessingAlgorithm):
 
                 y_tol = last_h * y_tol_f
                 ytb_tol = last_h * ytb_tol_f
-                avg_w = sum(b['w'] for b in course) / len(course)
+                avg_w = sum_w / len(course)
                 x_gap_tol = avg_w * x_gap_f
 
                 best = None
-                for b in unassigned:
+                for b in candidates(last_x, last_x + x_gap_tol,
+                                    last_y - y_tol, last_y + y_tol):
+                    b_x = cx[b]
                     # solo pezzi a DESTRA dell'ultimo
-                    if b['cx'] <= last_x:
+                    if b_x <= last_x:
                         continue
                     # gap in X non troppo grande
-                    if (b['cx'] - last_x) > x_gap_tol:
+                    if (b_x - last_x) > x_gap_tol:
                         continue
                     # continuita' del centroide Y
-                    if abs(b['cy'] - last_y) > y_tol:
+                    if abs(cy[b] - last_y) > y_tol:
                         continue
                     # continuita' dei bordi alto e basso
-                    b_top = b['cy'] + b['h'] / 2.0
-                    b_bottom = b['cy'] - b['h'] / 2.0
+                    b_top = cy[b] + h[b] / 2.0
+                    b_bottom = cy[b] - h[b] / 2.0
                     if abs(b_top - last_top) > ytb_tol:
                         continue
                     if abs(b_bottom - last_bottom) > ytb_tol:
                         continue
                     # somiglianza di altezza
-                    if last_h <= 0:
-                        continue
-                    ratio = b['h'] / last_h
+                    ratio = h[b] / last_h
                     if not ((1.0 - h_tol_f) <= ratio <= (1.0 + h_tol_f)):
                         continue
-                    # primo compatibile a destra: greedy, lo prendo subito
-                    best = b
-                    break
+                    # primo compatibile a destra: X minima, poi ordine di lettura
+                    if best is None or (b_x, b) < (cx[best], best):
+                        best = b
 
                 if best is None:
                     break
+                take(best)
                 course.append(best)
-                unassigned.remove(best)
+                sum_w += w[best]
+                last = best
 
+            # ogni pezzo agganciato sta a destra del precedente: il corso e'
+            # gia' ordinato per X
             courses.append(course)
 
-        # ordina i pezzi di ogni corso per X
-        for c in courses:
-            c.sort(key=lambda b: b['cx'])
+        return CourseAnalysis._order_courses(courses, cx, cy, w, h)
 
-        # ordina i corsi: dal basso verso l'alto (Y crescente), con
-        # quantizzazione della quota per raggruppare corsi allo stesso livello,
-        # poi da sinistra a destra entro lo stesso livello.
+    @staticmethod
+    def _order_courses(courses, cx, cy, w, h):
+        """Ordina i corsi (liste di indici dei pezzi) dal basso verso l'alto
+        (Y crescente), con quantizzazione della quota per raggruppare corsi
+        allo stesso livello, poi da sinistra a destra entro lo stesso livello.
+        cx, cy, w, h: sequenze indicizzabili per pezzo (liste Python per
+        velocita')."""
         if courses:
             avg_h = sum(
-                (sum(b['h'] for b in c) / len(c)) for c in courses
+                (sum(h[b] for b in c) / len(c)) for c in courses
             ) / len(courses)
             y_q = avg_h * 0.5
         else:
             y_q = 0.0
 
         def sort_key(c):
-            cy = sum(b['cy'] for b in c) / len(c)
-            min_x = min(b['cx'] - b['w'] / 2.0 for b in c)
-            bucket = int(cy / y_q) if y_q > 0 else cy
+            ccy = sum(cy[b] for b in c) / len(c)
+            min_x = min(cx[b] - w[b] / 2.0 for b in c)
+            bucket = int(ccy / y_q) if y_q > 0 else ccy
             return (bucket, min_x)
 
         courses.sort(key=sort_key)
         return courses
 
+    # ----------------------------------------------------------------------
+    #  Rianalisi incrementale (stato salvato tra un'esecuzione e l'altra)
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _feature_hash(cx, cy, w, h):
+        """Impronta a 64 bit di (cx, cy, w, h) per componente (FNV-1a sulle
+        parole IEEE 754 dei quattro valori), calcolata in forma vettoriale."""
+        words = np.column_stack([cx, cy, w, h]).astype('<f8').view(np.uint64)
+        hsh = np.full(words.shape[0], 0xcbf29ce484222325, dtype=np.uint64)
+        prime = np.uint64(0x100000001b3)
+        for k in range(words.shape[1]):
+            hsh = (hsh ^ words[:, k]) * prime
+        return hsh
+
     @staticmethod
-    def _inclination_deg(course):
-        """Inclinazione del corso: fit y = m x + b sui centroidi, angolo in
-        gradi. Y verso l'alto: positivo = corso che sale verso destra.
-        Ritorna 0.0 per corsi con meno di 2 pezzi."""
-        if len(course) < 2:
-            return 0.0
-        xs = np.array([b['cx'] for b in course], dtype=float)
-        ys = np.array([b['cy'] for b in course], dtype=float)
+    def _load_state(path, tols, feedback):
+        """Legge il file di stato della rianalisi incrementale. Ritorna un
+        dict di array, oppure None se il file manca, non e' leggibile (anche
+        un npz troncato o senza gli array di STATE_KEYS) o e' stato prodotto
+        con parametri di raggruppamento diversi."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            data = np.load(path, allow_pickle=False)
+            if not hasattr(data, 'files'):
+                # un .npy singolo invece dell'archivio npz
+                raise ValueError("non e' un archivio npz")
+            with data:
+                state = {k: data[k] for k in data.files}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            feedback.pushWarning(
+                "File di stato non leggibile (%s): ricalcolo completo." % str(e))
+            return None
+        missing = [k for k in CourseAnalysis.STATE_KEYS if k not in state]
+        if missing:
+            feedback.pushWarning(
+                "File di stato incompleto (mancano %s): ricalcolo completo."
+                % ', '.join(missing))
+            return None
+        if int(state['version']) != CourseAnalysis.STATE_VERSION:
+            feedback.pushInfo("File di stato di una versione diversa: ricalcolo completo.")
+            return None
+        if not np.array_equal(state['tols'], np.asarray(tols, dtype=float)):
+            feedback.pushInfo(
+                "Parametri di raggruppamento cambiati rispetto al file di stato: "
+                "ricalcolo completo.")
+            return None
+        return state
+
+    @staticmethod
+    def _save_state(path, feedback, **arrays):
+        """Scrive il file di stato (npz non compresso)."""
+        try:
+            with open(path, 'wb') as fh:
+                np.savez(fh, version=CourseAnalysis.STATE_VERSION, **arrays)
+            feedback.pushInfo("Stato per la rianalisi incrementale salvato in: %s" % path)
+        except OSError as e:
+            feedback.pushWarning("Impossibile scrivere il file di stato: %s" % str(e))
+
+    @staticmethod
+    def _update_courses(state, comp_fid, comp_hash, cx, cy, w, h, valid,
+                        tols, max_changed, feedback):
+        """Aggiorna l'assegnazione dei corsi salvata nello stato dopo
+        modifiche locali al rilievo.
+
+        I componenti sono confrontati per fid e impronta: sono 'modificati'
+        quelli nuovi o con impronta diversa, 'rimossi' quelli dello stato
+        assenti dal layer. Si ricostruiscono (con _detect_courses) solo i
+        corsi che contenevano componenti modificati o rimossi, quelli la cui
+        fascia verticale interseca la nuova posizione di un componente
+        modificato, e i corsi adiacenti sopra e sotto a questi; gli altri
+        corsi sono riusati tali e quali.
+
+        Ritorna la lista dei corsi (array di indici dei componenti), oppure
+        None se le modifiche superano la frazione max_changed del layer.
+        """
+        n = comp_fid.size
+        old_fid = state['fid']
+        old_hash = state['hash']
+        c_fid = state['course_fid']
+        c_off = state['course_off']
+        n_old_courses = c_off.size - 1
+
+        # fid -> indice corrente, per ricerca binaria su fid ordinati
+        cur_order = np.argsort(comp_fid, kind='stable')
+        cur_sorted = comp_fid[cur_order]
+
+        def index_of(fids):
+            pos = np.searchsorted(cur_sorted, fids)
+            pos = np.minimum(pos, max(n - 1, 0))
+            found = cur_sorted[pos] == fids if n else np.zeros(fids.size, dtype=bool)
+            return np.where(found, cur_order[pos], -1)
+
+        # componenti nuovi o modificati
+        old_idx = index_of(old_fid)
+        unchanged = np.zeros(n, dtype=bool)
+        present = old_idx >= 0
+        unchanged[old_idx[present]] = comp_hash[old_idx[present]] == old_hash[present]
+        changed = ~unchanged
+        n_changed = int(changed.sum())
+        n_removed = int((~present).sum())
+        if n_changed + n_removed > max_changed * n:
+            feedback.pushInfo(
+                "Rianalisi incrementale: %d componenti modificati e %d rimossi "
+                "(oltre il %d%% del layer): ricalcolo completo." % (
+                    n_changed, n_removed, int(max_changed * 100)))
+            return None
+
+        # membri dei corsi salvati, riportati agli indici correnti
+        m_idx = index_of(c_fid)
+        m_course = np.repeat(np.arange(n_old_courses), np.diff(c_off))
+        bad = m_idx < 0
+        bad[~bad] = changed[m_idx[~bad]]
+        affected = np.zeros(n_old_courses, dtype=bool)
+        affected[m_course[bad]] = True
+
+        # fascia verticale di ogni corso (dai membri invariati): i corsi che
+        # intersecano la nuova posizione di un componente modificato sono
+        # ricostruiti, perche' il componente potrebbe agganciarvisi
+        ok = ~bad
+        lo = np.full(n_old_courses, np.inf)
+        hi = np.full(n_old_courses, -np.inf)
+        mi = m_idx[ok]
+        np.minimum.at(lo, m_course[ok], cy[mi] - h[mi] / 2.0)
+        np.maximum.at(hi, m_course[ok], cy[mi] + h[mi] / 2.0)
+        for i in np.flatnonzero(changed & valid).tolist():
+            affected |= (lo <= cy[i] + h[i] / 2.0) & (hi >= cy[i] - h[i] / 2.0)
+
+        # corsi adiacenti sopra e sotto (i corsi salvati sono dal basso in alto)
+        near = affected.copy()
+        near[1:] |= affected[:-1]
+        near[:-1] |= affected[1:]
+        affected = near
+
+        redo = np.zeros(n, dtype=bool)
+        redo[m_idx[affected[m_course] & ok]] = True
+        redo |= changed
+        redo &= valid
+        redo_idx = np.flatnonzero(redo)
+
+        kept = np.split(m_idx, c_off[1:-1])
+        courses = [c for c, a in zip(kept, affected) if not a]
+        if redo_idx.size:
+            courses += [redo_idx[np.asarray(c, dtype=np.int64)]
+                        for c in CourseAnalysis._detect_courses(
+                            cx[redo_idx], cy[redo_idx], w[redo_idx], h[redo_idx],
+                            *tols)]
+        feedback.pushInfo(
+            "Rianalisi incrementale: %d componenti modificati/nuovi, %d rimossi; "
+            "%d corsi su %d ricostruiti (%d componenti rielaborati)." % (
+                n_changed, n_removed, int(affected.sum()), n_old_courses,
+                redo_idx.size))
+        return CourseAnalysis._order_courses(
+            courses, cx.tolist(), cy.tolist(), w.tolist(), h.tolist())
+
+    @staticmethod
+    def _inclination_deg(cx, cy, off):
+        """Inclinazione di ciascun corso: fit y = m x + b sui centroidi, angolo
+        in gradi. Y verso l'alto: positivo = corso che sale verso destra.
+
+        cx, cy: centroidi dei pezzi concatenati corso per corso; off: array
+        (C+1,) degli indici di inizio dei corsi. La pendenza ai minimi quadrati
+        e' calcolata per gruppo con somme centrate (np.bincount), equivalente a
+        np.polyfit di grado 1. Ritorna un array (C,): 0.0 per corsi con meno di
+        2 pezzi, 90.0 se tutti i centroidi hanno la stessa X (fit degenere).
+        """
+        sizes = np.diff(off)
+        starts = off[:-1]
+        nc = sizes.size
+        cid = np.repeat(np.arange(nc), sizes)
+        xm = np.bincount(cid, weights=cx, minlength=nc) / sizes
+        ym = np.bincount(cid, weights=cy, minlength=nc) / sizes
+        dx = cx - xm[cid]
+        dy = cy - ym[cid]
+        sxx = np.bincount(cid, weights=dx * dx, minlength=nc)
+        sxy = np.bincount(cid, weights=dx * dy, minlength=nc)
+        ptp_x = np.maximum.reduceat(cx, starts) - np.minimum.reduceat(cx, starts)
+        ptp_y = np.maximum.reduceat(cy, starts) - np.minimum.reduceat(cy, starts)
+
+        deg = np.zeros(nc)
+        multi = sizes >= 2
+        fit = multi & (ptp_x >= 1e-12)
+        deg[fit] = np.degrees(np.arctan(sxy[fit] / sxx[fit]))
         # se tutti i centroidi hanno la stessa X il fit e' degenere
-        if np.ptp(xs) < 1e-12:
-            return 90.0 if np.ptp(ys) > 0 else 0.0
-        slope = np.polyfit(xs, ys, 1)[0]
-        return math.degrees(math.atan(slope))
+        deg[multi & (ptp_x < 1e-12) & (ptp_y > 0)] = 90.0
+        return deg
+
+    @staticmethod
+    def _course_table(cx, cy, w, h, off):
+        """Sintesi per corso come array strutturato COURSE_DTYPE.
+
+        cx, cy, w, h: array dei pezzi concatenati corso per corso (corsi dal
+        basso verso l'alto, pezzi per X crescente); off: array (C+1,) degli
+        indici di inizio dei corsi. Tutte le grandezze sono ridotte per gruppo
+        (np.add.reduceat e simili), senza oggetti Python per corso. I campi di
+        giunto e di segmento sono inizializzati a NULL (NaN) / segmento 1.
+        """
+        sizes = np.diff(off)
+        starts = off[:-1]
+        nc = sizes.size
+        cid = np.repeat(np.arange(nc), sizes)
+
+        tab = np.zeros(nc, dtype=COURSE_DTYPE)
+        tab['corso_id'] = np.arange(1, nc + 1)
+        tab['n_pezzi'] = sizes
+        quota = np.add.reduceat(cy, starts) / sizes
+        # altezza rappresentativa (mediana): altezze ordinate entro ogni corso,
+        # poi media dei due valori centrali (coincidenti se n_pezzi e' dispari)
+        hs = h[np.lexsort((h, cid))]
+        alt = 0.5 * (hs[starts + (sizes - 1) // 2] + hs[starts + sizes // 2])
+        tab['quota_media'] = quota
+        tab['altezza_corso'] = alt
+        tab['lunghezza_corso'] = (np.maximum.reduceat(cx + w / 2.0, starts)
+                                  - np.minimum.reduceat(cx - w / 2.0, starts))
+        tab['inclinaz_deg'] = CourseAnalysis._inclination_deg(cx, cy, off)
+        tab['letto_malta_sup'] = np.nan
+        tab['sfalso_giunti_sup'] = np.nan
+        tab['segmento'] = 1
+        tab['cesura'] = 0
+        tab['_sup'] = quota + alt / 2.0
+        tab['_inf'] = quota - alt / 2.0
+        tab['_avg_w'] = np.add.reduceat(w, starts) / sizes
+        return tab
 
     @staticmethod
     def _joint_stagger(joints_lower, joints_upper, avg_w):
@@ -336,18 +667,85 @@ class CourseAnalysis(QgsProcessingAlgorithm):
                  giunto passante tra settori o fasi);
           ~0.5 = sfalsamento di mezzo pezzo (ammorsatura regolare).
         Ritorna None se uno dei due corsi non ha giunti (corsi di 1 pezzo).
+        Caso particolare (una sola coppia) di _joint_stagger_batch.
         """
-        if not joints_lower or not joints_upper or avg_w <= 0:
+        if not len(joints_lower) or not len(joints_upper) or avg_w <= 0:
             return None
-        up = np.asarray(joints_upper, dtype=float)
-        vals = []
-        for jx in joints_lower:
-            d = np.min(np.abs(up - jx)) / avg_w   # distanza in frazioni di passo
-            frac = d - math.floor(d)              # fase entro un passo [0,1)
-            if frac > 0.5:
-                frac = 1.0 - frac                 # simmetria: 0.5 = max sfalsamento
-            vals.append(frac)
-        return float(np.mean(vals))
+        xs = np.concatenate([np.asarray(joints_lower, dtype=float),
+                             np.asarray(joints_upper, dtype=float)])
+        offsets = [0, len(joints_lower), xs.size]
+        res = CourseAnalysis._joint_stagger_batch(xs, offsets, [avg_w, 0.0])
+        return None if np.isnan(res[0]) else float(res[0])
+
+    @staticmethod
+    def _joint_stagger_batch(joint_xs, offsets, avg_ws):
+        """Sfalsamento dei giunti per TUTTE le coppie di corsi adiacenti in
+        un'unica chiamata vettoriale.
+
+        joint_xs: posizioni X dei giunti di tutti i corsi, concatenate
+                  nell'ordine dei corsi (dal basso verso l'alto);
+        offsets:  array (C+1,) di indici: i giunti del corso k sono
+                  joint_xs[offsets[k]:offsets[k+1]];
+        avg_ws:   larghezza media dei pezzi di ciascun corso (C,).
+
+        Ritorna un array (C,) con lo sfalsamento del corso k rispetto al
+        corso k+1 (stessa definizione di _joint_stagger), NaN dove non e'
+        definito (ultimo corso, corsi senza giunti, larghezza non valida).
+
+        I giunti sono ordinati una sola volta entro ciascun corso codificando
+        (corso, x) in una chiave monotona corso + x_normalizzata, con
+        x_normalizzata in [0, 1): con np.searchsorted sulla chiave si trova
+        per ogni giunto inferiore il punto d'inserzione nel corso superiore, e
+        il giunto piu' vicino e' uno dei due adiacenti. Costo O(L log U)
+        complessivo invece di O(L x U) per coppia.
+        """
+        xs = np.asarray(joint_xs, dtype=float)
+        off = np.asarray(offsets, dtype=np.int64)
+        aw = np.asarray(avg_ws, dtype=float)
+        nc = off.size - 1
+        out = np.full(max(nc, 0), np.nan)
+        if nc < 2 or xs.size == 0:
+            return out
+
+        counts = np.diff(off)
+        seg = np.repeat(np.arange(nc), counts)
+
+        # chiave monotona (corso, x): l'ordinamento per chiave ordina i giunti
+        # entro ogni corso lasciando invariati i blocchi (e quindi gli offsets)
+        lo = float(xs.min())
+        span = float(np.ptp(xs)) + 1.0
+        key = seg + (xs - lo) / span
+        order = np.argsort(key, kind='stable')
+        key_s = key[order]
+        xs_s = xs[order]
+
+        # interrogazioni: i giunti di ogni corso che ha un corso superiore
+        q = seg < nc - 1
+        qseg = seg[q]
+        qx = xs[q]
+        up = qseg + 1
+        has_up = counts[up] > 0
+        start = off[up]
+        end = off[up + 1]
+        pos = np.searchsorted(key_s, up + (qx - lo) / span)
+        # vicini a destra e a sinistra del punto d'inserzione, confinati nel
+        # blocco del corso superiore (indici fittizi dove il blocco e' vuoto)
+        last = xs_s.size - 1
+        right = np.clip(np.minimum(pos, end - 1), 0, last)
+        left = np.clip(np.maximum(pos - 1, start), 0, last)
+        d = np.minimum(np.abs(xs_s[right] - qx), np.abs(xs_s[left] - qx))
+
+        w = aw[qseg]
+        ok = has_up & (w > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = np.where(ok, d / np.where(w > 0, w, 1.0), 0.0)  # frazioni di passo
+        frac = d - np.floor(d)                                 # fase entro un passo [0,1)
+        frac = np.where(frac > 0.5, 1.0 - frac, frac)          # simmetria: 0.5 = max sfalsamento
+
+        sums = np.bincount(qseg[ok], weights=frac[ok], minlength=nc)
+        cnts = np.bincount(qseg[ok], minlength=nc)
+        np.divide(sums, cnts, out=out, where=cnts > 0)
+        return out
 
     # ----------------------------------------------------------------------
     #  Change-point detection sulla serie ordinata dei corsi (discontinuita')
@@ -441,18 +839,69 @@ class CourseAnalysis(QgsProcessingAlgorithm):
     def _segments_from_bkps(n, bkps):
         """Assegna a ciascuno degli n elementi (ordinati) un id di segmento
         1-based, dai breakpoint (indici di inizio dei nuovi segmenti)."""
-        labels = np.ones(n, dtype=int)
-        seg = 1
-        bset = set(bkps)
-        for i in range(n):
-            if i in bset:
-                seg += 1
-            labels[i] = seg
-        return labels
+        marks = np.zeros(n, dtype=int)
+        b = np.asarray(list(bkps), dtype=int)
+        marks[b[(b >= 0) & (b < n)]] = 1
+        return 1 + np.cumsum(marks)
+
+    @staticmethod
+    def _segment_stats(segmento, values):
+        """Statistiche per segmento di una colonna della sintesi per corso.
+
+        segmento: id di segmento 1-based per corso; values: colonna float con
+        NaN = NULL. Ritorna (n_corsi, n_validi, media, dev. std campionaria)
+        come array indicizzati da segmento - 1, calcolati con np.bincount
+        (due passate per la varianza)."""
+        s0 = np.asarray(segmento, dtype=int) - 1
+        ns = int(s0.max()) + 1 if s0.size else 0
+        n_c = np.bincount(s0, minlength=ns)
+        ok = ~np.isnan(values)
+        sv, vv = s0[ok], values[ok]
+        cnt = np.bincount(sv, minlength=ns)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mu = np.bincount(sv, weights=vv, minlength=ns) / cnt
+            ss = np.bincount(sv, weights=(vv - mu[sv]) ** 2, minlength=ns)
+            sd = np.sqrt(ss / (cnt - 1))
+        return n_c, cnt, mu, sd
+
+    # ----------------------------------------------------------------------
+    #  Lettura e scrittura diretta dei GeoPackage
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _read_gpkg(gpkg_in, names, source, feedback):
+        """Campi, centroidi e bbox letti con SQL; None se non applicabile"""
+        try:
+            direct = mat_gpkg.read_components(*gpkg_in, names)
+        except mat_gpkg.GpkgError as e:
+            feedback.pushWarning("Lettura diretta del GeoPackage non riuscita: %s" % e)
+            direct = None
+        if direct is None or direct[0].size != source.featureCount():
+            feedback.pushInfo("Lettura diretta non applicabile: si usa la lettura di QGIS.")
+            return None
+        feedback.pushInfo("Lettura diretta dal GeoPackage: %d componenti." % direct[0].size)
+        return direct
 
+    def _write_gpkg(self, gpkg_in, gpkg_out, fid, extra, bounds, feedback, p0, p1):
+        """Copia ingresso + colonne calcolate con SQL in blocco; False se non riesce"""
+        try:
+            ok = mat_gpkg.copy_with_columns(
+                gpkg_in, gpkg_out, fid, extra, bounds, batch=self.OUTPUT_BATCH,
+                progress=lambda f: feedback.setProgress(p0 + int((p1 - p0) * f)))
+        except mat_gpkg.GpkgError as e:
+            feedback.pushWarning("Scrittura diretta nel GeoPackage non riuscita (%s): "
+                                 "si usa la scrittura di QGIS." % e)
+            return False
+        if not ok:
+            feedback.pushInfo("Campi dell'output diversi dall'ingresso: "
+                              "si usa la scrittura di QGIS.")
+            return False
+        feedback.pushInfo("Output scritto direttamente nel GeoPackage: %s" % gpkg_out[0])
+        return True
+
+    @profilable(PROFILE)
     def processAlgorithm(self, parameters, context, feedback):
+        prof = StageProfiler(self.name(), feedback)
         source = self.parameterAsSource(parameters, self.INPUT, context)
-        f_id = self.parameterAsString(parameters, self.FIELD_ID, context)
         f_len = self.parameterAsString(parameters, self.FIELD_LEN, context)
         f_hgt = self.parameterAsString(parameters, self.FIELD_HGT, context)
         y_tol_f = self.parameterAsDouble(parameters, self.Y_TOL, context)
@@ -463,6 +912,16 @@ class CourseAnalysis(QgsProcessingAlgorithm):
         do_days = self.parameterAsBool(parameters, self.DO_DAYS, context)
         days_series = self.parameterAsInt(parameters, self.DAYS_SERIES, context)
         days_pen = self.parameterAsDouble(parameters, self.DAYS_PEN, context)
+        state_path = self.parameterAsFileOutput(parameters, self.STATE_FILE, context)
+        tols = (y_tol_f, ytb_tol_f, h_tol_f, x_gap_f)
+        gpkg_in = None
+        if self.parameterAsBool(parameters, self.GPKG_DIRECT, context):
+            gpkg_in = mat_gpkg.source_table(
+                self.parameterAsVectorLayer(parameters, self.INPUT, context),
+                parameters.get(self.INPUT))
+            if gpkg_in is None:
+                feedback.pushInfo("L'ingresso non e' una tabella GeoPackage senza filtri: "
+                                  "si usa la lettura di QGIS.")
         # il rilevamento delle discontinuita' sui letti/sfalsamento richiede
         # l'analisi dei giunti: se l'utente chiede una serie che dipende da quei
         # campi ma non ha attivato i giunti, li attiviamo implicitamente.
@@ -472,189 +931,208 @@ class CourseAnalysis(QgsProcessingAlgorithm):
                 "Il segnale scelto richiede l'analisi dei giunti: "
                 "attivata automaticamente.")
 
+        prof.lap('LETTURA DATI')
         # --- lettura dati ---
-        feats = list(source.getFeatures())
-        n = len(feats)
+        direct = self._read_gpkg(gpkg_in, [f_len, f_hgt], source, feedback) \
+            if gpkg_in else None
+        if direct is not None:
+            comp_fid, cols, cxy, bounds = direct
+            comp_cx, comp_cy = cxy[:, 0], cxy[:, 1]
+            comp_w, comp_h = cols[f_len], cols[f_hgt]
+            # un valore NULL annulla entrambe le dimensioni, come nella lettura di QGIS
+            bad = np.isnan(comp_w) | np.isnan(comp_h)
+            comp_w[bad] = comp_h[bad] = np.nan
+            n = comp_fid.size
+        else:
+            # Una sola passata sul source, leggendo solo i campi dimensionali
+            # e il centroide: le geometrie NON restano in memoria e vengono
+            # rilette in streaming al momento della scrittura dell'output.
+            gpkg_in = bounds = None
+            req = QgsFeatureRequest().setSubsetOfAttributes(
+                [f_len, f_hgt], source.fields())
+            fids, xs, ys, ws, hs = [], [], [], [], []
+            for ft in source.getFeatures(req):
+                try:
+                    w = float(ft[f_len])
+                    h = float(ft[f_hgt])
+                except (TypeError, ValueError):
+                    w = h = float('nan')
+                c = ft.geometry().centroid().asPoint()
+                fids.append(ft.id())
+                xs.append(c.x())
+                ys.append(c.y())
+                ws.append(w)
+                hs.append(h)
+            n = len(fids)
+            comp_fid = np.array(fids, dtype=np.int64)
+            comp_cx = np.array(xs, dtype=float)
+            comp_cy = np.array(ys, dtype=float)
+            comp_w = np.array(ws, dtype=float)
+            comp_h = np.array(hs, dtype=float)
+            del fids, xs, ys, ws, hs
         if n < 2:
             raise Exception("Servono almeno 2 componenti per l'analisi dei corsi.")
 
-        items = []
-        for i, ft in enumerate(feats):
-            try:
-                w = float(ft[f_len])
-                h = float(ft[f_hgt])
-            except (TypeError, ValueError):
-                w = h = float('nan')
-            c = ft.geometry().centroid().asPoint()
-            items.append({
-                'cx': c.x(), 'cy': c.y(),
-                'w': w, 'h': h,
-                'idx': i, 'fid': ft[f_id],
-            })
-
         # scarta i componenti senza dimensioni valide (non raggruppabili)
-        valid = [it for it in items if not (math.isnan(it['w']) or math.isnan(it['h']))]
-        n_skip = n - len(valid)
+        valid_idx = np.flatnonzero(~(np.isnan(comp_w) | np.isnan(comp_h)))
+        n_skip = n - valid_idx.size
         if n_skip:
             feedback.pushWarning(
                 "%d componenti privi di dimensioni valide: esclusi dai corsi "
                 "(corso_id = NULL)." % n_skip)
-        if len(valid) < 2:
+        if valid_idx.size < 2:
             raise Exception("Meno di 2 componenti con dimensioni valide.")
 
+        prof.lap('RICONOSCIMENTO CORSI', n_in=int(valid_idx.size))
+        # --- stato della rianalisi incrementale (opzionale) ---
+        comp_hash = None
+        state = None
+        if state_path:
+            comp_hash = self._feature_hash(comp_cx, comp_cy, comp_w, comp_h)
+            state = self._load_state(state_path, tols, feedback)
+
         # --- riconoscimento corsi ---
         feedback.pushInfo("Riconoscimento corsi in corso...")
-        courses = self._detect_courses(valid, y_tol_f, ytb_tol_f, h_tol_f, x_gap_f)
+        courses = None
+        if state is not None:
+            valid_mask = np.zeros(n, dtype=bool)
+            valid_mask[valid_idx] = True
+            courses = self._update_courses(
+                state, comp_fid, comp_hash, comp_cx, comp_cy, comp_w, comp_h,
+                valid_mask, tols, self.INCREMENTAL_MAX_CHANGED, feedback)
+        if courses is None:
+            courses = [valid_idx[np.asarray(c, dtype=np.int64)]
+                       for c in self._detect_courses(
+                           comp_cx[valid_idx], comp_cy[valid_idx],
+                           comp_w[valid_idx], comp_h[valid_idx], *tols)]
         feedback.pushInfo("Trovati %d corsi (su %d componenti validi)." % (
-            len(courses), len(valid)))
-
-        # --- mappa idx -> (corso_id, pos_in_corso) e metadati per corso ---
-        course_of = {}      # idx componente -> corso_id (1-based, dal basso)
-        pos_of = {}         # idx componente -> posizione nel corso (1-based, da sx)
-        joint_of = {}       # idx componente -> giunto verticale verso il pezzo a destra
-        course_meta = []    # lista di dict di sintesi per corso
-
-        for ci, course in enumerate(courses, start=1):
-            hs = [b['h'] for b in course]
-            ws = [b['w'] for b in course]
-            cys = [b['cy'] for b in course]
-            xs_left = [b['cx'] - b['w'] / 2.0 for b in course]
-            xs_right = [b['cx'] + b['w'] / 2.0 for b in course]
-
-            quota = float(np.mean(cys))
-            alt = float(np.median(hs))            # altezza rappresentativa (mediana)
-            lung = float(max(xs_right) - min(xs_left))
-            incl = self._inclination_deg(course)
-
-            for pos, b in enumerate(course, start=1):
-                course_of[b['idx']] = ci
-                pos_of[b['idx']] = pos
-
+            len(courses), valid_idx.size))
+
+        prof.lap('SINTESI PER CORSO', n_in=int(valid_idx.size))
+        # --- pezzi concatenati corso per corso (dal basso, da sinistra) ---
+        sizes = np.array([len(c) for c in courses], dtype=np.int64)
+        off = np.concatenate([[0], np.cumsum(sizes)])
+        n_courses = sizes.size
+        members = np.concatenate(courses)
+        del courses
+        cx = comp_cx[members]
+        cy = comp_cy[members]
+        w = comp_w[members]
+        h = comp_h[members]
+
+        # --- array densi per componente (indice = ordine di lettura) ---
+        # 0 = NULL per i campi interi, NaN = NULL per i campi reali
+        course_of = np.zeros(n, dtype=np.int32)   # corso_id (1-based, dal basso)
+        pos_of = np.zeros(n, dtype=np.int32)      # posizione nel corso (1-based, da sx)
+        npz_of = np.zeros(n, dtype=np.int32)      # numero di pezzi del corso
+        joint_of = np.full(n, np.nan)             # giunto verticale verso il pezzo a destra
+        course_of[members] = np.repeat(np.arange(1, n_courses + 1), sizes)
+        pos_of[members] = np.arange(members.size) - np.repeat(off[:-1], sizes) + 1
+        npz_of[members] = np.repeat(sizes, sizes)
+
+        # --- sintesi per corso (colonnare) ---
+        tab = self._course_table(cx, cy, w, h, off)
+
+        prof.lap('ANALISI DEI GIUNTI', n_in=n_courses)
+        # --- analisi dei giunti tra corsi (opzionale) ---
+        # I corsi sono gia' ordinati dal basso verso l'alto in tab.
+        if do_joints:
             # giunto verticale (di testa) tra pezzi contigui dello stesso corso:
             # spazio libero tra il bordo destro di un pezzo e il bordo sinistro
             # del successivo. L'ultimo pezzo del corso non ha pezzo a destra.
-            # Si memorizzano anche le posizioni X dei giunti (punto medio del gap)
-            # per il calcolo dello sfalsamento tra corsi.
-            joint_xs = []
-            if do_joints:
-                for pp in range(len(course)):
-                    b = course[pp]
-                    if pp + 1 < len(course):
-                        nb = course[pp + 1]
-                        right_b = b['cx'] + b['w'] / 2.0
-                        left_nb = nb['cx'] - nb['w'] / 2.0
-                        gap = left_nb - right_b
-                        joint_of[b['idx']] = float(gap)
-                        joint_xs.append((right_b + left_nb) / 2.0)
-                    else:
-                        joint_of[b['idx']] = None  # ultimo pezzo del corso
-
-            course_meta.append({
-                'corso_id': ci,
-                'n_pezzi': len(course),
-                'quota_media': quota,
-                'altezza_corso': alt,
-                'lunghezza_corso': lung,
-                'inclinaz_deg': incl,
-                # bordi rappresentativi per il calcolo del letto di malta
-                '_sup': quota + alt / 2.0,
-                '_inf': quota - alt / 2.0,
-                # posizioni X dei giunti verticali e larghezza media (per ammorsatura)
-                '_joint_xs': joint_xs,
-                '_avg_w': float(np.mean(ws)),
-            })
-
-        # --- analisi dei giunti tra corsi (opzionale) ---
-        # I corsi sono gia' ordinati dal basso verso l'alto in course_meta.
-        if do_joints:
-            for k in range(len(course_meta)):
-                if k + 1 < len(course_meta):
-                    sopra = course_meta[k + 1]
-                    # letto di malta orizzontale verso il corso superiore
-                    letto = sopra['_inf'] - course_meta[k]['_sup']
-                    course_meta[k]['letto_malta_sup'] = float(letto)
-                    # sfalsamento dei giunti verticali rispetto al corso superiore
-                    course_meta[k]['sfalso_giunti_sup'] = self._joint_stagger(
-                        course_meta[k]['_joint_xs'], sopra['_joint_xs'],
-                        course_meta[k]['_avg_w'])
-                else:
-                    course_meta[k]['letto_malta_sup'] = None    # ultimo corso
-                    course_meta[k]['sfalso_giunti_sup'] = None
-            neg = sum(1 for c in course_meta
-                      if c.get('letto_malta_sup') is not None and c['letto_malta_sup'] < 0)
+            # Le posizioni X dei giunti (punto medio del gap) servono per il
+            # calcolo dello sfalsamento tra corsi.
+            left = cx - w / 2.0
+            right = cx + w / 2.0
+            has_next = np.ones(members.size, dtype=bool)
+            has_next[off[1:] - 1] = False
+            gap = np.full(members.size, np.nan)
+            gap[:-1] = left[1:] - right[:-1]
+            gap[~has_next] = np.nan
+            joint_of[members] = gap
+            joint_xs = ((right[:-1] + left[1:]) / 2.0)[has_next[:-1]]
+            # ogni corso di n pezzi ha n-1 giunti
+            joint_off = off - np.arange(n_courses + 1)
+
+            # letto di malta orizzontale verso il corso superiore (NULL sull'ultimo)
+            tab['letto_malta_sup'][:-1] = tab['_inf'][1:] - tab['_sup'][:-1]
+            # sfalsamento dei giunti verticali rispetto al corso superiore, per
+            # tutte le coppie di corsi adiacenti in un'unica passata vettoriale
+            tab['sfalso_giunti_sup'] = self._joint_stagger_batch(
+                joint_xs, joint_off, tab['_avg_w'])
+            neg = int(np.sum(tab['letto_malta_sup'] < 0))
             if neg:
                 feedback.pushInfo(
                     "Nota: %d corsi hanno letto_malta_sup negativo (sovrapposizione "
                     "verticale dei corsi: zone irregolari, rincocci o assegnazioni "
                     "di corso da verificare)." % neg)
 
+        prof.lap('CHANGE-POINT', n_in=n_courses)
         # --- rilevamento delle discontinuita' (change-point sui corsi) ---
         # default: ogni corso appartiene al segmento 1, nessuna cesura.
-        for c in course_meta:
-            c['segmento'] = 1
-            c['cesura'] = 0
-        if do_days and len(course_meta) >= 4:
-            # costruisci la serie ordinata (course_meta e' gia' dal basso in alto)
-            def col(key):
-                return [c.get(key) for c in course_meta]
+        # cp_*: segnale e cesure dell'ultima analisi, salvati nel file di stato
+        cp_key = np.array([days_series, days_pen], dtype=float)
+        cp_signal = np.empty((0, 0))
+        cp_bkps = np.empty(0, dtype=np.int64)
+        if do_days and n_courses >= 4:
+            # serie ordinata (tab e' gia' dal basso in alto), una colonna per segnale
             if days_series == 1:
-                raw = [[v] for v in col('altezza_corso')]
+                cols = ['altezza_corso']
                 label = 'altezza_corso'
             elif days_series == 2:
-                raw = [[v] for v in col('sfalso_giunti_sup')]
+                cols = ['sfalso_giunti_sup']
                 label = 'sfalso_giunti_sup'
             elif days_series == 3:
-                raw = [[a, b] for a, b in zip(col('letto_malta_sup'),
-                                              col('sfalso_giunti_sup'))]
+                cols = ['letto_malta_sup', 'sfalso_giunti_sup']
                 label = 'letto + sfalsamento'
             elif days_series == 4:
-                raw = [[a, b, h] for a, b, h in zip(col('letto_malta_sup'),
-                                                    col('sfalso_giunti_sup'),
-                                                    col('altezza_corso'))]
+                cols = ['letto_malta_sup', 'sfalso_giunti_sup', 'altezza_corso']
                 label = 'letto + sfalsamento + altezza'
             else:
-                raw = [[v] for v in col('letto_malta_sup')]
+                cols = ['letto_malta_sup']
                 label = 'letto_malta_sup'
+            raw = np.column_stack([tab[c] for c in cols])
 
             # i campi di giunto sono NULL sull'ultimo corso (e su eventuali corsi
             # di 1 pezzo per lo sfalsamento): si considera solo il prefisso di
             # corsi con valori tutti validi, su cui il change-point e' definito.
-            valid_len = len(raw)
-            for i, row in enumerate(raw):
-                if any(v is None or (isinstance(v, float) and math.isnan(v)) for v in row):
-                    valid_len = i
-                    break
+            bad = np.isnan(raw).any(axis=1)
+            valid_len = int(np.argmax(bad)) if bad.any() else n_courses
             if valid_len >= 4:
-                sig = np.array(raw[:valid_len], dtype=float)
-                bkps = self._changepoints(sig, days_pen, feedback)
+                cp_signal = raw[:valid_len]
+                if (state is not None
+                        and np.array_equal(state.get('cp_key'), cp_key)
+                        and np.array_equal(state.get('cp_signal'), cp_signal)):
+                    # segnale identico all'esecuzione precedente: cesure riusate
+                    bkps = state['cp_bkps'].tolist()
+                    feedback.pushInfo(
+                        "Segnale delle discontinuita' invariato: cesure riusate "
+                        "dal file di stato.")
+                else:
+                    bkps = self._changepoints(cp_signal, days_pen, feedback)
+                cp_bkps = np.asarray(bkps, dtype=np.int64)
                 labels = self._segments_from_bkps(valid_len, bkps)
-                for i in range(valid_len):
-                    course_meta[i]['segmento'] = int(labels[i])
-                    course_meta[i]['cesura'] = 1 if i in set(bkps) else 0
+                tab['segmento'][:valid_len] = labels
+                tab['cesura'][np.asarray(bkps, dtype=int)] = 1
                 # i corsi di coda senza segnale valido ereditano l'ultimo segmento
-                last_seg = int(labels[-1]) if valid_len > 0 else 1
-                for i in range(valid_len, len(course_meta)):
-                    course_meta[i]['segmento'] = last_seg
-                    course_meta[i]['cesura'] = 0
+                tab['segmento'][valid_len:] = labels[-1]
 
-                nseg = len(set(c['segmento'] for c in course_meta))
+                n_c, cnt, mu, sd = self._segment_stats(
+                    tab['segmento'], tab['letto_malta_sup'])
+                nseg = int(np.count_nonzero(n_c))
                 feedback.pushInfo(
                     "Discontinuita' (segnale: %s): %d cesure -> %d segmenti."
                     % (label, len(bkps), nseg))
                 # statistica per segmento
-                for s in sorted(set(c['segmento'] for c in course_meta)):
-                    membri = [c for c in course_meta if c['segmento'] == s]
-                    vals = [c.get('letto_malta_sup') for c in membri
-                            if c.get('letto_malta_sup') is not None]
-                    if len(vals) >= 2:
-                        mu = float(np.mean(vals)); sd = float(np.std(vals, ddof=1))
-                        cv = sd / mu if abs(mu) > 1e-12 else float('nan')
+                for si in np.flatnonzero(n_c):
+                    if cnt[si] >= 2:
+                        cv = sd[si] / mu[si] if abs(mu[si]) > 1e-12 else float('nan')
                         feedback.pushInfo(
                             "  segmento %d: %d corsi, letto medio=%.4f CV=%.3f"
-                            % (s, len(membri), mu, cv))
+                            % (si + 1, n_c[si], mu[si], cv))
                     else:
                         feedback.pushInfo(
-                            "  segmento %d: %d corsi" % (s, len(membri)))
+                            "  segmento %d: %d corsi" % (si + 1, n_c[si]))
             else:
                 feedback.pushInfo(
                     "Rilevamento discontinuita' saltato: meno di 4 corsi con segnale valido.")
@@ -662,6 +1140,15 @@ class CourseAnalysis(QgsProcessingAlgorithm):
             feedback.pushInfo(
                 "Rilevamento discontinuita' saltato: servono almeno 4 corsi.")
 
+        if state_path:
+            self._save_state(
+                state_path, feedback,
+                tols=np.asarray(tols, dtype=float),
+                fid=comp_fid, hash=comp_hash,
+                course_fid=comp_fid[members], course_off=off,
+                cp_key=cp_key, cp_signal=cp_signal, cp_bkps=cp_bkps)
+
+        prof.lap('SCRITTURA COMPONENTI', n_in=n)
         # ===== OUTPUT 1: componenti con corso =====
         out_fields = QgsFields()
         for fld in source.fields():
@@ -683,30 +1170,58 @@ class CourseAnalysis(QgsProcessingAlgorithm):
             parameters, self.OUTPUT, context, out_fields,
             source.wkbType(), source.sourceCrs())
 
-        seg_by_course = {c['corso_id']: c['segmento'] for c in course_meta}
-        n_pezzi_by_course = {c['corso_id']: c['n_pezzi'] for c in course_meta}
-        for i, ft in enumerate(feats):
+        # colonne aggiunte come liste Python con i NULL gia' risolti (0 per i
+        # campi interi, NaN per i reali -> None): accesso scalare rapido nel ciclo
+        seg_of = np.zeros(n, dtype=np.int32)
+        assigned = course_of > 0
+        seg_of[assigned] = tab['segmento'][course_of[assigned] - 1]
+        int_cols = [course_of, pos_of, npz_of]
+        if do_days:
+            int_cols.append(seg_of)
+        extra_cols = [[v or None for v in a.tolist()] for a in int_cols]
+        if do_joints:
+            # giunto_vert precede segmento nell'ordine dei campi
+            extra_cols.insert(3, [None if v != v else v for v in joint_of.tolist()])
+        del course_of, pos_of, npz_of, joint_of, seg_of, int_cols
+
+        written = False
+        gpkg_out = mat_gpkg.sink_table(dest_id) if gpkg_in else None
+        if gpkg_out:
+            # la tabella creata (vuota) da QGIS va chiusa prima di scriverci
+            del sink
+            written = self._write_gpkg(
+                gpkg_in, gpkg_out, comp_fid,
+                list(zip([nm for nm, _ in new_comp], extra_cols)), bounds,
+                feedback, 0, 60)
+            if not written:
+                (sink, dest_id) = self.parameterAsSink(
+                    parameters, self.OUTPUT, context, out_fields,
+                    source.wkbType(), source.sourceCrs())
+
+        # geometrie e attributi riletti in streaming dal source, scritti a blocchi
+        idx_by_fid = None
+        batch = []
+        for i, ft in enumerate(source.getFeatures() if not written else ()):
+            if i >= n or ft.id() != comp_fid[i]:
+                # ordine di lettura diverso dalla prima passata: si ripiega
+                # sulla ricerca per fid (costruita una sola volta)
+                if idx_by_fid is None:
+                    idx_by_fid = {f: k for k, f in enumerate(comp_fid.tolist())}
+                i = idx_by_fid[ft.id()]
             g = QgsFeature(out_fields)
             g.setGeometry(ft.geometry())
-            cid = course_of.get(i)
-            pos = pos_of.get(i)
-            npz = n_pezzi_by_course.get(cid) if cid is not None else None
-            attrs = list(ft.attributes()) + [
-                int(cid) if cid is not None else None,
-                int(pos) if pos is not None else None,
-                int(npz) if npz is not None else None,
-            ]
-            if do_joints:
-                gv = joint_of.get(i)
-                attrs.append(float(gv) if gv is not None else None)
-            if do_days:
-                seg = seg_by_course.get(cid) if cid is not None else None
-                attrs.append(int(seg) if seg is not None else None)
+            attrs = ft.attributes()
+            attrs.extend(col[i] for col in extra_cols)
             g.setAttributes(attrs)
-            sink.addFeature(g, QgsFeatureSink.FastInsert)
-            if n:
+            batch.append(g)
+            if len(batch) >= self.OUTPUT_BATCH:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                batch = []
                 feedback.setProgress(int(60.0 * i / n))
+        if batch:
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
 
+        prof.lap('SCRITTURA SINTESI', n_in=n_courses)
         # ===== OUTPUT 2: sintesi per corso =====
         cfields = QgsFields()
         cfields.append(QgsField('corso_id', QVariant.Int))
@@ -726,7 +1241,7 @@ class CourseAnalysis(QgsProcessingAlgorithm):
             parameters, self.OUTPUT_COURSES, context, cfields,
             QgsWkbTypes.NoGeometry)
 
-        for c in course_meta:
+        for c in tab:
             f = QgsFeature(cfields)
             attrs = [
                 int(c['corso_id']), int(c['n_pezzi']),
@@ -734,13 +1249,22 @@ class CourseAnalysis(QgsProcessingAlgorithm):
                 float(c['lunghezza_corso']), float(c['inclinaz_deg']),
             ]
             if do_joints:
-                attrs.append(c['letto_malta_sup'])
-                attrs.append(c['sfalso_giunti_sup'])
+                for key in ('letto_malta_sup', 'sfalso_giunti_sup'):
+                    attrs.append(float(c[key]) if not np.isnan(c[key]) else None)
             if do_days:
                 attrs.append(int(c['segmento']))
                 attrs.append(int(c['cesura']))
             f.setAttributes(attrs)
             csink.addFeature(f, QgsFeatureSink.FastInsert)
 
+        prof.finish(n_out=n_courses)
         feedback.pushInfo("Analisi dei corsi completata.")
-        return {self.OUTPUT: dest_id, self.OUTPUT_COURSES: cdest_id}
+        prof.log_summary(feedback)
+        results = {self.OUTPUT: dest_id, self.OUTPUT_COURSES: cdest_id}
+        if state_path:
+            results[self.STATE_FILE] = state_path
+        report_path = self.parameterAsFileOutput(parameters, self.REPORT, context)
+        if report_path:
+            results[self.REPORT] = prof.write(report_path)
+            feedback.pushInfo("Resoconto tempi per fase salvato in: %s" % report_path)
+        return results
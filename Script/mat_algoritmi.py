@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Elenco degli algoritmi
+    --------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Tabella unica dei dati statici di ogni algoritmo della suite: modulo,
+    classe, name(), displayName(), gruppo e testo di aiuto. La leggono sia
+    le classi vere (name() e' la chiave, displayName/group/groupId/
+    shortHelpString vengono da qui) sia i segnaposto del provider del
+    plugin, che cosi' mostrano gruppo, titolo e aiuto senza importare il
+    modulo dell'algoritmo. Il modulo non importa qgis ne' numpy.
+***************************************************************************
+"""
+
+from collections import namedtuple
+
+# groupId -> group (sottocartelle del provider nel Processing Toolbox)
+GRUPPI = {
+    'analisi_quantitative': 'Analisi quantitative',
+    'statistiche_avanzate': 'Statistiche avanzate',
+    'analisi_corsi': 'Analisi dei corsi',
+}
+
+Algoritmo = namedtuple('Algoritmo', 'modulo classe nome titolo id_gruppo aiuto')
+
+
+# ============ TESTI DI AIUTO ============
+AIUTO_MATTONI = """
+        <h3>Analisi Quantitativa Mattoni - Versione 2.0</h3>
+        
+        <p>Analizza le geometrie dei mattoni in una muratura calcolando statistiche dettagliate su dimensioni, aree e distribuzioni dei materiali.</p>
+        
+        <h4>Parametri di Input:</h4>
+        <ul>
+            <li><b>Layer rilievo:</b> Poligoni dei componenti murari (richiede: fid, tipo, superficie, area_componente, num_componente)</li>
+            <li><b>Layer campioni:</b> Poligoni dei campioni di muratura (richiede: campione, sito, ambiente, usm, area_campione)</li>
+            <li><b>Tipo di materiale:</b> Lista separata da virgole o vuoto per tutti</li>
+            <li><b>Includi non classificati:</b> Include elementi con tipo NULL</li>
+            <li><b>Step range:</b> Incremento per calcolo dei range (metri)</li>
+        </ul>
+        
+        <h4>Output Generati:</h4>
+        <ul>
+            <li><b>min_oriented_bbox:</b> Rettangoli orientati minimi</li>
+            <li><b>analisi_rilievo:</b> Rilievo arricchito con metriche bbox</li>
+            <li><b>analisi_campioni_table:</b> Statistiche per campione (tabella)</li>
+            <li><b>analisi_campioni:</b> Campioni con statistiche (layer poligonale)</li>
+            <li><b>conteggio_range_larghezza/altezza:</b> Distribuzioni per range</li>
+        </ul>
+        
+        <h4>Note Importanti:</h4>
+        <ul>
+            <li>Il layer rilievo deve contenere i campi: fid, tipo, superficie, area_componente, num_componente</li>
+            <li>Il layer campioni deve contenere i campi: campione, sito, ambiente, usm, area_campione</li>
+            <li>I componenti vengono separati in "interi" e "parziali" in base al campo "superficie"</li>
+            <li>Le statistiche vengono calcolate solo sui componenti interi</li>
+            <li>Il filtro materiali e' case-sensitive</li>
+        </ul>
+        
+        <p><b>Versione:</b> 2.0</p>
+        """
+
+
+AIUTO_MATTONI_SENZA_CAMPIONE = """
+        <h3>Analisi Quantitativa Mattoni Senza Area Campione - Versione 2.0</h3>
+        
+        <p>Analizza le geometrie dei mattoni in una muratura senza necessità del layer campioni.
+        Calcola statistiche aggregate su tutti i componenti, se il campo superficie è compilato con il valore intero o parziale i calcoli sono eseguiti sui soli componenti interi.</p>
+        
+        <h4>Parametri di Input:</h4>
+        <ul>
+            <li><b>Layer rilievo:</b> Poligoni dei componenti murari (richiede: fid, tipo, superficie, area_componente, num_componente)</li>
+            <li><b>Tipo di materiale:</b> Lista separata da virgole o vuoto per tutti</li>
+            <li><b>Includi non classificati:</b> Include elementi con tipo NULL</li>
+            <li><b>Step range:</b> Incremento per calcolo dei range (metri)</li>
+        </ul>
+        
+        <h4>Output Generati:</h4>
+        <ul>
+            <li><b>min_oriented_bbox:</b> Rettangoli orientati minimi</li>
+            <li><b>analisi_rilievo:</b> Rilievo arricchito con metriche bbox</li>
+            <li><b>statistiche_aggregate:</b> Statistiche globali (min, max, mean, stddev, range)</li>
+            <li><b>distribuzione_range_larghezza/altezza:</b> Distribuzioni per range</li>
+        </ul>
+        
+        <h4>Differenze dalla versione 1.0:</h4>
+        <ul>
+            <li>Non richiede il layer campioni</li>
+            <li>Calcola statistiche aggregate su tutti i componenti interi</li>
+            <li>Genera una tabella di statistiche globali invece che per campione</li>
+            <li>Più semplice e veloce da utilizzare</li>
+        </ul>
+        
+        <h4>Note Importanti:</h4>
+        <ul>
+            <li>Il layer rilievo deve contenere i campi: fid, tipo, superficie, area_componente, num_componente</li>
+            <li>I componenti vengono separati in "interi" e "parziali" in base al campo "superficie" solo se compilato</li>
+            <li>Le statistiche vengono calcolate solo sui componenti interi</li>
+            <li>Il filtro materiali è case-sensitive</li>
+        </ul>
+        
+        <p><b>Versione:</b> 2.0 - Senza Area Campione</p>
+        """
+
+
+AIUTO_COMPONENTI_A_SECCO = """
+        <h3>Analisi Quantitativa Componenti a Secco - Versione 2.0</h3>
+        
+        <p>Analizza le geometrie dei componenti in una muratura calcolando statistiche dettagliate su dimensioni, aree e distribuzioni dei materiali.</p>
+        
+        <h4>Parametri di Input:</h4>
+        <ul>
+            <li><b>Layer rilievo:</b> Poligoni dei componenti murari (richiede: fid, tipo, superficie, area_componente, num_componente)</li>
+            <li><b>Layer campioni:</b> Poligoni dei campioni di muratura (richiede: campione, sito, ambiente, usm, area_campione)</li>
+            <li><b>Tipo di materiale:</b> Lista separata da virgole o vuoto per tutti</li>
+            <li><b>Includi non classificati:</b> Include elementi con tipo NULL</li>
+            <li><b>Step range larghezza:</b> Incremento per calcolo dei range di larghezza (metri)</li>
+            <li><b>Step range altezza:</b> Incremento per calcolo dei range di altezza (metri)</li>
+            <li><b>Valore del modulo:</b> Unità di misura per calcoli metrici (default: 0.296 m per piede attico/romano)</li>
+        </ul>
+        
+        <h4>Output Generati:</h4>
+        <ul>
+            <li><b>min_oriented_bbox:</b> Rettangoli orientati minimi</li>
+            <li><b>analisi_rilievo:</b> Rilievo arricchito con metriche bbox e campi calcolati (width_modulo, Δwidth_modulo, height_modulo, Δheight_modulo)</li>
+            <li><b>analisi_campioni_table:</b> Statistiche per campione (tabella)</li>
+            <li><b>analisi_campioni:</b> Campioni con statistiche (layer poligonale)</li>
+            <li><b>conteggio_range_larghezza/altezza:</b> Distribuzioni per range</li>
+        </ul>
+        
+        <h4>Campi Calcolati nel Layer Rilievo:</h4>
+        <p><b>IMPORTANTE: I seguenti campi vengono calcolati SOLO per gli elementi con superficie = 'intera'. Per tutti gli altri elementi (superficie = 'parziale' o altro) i campi avranno valore NULL.</b></p>
+        <ul>
+            <li><b>width_modulo:</b> Numero di moduli interi nella larghezza (floor(width_bbox / valore_modulo))</li>
+            <li><b>Δwidth_modulo:</b> Resto della larghezza in metri (width_bbox % valore_modulo, arrotondato a 3 decimali)</li>
+            <li><b>height_modulo:</b> Numero di moduli interi nell'altezza (floor(height_bbox / valore_modulo))</li>
+            <li><b>Δheight_modulo:</b> Resto dell'altezza in metri (height_bbox % valore_modulo, arrotondato a 3 decimali)</li>
+        </ul>
+        
+        <h4>Note Importanti:</h4>
+        <ul>
+            <li>Il layer rilievo deve contenere i campi: fid, tipo, superficie, area_componente, num_componente</li>
+            <li>Il layer campioni deve contenere i campi: campione, sito, ambiente, usm, area_campione</li>
+            <li>I componenti vengono separati in "interi" e "parziali" in base al campo "superficie"</li>
+            <li>Le statistiche vengono calcolate solo sui componenti interi</li>
+            <li>I campi width_modulo, Δwidth_modulo, height_modulo e Δheight_modulo sono NULL per i componenti parziali</li>
+            <li>Il filtro materiali è case-sensitive</li>
+            <li>Al layer analisi_rilievo viene aggiunta la variabile 'modulo' con il valore del modulo impostato dall'utente</li>
+            <li>Il valore del modulo può essere personalizzato (default 0.296 m per piede attico/romano)</li>
+        </ul>
+        
+        <p><b>Versione:</b> 2.0</p>
+        """
+
+
+AIUTO_ALTRI_COMPONENTI = """
+        <h3>Analisi Quantitativa Altri Componenti - Versione 2.0</h3>
+        
+        <p>Analizza le geometrie dei componenti in una muratura calcolando statistiche dettagliate su dimensioni, aree e distribuzioni dei materiali.</p>
+        
+        <h4>Parametri di Input:</h4>
+        <ul>
+            <li><b>Layer rilievo:</b> Poligoni dei componenti murari (richiede: fid, tipo, superficie, area_componente, num_componente)</li>
+            <li><b>Layer campioni:</b> Poligoni dei campioni di muratura (richiede: campione, sito, ambiente, usm, area_campione)</li>
+            <li><b>Tipo di materiale:</b> Lista separata da virgole o vuoto per tutti</li>
+            <li><b>Includi non classificati:</b> Include elementi con tipo NULL</li>
+            <li><b>Step range larghezza:</b> Incremento per calcolo dei range di larghezza (metri)</li>
+            <li><b>Step range altezza:</b> Incremento per calcolo dei range di altezza (metri)</li>
+            <li><b>Valore del modulo:</b> Unità di misura per calcoli metrici (default: 0.296 m per piede attico/romano)</li>
+        </ul>
+        
+        <h4>Output Generati:</h4>
+        <ul>
+            <li><b>min_oriented_bbox:</b> Rettangoli orientati minimi</li>
+            <li><b>analisi_rilievo:</b> Rilievo arricchito con metriche bbox e campi calcolati (width_modulo, Δwidth_modulo, height_modulo, Δheight_modulo)</li>
+            <li><b>analisi_campioni_table:</b> Statistiche per campione (tabella)</li>
+            <li><b>analisi_campioni:</b> Campioni con statistiche (layer poligonale)</li>
+            <li><b>conteggio_range_larghezza/altezza:</b> Distribuzioni per range</li>
+        </ul>
+        
+        <h4>Campi Calcolati nel Layer Rilievo:</h4>
+        <p><b>IMPORTANTE: I seguenti campi vengono calcolati SOLO per gli elementi con superficie = 'intera'. Per tutti gli altri elementi (superficie = 'parziale' o altro) i campi avranno valore NULL.</b></p>
+        <ul>
+            <li><b>width_modulo:</b> Numero di moduli interi nella larghezza (floor(width_bbox / valore_modulo))</li>
+            <li><b>Δwidth_modulo:</b> Resto della larghezza in metri (width_bbox % valore_modulo, arrotondato a 3 decimali)</li>
+            <li><b>height_modulo:</b> Numero di moduli interi nell'altezza (floor(height_bbox / valore_modulo))</li>
+            <li><b>Δheight_modulo:</b> Resto dell'altezza in metri (height_bbox % valore_modulo, arrotondato a 3 decimali)</li>
+        </ul>
+        
+        <h4>Note Importanti:</h4>
+        <ul>
+            <li>Il layer rilievo deve contenere i campi: fid, tipo, superficie, area_componente, num_componente</li>
+            <li>Il layer campioni deve contenere i campi: campione, sito, ambiente, usm, area_campione</li>
+            <li>I componenti vengono separati in "interi" e "parziali" in base al campo "superficie"</li>
+            <li>Le statistiche vengono calcolate solo sui componenti interi</li>
+            <li>I campi width_modulo, Δwidth_modulo, height_modulo e Δheight_modulo sono NULL per i componenti parziali</li>
+            <li>Il filtro materiali è case-sensitive</li>
+            <li>Al layer analisi_rilievo viene aggiunta la variabile 'modulo' con il valore del modulo impostato dall'utente</li>
+            <li>Il valore del modulo può essere personalizzato (default 0.296 m per piede attico/romano)</li>
+        </ul>
+        
+        <p><b>Versione:</b> 2.0</p>
+        """
+
+
+AIUTO_SECCO_ALTRI_MATERIALI_SENZA_CAMPIONE = """
+        <h3>Analisi Quantitativa Componenti a Secco / Altri Materiali Senza Area Campione - Versione 2.0</h3>
+        
+        <p>Analizza le geometrie dei componenti a secco / altri materiali in una muratura senza necessità del layer campioni.
+        Calcola statistiche aggregate su tutti i componenti e aggiunge campi per il calcolo dei moduli.</p>
+        
+        <h4>Parametri di Input:</h4>
+        <ul>
+            <li><b>Layer rilievo:</b> Poligoni dei componenti murari (richiede: fid, tipo, area_componente, num_componente; opzionale: superficie)</li>
+            <li><b>Tipo di materiale:</b> Lista separata da virgole o vuoto per tutti</li>
+            <li><b>Includi non classificati:</b> Include elementi con tipo NULL</li>
+            <li><b>Step range:</b> Incremento per calcolo dei range (metri)</li>
+            <li><b>Valore del modulo:</b> Unità di misura per calcoli metrici (default: 0.296 m per piede attico/romano)</li>
+        </ul>
+        
+        <h4>Output Generati:</h4>
+        <ul>
+            <li><b>min_oriented_bbox:</b> Rettangoli orientati minimi</li>
+            <li><b>analisi_rilievo:</b> Rilievo arricchito con metriche bbox e campi modulo</li>
+            <li><b>statistiche_aggregate:</b> Statistiche globali (min, max, mean, stddev, range)</li>
+            <li><b>distribuzione_range_larghezza/altezza:</b> Distribuzioni per range</li>
+        </ul>
+        
+        <h4>Campi Calcolati nel Layer Rilievo:</h4>
+        <p><b>I seguenti campi vengono calcolati per TUTTI i componenti:</b></p>
+        <ul>
+            <li><b>width_modulo:</b> Numero di moduli interi nella larghezza (floor(width_bbox / valore_modulo))</li>
+            <li><b>Δwidth_modulo:</b> Resto della larghezza in metri (width_bbox % valore_modulo, arrotondato a 3 decimali)</li>
+            <li><b>height_modulo:</b> Numero di moduli interi nell'altezza (floor(height_bbox / valore_modulo))</li>
+            <li><b>Δheight_modulo:</b> Resto dell'altezza in metri (height_bbox % valore_modulo, arrotondato a 3 decimali)</li>
+            <li><b>Variabile @modulo:</b> Variabile di layer con il valore del modulo impostato</li>
+        </ul>
+        
+        <h4>Differenze dalla versione 1.0:</h4>
+        <ul>
+            <li>Non richiede il layer campioni</li>
+            <li>Calcola statistiche aggregate globali invece che per campione</li>
+            <li>Campo 'superficie' opzionale con comportamento adattivo</li>
+            <li>Campi modulo calcolati per tutti i componenti</li>
+            <li>Più semplice e veloce da utilizzare</li>
+        </ul>
+        
+        <h4>Note Importanti:</h4>
+        <ul>
+            <li>Il layer rilievo deve contenere i campi: fid, tipo, area_componente, num_componente</li>
+            <li>Il campo 'superficie' è opzionale: se presente, le statistiche sono calcolate sui componenti interi; se assente, su tutti</li>
+            <li>I campi modulo (width_modulo, Δwidth_modulo, height_modulo, Δheight_modulo) sono calcolati per TUTTI i componenti indipendentemente dal valore del campo superficie</li>
+            <li>Il filtro materiali è case-sensitive</li>
+            <li>Il valore del modulo può essere personalizzato (default 0.296 m per piede attico/romano)</li>
+        </ul>
+        
+        <p><b>Versione:</b> 2.0 - Senza Area Campione</p>
+        """
+
+
+AIUTO_PATTERN_REIMPIEGO = (
+    "Analisi statistica di un paramento.\n\n"
+    "PER I MATTONI: lascia disattivata l'analisi metrologica. Calcola "
+    "fattore di riempimento, statistica circolare assiale dell'orientamento "
+    "(raggio fisso + k-nearest), Mahalanobis, PCA, clustering, CV, e LISA "
+    "(Local Moran's I) per individuare hotspot di reimpiego.\n\n"
+    "PER I COMPONENTI A SECCO / ALTRI COMPONENTI (es. blocchi, conci, "
+    "elementi lapidei): attiva anche l'analisi metrologica modulare. Verifica "
+    "un modulo dato (R_bar + Rayleigh) e cerca il modulo ottimale (cosine "
+    "quantogram di Kendall, validato Monte Carlo) su lunghezza e altezza, "
+    "trattate simmetricamente: per questi componenti il modulo e' atteso su "
+    "entrambe. Lo scarto modulare confluisce nel reuse_score. NON usare sui "
+    "mattoni: sono ritagli senza modulo di lunghezza.\n\n"
+    "Con la Mahalanobis robusta la covarianza e' stimata con FastMCD (determinante "
+    "minimo), non gonfiata dai pezzi anomali: il campo mahal_rob sostituisce "
+    "mahal nel reuse_score.\n\n"
+    "L'orientamento e il resto modulare sono trattati come variabili circolari."
+)
+
+
+AIUTO_CORSI = (
+    "Riconosce i corsi (filari orizzontali) di un paramento gia' "
+    "segmentato in componenti poligonali, adattando la logica "
+    "incrementale di TagLab (QtCourseAnalysis).\n\n"
+    "Richiede un rilievo RADDRIZZATO con Y verso l'alto. Usa i campi "
+    "width_bbox (lunghezza) e height_bbox (altezza) prodotti da "
+    "MensioAnalysisTools; il centroide e' ricavato dalla geometria.\n\n"
+    "Un componente si aggancia al corso se, rispetto all'ultimo pezzo "
+    "gia' inserito: il gap in X non supera la larghezza media del corso "
+    "per x_gap_factor; il centroide Y, e i bordi alto e basso, restano "
+    "entro le rispettive tolleranze (relative all'altezza); e l'altezza "
+    "e' simile (rapporto entro 1+-h_tol).\n\n"
+    "Output: i componenti con corso_id/pos_in_corso/corso_n_pezzi (e, "
+    "con l'analisi dei giunti attiva, giunto_vert per ogni pezzo) e una "
+    "tabella di sintesi per corso (n. pezzi, quota, altezza, lunghezza, "
+    "inclinazione e, se richiesto, letto_malta_sup = spessore del letto "
+    "di malta verso il corso superiore, e sfalso_giunti_sup = sfalsamento "
+    "dei giunti verticali rispetto al corso superiore, indice di "
+    "ammorsatura).\n\n"
+    "DIPENDENZE: numpy (sempre presente in QGIS) e' sufficiente. Il "
+    "rilevamento delle discontinuita' usa, se installata, la libreria "
+    "'ruptures' (algoritmo PELT); in sua assenza ricade automaticamente "
+    "su un rilevatore interno in puro numpy che fornisce risultati "
+    "equivalenti. 'ruptures' e' quindi OPZIONALE: conviene solo per "
+    "velocizzare l'analisi su serie molto lunghe (centinaia di corsi). "
+    "Per installarla, dalla OSGeo4W Shell: python -m pip install ruptures\n\n"
+    "RIANALISI INCREMENTALE (opzionale): indicando un file di stato "
+    "(.npz), l'assegnazione dei corsi viene salvata insieme a un'impronta "
+    "di centroide e dimensioni di ogni componente. Alla successiva "
+    "esecuzione con gli stessi parametri di raggruppamento si "
+    "ricostruiscono solo i corsi toccati dai componenti modificati, "
+    "aggiunti o rimossi (e quelli adiacenti sopra e sotto); il resto "
+    "dell'assegnazione e' riusato."
+)
+
+
+
+# ============ TABELLA ============
+ALGORITMI = [
+    # --- Analisi quantitative ----------------------------------------------
+    Algoritmo('mattoni_v2_0', 'Analisi',
+              'analisi_mattoni',
+              'Mattoni',
+              'analisi_quantitative', AIUTO_MATTONI),
+    Algoritmo('mattoni_senza_campione_v2_0', 'AnalisiSenzaCampione',
+              'analisi_mattoni_senza_campione',
+              'Mattoni senza campione',
+              'analisi_quantitative', AIUTO_MATTONI_SENZA_CAMPIONE),
+    Algoritmo('componenti_a_secco_v2_0', 'Analisi',
+              'analisi_componenti_a_secco',
+              'Componenti a secco',
+              'analisi_quantitative', AIUTO_COMPONENTI_A_SECCO),
+    Algoritmo('altri_componenti_v2_0', 'Analisi',
+              'analisi_altri_componenti',
+              'Altri componenti',
+              'analisi_quantitative', AIUTO_ALTRI_COMPONENTI),
+    Algoritmo('componenti_a_secco_altri_materiali_senza_campione_v2_0', 'AnalisiComponentiSeccoAltriMaterialiSenzaCampione',
+              'analisi_componenti_secco_altri_materiali_senza_campione',
+              'Componenti a secco / altri materiali senza campione',
+              'analisi_quantitative', AIUTO_SECCO_ALTRI_MATERIALI_SENZA_CAMPIONE),
+    # --- Statistiche avanzate ----------------------------------------------
+    Algoritmo('statistiche_avanzate_pattern_reimpiego', 'MasonryPatternAnalysis',
+              'statistiche_avanzate_pattern_paramento_reimpiego',
+              'Statistiche avanzate pattern e reimpiego',
+              'statistiche_avanzate', AIUTO_PATTERN_REIMPIEGO),
+    # --- Analisi dei corsi -------------------------------------------------
+    Algoritmo('analisi_corsi_paramento', 'CourseAnalysis',
+              'analisi_corsi_paramento',
+              'Analisi dei corsi del paramento',
+              'analisi_corsi', AIUTO_CORSI),
+]
+
+PER_NOME = {alg.nome: alg for alg in ALGORITMI}
+
+
+def info(nome):
+    """
+    Dati statici di un algoritmo
+
+    Args:
+        nome: name() dell'algoritmo
+
+    Returns:
+        Algoritmo (modulo, classe, nome, titolo, id_gruppo, aiuto)
+    """
+    return PER_NOME[nome]
+
+
+def gruppo(nome):
+    """Nome visualizzato del gruppo dell'algoritmo"""
+    return GRUPPI[PER_NOME[nome].id_gruppo]
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Bounding box orientati in parallelo
+    ---------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    qgis:minimumboundinggeometry e native:orientedminimumboundingbox
+    calcolano i bbox orientati minimi in un solo thread, componente dopo
+    componente. Qui i componenti sono divisi in blocchi contigui (nell'ordine
+    dei fid del layer), spediti come WKB a un pool di processi e ricomposti
+    nell'ordine di ingresso:
+
+      gruppi      una lista di WKB per bbox: le geometrie di un fid (come
+                  minimumboundinggeometry con FIELD, sui vertici di tutte le
+                  geometrie del gruppo) oppure di una sola feature (come
+                  orientedminimumboundingbox);
+      processi    ogni processo importa qgis.core e usa la stessa
+                  QgsGeometry.orientedMinimumBoundingBox degli algoritmi di
+                  Processing (inviluppo convesso di GEOS e lati ruotati):
+                  width, height, angle, area e perimetro hanno la stessa
+                  semantica;
+      ripiego     sotto SOGLIA_PROCESSI gruppi, o se i processi non partono
+                  (interprete senza qgis.core), il calcolo resta nel processo
+                  di QGIS con la stessa funzione.
+
+    I processi sono avviati con 'spawn' dallo stesso interprete Python di
+    QGIS (mat_worker._python_executable) e terminano alla fine del calcolo.
+***************************************************************************
+"""
+
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from . import mat_worker
+except ImportError:
+    # caricato come script di Processing, fuori dal pacchetto del plugin
+    import sys
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    import mat_worker
+
+# sotto questo numero di gruppi l'avvio dei processi costa piu' del calcolo
+SOGLIA_PROCESSI = 20000
+# blocchi per processo: equilibrano il carico tra blocchi piu' o meno costosi
+BLOCCHI_PER_PROCESSO = 4
+
+
+def _bbox_chunk(groups, vertices=False):
+    """
+    Bbox orientati di un blocco di gruppi (eseguito nei processi del pool)
+
+    Args:
+        groups: Liste di WKB, una per bbox (vuota: gruppo senza geometria)
+        vertices: True per il bbox dei vertici di tutte le geometrie del
+            gruppo raccolti in un multipunto (qgis:minimumboundinggeometry),
+            False per il bbox della geometria stessa
+
+    Returns:
+        Una tupla (wkb, width, height, angle, area, perimeter, x, y,
+        area_componente) per gruppo, con il bbox seguito da centroide e area
+        delle geometrie del gruppo; None per i gruppi senza geometria
+    """
+    from qgis.core import QgsGeometry, QgsMultiPoint
+
+    out = []
+    for wkbs in groups:
+        if not wkbs:
+            out.append(None)
+            continue
+        parts = []
+        for wkb in wkbs:
+            g = QgsGeometry()
+            g.fromWkb(wkb)
+            parts.append(g)
+        component = parts[0] if len(parts) == 1 else QgsGeometry.collectGeometry(parts)
+        if vertices:
+            multi_point = QgsMultiPoint()
+            for g in parts:
+                it = g.vertices()
+                while it.hasNext():
+                    multi_point.addGeometry(it.next())
+            geometry = QgsGeometry(multi_point)
+        else:
+            geometry = component
+        rect, area, angle, width, height = geometry.orientedMinimumBoundingBox()
+        centroid = component.centroid().asPoint()
+        out.append((bytes(rect.asWkb()), width, height, angle, area,
+                    2 * width + 2 * height, centroid.x(), centroid.y(), component.area()))
+    return out
+
+
+def _split(groups, n_chunks):
+    """Blocchi contigui di gruppi, nell'ordine di ingresso"""
+    size = max(1, -(-len(groups) // max(1, n_chunks)))
+    return [groups[i:i + size] for i in range(0, len(groups), size)]
+
+
+def oriented_bboxes(groups, processi, vertices=False, feedback=None):
+    """
+    Bbox orientati minimi di gruppi di geometrie, nell'ordine dei gruppi
+
+    Args:
+        groups: Liste di WKB, una per bbox
+        processi: Numero di processi del pool (<= 1: nel processo corrente)
+        vertices: Vedi _bbox_chunk
+        feedback: Feedback per avanzamento, annullamento e avvisi
+
+    Returns:
+        Lista di tuple (wkb, width, height, angle, area, perimeter, x, y,
+        area_componente) o None, una per gruppo
+    """
+    processi = min(processi, os.cpu_count() or 1)
+    if processi > 1 and len(groups) >= SOGLIA_PROCESSI:
+        chunks = _split(groups, processi * BLOCCHI_PER_PROCESSO)
+        try:
+            ctx = multiprocessing.get_context('spawn')
+            ctx.set_executable(mat_worker._python_executable())
+            out = []
+            with ProcessPoolExecutor(processi, mp_context=ctx) as pool:
+                if feedback is not None:
+                    feedback.pushInfo(f"Bbox orientati in {processi} processi, "
+                                      f"{len(chunks)} blocchi")
+                # map restituisce i blocchi nell'ordine di ingresso
+                for k, res in enumerate(pool.map(_bbox_chunk, chunks,
+                                                 itertools.repeat(vertices))):
+                    if feedback is not None:
+                        if feedback.isCanceled():
+                            pool.shutdown(cancel_futures=True)
+                            return out
+                        feedback.setProgress(100.0 * (k + 1) / len(chunks))
+                    out.extend(res)
+            return out
+        except Exception as e:
+            if feedback is not None:
+                feedback.pushWarning(f"Processi paralleli non disponibili ({e}): "
+                                     f"calcolo dei bbox nel processo di QGIS")
+
+    return _bbox_chunk(groups, vertices)
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Cache delle metriche e delle fasi
+    -------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Metriche geometriche (MetricsCache)
+    -----------------------------------
+
+    Tra un'esecuzione e l'altra degli strumenti cambiano di solito i
+    parametri (tipi di materiale, step dei range, statistiche), non le
+    geometrie del rilievo. Le metriche per componente (bbox orientato con
+    width, height, angle, area e perimetro, centroide e area) sono quindi
+    salvate in un database SQLite accanto al file del layer rilievo
+    (<file>.mat_metriche.sqlite), con chiave
+
+        layer, modo di calcolo, fid  +  hash BLAKE2b dei WKB del componente
+
+    Alla lettura una riga vale solo se l'hash coincide con quello delle
+    geometrie attuali: i componenti nuovi o modificati sono ricalcolati e
+    riscritti, gli altri riusati senza passare dal calcolo dei bbox. Una
+    cache di versione diversa o illeggibile viene ricreata da capo.
+
+    La cache e' disponibile solo per i layer su file (GeoPackage,
+    shapefile, ...); per i layer in memoria le funzioni restituiscono None.
+
+    Fasi della pipeline (StageCache)
+    --------------------------------
+    Le fasi costose della pipeline con campione (spatial join, filtro, bbox)
+    formano un grafo: ciascuna dichiara i parametri da cui dipende e le fasi
+    a monte. La chiave di una fase e' l'hash di impronte dei layer in
+    ingresso (layer_fingerprint: file, dimensione e data di modifica,
+    sottoinsieme, selezione), parametri e chiavi delle fasi a monte; l'output
+    e' un GeoPackage con quel nome nella cartella della cache, valido solo se
+    accompagnato dal file di completamento. Un'esecuzione con gli stessi dati
+    e parametri a monte riusa l'output invece di ricalcolarlo; una fase con
+    un ingresso senza impronta (layer in memoria) non e' mai riusata, e con
+    lei le fasi a valle. La cartella e' quella privata dell'utente
+    (mat_privato.private_dir, modo 0700 verificato) e i file di
+    completamento sono file privati: un output scritto da altri non viene
+    mai riusato.
+***************************************************************************
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from qgis.core import (
+    QgsProcessingFeatureSourceDefinition,
+    QgsProviderRegistry,
+    QgsVectorLayer
+)
+
+try:
+    from . import mat_privato
+except ImportError:
+    # caricato come script di Processing, fuori dal pacchetto del plugin
+    import sys
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    import mat_privato
+
+# versione dello schema e del calcolo: se cambia, le cache esistenti sono ricreate
+VERSIONE = '1'
+SUFFISSO = '.mat_metriche.sqlite'
+# righe per executemany nella scrittura
+BATCH = 10000
+# fid per interrogazione nella lettura (sotto il limite di variabili di SQLite)
+BATCH_LETTURA = 500
+# errori di apertura, lettura e scrittura della cache
+CacheError = (sqlite3.Error, OSError)
+
+_COLONNE = ('wkb', 'width', 'height', 'angle', 'area', 'perimeter',
+            'x', 'y', 'area_componente')
+
+
+def geometry_hash(wkbs) -> bytes:
+    """Hash delle geometrie di un componente (lista di WKB)"""
+    h = hashlib.blake2b(digest_size=16)
+    for wkb in wkbs:
+        # lunghezza davanti a ogni WKB: gruppi diversi non danno la stessa sequenza
+        h.update(len(wkb).to_bytes(8, 'little'))
+        h.update(wkb)
+    return h.digest()
+
+
+def cache_path(layer):
+    """
+    File della cache per un layer rilievo
+
+    Returns:
+        (percorso del database, nome del layer) oppure None se il layer non
+        e' su file o la cartella non e' scrivibile
+    """
+    if layer is None:
+        return None
+    parts = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source())
+    path = parts.get('path') or ''
+    if not os.path.isfile(path) or not os.access(os.path.dirname(os.path.abspath(path)), os.W_OK):
+        return None
+    return path + SUFFISSO, parts.get('layerName') or os.path.splitext(os.path.basename(path))[0]
+
+
+class MetricsCache:
+    """Metriche geometriche per componente di un layer, su SQLite"""
+
+    def __init__(self, path, layer_name):
+        self.path = path
+        self.layer_name = layer_name
+        try:
+            self._con = self._open()
+        except sqlite3.DatabaseError:
+            # file corrotto o non SQLite: si ricrea
+            os.remove(path)
+            self._con = self._open()
+
+    @classmethod
+    def for_layer(cls, layer):
+        """Cache del layer rilievo, o None se non disponibile"""
+        where = cache_path(layer)
+        return cls(*where) if where else None
+
+    def _open(self):
+        con = sqlite3.connect(self.path)
+        try:
+            con.execute("CREATE TABLE IF NOT EXISTS meta (chiave TEXT PRIMARY KEY, valore TEXT)")
+            row = con.execute("SELECT valore FROM meta WHERE chiave = 'versione'").fetchone()
+            if row is None or row[0] != VERSIONE:
+                con.execute("DROP TABLE IF EXISTS metriche")
+                con.execute("INSERT OR REPLACE INTO meta VALUES ('versione', ?)", (VERSIONE,))
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS metriche ("
+                " layer TEXT NOT NULL, modo TEXT NOT NULL, fid INTEGER NOT NULL,"
+                " hash BLOB NOT NULL, wkb BLOB NOT NULL, width REAL, height REAL,"
+                " angle REAL, area REAL, perimeter REAL, x REAL, y REAL,"
+                " area_componente REAL, PRIMARY KEY (layer, modo, fid))")
+            con.commit()
+        except sqlite3.DatabaseError:
+            con.close()
+            raise
+        return con
+
+    def close(self):
+        self._con.close()
+
+    def lookup(self, modo, keys, hashes):
+        """
+        Metriche in cache dei componenti dati
+
+        Args:
+            modo: Modo di calcolo dei bbox (es. 'vertici', 'geometria')
+            keys: fid dei componenti
+            hashes: Hash delle geometrie attuali (geometry_hash)
+
+        Returns:
+            Lista allineata a keys: tupla delle metriche (come
+            mat_bbox.oriented_bboxes) se la riga esiste con lo stesso hash,
+            altrimenti None
+
+        Sono lette solo le righe dei fid richiesti (fid IN (...) a gruppi di
+        BATCH_LETTURA, sulla chiave primaria): chiamata per ogni blocco di
+        componenti, la lettura resta proporzionale al blocco e non alla cache.
+        """
+        wanted = sorted({key for key in keys if isinstance(key, int)})
+        stored = {}
+        try:
+            for i in range(0, len(wanted), BATCH_LETTURA):
+                part = wanted[i:i + BATCH_LETTURA]
+                rows = self._con.execute(
+                    "SELECT fid, hash, %s FROM metriche WHERE layer = ? AND modo = ?"
+                    " AND fid IN (%s)" % (', '.join(_COLONNE), ', '.join('?' * len(part))),
+                    [self.layer_name, modo] + part)
+                stored.update((fid, (h, tuple(values))) for fid, h, *values in rows)
+        except sqlite3.DatabaseError:
+            return [None] * len(keys)
+        out = []
+        for key, h in zip(keys, hashes):
+            hit = stored.get(key)
+            valid = (hit is not None and hit[0] == h and hit[1][0]
+                     and all(v is not None for v in hit[1]))
+            out.append(hit[1] if valid else None)
+        return out
+
+    def store(self, modo, keys, hashes, metrics):
+        """Salva (o sostituisce) le metriche dei componenti dati"""
+        sql = ("INSERT OR REPLACE INTO metriche (layer, modo, fid, hash, %s) "
+               "VALUES (?, ?, ?, ?%s)" % (', '.join(_COLONNE), ', ?' * len(_COLONNE)))
+        rows = [(self.layer_name, modo, key, h) + tuple(m)
+                for key, h, m in zip(keys, hashes, metrics)
+                if m is not None and isinstance(key, int)]
+        with self._con:
+            for i in range(0, len(rows), BATCH):
+                self._con.executemany(sql, rows[i:i + BATCH])
+
+
+# --------------------------------------------------------------------------
+#  Fasi della pipeline
+# --------------------------------------------------------------------------
+# versione del calcolo delle fasi: se cambia, gli output salvati non valgono piu'
+VERSIONE_FASI = '1'
+# fasi salvate al massimo nella cartella (le meno usate di recente sono rimosse)
+MAX_FASI = 40
+
+
+# sottocartella della cartella privata dell'utente
+CARTELLA_FASI = 'fasi'
+
+
+def layer_fingerprint(value, layer):
+    """
+    Impronta di un layer in ingresso per le chiavi delle fasi
+
+    Args:
+        value: Valore del parametro (stringa o QgsProcessingFeatureSourceDefinition)
+        layer: Layer risolto dal parametro
+
+    Returns:
+        Lista serializzabile in JSON, None se il layer non e' su file
+    """
+    if layer is None:
+        return None
+    parts = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source())
+    path = parts.get('path') or ''
+    if not os.path.isfile(path):
+        return None
+    # le modifiche a un GeoPackage possono restare nel file -wal fino al checkpoint
+    files = [[p, os.stat(p).st_mtime_ns, os.stat(p).st_size]
+             for p in (path, path + '-wal') if os.path.exists(p)]
+    selection = None
+    if isinstance(value, QgsProcessingFeatureSourceDefinition):
+        selection = [bool(value.selectedFeaturesOnly),
+                     getattr(value, 'featureLimit', -1),
+                     getattr(value, 'filterExpression', '')]
+        if value.selectedFeaturesOnly:
+            selection.append(sorted(layer.selectedFeatureIds()))
+    return [layer.source(), layer.subsetString(), layer.crs().authid(), files, selection]
+
+
+class StageCache:
+    """
+    Output delle fasi memorizzati tra un'esecuzione e l'altra
+
+    Attributes:
+        keys: Chiave calcolata per ogni fase eseguita (None: non memorizzabile)
+        riusate: Fasi riusate nell'esecuzione corrente, in ordine
+    """
+
+    def __init__(self, enabled=True):
+        """
+        Args:
+            enabled: False disattiva la memorizzazione (ogni fase e'
+                calcolata con la destinazione di default)
+
+        Raises:
+            mat_privato.PrivateError: la cartella esiste ma non e' privata
+                dell'utente
+        """
+        self.folder = mat_privato.private_dir(CARTELLA_FASI) if enabled else None
+        self.keys = {}
+        self.riusate = []
+        if self.folder:
+            self._prune()
+
+    def key(self, name, deps, upstream=()):
+        """Chiave della fase, None se la fase non e' memorizzabile"""
+        if not self.folder or any(v is None for v in deps.values()):
+            return None
+        if any(self.keys.get(u) is None for u in upstream):
+            return None
+        payload = json.dumps([VERSIONE_FASI, name, deps, [self.keys[u] for u in upstream]],
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def run(self, name, deps, compute, upstream=()):
+        """
+        Output della fase, riusato se gia' calcolato con le stesse dipendenze
+
+        Args:
+            name: Nome della fase
+            deps: Parametri e impronte da cui dipende (valori JSON; un None
+                rende la fase non memorizzabile)
+            compute: Funzione che calcola la fase: riceve la destinazione
+                dell'output (None: quella di default) e restituisce l'output
+            upstream: Nomi delle fasi a monte
+
+        Returns:
+            Output della fase (percorso o id del layer)
+        """
+        key = self.key(name, deps, upstream)
+        self.keys[name] = key
+        if key is None:
+            return compute(None)
+
+        marker = os.path.join(self.folder, key + '.json')
+        try:
+            info = json.loads(mat_privato.read_private(marker))
+            # solo output della cartella stessa
+            if os.path.dirname(os.path.abspath(info['output'])) != os.path.abspath(self.folder):
+                raise ValueError(info['output'])
+            layer = QgsVectorLayer(info['output'], name, 'ogr')
+            if layer.isValid() and layer.featureCount() == info['conteggio']:
+                # segna l'uso recente per la rimozione delle fasi vecchie
+                os.utime(marker)
+                self.riusate.append(name)
+                return info['output']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        path = os.path.join(self.folder, key + '.gpkg')
+        try:
+            # output di un calcolo interrotto, senza file di completamento
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            self.keys[name] = None
+            return compute(None)
+        output = compute(path)
+        count = QgsVectorLayer(output, name, 'ogr').featureCount()
+        # file di completamento scritto solo a output chiuso e verificato
+        mat_privato.write_private(marker, json.dumps(
+            {'fase': name, 'output': output, 'conteggio': count}))
+        return output
+
+    def _prune(self):
+        """Rimuove gli output delle fasi usate meno di recente oltre MAX_FASI"""
+        try:
+            markers = [os.path.join(self.folder, f) for f in os.listdir(self.folder)
+                       if f.endswith('.json')]
+            markers.sort(key=os.path.getmtime, reverse=True)
+            for marker in markers[MAX_FASI:]:
+                base = marker[:-len('.json')]
+                os.remove(marker)
+                for ext in ('.gpkg', '.gpkg-wal', '.gpkg-shm'):
+                    if os.path.exists(base + ext):
+                        os.remove(base + ext)
+        except OSError:
+            pass
@@ -0,0 +1,2857 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Motore comune degli strumenti quantitativi
+    ----------------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing). Riunisce
+    in un solo punto cio' che i cinque script quantitativi ripetevano:
+
+      - costanti dei campi (FieldNames, SurfaceTypes);
+      - modello colonnare degli attributi (ComponentTable): un array NumPy
+        per campo, indicizzato per fid, letto con una sola passata sul layer
+        senza geometrie e limitato ai soli campi richiesti;
+      - kernel vettoriali sulle colonne (value_counts, describe, group_stats)
+        e l'accumulatore combinabile Moments per le statistiche a blocchi,
+        definiti in mat_stats senza dipendenze da QGIS;
+      - le fasi riutilizzabili (validazione, filtro, bounding box, range,
+        statistiche, analisi rilievo e campioni) come mixin:
+
+            MatAlgorithmBase       utilita' comuni (validazione, conteggi,
+                                   espressioni, mapping dei campi, resoconto)
+            AnalisiCampioneEngine  analisi con layer campioni
+            AnalisiSenzaCampioneEngine  analisi con il solo layer rilievo
+
+    Gli script sono parametrizzazioni sottili: ereditano dal mixin e da
+    QgsProcessingAlgorithm e impostano solo le costanti di classe (titolo,
+    suffisso dei layer, step di default, modulo, calcoli finali) e i testi
+    dell'interfaccia. I mixin non derivano da QgsProcessingAlgorithm: il
+    caricatore degli script di Processing, che istanzia la prima classe
+    algoritmo trovata nel modulo, non li scambia quindi per algoritmi.
+
+    Elaborazione a blocchi (parametro avanzato, per rilievi di milioni di
+    componenti): i layer intermedi della catena di Processing sono scritti
+    in GeoPackage temporanei su disco invece che in layer in memoria, le
+    colonne sono lette e convertite a blocchi e le statistiche aggregate
+    sono accumulate blocco per blocco (Moments), senza tenere in memoria i
+    valori dell'intero layer.
+***************************************************************************
+"""
+
+from __future__ import annotations
+
+from qgis.core import (
+    Qgis,
+    QgsProcessing,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterDefinition,
+    QgsProcessingException,
+    QgsProcessingUtils,
+    QgsProcessingFeatureSourceDefinition,
+    QgsFeatureRequest,
+    QgsExpression,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsWkbTypes,
+    QgsExpressionContextUtils
+)
+from qgis.PyQt.QtCore import QVariant
+from typing import Dict, List, Tuple, Any, Optional
+import itertools
+
+try:
+    from .mat_profiling import StageProfiler, profilable, profiled_stage
+    from .mat_lazy import lazy_import
+    from .mat_spatial import SampleIndex, NESSUNO
+    from . import mat_algoritmi
+    from . import mat_bbox
+    from . import mat_numpy
+    from .mat_stats import (value_counts, describe, Moments, QUANTILI, robust_stats,
+                            QuantileSketch, histogram_pyramid, DECIMALI_QUANTO)
+    from .mat_cache import (MetricsCache, CacheError, StageCache, cache_path,
+                            geometry_hash, layer_fingerprint)
+except ImportError:
+    # caricato come script di Processing, fuori dal pacchetto del plugin
+    import os
+    import sys
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_profiling import StageProfiler, profilable, profiled_stage
+    from mat_lazy import lazy_import
+    from mat_spatial import SampleIndex, NESSUNO
+    import mat_algoritmi
+    import mat_bbox
+    import mat_numpy
+    from mat_stats import (value_counts, describe, Moments, QUANTILI, robust_stats,
+                           QuantileSketch, histogram_pyramid, DECIMALI_QUANTO)
+    from mat_cache import (MetricsCache, CacheError, StageCache, cache_path,
+                           geometry_hash, layer_fingerprint)
+
+# numpy e processing servono solo durante l'elaborazione: importati al primo uso
+np = lazy_import('numpy', globals(), 'np')
+processing = lazy_import('processing', globals())
+
+# filtro delle feature valutato dal provider (filterExpression di
+# QgsProcessingFeatureSourceDefinition), disponibile da QGIS 3.32
+FILTRO_NEL_PROVIDER = Qgis.QGIS_VERSION_INT >= 33200
+
+
+# ============ COSTANTI ============
+class FieldNames:
+    """Nomi dei campi richiesti nei layer"""
+    # Campi layer rilievo
+    FID = 'fid'
+    TIPO = 'tipo'
+    SUPERFICIE = 'superficie'
+    AREA_COMPONENTE = 'area_componente'
+    NUM_COMPONENTE = 'num_componente'
+
+    # Campi layer campioni
+    CAMPIONE = 'campione'
+    SITO = 'sito'
+    AMBIENTE = 'ambiente'
+    USM = 'usm'
+    AREA_CAMPIONE = 'area_campione'
+
+    # Campi bbox
+    WIDTH_BBOX = 'width_bbox'
+    HEIGHT_BBOX = 'height_bbox'
+    ANGLE_BBOX = 'angle_bbox'
+    PERIMETER_BBOX = 'perimeter_bbox'
+    AREA_BBOX = 'area_bbox'
+
+
+class SurfaceTypes:
+    """Valori per il campo superficie"""
+    INTERA = 'intera'
+    PARZIALE = 'parziale'
+
+
+# ============ MODELLO COLONNARE ============
+def _is_null(value) -> bool:
+    """NULL di QGIS (None o QVariant nullo)"""
+    return value is None or (isinstance(value, QVariant) and value.isNull())
+
+
+def _to_column(values: List, as_object: bool = False) -> np.ndarray:
+    """
+    Converte i valori di un campo in un array NumPy
+
+    Numeri -> float64 con NaN per i NULL (interi senza NULL -> int64);
+    altrimenti (o con as_object) array di oggetti con None per i NULL.
+    """
+    clean = [None if _is_null(v) else v for v in values]
+    if not as_object:
+        present = [v for v in clean if v is not None]
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+            if len(present) == len(clean) and all(isinstance(v, int) for v in present):
+                return np.asarray(clean, dtype=np.int64)
+            return np.asarray([np.nan if v is None else v for v in clean], dtype=np.float64)
+    column = np.empty(len(clean), dtype=object)
+    column[:] = clean
+    return column
+
+
+def _concat_columns(parts: List[np.ndarray], as_object: bool = False) -> np.ndarray:
+    """Unisce le colonne convertite a blocchi (stesso risultato di _to_column)"""
+    if not parts:
+        return _to_column([], as_object)
+    if all(p.dtype != object for p in parts):
+        return np.concatenate(parts)
+    # blocchi numerici e non: si torna ai valori originali (NaN -> None)
+    column = np.empty(sum(p.size for p in parts), dtype=object)
+    pos = 0
+    for p in parts:
+        if p.dtype.kind == 'f':
+            column[pos:pos + p.size] = [None if v != v else v for v in p.tolist()]
+        else:
+            column[pos:pos + p.size] = p.tolist() if p.dtype != object else p
+        pos += p.size
+    return column
+
+
+def iter_chunks(iterable, size: int):
+    """Blocchi (liste) di al piu' size elementi; un solo blocco se size <= 0"""
+    it = iter(iterable)
+    if size <= 0:
+        chunk = list(it)
+        if chunk:
+            yield chunk
+        return
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ComponentTable:
+    """
+    Attributi dei componenti in forma colonnare
+
+    Un array NumPy per campo, tutti allineati e indicizzati per fid
+    (ordinati per fid, ricerca con searchsorted). Le fasi che lavorano solo
+    sugli attributi (conteggi, statistiche, range) operano sulle colonne
+    invece di scorrere le feature una per una.
+    """
+
+    def __init__(self, fids, columns: Dict[str, np.ndarray]):
+        fids = np.asarray(fids, dtype=np.int64)
+        order = np.argsort(fids, kind='stable')
+        self.fid = fids[order]
+        self.columns = {name: np.asarray(col)[order] for name, col in columns.items()}
+
+    @classmethod
+    def from_layer(cls, layer, field_names: List[str], key: str = FieldNames.FID,
+                   expression: str = '', as_object: bool = False,
+                   chunk_size: int = 0) -> 'ComponentTable':
+        """
+        Legge i campi richiesti con una sola passata, senza geometrie
+
+        Args:
+            layer: Layer o sorgente da leggere
+            field_names: Campi da caricare (quelli assenti sono ignorati)
+            key: Campo usato come fid (se assente: id delle feature)
+            expression: Filtro opzionale applicato dal provider
+            as_object: Mantiene i valori originali (nessuna conversione numerica)
+            chunk_size: Se > 0 converte i valori in array ogni chunk_size
+                feature, senza accumulare liste Python dell'intero layer
+
+        Returns:
+            ComponentTable con una colonna per campo presente
+        """
+        fields = layer.fields()
+        names = [n for n in field_names if fields.lookupField(n) >= 0]
+        use_key = fields.lookupField(key) >= 0
+        wanted = names + ([key] if use_key and key not in names else [])
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(wanted, fields)
+        if expression:
+            request.setFilterExpression(expression)
+
+        idx = [fields.lookupField(n) for n in names]
+        key_idx = fields.lookupField(key) if use_key else -1
+        fid_parts = []
+        parts = [[] for _ in names]
+        for chunk in iter_chunks(layer.getFeatures(request), chunk_size):
+            fids = []
+            values = [[] for _ in names]
+            for feat in chunk:
+                attrs = feat.attributes()
+                if key_idx >= 0:
+                    k = attrs[key_idx]
+                    fids.append(feat.id() if _is_null(k) else k)
+                else:
+                    fids.append(feat.id())
+                for col, i in zip(values, idx):
+                    col.append(attrs[i])
+            fid_parts.append(np.asarray(fids, dtype=np.int64))
+            for part, v in zip(parts, values):
+                part.append(_to_column(v, as_object))
+
+        fids = np.concatenate(fid_parts) if fid_parts else np.zeros(0, dtype=np.int64)
+        return cls(fids, {n: _concat_columns(p, as_object) for n, p in zip(names, parts)})
+
+    def __len__(self) -> int:
+        return int(self.fid.size)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def column(self, name: str) -> np.ndarray:
+        """Colonna di un campo"""
+        return self.columns[name]
+
+    def isnull(self, name: str) -> np.ndarray:
+        """Maschera dei NULL di un campo"""
+        col = self.columns[name]
+        if col.dtype == object:
+            return np.fromiter((v is None for v in col), dtype=bool, count=col.size)
+        if col.dtype.kind == 'f':
+            return np.isnan(col)
+        return np.zeros(col.size, dtype=bool)
+
+    def equals(self, name: str, value) -> np.ndarray:
+        """Maschera delle righe con campo uguale a value"""
+        if name not in self.columns:
+            return np.zeros(len(self), dtype=bool)
+        return self.columns[name] == value
+
+    def isin(self, name: str, values) -> np.ndarray:
+        """Maschera delle righe con campo compreso tra i valori dati"""
+        if name not in self.columns:
+            return np.zeros(len(self), dtype=bool)
+        wanted = set(values)
+        col = self.columns[name]
+        return np.fromiter((v in wanted for v in col), dtype=bool, count=col.size)
+
+    def distinct(self) -> 'ComponentTable':
+        """Prima riga per ciascun fid (come un raggruppamento per fid)"""
+        if len(self) == 0:
+            return self
+        first = np.ones(len(self), dtype=bool)
+        first[1:] = self.fid[1:] != self.fid[:-1]
+        return self.take(first)
+
+    def take(self, mask) -> 'ComponentTable':
+        """Sotto-tabella delle righe selezionate (maschera o indici)"""
+        return ComponentTable(self.fid[mask], {n: c[mask] for n, c in self.columns.items()})
+
+    def rows_of(self, fids) -> np.ndarray:
+        """Posizioni delle righe per i fid dati (-1 se assenti)"""
+        fids = np.asarray(fids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(fids.size, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.fid, fids), len(self) - 1)
+        return np.where(self.fid[pos] == fids, pos, -1)
+
+    def lookup(self, name: str, fids) -> np.ndarray:
+        """Valori di un campo per i fid dati (NaN/None se assenti)"""
+        rows = self.rows_of(fids)
+        col = self.columns[name]
+        if col.dtype == object:
+            out = np.empty(rows.size, dtype=object)
+        else:
+            out = np.full(rows.size, np.nan)
+        hit = rows >= 0
+        out[hit] = col[rows[hit]]
+        return out
+
+
+def describe_layer(layer, field_names: List[str], chunk_size: int,
+                   ddof: int = 1, expression: str = '') -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Statistiche descrittive dei campi di un layer, lette a blocchi
+
+    Ogni blocco di chunk_size feature e' convertito in colonne, sommato agli
+    accumulatori (Moments) e scartato: la memoria dipende dal blocco, non
+    dalla dimensione del layer. Campi assenti: None. expression e' un filtro
+    opzionale applicato dal provider, come in ComponentTable.from_layer.
+    """
+    fields = layer.fields()
+    names = [n for n in field_names if fields.lookupField(n) >= 0]
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(names, fields)
+    if expression:
+        request.setFilterExpression(expression)
+    idx = [fields.lookupField(n) for n in names]
+    acc = {n: Moments() for n in names}
+    for chunk in iter_chunks(layer.getFeatures(request), chunk_size):
+        rows = [feat.attributes() for feat in chunk]
+        for n, i in zip(names, idx):
+            acc[n].add(_to_column([r[i] for r in rows]))
+    return {n: acc[n].result(ddof) if n in acc else None for n in field_names}
+
+
+def category_labels(values: np.ndarray) -> np.ndarray:
+    """Etichette testuali delle categorie di una colonna ('NULL' per i NULL)"""
+    return np.array(['NULL' if _is_null(v) or v != v else str(v) for v in np.asarray(values).tolist()],
+                    dtype=object)
+
+
+def group_rows(labels: np.ndarray):
+    """
+    Posizioni delle righe per categoria
+
+    Un ordinamento stabile per categoria e una divisione ai cambi di
+    categoria, invece di una maschera per categoria.
+
+    Returns:
+        Lista di (categoria, posizioni), categorie in ordine crescente
+    """
+    cats, inv = np.unique(np.asarray(labels).astype(str), return_inverse=True)
+    inv = inv.reshape(-1)
+    order = np.argsort(inv, kind='stable')
+    bounds = np.searchsorted(inv[order], np.arange(1, cats.size))
+    return [(str(cat), rows) for cat, rows in zip(cats, np.split(order, bounds))]
+
+
+def robust_stats_layer(layer, field_names: List[str], group_names: List[str], chunk_size: int,
+                       k: int = 400) -> Tuple[Dict[Tuple, Optional[Dict[str, Any]]], bool]:
+    """
+    Statistiche robuste dei campi di un layer, complessive e per categoria
+
+    Con chunk_size <= 0 le colonne sono lette per intero e i quantili sono
+    esatti (robust_stats, np.partition per gruppo). Altrimenti ogni blocco
+    alimenta uno QuantileSketch per campo e gruppo ed e' scartato: la
+    memoria dipende dal blocco e dal numero di gruppi, non dal layer.
+
+    Args:
+        layer: Layer o sorgente
+        field_names: Campi numerici (assenti: ignorati)
+        group_names: Campi delle categorie (assenti: ignorati)
+        chunk_size: Feature per blocco (<= 0: lettura completa ed esatta)
+        k: Dimensione degli sketch
+
+    Returns:
+        ({(campo categoria, categoria, campo): statistiche}, esatte), con
+        campo categoria e categoria None per le statistiche complessive; le
+        chiavi sono in ordine di group_names, categoria e field_names
+    """
+    fields = layer.fields()
+    names = [n for n in field_names if fields.lookupField(n) >= 0]
+    groups = [n for n in group_names if fields.lookupField(n) >= 0]
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(names + groups, fields)
+    idx = [fields.lookupField(n) for n in names + groups]
+
+    def groupings(cols, n):
+        yield (None, None), np.arange(n)
+        for g in groups:
+            for cat, rows in group_rows(category_labels(cols[g])):
+                yield (g, cat), rows
+
+    exact = chunk_size <= 0
+    parts = {n: [] for n in names + groups}
+    sketches = {}
+    for chunk in iter_chunks(layer.getFeatures(request), chunk_size):
+        rows = [feat.attributes() for feat in chunk]
+        cols = {n: _to_column([r[i] for r in rows]) for n, i in zip(names + groups, idx)}
+        if exact:
+            for n in parts:
+                parts[n].append(cols[n])
+            continue
+        for key, pos in groupings(cols, len(rows)):
+            for n in names:
+                sketches.setdefault(key + (n,), QuantileSketch(k)).add(cols[n][pos])
+
+    out = {}
+    if exact:
+        cols = {n: _concat_columns(parts[n]) for n in parts}
+        count = sum(p.size for p in parts[names[0]]) if names else 0
+        for key, pos in groupings(cols, count):
+            for n in names:
+                out[key + (n,)] = robust_stats(cols[n][pos])
+    else:
+        order = {g: i for i, g in enumerate([None] + groups)}
+        for key in sorted(sketches, key=lambda t: (order[t[0]], t[1] or '', names.index(t[2]))):
+            out[key] = sketches[key].result()
+    return out, exact
+
+
+class MatAlgorithmBase:
+    """Utilita' comuni agli algoritmi quantitativi (mixin)"""
+
+    # componenti per blocco di default nell'elaborazione a blocchi
+    DIMENSIONE_BLOCCO = 100000
+    OUTPUT_BATCH = 1000  # feature per addFeatures nei layer scritti dal motore
+    # risoluzione dei range (m): step ed estremi delle classi a 3 decimali
+    QUANTO_RANGE = 0.001
+    # punti della griglia delle curve di densita' e scelta della banda
+    PUNTI_KDE = 512
+    BANDE_KDE = ['ISJ (Improved Sheather-Jones)', 'Silverman']
+
+    # titolo, gruppo e aiuto vengono dalla tabella condivisa (mat_algoritmi),
+    # letta anche dal provider del plugin: name() e' la chiave
+    def displayName(self) -> str:
+        return mat_algoritmi.info(self.name()).titolo
+
+    def group(self) -> str:
+        return mat_algoritmi.gruppo(self.name())
+
+    def groupId(self) -> str:
+        return mat_algoritmi.info(self.name()).id_gruppo
+
+    def shortHelpString(self) -> str:
+        return mat_algoritmi.info(self.name()).aiuto
+
+    def _add_report_parameters(self):
+        """Aggiunge i parametri avanzati del resoconto, dei controlli e della profilazione"""
+        # Resoconto dei tempi per fase (opzionale, parametro avanzato)
+        report = QgsProcessingParameterFileDestination(
+            'report_fasi',
+            'Resoconto tempi per fase (JSON/CSV, opzionale)',
+            'JSON (*.json);;CSV (*.csv)',
+            optional=True,
+            createByDefault=False
+        )
+        report.setFlags(report.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(report)
+
+        # Dettaglio per tipo nei controlli intermedi (parametro avanzato)
+        dettaglio = QgsProcessingParameterBoolean(
+            'dettaglio_verifiche',
+            'Conteggio per tipo nei controlli intermedi del log',
+            defaultValue=True
+        )
+        dettaglio.setFlags(dettaglio.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(dettaglio)
+
+        # Profilazione dettagliata (opzionale, parametro avanzato)
+        profilo = QgsProcessingParameterBoolean(
+            'profilo_dettagliato',
+            'Profilazione dettagliata (cProfile + pile campionate, accanto agli output)',
+            defaultValue=False
+        )
+        profilo.setFlags(profilo.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(profilo)
+
+    def _add_streaming_parameters(self):
+        """Aggiunge i parametri avanzati per i rilievi molto grandi (blocchi, processi)"""
+        blocchi = QgsProcessingParameterBoolean(
+            'elaborazione_a_blocchi',
+            'Elaborazione a blocchi per layer molto grandi (intermedi su disco)',
+            defaultValue=False
+        )
+        blocchi.setFlags(blocchi.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(blocchi)
+
+        dimensione = QgsProcessingParameterNumber(
+            'dimensione_blocco',
+            'Componenti per blocco (elaborazione a blocchi)',
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=self.DIMENSIONE_BLOCCO,
+            minValue=1000
+        )
+        dimensione.setFlags(dimensione.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(dimensione)
+
+        processi = QgsProcessingParameterNumber(
+            'processi_bbox',
+            'Processi paralleli per i bounding box orientati (0 = algoritmo di Processing)',
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=0,
+            minValue=0
+        )
+        processi.setFlags(processi.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(processi)
+
+        cache = QgsProcessingParameterBoolean(
+            'cache_metriche',
+            'Cache delle metriche geometriche accanto al layer rilievo '
+            '(ricalcola solo le geometrie nuove o modificate)',
+            defaultValue=False
+        )
+        cache.setFlags(cache.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cache)
+
+    def _add_range_parameters(self):
+        """Aggiunge gli step dei range e, se previsto, il valore del modulo"""
+        self.addParameter(QgsProcessingParameterNumber(
+            'width_range_step',
+            'Step range larghezza (m)',
+            type=QgsProcessingParameterNumber.Double,
+            defaultValue=self.STEP_LARGHEZZA,
+            minValue=0.001
+        ))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            'height_range_step',
+            'Step range altezza (m)',
+            type=QgsProcessingParameterNumber.Double,
+            defaultValue=self.STEP_ALTEZZA,
+            minValue=0.001
+        ))
+
+        if self.USA_MODULO:
+            self.addParameter(QgsProcessingParameterNumber(
+                'valore_modulo',
+                'Valore del modulo (m, default=piede attico/romano)',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.296,
+                minValue=0.001
+            ))
+
+    def _add_range_comparison_parameters(self):
+        """Aggiunge gli step di confronto dei range e la tabella dei conteggi per step"""
+        confronto = QgsProcessingParameterString(
+            'step_confronto',
+            'Step aggiuntivi dei range da confrontare (m, separati da virgola)',
+            defaultValue='',
+            optional=True
+        )
+        confronto.setFlags(confronto.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(confronto)
+
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            'output_range_step',
+            'Conteggio range per step (confronto)',
+            type=QgsProcessing.TypeVectorAnyGeometry,
+            optional=True,
+            createByDefault=False
+        ))
+
+    def _add_kde_parameters(self):
+        """Aggiunge la tabella delle curve di densita' e la scelta della banda"""
+        banda = QgsProcessingParameterEnum(
+            'banda_kde',
+            "Banda delle curve di densita' (KDE)",
+            options=self.BANDE_KDE,
+            defaultValue=0
+        )
+        banda.setFlags(banda.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(banda)
+
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            'output_kde',
+            "Curve di densita' larghezza/altezza (KDE)",
+            type=QgsProcessing.TypeVectorAnyGeometry,
+            optional=True,
+            createByDefault=False
+        ))
+
+    def _add_robust_stats_parameters(self):
+        """Aggiunge la tabella delle statistiche robuste"""
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            'output_robuste',
+            'Statistiche robuste (mediana, quartili, P5/P95, MAD)',
+            type=QgsProcessing.TypeVectorAnyGeometry,
+            optional=True,
+            createByDefault=False
+        ))
+
+    def _add_filter_parameters(self):
+        """Aggiunge i parametri del filtro materiali"""
+        self.addParameter(QgsProcessingParameterString(
+            'tipo_materiale',
+            'Tipo di materiale (separati da virgola, vuoto=tutti)',
+            defaultValue='',
+            optional=True
+        ))
+
+        self.addParameter(QgsProcessingParameterBoolean(
+            'includi_non_classificati',
+            'Includi elementi non classificati (NULL)',
+            defaultValue=False
+        ))
+
+    def _write_stage_report(self, parameters: Dict, context, feedback, results: Dict):
+        """Stampa i tempi per fase e, se richiesto, salva il resoconto"""
+        self._profiler.log_summary(feedback)
+        report_path = self.parameterAsFileOutput(parameters, 'report_fasi', context)
+        if report_path:
+            results['report_fasi'] = self._profiler.write(report_path)
+            feedback.pushInfo(f"Resoconto tempi per fase salvato in: {report_path}")
+
+    def validate_layer_fields(self, layer, required_fields: List[str], layer_name: str, feedback) -> bool:
+        """
+        Valida che un layer contenga tutti i campi richiesti
+
+        Args:
+            layer: Layer da validare
+            required_fields: Lista dei nomi dei campi richiesti
+            layer_name: Nome del layer (per messaggi di errore)
+            feedback: Oggetto feedback per logging
+
+        Returns:
+            True se tutti i campi esistono, False altrimenti
+
+        Raises:
+            QgsProcessingException: Se mancano campi obbligatori
+        """
+        if not layer:
+            raise QgsProcessingException(f"Layer {layer_name} non valido!")
+
+        existing_fields = [f.name() for f in layer.fields()]
+        missing_fields = [f for f in required_fields if f not in existing_fields]
+
+        if missing_fields:
+            feedback.reportError(f"Campi mancanti in {layer_name}: {', '.join(missing_fields)}")
+            feedback.reportError(f"Campi disponibili: {', '.join(existing_fields)}")
+            raise QgsProcessingException(
+                f"Il layer '{layer_name}' non contiene i campi obbligatori: {', '.join(missing_fields)}"
+            )
+
+        feedback.pushInfo(f"✓ Validazione campi {layer_name} completata")
+        return True
+
+    def get_layer_from_source(self, source, context):
+        """
+        Ottiene un layer da varie sorgenti (stringa, QgsProcessingFeatureSourceDefinition, ecc.)
+        """
+        from qgis.core import QgsProcessingFeatureSourceDefinition
+
+        # Se è già una stringa con ID layer
+        if isinstance(source, str):
+            return QgsProcessingUtils.mapLayerFromString(source, context)
+
+        # Se è un QgsProcessingFeatureSourceDefinition
+        if isinstance(source, QgsProcessingFeatureSourceDefinition):
+            # Estrai la sorgente interna
+            internal_source = source.source
+            if hasattr(internal_source, 'staticValue'):
+                # È un QgsProperty, prendi il valore statico
+                layer_id = internal_source.staticValue()
+            else:
+                layer_id = str(internal_source)
+            return QgsProcessingUtils.mapLayerFromString(layer_id, context)
+
+        # Per altri tipi, prova a convertire in stringa
+        try:
+            return QgsProcessingUtils.mapLayerFromString(str(source), context)
+        except Exception:
+            return None
+
+    def _load_verbosity(self, parameters: Dict, context):
+        """Legge il livello di dettaglio dei controlli intermedi"""
+        self._dettaglio_verifiche = self.parameterAsBool(parameters, 'dettaglio_verifiche', context)
+
+    def _load_streaming(self, parameters: Dict, context, feedback):
+        """Legge i parametri dell'elaborazione a blocchi (0 = tutto in memoria)"""
+        self._blocco = 0
+        if self.parameterAsBool(parameters, 'elaborazione_a_blocchi', context):
+            self._blocco = self.parameterAsInt(parameters, 'dimensione_blocco', context)
+            feedback.pushInfo(f"Elaborazione a blocchi di {self._blocco} componenti, "
+                              f"layer intermedi su disco")
+        self._processi_bbox = self.parameterAsInt(parameters, 'processi_bbox', context)
+        if self._processi_bbox > 0:
+            feedback.pushInfo(f"Bounding box orientati calcolati fino a "
+                              f"{self._processi_bbox} processi paralleli")
+        self._cache_metriche = None
+        if self.parameterAsBool(parameters, 'cache_metriche', context):
+            self._cache_metriche = cache_path(
+                self.parameterAsVectorLayer(parameters, 'layer_rilievo', context))
+            if self._cache_metriche:
+                feedback.pushInfo(f"Cache delle metriche geometriche: {self._cache_metriche[0]}")
+            else:
+                feedback.pushWarning("Cache delle metriche non disponibile: il layer rilievo "
+                                     "non e' su un file in una cartella scrivibile")
+
+    def _temp_output(self, nome: str = 'intermedio') -> str:
+        """Destinazione di un layer intermedio: in memoria oppure, nell'elaborazione
+        a blocchi, un GeoPackage temporaneo su disco"""
+        if getattr(self, '_blocco', 0) > 0:
+            return QgsProcessingUtils.generateTempFilename(f'{nome}.gpkg')
+        return QgsProcessing.TEMPORARY_OUTPUT
+
+    def _temp_sink(self, fields, wkb_type, crs, context, nome: str = 'intermedio',
+                   destination: Optional[str] = None):
+        """Sink di un layer intermedio scritto dal motore (destinazione data o
+        quella di _temp_output); il sink va chiuso (del) prima di usare il layer"""
+        destination = destination or self._temp_output(nome)
+        if destination == QgsProcessing.TEMPORARY_OUTPUT:
+            destination = 'memory:'
+        return QgsProcessingUtils.createFeatureSink(destination, context, fields, wkb_type, crs)
+
+    def _filtered_source(self, source, expression: str, context, feedback,
+                         destination: Optional[str] = None):
+        """
+        Vista filtrata di un layer, senza copiarne le feature
+
+        Il filtro viaggia con la sorgente (filterExpression) ed e' valutato
+        dal provider a ogni lettura: per un GeoPackage diventa una clausola
+        WHERE in SQL. Con QGIS precedenti alla 3.32, o con una sorgente che
+        non e' un riferimento a un layer, le feature sono estratte in un
+        layer intermedio come prima.
+
+        Args:
+            source: ID, percorso o QgsProcessingFeatureSourceDefinition del layer
+            expression: Espressione del filtro
+            context: Contesto di processing
+            feedback: Oggetto feedback per logging
+            destination: Destinazione del layer estratto (default: _temp_output)
+
+        Returns:
+            Sorgente filtrata da passare agli algoritmi successivi
+        """
+        if FILTRO_NEL_PROVIDER and isinstance(source, QgsProcessingFeatureSourceDefinition):
+            if source.filterExpression:
+                expression = f'({source.filterExpression}) AND ({expression})'
+            return QgsProcessingFeatureSourceDefinition(
+                source.source, selectedFeaturesOnly=source.selectedFeaturesOnly,
+                featureLimit=source.featureLimit, flags=source.flags,
+                geometryCheck=source.geometryCheck, filterExpression=expression)
+        if FILTRO_NEL_PROVIDER and isinstance(source, str):
+            return QgsProcessingFeatureSourceDefinition(source, filterExpression=expression)
+
+        return processing.run('native:extractbyexpression', {
+            'INPUT': source,
+            'EXPRESSION': expression,
+            'OUTPUT': destination or self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)['OUTPUT']
+
+    def _oriented_bboxes(self, source, context, feedback, group_field: str = '',
+                         destination: Optional[str] = None) -> Dict:
+        """
+        Bbox orientati minimi calcolati in processi paralleli (mat_bbox),
+        riusando le metriche in cache dei componenti non modificati
+
+        Con group_field: un bbox per valore del campo, sui vertici di tutte le
+        sue geometrie, con i campi [group_field, width, height, angle, area,
+        perimeter] (come qgis:minimumboundinggeometry con TYPE=1). Senza: un
+        bbox per feature, con i suoi attributi seguiti dagli stessi cinque
+        campi (come native:orientedminimumboundingbox).
+
+        Geometrie lette, bbox calcolati e feature scritte un blocco alla
+        volta (_bbox_blocks): nell'elaborazione a blocchi la memoria dipende
+        da dimensione_blocco, non dal numero di componenti.
+
+        Args:
+            source: Layer o sorgente dei componenti
+            context: Contesto di processing
+            feedback: Oggetto feedback per logging
+            group_field: Campo di raggruppamento (opzionale)
+            destination: Destinazione del layer (default: _temp_output)
+
+        Returns:
+            Dizionario con il layer dei bbox ('OUTPUT')
+        """
+        in_fields = source.fields()
+        if group_field:
+            key_idx = in_fields.lookupField(group_field)
+            fields = QgsFields()
+            fields.append(in_fields.field(key_idx))
+        else:
+            key_idx = in_fields.lookupField(FieldNames.FID)
+            fields = QgsFields(in_fields)
+        for name in ('width', 'height', 'angle', 'area', 'perimeter'):
+            fields.append(QgsField(name, QVariant.Double, '', 20, 6))
+
+        # metriche in cache valide solo se l'hash delle geometrie coincide
+        modo = 'vertici' if group_field else 'geometria'
+        cache = None
+        if self._cache_metriche:
+            try:
+                cache = MetricsCache(*self._cache_metriche)
+            except CacheError as e:
+                feedback.pushWarning(f"Cache delle metriche non leggibile ({e}): ricalcolo completo")
+        usa_cache = cache is not None
+        da_cache = calcolati = 0
+
+        sink, dest_id = self._temp_sink(fields, QgsWkbTypes.Polygon, source.sourceCrs(), context,
+                                        destination=destination)
+        nessuno = [None] * 5
+        try:
+            for keys, attrs, groups in self._bbox_blocks(source, key_idx, group_field):
+                bboxes = [None] * len(groups)
+                if cache is not None:
+                    hashes = [geometry_hash(g) for g in groups]
+                    try:
+                        bboxes = cache.lookup(modo, keys, hashes)
+                    except CacheError as e:
+                        feedback.pushWarning(f"Cache delle metriche non leggibile ({e}): "
+                                             f"ricalcolo completo")
+                        cache.close()
+                        cache = None
+
+                todo = [i for i, (g, b) in enumerate(zip(groups, bboxes)) if g and b is None]
+                computed = mat_bbox.oriented_bboxes([groups[i] for i in todo], self._processi_bbox,
+                                                    vertices=bool(group_field), feedback=feedback)
+                if feedback.isCanceled():
+                    raise QgsProcessingException("Elaborazione annullata durante il calcolo "
+                                                 "dei bounding box")
+                for i, bbox in zip(todo, computed):
+                    bboxes[i] = bbox
+                da_cache += sum(1 for g in groups if g) - len(todo)
+                calcolati += len(computed)
+
+                if cache is not None:
+                    try:
+                        cache.store(modo, [keys[i] for i in todo], [hashes[i] for i in todo], computed)
+                    except CacheError as e:
+                        feedback.pushWarning(f"Cache delle metriche non aggiornata: {e}")
+                        cache.close()
+                        cache = None
+
+                batch = []
+                for values, bbox in zip(attrs, bboxes):
+                    out = QgsFeature(fields)
+                    if bbox is None:
+                        out.setAttributes(values + nessuno)
+                    else:
+                        geom = QgsGeometry()
+                        geom.fromWkb(bbox[0])
+                        out.setGeometry(geom)
+                        out.setAttributes(values + list(bbox[1:6]))
+                    batch.append(out)
+                    if len(batch) >= self.OUTPUT_BATCH:
+                        sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                        batch = []
+                if batch:
+                    sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+        finally:
+            if cache is not None:
+                cache.close()
+        del sink
+
+        if usa_cache:
+            feedback.pushInfo(f"Metriche geometriche: {da_cache} dalla cache, {calcolati} calcolate")
+        return {'OUTPUT': dest_id}
+
+    def _bbox_blocks(self, source, key_idx: int, group_field: str = ''):
+        """
+        Blocchi (chiavi, attributi, liste di WKB) per _oriented_bboxes
+
+        Letti dall'iteratore delle feature senza caricare l'intero layer:
+        senza group_field un elemento per feature, _blocco feature per
+        blocco; con group_field le feature sono lette ordinate per il campo,
+        un elemento raccoglie le geometrie di un valore e il blocco si
+        chiude appena supera _blocco geometrie. Con _blocco = 0 un solo
+        blocco, come prima dell'elaborazione a blocchi.
+        """
+        blocco = getattr(self, '_blocco', 0)
+        if not group_field:
+            for chunk in iter_chunks(source.getFeatures(), blocco):
+                keys, attrs, groups = [], [], []
+                for feat in chunk:
+                    values = feat.attributes()
+                    key = values[key_idx] if key_idx >= 0 else None
+                    keys.append(feat.id() if _is_null(key) else key)
+                    attrs.append(values)
+                    groups.append([bytes(feat.geometry().asWkb())] if feat.hasGeometry() else [])
+                yield keys, attrs, groups
+            return
+
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes([key_idx])
+        # valori uguali contigui: i gruppi si chiudono man mano
+        request.addOrderBy(QgsExpression.quotedColumnRef(group_field))
+        keys, groups, n_geom = [], [], 0
+        for key, feats in itertools.groupby(source.getFeatures(request),
+                                            key=lambda feat: feat.attributes()[key_idx]):
+            wkbs = [bytes(feat.geometry().asWkb()) for feat in feats if feat.hasGeometry()]
+            if not wkbs:
+                continue
+            keys.append(key)
+            groups.append(wkbs)
+            n_geom += len(wkbs)
+            if blocco > 0 and n_geom >= blocco:
+                yield keys, [[k] for k in keys], groups
+                keys, groups, n_geom = [], [], 0
+        if keys:
+            yield keys, [[k] for k in keys], groups
+
+    def verifica_features(self, layer_id, context, feedback, step_name: str,
+                          tabella: Optional[ComponentTable] = None) -> int:
+        """
+        Conta e mostra le features a ogni step con dettagli per tipo
+
+        Il conteggio non scorre mai le feature: se lo step dispone della
+        tabella colonnare dei componenti che contiene (tabella) numero e
+        dettaglio per tipo vengono da li' senza nemmeno risolvere il layer,
+        altrimenti si usa il conteggio del provider e il dettaglio e' omesso.
+
+        Args:
+            layer_id: ID o sorgente del layer da verificare
+            context: Contesto di processing
+            feedback: Oggetto feedback per logging
+            step_name: Nome dello step per il log
+            tabella: Attributi in memoria delle feature del layer (opzionale)
+
+        Returns:
+            Numero di features nel layer
+        """
+        if tabella is not None:
+            count = len(tabella)
+        else:
+            layer = self.get_layer_from_source(layer_id, context)
+            if not layer or not layer.isValid():
+                feedback.pushWarning(f"Layer non valido per step: {step_name}")
+                return 0
+            count = layer.featureCount()
+
+        feedback.pushInfo(f"  --> {step_name}: {count} features")
+
+        # Dettagli per tipo dalle colonne gia' in memoria
+        if (tabella is not None and FieldNames.TIPO in tabella
+                and getattr(self, '_dettaglio_verifiche', True)):
+            for tipo, cnt in sorted(value_counts(tabella.column(FieldNames.TIPO)).items()):
+                feedback.pushInfo(f"      * {tipo}: {cnt}")
+
+        return count
+
+    def parse_tipi(self, tipo_input: str) -> List[str]:
+        """Tipi di materiale dalla stringa del parametro (separati da virgola)"""
+        return [t.strip() for t in tipo_input.split(',') if t.strip()]
+
+    def parse_steps(self, step_input: str) -> List[float]:
+        """Step di confronto dalla stringa del parametro (m, separati da virgola)"""
+        steps = []
+        for token in step_input.split(','):
+            token = token.strip()
+            if not token:
+                continue
+            try:
+                step = float(token)
+            except ValueError:
+                raise QgsProcessingException(f"Step di confronto non valido: '{token}'")
+            if step <= 0:
+                raise QgsProcessingException(f"Gli step di confronto devono essere maggiori di 0: {token}")
+            steps.append(step)
+        return steps
+
+    def build_filter_expression(self, tipi: List[str], includi_null: bool) -> str:
+        """
+        Costruisce l'espressione di filtro per i materiali
+
+        Args:
+            tipi: Lista dei tipi di materiale da filtrare
+            includi_null: Se includere valori NULL
+
+        Returns:
+            Espressione SQL per il filtro
+        """
+        if not tipi:
+            return ""
+
+        # Escape delle virgolette nei valori
+        tipi_escaped = [t.replace("'", "''") for t in tipi]
+
+        if len(tipi_escaped) == 1:
+            expr = f'"{FieldNames.TIPO}" = \'{tipi_escaped[0]}\''
+        else:
+            tipi_quoted = "','".join(tipi_escaped)
+            expr = f'"{FieldNames.TIPO}" IN (\'{tipi_quoted}\')'
+
+        # Aggiungi condizione per NULL se richiesto
+        if includi_null:
+            expr = f'({expr}) OR "{FieldNames.TIPO}" IS NULL'
+
+        return expr
+
+    def filter_table(self, componenti: ComponentTable, tipi: List[str],
+                     includi_null: bool) -> ComponentTable:
+        """Stesso filtro di build_filter_expression applicato alle colonne in memoria"""
+        mask = componenti.isin(FieldNames.TIPO, tipi)
+        if includi_null and FieldNames.TIPO in componenti:
+            mask |= componenti.isnull(FieldNames.TIPO)
+        return componenti.take(mask)
+
+    def create_field_mapping(self, field_configs: List[Tuple[str, str, int, int, int]]) -> List[Dict]:
+        """
+        Crea la configurazione dei campi per refactorfields
+
+        Args:
+            field_configs: Lista di tuple (expression, name, type, length, precision)
+
+        Returns:
+            Lista di dizionari per FIELDS_MAPPING
+        """
+        return [
+            {
+                'expression': expr,
+                'name': name,
+                'type': field_type,
+                'length': length,
+                'precision': precision
+            }
+            for expr, name, field_type, length, precision in field_configs
+        ]
+
+    def range_formula(self, field_name: str, step: float) -> str:
+        """
+        Espressione della classe di range 'a - b' di un campo per lo step dato
+
+        La classe e' calcolata in quanti (QUANTO_RANGE) arrotondati a
+        DECIMALI_QUANTO, come histogram_pyramid: un valore sul bordo cade
+        nella classe che inizia li' in entrambi.
+        """
+        quantum = self.QUANTO_RANGE
+        units = round(step / quantum, DECIMALI_QUANTO)
+        bin_expr = f'floor(round("{field_name}"/{quantum}, {DECIMALI_QUANTO})/{units})'
+        return f'''CASE 
+    WHEN "{field_name}" IS NULL THEN 'N/A'
+    ELSE concat(
+        round({bin_expr}*{step}, 3),
+        ' - ',
+        round(({bin_expr}+1)*{step}, 3)
+    )
+END'''
+
+    def _add_range_fields(self, input_layer, width_step: float, height_step: float,
+                          context, feedback) -> Dict:
+        """Aggiunge i campi width_bbox_range e height_bbox_range"""
+        with_width_range = processing.run('native:fieldcalculator', {
+            'INPUT': input_layer,
+            'FIELD_NAME': 'width_bbox_range',
+            'FIELD_TYPE': 2,  # string
+            'FORMULA': self.range_formula(FieldNames.WIDTH_BBOX, width_step),
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        return processing.run('native:fieldcalculator', {
+            'INPUT': with_width_range['OUTPUT'],
+            'FIELD_NAME': 'height_bbox_range',
+            'FIELD_TYPE': 2,
+            'FORMULA': self.range_formula(FieldNames.HEIGHT_BBOX, height_step),
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+    @profiled_stage('CONFRONTO STEP RANGE')
+    def _write_range_comparison(self, source, width_step: float, height_step: float,
+                                extra: List[float], parameters: Dict, context, feedback,
+                                results: Dict, group_field: str = ''):
+        """
+        Conteggi per classe di range a tutti gli step richiesti, in una tabella
+
+        Per ogni asse un solo istogramma alla risoluzione piu' fine
+        (histogram_pyramid): gli step dei range e quelli di step_confronto ne
+        sommano le classi adiacenti. Una riga per asse, step, categoria e
+        classe, con le stesse etichette di range_formula.
+
+        Args:
+            source: Layer o sorgente dei componenti interi
+            width_step: Step range larghezza (m)
+            height_step: Step range altezza (m)
+            extra: Step di confronto (m, da parse_steps)
+            parameters: Parametri dell'algoritmo
+            context: Contesto di processing
+            feedback: Oggetto feedback per logging
+            results: Dizionario dei risultati
+            group_field: Campo delle categorie (opzionale, es. campione)
+        """
+        feedback.pushInfo("\n--- CONFRONTO STEP DEI RANGE ---")
+
+        fields = QgsFields()
+        fields.append(QgsField('asse', QVariant.String, len=20))
+        fields.append(QgsField('step', QVariant.Double, len=10, prec=4))
+        if group_field:
+            fields.append(QgsField(group_field, QVariant.String, len=50))
+        fields.append(QgsField('range', QVariant.String, len=50))
+        fields.append(QgsField('range_min', QVariant.Double, len=10, prec=3))
+        fields.append(QgsField('range_max', QVariant.Double, len=10, prec=3))
+        fields.append(QgsField('count', QVariant.Int))
+
+        (sink, dest_id) = self.parameterAsSink(
+            parameters, 'output_range_step', context, fields, QgsWkbTypes.NoGeometry
+        )
+        if sink is None:
+            feedback.pushWarning("Step di confronto indicati ma la tabella 'Conteggio range "
+                                 "per step' non e' attiva: confronto non calcolato")
+            return
+
+        # step di confronto in millimetri interi: la classe piu' fine e' il loro MCD
+        def to_units(step):
+            units = max(1, int(round(step / self.QUANTO_RANGE)))
+            if abs(units * self.QUANTO_RANGE - step) > 1e-9:
+                feedback.pushWarning(f"Step {step} arrotondato a {units * self.QUANTO_RANGE:.3f} m")
+            return units
+
+        # lo step dei range resta quello esatto, come in range_formula: le sue
+        # righe coincidono con le tabelle Conteggio range anche fuori dal mm
+        def main_units(step):
+            units = round(step / self.QUANTO_RANGE, DECIMALI_QUANTO)
+            return int(units) if float(units).is_integer() else units
+
+        extra_units = [to_units(step) for step in extra]
+
+        def fmt(x):
+            return f'{x:.3f}'.rstrip('0').rstrip('.')
+
+        table = ComponentTable.from_layer(
+            QgsProcessingUtils.variantToSource(source, context),
+            [FieldNames.WIDTH_BBOX, FieldNames.HEIGHT_BBOX] + ([group_field] if group_field else []),
+            chunk_size=self._blocco
+        )
+        groups = table.column(group_field) if group_field in table else None
+
+        batch = []
+        for asse, field, step in [('larghezza', FieldNames.WIDTH_BBOX, width_step),
+                                  ('altezza', FieldNames.HEIGHT_BBOX, height_step)]:
+            if field not in table:
+                continue
+            passi = {u: u * self.QUANTO_RANGE for u in extra_units}
+            passi[main_units(step)] = step
+            units = sorted(passi)
+            pyramid = histogram_pyramid(table.column(field), units, self.QUANTO_RANGE, groups)
+            interi = [u for u in units if float(u).is_integer()]
+            base = f"istogramma a {int(np.gcd.reduce(interi)) * self.QUANTO_RANGE:.3f} m, " if interi else ''
+            feedback.pushInfo(f"{asse.capitalize()}: {base}"
+                              f"step {', '.join(f'{passi[u]:g}' for u in units)} m")
+            for u in units:
+                step_m = passi[u]
+                for cat, b, n in zip(*pyramid[u]):
+                    lo, hi = round(b * step_m, 3), round((b + 1) * step_m, 3)
+                    feat = QgsFeature(fields)
+                    values = [asse, round(step_m, 4)]
+                    if group_field:
+                        values.append(str(cat.item() if hasattr(cat, 'item') else cat))
+                    values.extend([f'{fmt(lo)} - {fmt(hi)}', lo, hi, int(n)])
+                    feat.setAttributes(values)
+                    batch.append(feat)
+                    if len(batch) >= self.OUTPUT_BATCH:
+                        sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                        batch = []
+        if batch:
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+        del sink
+
+        results['output_range_step'] = dest_id
+        context.layerToLoadOnCompletionDetails(dest_id).name = self._layer_name("conteggio_range_per_step")
+
+    @profiled_stage("CURVE DI DENSITA'")
+    def _write_kde(self, source, parameters: Dict, context, feedback, results: Dict,
+                   per_campione: bool = False):
+        """
+        Curve di densita' di kernel di larghezza e altezza dei bbox
+
+        Una curva gaussiana per gruppo su una griglia comune per asse, con
+        binnatura lineare e convoluzione FFT (mat_numpy.binned_kde): il costo
+        e' una lettura delle colonne piu' O(G log G) per curva. La banda e'
+        scelta per gruppo (ISJ o Silverman; ISJ ricade su Silverman per i
+        gruppi con pochi valori distinti). Una riga per asse, gruppo e punto
+        della griglia, per i grafici a linee di DataPlotly.
+
+        Args:
+            source: Layer o sorgente dei componenti interi
+            parameters: Parametri dell'algoritmo
+            context: Contesto di processing
+            feedback: Oggetto feedback per logging
+            results: Dizionario dei risultati
+            per_campione: Curve per campione e per sito invece di una
+                curva complessiva
+        """
+        feedback.pushInfo("\n--- CURVE DI DENSITA' (KDE) ---")
+
+        fields = QgsFields()
+        fields.append(QgsField('asse', QVariant.String, len=20))
+        fields.append(QgsField(FieldNames.SITO, QVariant.String, len=50))
+        fields.append(QgsField(FieldNames.CAMPIONE, QVariant.String, len=50))
+        fields.append(QgsField('valore', QVariant.Double, len=10, prec=6))
+        fields.append(QgsField('densita', QVariant.Double, len=20, prec=6))
+        fields.append(QgsField('banda', QVariant.Double, len=10, prec=6))
+        fields.append(QgsField('n', QVariant.Int))
+
+        (sink, dest_id) = self.parameterAsSink(
+            parameters, 'output_kde', context, fields, QgsWkbTypes.NoGeometry
+        )
+        if sink is None:
+            return
+        isj = self.parameterAsEnum(parameters, 'banda_kde', context) == 0
+
+        names = [FieldNames.WIDTH_BBOX, FieldNames.HEIGHT_BBOX]
+        if per_campione:
+            names += [FieldNames.CAMPIONE, FieldNames.SITO]
+        table = ComponentTable.from_layer(QgsProcessingUtils.variantToSource(source, context),
+                                          names, chunk_size=self._blocco)
+
+        def labels(name):
+            if name not in table:
+                return np.full(len(table), 'NULL', dtype=object)
+            return category_labels(table.column(name))
+
+        # gruppi come posizioni delle righe: (sito, campione, righe)
+        if per_campione:
+            campioni, siti = labels(FieldNames.CAMPIONE), labels(FieldNames.SITO)
+            gruppi = [(siti[rows[0]], cat, rows) for cat, rows in group_rows(campioni)]
+            gruppi += [(cat, None, rows) for cat, rows in group_rows(siti)]
+        else:
+            gruppi = [(None, None, np.arange(len(table)))]
+
+        batch = []
+        for asse, field in [('larghezza', FieldNames.WIDTH_BBOX), ('altezza', FieldNames.HEIGHT_BBOX)]:
+            if field not in table:
+                continue
+            column = np.asarray(table.column(field), dtype=np.float64)
+            curve, ripiego, scartati = [], 0, 0
+            for sito, campione, rows in gruppi:
+                x = column[rows]
+                x = x[~np.isnan(x)]
+                if np.unique(x).size < 2:
+                    scartati += 1
+                    continue
+                h = mat_numpy.bandwidth_isj(x) if isj else None
+                if h is None:
+                    ripiego += 1 if isj else 0
+                    h = mat_numpy.bandwidth_silverman(x)
+                if not h > 0:
+                    scartati += 1
+                    continue
+                curve.append((sito, campione, x, h))
+            if not curve:
+                feedback.pushWarning(f"{asse.capitalize()}: nessun gruppo con almeno due valori distinti")
+                continue
+
+            # griglia comune dell'asse, con quattro bande di margine
+            lo = min(float(x.min()) - 4 * h for _, _, x, h in curve)
+            hi = max(float(x.max()) + 4 * h for _, _, x, h in curve)
+            grid = np.linspace(lo, hi, self.PUNTI_KDE)
+            for sito, campione, x, h in curve:
+                density = mat_numpy.binned_kde(x, lo, hi, self.PUNTI_KDE, h)
+                for value, d in zip(grid.tolist(), density.tolist()):
+                    feat = QgsFeature(fields)
+                    feat.setAttributes([asse, sito, campione, value, d, float(h), int(x.size)])
+                    batch.append(feat)
+                if len(batch) >= self.OUTPUT_BATCH:
+                    sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                    batch = []
+
+            bande = [h for _, _, _, h in curve]
+            feedback.pushInfo(f"{asse.capitalize()}: {len(curve)} curve, banda "
+                              f"{self.BANDE_KDE[0 if isj else 1].split(' ')[0]} "
+                              f"da {min(bande):.4f} a {max(bande):.4f} m")
+            if ripiego:
+                feedback.pushInfo(f"  ISJ senza soluzione per {ripiego} gruppi: regola di Silverman")
+            if scartati:
+                feedback.pushWarning(f"  {scartati} gruppi con meno di due valori distinti esclusi")
+        if batch:
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+        del sink
+
+        results['output_kde'] = dest_id
+        context.layerToLoadOnCompletionDetails(dest_id).name = self._layer_name("curve_densita")
+
+    @profiled_stage('STATISTICHE ROBUSTE')
+    def _write_robust_stats(self, source, parameters: Dict, context, feedback, results: Dict,
+                            per_campione: bool = False):
+        """
+        Mediana, quartili, P5/P95, IQR e MAD di larghezza, altezza e area
+
+        Statistiche complessive, per campione (per_campione) e per tipo, in
+        formato lungo: una riga per livello, gruppo e variabile. Esatte con
+        la lettura completa, da sketch KLL combinabili con la lettura a
+        blocchi (robust_stats_layer); il campo calcolo dice quale.
+
+        Args:
+            source: Layer o sorgente dei componenti interi
+            parameters: Parametri dell'algoritmo
+            context: Contesto di processing
+            feedback: Oggetto feedback per logging
+            results: Dizionario dei risultati
+            per_campione: Aggiunge le statistiche per campione
+        """
+        feedback.pushInfo("\n--- STATISTICHE ROBUSTE ---")
+
+        fields = QgsFields()
+        fields.append(QgsField('livello', QVariant.String, len=20))
+        fields.append(QgsField('gruppo', QVariant.String, len=50))
+        fields.append(QgsField('variabile', QVariant.String, len=20))
+        fields.append(QgsField('n', QVariant.Int))
+        for name in [q for q, _ in QUANTILI] + ['iqr', 'mad']:
+            fields.append(QgsField(name, QVariant.Double, len=10, prec=6))
+        fields.append(QgsField('calcolo', QVariant.String, len=20))
+
+        (sink, dest_id) = self.parameterAsSink(
+            parameters, 'output_robuste', context, fields, QgsWkbTypes.NoGeometry
+        )
+        if sink is None:
+            return
+
+        variabili = {FieldNames.WIDTH_BBOX: 'larghezza', FieldNames.HEIGHT_BBOX: 'altezza',
+                     FieldNames.AREA_COMPONENTE: 'area'}
+        groups = ([FieldNames.CAMPIONE] if per_campione else []) + [FieldNames.TIPO]
+        stats, exact = robust_stats_layer(QgsProcessingUtils.variantToSource(source, context),
+                                          list(variabili), groups, self._blocco)
+        calcolo = 'esatto' if exact else 'sketch KLL'
+
+        batch = []
+        for (livello, gruppo, name), st in stats.items():
+            if st is None:
+                continue
+            feat = QgsFeature(fields)
+            feat.setAttributes([livello or 'complessivo', gruppo, variabili[name], st['count']]
+                               + [st[q] for q, _ in QUANTILI] + [st['iqr'], st['mad'], calcolo])
+            batch.append(feat)
+            if len(batch) >= self.OUTPUT_BATCH:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                batch = []
+        if batch:
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+        del sink
+
+        for name, label in variabili.items():
+            st = stats.get((None, None, name))
+            if st:
+                feedback.pushInfo(f"{label.capitalize()}: mediana {st['mediana']:.4f}, "
+                                  f"IQR {st['iqr']:.4f}, MAD {st['mad']:.4f} (n={st['count']})")
+        feedback.pushInfo(f"{sum(1 for st in stats.values() if st)} righe, calcolo {calcolo}")
+
+        results['output_robuste'] = dest_id
+        context.layerToLoadOnCompletionDetails(dest_id).name = self._layer_name("statistiche_robuste")
+
+    def _add_modulo_fields(self, layer, valore_modulo: float, solo_interi: bool, feedback):
+        """
+        Aggiunge al layer la variabile @modulo e i campi virtuali del modulo
+
+        Args:
+            layer: Layer di analisi del rilievo
+            valore_modulo: Valore del modulo (m)
+            solo_interi: Se True i campi valgono NULL per superficie != 'intera'
+            feedback: Oggetto feedback per logging
+        """
+        from qgis.core import QgsField
+
+        # Aggiungi variabile modulo al layer
+        QgsExpressionContextUtils.setLayerVariable(layer, 'modulo', valore_modulo)
+        if solo_interi:
+            feedback.pushInfo(f"Variabile 'modulo' aggiunta al layer (valore: {valore_modulo})")
+        else:
+            feedback.pushInfo(f"✓ Variabile 'modulo' aggiunta al layer (valore: {valore_modulo} m)")
+
+        campi = [
+            ('width_modulo', 'floor("width_bbox" / @modulo)', QVariant.Int),
+            ('Δwidth_modulo', 'round("width_bbox" % @modulo, 3)', QVariant.Double),
+            ('height_modulo', 'floor("height_bbox" / @modulo)', QVariant.Int),
+            ('Δheight_modulo', 'round("height_bbox" % @modulo, 3)', QVariant.Double)
+        ]
+        for nome, expr, tipo in campi:
+            if solo_interi:
+                expr = f'''CASE 
+        WHEN "superficie" = 'intera' THEN {expr}
+        ELSE NULL
+    END'''
+            layer.addExpressionField(expr, QgsField(nome, tipo))
+            if solo_interi:
+                feedback.pushInfo(f"Campo virtuale '{nome}' aggiunto (solo per superficie='intera')")
+            else:
+                feedback.pushInfo(f"✓ Campo virtuale '{nome}' aggiunto (tutti i componenti)")
+
+    def _log_filter_summary(self, applica_filtro: bool, tipi: List[str], includi_null: bool, feedback):
+        """Riepilogo del filtro materiali"""
+        if applica_filtro:
+            feedback.pushInfo(f"\n[FILTRO APPLICATO]")
+            feedback.pushInfo(f"Tipi materiale: {', '.join(tipi)}")
+            if includi_null:
+                feedback.pushInfo("Include non classificati: SI")
+        else:
+            feedback.pushInfo("\n[NESSUN FILTRO] - Tutti i materiali inclusi")
+
+
+# ============ ANALISI CON LAYER CAMPIONI ============
+class AnalisiCampioneEngine(MatAlgorithmBase):
+    """
+    Analisi quantitativa con layer campioni (mixin)
+
+    Costanti di classe da impostare nello script:
+        TITOLO: Titolo nel log ('MATTONI', 'COMPONENTI A SECCO', ...)
+        SUFFISSO_LAYER: Suffisso dei nomi dei layer di output
+        COMPONENTI: Nome dei componenti nei campi statistici ('mattoni', 'componenti')
+        STEP_LARGHEZZA, STEP_ALTEZZA: Step di default dei range (m)
+        USA_MODULO: Se aggiungere il parametro modulo e i relativi campi virtuali
+        CALCOLI_FINALI: Tuple (campo, tipo calcolo, formula, tipo output, precisione)
+            dei campi calcolati per campione, nell'ordine di output
+    """
+
+    TOTAL_STEPS = 19
+    TITOLO = ''
+    SUFFISSO_LAYER = ''
+    COMPONENTI = 'componenti'
+    STEP_LARGHEZZA = 0.01
+    STEP_ALTEZZA = 0.01
+    USA_MODULO = False
+    CALCOLI_FINALI = ()
+    # campi del campione riportati sui componenti dallo spatial join
+    CAMPI_CAMPIONE = (FieldNames.CAMPIONE, FieldNames.AMBIENTE, FieldNames.USM, FieldNames.SITO)
+
+    def initAlgorithm(self, config=None):
+        """Inizializza i parametri dell'algoritmo"""
+        # Input layers
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            'layer_rilievo',
+            'Layer rilievo (poligoni componenti muratura)',
+            types=[QgsProcessing.TypeVectorPolygon],
+            defaultValue='rilievo'
+        ))
+
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            'layer_campioni',
+            'Layer campioni (poligoni aree campioni)',
+            types=[QgsProcessing.TypeVectorPolygon],
+            defaultValue='campioni'
+        ))
+
+        # Parametri filtro e range
+        self._add_filter_parameters()
+        self._add_range_parameters()
+
+        # Output layers
+        self._add_output_parameters()
+
+    def _add_output_parameters(self):
+        """Aggiunge i parametri di output"""
+        outputs = [
+            ('output_bbox', 'Min oriented bbox', QgsProcessing.TypeVectorPolygon),
+            ('output_rilievo', 'Analisi rilievo', QgsProcessing.TypeVectorPolygon),
+            ('output_campioni_table', 'Analisi campioni (tabella)', QgsProcessing.TypeVectorAnyGeometry),
+            ('output_campioni', 'Analisi campioni (layer poligonale)', QgsProcessing.TypeVectorAnyGeometry),
+            ('output_width_range', 'Conteggio range larghezza', QgsProcessing.TypeVectorAnyGeometry),
+            ('output_height_range', 'Conteggio range altezza', QgsProcessing.TypeVectorAnyGeometry)
+        ]
+
+        for param_name, description, geom_type in outputs:
+            self.addParameter(QgsProcessingParameterFeatureSink(
+                param_name, description, type=geom_type
+            ))
+
+        self._add_range_comparison_parameters()
+        self._add_kde_parameters()
+        self._add_robust_stats_parameters()
+        self._add_report_parameters()
+        self._add_streaming_parameters()
+
+        riusa = QgsProcessingParameterBoolean(
+            'riusa_fasi',
+            'Riusa spatial join, filtro e bounding box delle esecuzioni precedenti '
+            'con gli stessi dati e parametri',
+            defaultValue=False
+        )
+        riusa.setFlags(riusa.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(riusa)
+
+    def _layer_name(self, prefix: str) -> str:
+        """Nome del layer di output per il caricamento nel progetto"""
+        return f"{prefix}_{self.SUFFISSO_LAYER}"
+
+    def _load_stage_cache(self, parameters: Dict, context, feedback):
+        """
+        Grafo delle fasi memorizzate tra un'esecuzione e l'altra
+
+        Con il parametro disattivato ogni fase e' calcolata come sempre
+        (StageCache senza cartella). Le impronte dei layer in ingresso
+        entrano nelle chiavi delle fasi che ne dipendono.
+        """
+        self._fasi = StageCache(enabled=False)
+        self._impronte = {}
+        if not self.parameterAsBool(parameters, 'riusa_fasi', context):
+            return
+        try:
+            self._fasi = StageCache()
+        except OSError as e:
+            feedback.pushWarning(f"Riuso delle fasi non disponibile: {e}")
+            return
+        for name in ('layer_rilievo', 'layer_campioni'):
+            self._impronte[name] = layer_fingerprint(
+                parameters.get(name), self.parameterAsVectorLayer(parameters, name, context))
+            if self._impronte[name] is None:
+                feedback.pushWarning(f"Il parametro {name} non e' un layer su file: le fasi "
+                                     f"che ne dipendono saranno sempre ricalcolate")
+        feedback.pushInfo(f"Riuso delle fasi attivo (cartella {self._fasi.folder})")
+
+    def _log_stage_reuse(self, feedback):
+        """Riporta nel log le fasi riusate da esecuzioni precedenti"""
+        if self._fasi.folder:
+            riusate = ', '.join(self._fasi.riusate) or 'nessuna (output salvati per le prossime esecuzioni)'
+            feedback.pushInfo(f"\n[FASI RIUSATE] {riusate}")
+
+    @profilable('profilo_dettagliato')
+    def processAlgorithm(self, parameters: Dict, context, model_feedback) -> Dict[str, Any]:
+        """
+        Algoritmo principale di elaborazione
+
+        Args:
+            parameters: Dizionario dei parametri di input
+            context: Contesto di processing
+            model_feedback: Oggetto feedback del modello
+
+        Returns:
+            Dizionario con i risultati dell'elaborazione
+
+        Raises:
+            QgsProcessingException: In caso di errori durante l'elaborazione
+        """
+        feedback = QgsProcessingMultiStepFeedback(self.TOTAL_STEPS, model_feedback)
+        results = {}
+        self._profiler = StageProfiler(self.name(), feedback)
+
+        try:
+            self._log_header(feedback)
+            self._load_verbosity(parameters, context)
+            self._load_streaming(parameters, context, feedback)
+            self._load_stage_cache(parameters, context, feedback)
+
+            # ============ FASE 1: CARICAMENTO E VALIDAZIONE ============
+            params = self._load_and_validate_parameters(parameters, context, feedback)
+            feedback.setCurrentStep(1)
+
+            # ============ FASE 2: SPATIAL JOIN ============
+            assegnazioni = self._fasi.run(
+                'SPATIAL JOIN',
+                {'rilievo': self._impronte.get('layer_rilievo'),
+                 'campioni': self._impronte.get('layer_campioni'),
+                 'geometrie_non_valide': context.invalidGeometryCheck()},
+                lambda output: self._spatial_join(params, context, feedback, output)['OUTPUT']
+            )
+            feedback.setCurrentStep(2)
+
+            # ============ FASE 3: FILTRO MATERIALI ============
+            layer_rilievo = parameters['layer_rilievo']
+            layer_base, componenti = self._apply_material_filter(
+                layer_rilievo, params, context, feedback
+            )
+            feedback.setCurrentStep(3)
+
+            # ============ FASE 4-6: BOUNDING BOX ============
+            bbox_final, componenti_bbox = self._compute_bounding_boxes(
+                layer_rilievo, layer_base, assegnazioni, componenti, parameters,
+                context, feedback, results
+            )
+            feedback.setCurrentStep(6)
+
+            # ============ FASE 7: SEPARAZIONE INTERI/PARZIALI ============
+            interi, parziali, count_interi, count_parziali = self._separate_complete_partial(
+                bbox_final['OUTPUT'], componenti_bbox, context, feedback
+            )
+            feedback.setCurrentStep(7)
+
+            # ============ FASE 8-9: RANGE E STATISTICHE ============
+            with_ranges = self._compute_ranges(
+                interi['OUTPUT'], params['width_step'], params['height_step'],
+                context, feedback
+            )
+            feedback.setCurrentStep(8)
+
+            stats = self._compute_statistics(
+                interi['OUTPUT'], parziali['OUTPUT'], with_ranges['OUTPUT'],
+                parameters, context, feedback, results
+            )
+            if params['step_confronto']:
+                self._write_range_comparison(
+                    interi['OUTPUT'], params['width_step'], params['height_step'],
+                    params['step_confronto'], parameters, context, feedback, results,
+                    group_field=FieldNames.CAMPIONE
+                )
+            if parameters.get('output_kde'):
+                self._write_kde(interi['OUTPUT'], parameters, context, feedback, results,
+                                per_campione=True)
+            if parameters.get('output_robuste'):
+                self._write_robust_stats(interi['OUTPUT'], parameters, context, feedback, results,
+                                         per_campione=True)
+            feedback.setCurrentStep(10)
+
+            # ============ FASE 10-11: ANALISI RILIEVO ============
+            self._create_rilievo_analysis(
+                layer_base, bbox_final['OUTPUT'],
+                componenti.take(np.isin(componenti.fid, componenti_bbox.fid)), parameters,
+                params.get('valore_modulo'), context, feedback, results
+            )
+            feedback.setCurrentStep(11)
+
+            # ============ FASE 12-17: ANALISI CAMPIONI ============
+            self._create_campioni_analysis(
+                parameters, stats, context, feedback, results
+            )
+            feedback.setCurrentStep(17)
+
+            # ============ RIEPILOGO ============
+            self._log_summary(
+                count_interi, count_parziali, params, results, context, feedback
+            )
+
+            # ============ TEMPI PER FASE ============
+            self._log_stage_reuse(feedback)
+            self._write_stage_report(parameters, context, feedback, results)
+
+            return results
+
+        except QgsProcessingException:
+            raise
+        except Exception as e:
+            feedback.reportError(f"\nERRORE IMPREVISTO: {str(e)}")
+            import traceback
+            feedback.reportError(traceback.format_exc())
+            raise QgsProcessingException(f"Errore durante l'elaborazione: {str(e)}")
+
+    def _log_header(self, feedback):
+        """Stampa l'intestazione del log"""
+        feedback.pushInfo("\n" + "="*70)
+        feedback.pushInfo(f"ANALISI QUANTITATIVA {self.TITOLO} - VERSIONE 2.0")
+        feedback.pushInfo("="*70)
+
+    @profiled_stage('CARICAMENTO E VALIDAZIONE')
+    def _load_and_validate_parameters(self, parameters: Dict, context, feedback) -> Dict:
+        """Carica e valida tutti i parametri di input"""
+        feedback.pushInfo("\n--- CARICAMENTO E VALIDAZIONE PARAMETRI ---")
+
+        # Carica layer
+        layer_rilievo = self.parameterAsSource(parameters, 'layer_rilievo', context)
+        layer_campioni = self.parameterAsSource(parameters, 'layer_campioni', context)
+
+        # Valida feature count
+        if layer_rilievo.featureCount() == 0:
+            raise QgsProcessingException("Il layer rilievo è vuoto!")
+        if layer_campioni.featureCount() == 0:
+            raise QgsProcessingException("Il layer campioni è vuoto!")
+
+        feedback.pushInfo(f"Layer rilievo: {layer_rilievo.featureCount()} features")
+        feedback.pushInfo(f"Layer campioni: {layer_campioni.featureCount()} features")
+
+        # Valida campi obbligatori
+        required_rilievo = [
+            FieldNames.FID, FieldNames.TIPO, FieldNames.SUPERFICIE,
+            FieldNames.AREA_COMPONENTE, FieldNames.NUM_COMPONENTE
+        ]
+        required_campioni = [
+            FieldNames.CAMPIONE, FieldNames.SITO, FieldNames.AMBIENTE,
+            FieldNames.USM, FieldNames.AREA_CAMPIONE
+        ]
+
+        self.validate_layer_fields(layer_rilievo, required_rilievo, "rilievo", feedback)
+        self.validate_layer_fields(layer_campioni, required_campioni, "campioni", feedback)
+
+        # Tipo e superficie letti una volta sola: i controlli delle fasi
+        # successive derivano conteggi e dettagli da queste colonne
+        componenti = ComponentTable.from_layer(
+            layer_rilievo, [FieldNames.TIPO, FieldNames.SUPERFICIE], as_object=True,
+            chunk_size=self._blocco
+        )
+
+        # Carica altri parametri
+        tipo_input = self.parameterAsString(parameters, 'tipo_materiale', context).strip()
+        includi_null = self.parameterAsBool(parameters, 'includi_non_classificati', context)
+        width_step = self.parameterAsDouble(parameters, 'width_range_step', context)
+        height_step = self.parameterAsDouble(parameters, 'height_range_step', context)
+
+        # Valida step
+        if width_step <= 0:
+            raise QgsProcessingException("Lo step larghezza deve essere maggiore di 0!")
+        if height_step <= 0:
+            raise QgsProcessingException("Lo step altezza deve essere maggiore di 0!")
+
+        params = {
+            'layer_rilievo': layer_rilievo,
+            'layer_campioni': layer_campioni,
+            'componenti': componenti,
+            'includi_null': includi_null,
+            'width_step': width_step,
+            'height_step': height_step,
+            'step_confronto': self.parse_steps(
+                self.parameterAsString(parameters, 'step_confronto', context))
+        }
+
+        if self.USA_MODULO:
+            valore_modulo = self.parameterAsDouble(parameters, 'valore_modulo', context)
+            if valore_modulo <= 0:
+                raise QgsProcessingException("Il valore del modulo deve essere maggiore di 0!")
+            feedback.pushInfo(f"Valore del modulo: {valore_modulo} m")
+            params['valore_modulo'] = valore_modulo
+
+        # Parse tipi materiale
+        tipi = []
+        applica_filtro = False
+
+        if tipo_input:
+            tipi = self.parse_tipi(tipo_input)
+            applica_filtro = True
+            feedback.pushInfo(f"Filtro materiali: {', '.join(tipi)}")
+            if includi_null:
+                feedback.pushInfo("  (+ elementi non classificati)")
+        else:
+            feedback.pushInfo("Filtro materiali: NESSUNO (tutti i tipi)")
+
+        params['tipi'] = tipi
+        params['applica_filtro'] = applica_filtro
+        return params
+
+    @profiled_stage('SPATIAL JOIN')
+    def _spatial_join(self, params: Dict, context, feedback,
+                      destination: Optional[str] = None) -> Dict:
+        """
+        Associa ogni componente al campione che interseca
+
+        I campioni sono in un R-tree caricato in blocco, con le geometrie
+        preparate; un componente a cavallo di piu' campioni va a quello di
+        sovrapposizione maggiore. SampleIndex.assign restituisce la posizione
+        del campione per fid leggendo le sole geometrie del rilievo, senza
+        copiarlo. Le fasi successive prendono i campi del campione da una
+        tabella senza geometrie (fid, campione, ambiente, usm, sito), unita
+        per fid ai bounding box.
+
+        Returns:
+            Dizionario con la tabella delle assegnazioni ('OUTPUT')
+        """
+        feedback.pushInfo("\n--- SPATIAL JOIN ---")
+
+        rilievo = params['layer_rilievo']
+        campioni = params['layer_campioni']
+        index = SampleIndex(campioni, self.CAMPI_CAMPIONE, rilievo.sourceCrs(),
+                            context.transformContext(), feedback)
+        assegnazione = index.assign(rilievo, FieldNames.FID, feedback)
+        if assegnazione is None:
+            raise QgsProcessingException("Elaborazione annullata durante lo spatial join")
+        fids, righe = assegnazione
+        assegnati = righe != NESSUNO
+
+        fields = QgsFields()
+        fields.append(rilievo.fields().field(FieldNames.FID))
+        for name in self.CAMPI_CAMPIONE:
+            fields.append(campioni.fields().field(name))
+        sink, dest_id = self._temp_sink(fields, QgsWkbTypes.NoGeometry, rilievo.sourceCrs(),
+                                        context, nome='campioni_componenti',
+                                        destination=destination)
+        # una riga per fid assegnato: la prima nell'ordine del layer, come il
+        # join per fid (METHOD=1) dei bbox
+        _, prime = np.unique(fids, return_index=True)
+        prime = np.sort(prime[assegnati[prime]])
+        for chunk in iter_chunks(prime.tolist(), self.OUTPUT_BATCH):
+            batch = []
+            for i in chunk:
+                feat = QgsFeature(fields)
+                feat.setAttributes([int(fids[i])] + index.attributes[righe[i]])
+                batch.append(feat)
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+        # chiude la tabella prima che i passi successivi la leggano
+        del sink
+
+        senza = int(fids.size - np.count_nonzero(assegnati))
+        feedback.pushInfo(f"Campioni indicizzati: {len(index)}")
+        feedback.pushInfo(f"  Componenti assegnati: {int(np.count_nonzero(assegnati))} "
+                          f"(a cavallo di piu' campioni, per sovrapposizione maggiore: {index.ambigui})")
+        if senza:
+            feedback.pushWarning(f"  Componenti fuori da ogni campione: {senza}")
+
+        return {'OUTPUT': dest_id}
+
+    @profiled_stage('FILTRO MATERIALI')
+    def _apply_material_filter(self, input_layer: str, params: Dict,
+                               context, feedback) -> Tuple[Any, ComponentTable]:
+        """
+        Applica il filtro sui materiali se necessario
+
+        Il layer filtrato e' una vista del rilievo (_filtered_source): le fasi
+        successive leggono solo le feature che passano il filtro.
+        """
+        if not params['applica_filtro']:
+            feedback.pushInfo("\n--- NESSUN FILTRO APPLICATO ---")
+            return input_layer, params['componenti']
+
+        feedback.pushInfo("\n--- APPLICAZIONE FILTRO ---")
+
+        expr = self.build_filter_expression(params['tipi'], params['includi_null'])
+        feedback.pushInfo(f"Espressione filtro: {expr}")
+
+        if FILTRO_NEL_PROVIDER:
+            # vista filtrata del rilievo: nessuna copia da memorizzare tra le esecuzioni
+            filtrato = self._filtered_source(input_layer, expr, context, feedback)
+        else:
+            filtrato = self._fasi.run(
+                'FILTRO MATERIALI',
+                {'rilievo': self._impronte.get('layer_rilievo'),
+                 'tipi': params['tipi'], 'includi_null': params['includi_null']},
+                lambda output: self._filtered_source(input_layer, expr, context, feedback,
+                                                     output)
+            )
+
+        componenti = self.filter_table(params['componenti'], params['tipi'], params['includi_null'])
+        count = self.verifica_features(filtrato, context, feedback, "Dopo filtro",
+                                       tabella=componenti)
+
+        if count == 0:
+            raise QgsProcessingException(
+                f"Il filtro ha prodotto 0 risultati! Verifica i valori: {', '.join(params['tipi'])}"
+            )
+
+        return filtrato, componenti
+
+    def _bbox_field_mapping(self, source_fields: bool) -> List[Dict]:
+        """
+        Mapping dei campi del rilievo arricchito con le metriche del bbox
+
+        Args:
+            source_fields: True se le metriche arrivano dai campi nativi di
+                minimumboundinggeometry (width/height/angle/...), False se
+                sono gia' nei campi *_bbox
+        """
+        configs = [
+            (f'"{FieldNames.FID}"', FieldNames.FID, 4, 0, 0),
+            (f'"{FieldNames.SITO}"', FieldNames.SITO, 10, 0, 0),
+            (f'"{FieldNames.AMBIENTE}"', FieldNames.AMBIENTE, 10, 0, 0),
+            (f'"{FieldNames.USM}"', FieldNames.USM, 10, 0, 0),
+            (f'"{FieldNames.CAMPIONE}"', FieldNames.CAMPIONE, 10, 0, 0),
+            (f'"{FieldNames.NUM_COMPONENTE}"', FieldNames.NUM_COMPONENTE, 4, 0, 0),
+            (f'"{FieldNames.TIPO}"', FieldNames.TIPO, 10, 0, 0),
+            (f'"{FieldNames.SUPERFICIE}"', FieldNames.SUPERFICIE, 10, 0, 0),
+            (f'"{FieldNames.AREA_COMPONENTE}"', FieldNames.AREA_COMPONENTE, 6, 6, 3)
+        ]
+        if source_fields:
+            configs.extend([
+                # width_bbox = lato MAGGIORE (lunghezza), height_bbox = lato MINORE
+                # (spessore). Si usano max()/min() invece di affidarsi ai nomi nativi
+                # "height"/"width": l'algoritmo QGIS orientedMinimumBoundingBox
+                # garantisce gia' width<=height in output (vincolo nel sorgente,
+                # qgsinternalgeometryengine.cpp), ma con max/min il mapping resta
+                # corretto anche se quella convenzione cambiasse in futuro.
+                ('max("width", "height")', FieldNames.WIDTH_BBOX, 6, 6, 3),
+                ('min("width", "height")', FieldNames.HEIGHT_BBOX, 6, 6, 3),
+                ('"angle"', FieldNames.ANGLE_BBOX, 6, 6, 3),
+                ('"perimeter"', FieldNames.PERIMETER_BBOX, 6, 6, 3),
+                ('"area"', FieldNames.AREA_BBOX, 6, 6, 3)
+            ])
+        else:
+            configs.extend([
+                (f'"{name}"', name, 6, 6, 3)
+                for name in (FieldNames.WIDTH_BBOX, FieldNames.HEIGHT_BBOX,
+                             FieldNames.ANGLE_BBOX, FieldNames.PERIMETER_BBOX,
+                             FieldNames.AREA_BBOX)
+            ])
+        return self.create_field_mapping(configs)
+
+    @profiled_stage('CALCOLO BOUNDING BOX')
+    def _compute_bounding_boxes(self, layer_rilievo, layer_base, assegnazioni: str,
+                                componenti: ComponentTable, parameters: Dict, context,
+                                feedback, results: Dict) -> Tuple[Dict, ComponentTable]:
+        """
+        Calcola i bounding box orientati e li arricchisce con attributi
+
+        I campi del rilievo arrivano dal join per fid con layer_base, quelli
+        del campione dalla tabella delle assegnazioni dello spatial join. Con
+        il riuso delle fasi attivo i bbox sono calcolati sull'intero rilievo
+        invece che sul layer filtrato: non dipendono dal filtro sui materiali
+        ne' dai campioni e restano validi cambiando i tipi; il join con gli
+        attributi tiene poi i soli fid del layer filtrato.
+        """
+        feedback.pushInfo("\n--- CALCOLO BOUNDING BOX ---")
+
+        # Calcola bbox
+        deps = {'rilievo': self._impronte.get('layer_rilievo'),
+                'geometrie_non_valide': context.invalidGeometryCheck()}
+        bbox_input = layer_rilievo if self._fasi.key('BOUNDING BOX', deps) else layer_base
+
+        def calcola(output):
+            if self._processi_bbox > 0 or self._cache_metriche:
+                source = QgsProcessingUtils.variantToSource(bbox_input, context)
+                return self._oriented_bboxes(source, context, feedback,
+                                             group_field=FieldNames.FID,
+                                             destination=output)['OUTPUT']
+            return processing.run('qgis:minimumboundinggeometry', {
+                'INPUT': bbox_input,
+                'FIELD': FieldNames.FID,
+                'TYPE': 1,  # oriented rectangle
+                'OUTPUT': output or self._temp_output()
+            }, context=context, feedback=feedback, is_child_algorithm=True)['OUTPUT']
+
+        bbox = self._fasi.run('BOUNDING BOX', deps, calcola)
+
+        # Conteggio del provider: i componenti senza geometria non hanno bbox
+        self.verifica_features(bbox, context, feedback, "Bounding box creati")
+        feedback.setCurrentStep(4)
+
+        # Join con attributi originali (solo i fid del layer filtrato)
+        bbox_full = processing.run('native:joinattributestable', {
+            'INPUT': bbox,
+            'INPUT_2': layer_base,
+            'FIELD': FieldNames.FID,
+            'FIELD_2': FieldNames.FID,
+            'DISCARD_NONMATCHING': bbox_input is not layer_base,
+            'METHOD': 1,
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Campi del campione (NULL per i componenti fuori da ogni campione)
+        bbox_campioni = processing.run('native:joinattributestable', {
+            'INPUT': bbox_full['OUTPUT'],
+            'INPUT_2': assegnazioni,
+            'FIELD': FieldNames.FID,
+            'FIELD_2': FieldNames.FID,
+            'FIELDS_TO_COPY': list(self.CAMPI_CAMPIONE),
+            'DISCARD_NONMATCHING': False,
+            'METHOD': 1,
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        feedback.setCurrentStep(5)
+
+        # Riorganizza campi
+        bbox_final = processing.run('native:refactorfields', {
+            'INPUT': bbox_campioni['OUTPUT'],
+            'FIELDS_MAPPING': self._bbox_field_mapping(source_fields=True),
+            'OUTPUT': parameters['output_bbox']
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        results['output_bbox'] = bbox_final['OUTPUT']
+        context.layerToLoadOnCompletionDetails(results['output_bbox']).name = self._layer_name("min_oriented_bbox")
+        count = self.verifica_features(results['output_bbox'], context, feedback,
+                                       "Min oriented bbox FINALE")
+
+        # Un bbox per fid: i componenti del bbox sono la prima riga di ciascun
+        # fid, esclusi quelli senza geometria (solo se ce ne sono si rileggono
+        # i fid del layer finale)
+        componenti_bbox = componenti.distinct()
+        if count != len(componenti_bbox):
+            presenti = ComponentTable.from_layer(
+                self.get_layer_from_source(results['output_bbox'], context), [],
+                chunk_size=self._blocco)
+            componenti_bbox = componenti_bbox.take(np.isin(componenti_bbox.fid, presenti.fid))
+
+        return bbox_final, componenti_bbox
+
+    @profiled_stage('SEPARAZIONE INTERI/PARZIALI')
+    def _separate_complete_partial(self, bbox_layer: str, componenti: ComponentTable,
+                                   context, feedback) -> Tuple:
+        """Separa i componenti interi da quelli parziali"""
+        feedback.pushInfo("\n--- SEPARAZIONE INTERI/PARZIALI ---")
+
+        # viste filtrate del layer dei bbox, senza copiarlo
+        interi = {'OUTPUT': self._filtered_source(
+            bbox_layer, f'"{FieldNames.SUPERFICIE}" = \'{SurfaceTypes.INTERA}\'',
+            context, feedback)}
+        parziali = {'OUTPUT': self._filtered_source(
+            bbox_layer, f'"{FieldNames.SUPERFICIE}" = \'{SurfaceTypes.PARZIALE}\'',
+            context, feedback)}
+
+        count_interi = self.verifica_features(
+            interi['OUTPUT'], context, feedback, "Componenti interi",
+            tabella=componenti.take(componenti.equals(FieldNames.SUPERFICIE, SurfaceTypes.INTERA))
+        )
+        count_parziali = self.verifica_features(
+            parziali['OUTPUT'], context, feedback, "Componenti parziali",
+            tabella=componenti.take(componenti.equals(FieldNames.SUPERFICIE, SurfaceTypes.PARZIALE))
+        )
+
+        if count_interi == 0:
+            feedback.pushWarning("ATTENZIONE: Nessun componente intero trovato! Le statistiche potrebbero essere incomplete.")
+        if count_parziali == 0:
+            feedback.pushInfo("INFO: Nessun componente parziale trovato.")
+
+        return interi, parziali, count_interi, count_parziali
+
+    @profiled_stage('CALCOLO RANGE')
+    def _compute_ranges(self, interi_layer: str, width_step: float, height_step: float,
+                       context, feedback) -> Dict:
+        """Calcola i range di larghezza e altezza"""
+        feedback.pushInfo("\n--- CALCOLO RANGE ---")
+        return self._add_range_fields(interi_layer, width_step, height_step, context, feedback)
+
+    @profiled_stage('STATISTICHE')
+    def _compute_statistics(self, interi_layer: str, parziali_layer: str,
+                           ranges_layer: str, parameters: Dict,
+                           context, feedback, results: Dict) -> Dict:
+        """Calcola tutte le statistiche necessarie"""
+        feedback.pushInfo("\n--- STATISTICHE ---")
+
+        # Statistiche per campione
+        stats = {}
+        for key, layer, field in [('area_int', interi_layer, FieldNames.AREA_COMPONENTE),
+                                  ('area_parz', parziali_layer, FieldNames.AREA_COMPONENTE),
+                                  ('width', interi_layer, FieldNames.WIDTH_BBOX),
+                                  ('height', interi_layer, FieldNames.HEIGHT_BBOX)]:
+            stats[key] = processing.run('qgis:statisticsbycategories', {
+                'INPUT': layer,
+                'CATEGORIES_FIELD_NAME': [FieldNames.CAMPIONE],
+                'VALUES_FIELD_NAME': field,
+                'OUTPUT': self._temp_output()
+            }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        feedback.setCurrentStep(9)
+
+        # Conteggi per range
+        counts = {}
+        for asse in ('width', 'height'):
+            counts[asse] = processing.run('qgis:statisticsbycategories', {
+                'INPUT': ranges_layer,
+                'CATEGORIES_FIELD_NAME': [FieldNames.CAMPIONE, f'{asse}_bbox_range'],
+                'VALUES_FIELD_NAME': '',
+                'OUTPUT': self._temp_output()
+            }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Ordina e salva
+        for asse, etichetta in [('width', 'larghezza'), ('height', 'altezza')]:
+            output_key = f'output_{asse}_range'
+            sorted_counts = processing.run('native:orderbyexpression', {
+                'INPUT': counts[asse]['OUTPUT'],
+                'EXPRESSION': f'{asse}_bbox_range',
+                'ASCENDING': True,
+                'OUTPUT': parameters[output_key]
+            }, context=context, feedback=feedback, is_child_algorithm=True)
+
+            results[output_key] = sorted_counts['OUTPUT']
+            context.layerToLoadOnCompletionDetails(results[output_key]).name = self._layer_name(f"conteggio_range_{etichetta}")
+
+        return stats
+
+    @profiled_stage('ANALISI RILIEVO')
+    def _create_rilievo_analysis(self, layer_base: str, bbox_layer: str, componenti: ComponentTable,
+                                 parameters: Dict, valore_modulo, context, feedback, results: Dict):
+        """Crea il layer di analisi del rilievo (con i campi modulo se previsti)"""
+        feedback.pushInfo("\n--- ANALISI RILIEVO ---")
+
+        # Join rilievo con bbox (metriche e campi del campione)
+        rilievo_bbox_temp = processing.run('native:joinattributestable', {
+            'INPUT': layer_base,
+            'INPUT_2': bbox_layer,
+            'FIELD': FieldNames.FID,
+            'FIELD_2': FieldNames.FID,
+            'FIELDS_TO_COPY': list(self.CAMPI_CAMPIONE) + [
+                FieldNames.WIDTH_BBOX, FieldNames.HEIGHT_BBOX, FieldNames.ANGLE_BBOX,
+                FieldNames.PERIMETER_BBOX, FieldNames.AREA_BBOX],
+            'DISCARD_NONMATCHING': True,
+            'METHOD': 1,
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Riorganizza campi
+        rilievo_bbox = processing.run('native:refactorfields', {
+            'INPUT': rilievo_bbox_temp['OUTPUT'],
+            'FIELDS_MAPPING': self._bbox_field_mapping(source_fields=False),
+            'OUTPUT': parameters['output_rilievo']
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        results['output_rilievo'] = rilievo_bbox['OUTPUT']
+        context.layerToLoadOnCompletionDetails(results['output_rilievo']).name = self._layer_name("analisi_rilievo")
+
+        if self.USA_MODULO:
+            # ========== AGGIUNTA CAMPI VIRTUALI (SOLO PER SUPERFICIE='INTERA') ==========
+            feedback.pushInfo("\n--- AGGIUNTA CAMPI VIRTUALI ---")
+            layer = QgsProcessingUtils.mapLayerFromString(results['output_rilievo'], context)
+            if layer:
+                self._add_modulo_fields(layer, valore_modulo, True, feedback)
+
+        self.verifica_features(results['output_rilievo'], context, feedback, "Analisi rilievo FINALE",
+                               tabella=componenti)
+
+    @profiled_stage('ANALISI CAMPIONI')
+    def _create_campioni_analysis(self, parameters: Dict, stats: Dict,
+                                  context, feedback, results: Dict):
+        """Crea i layer di analisi dei campioni (tabella e layer poligonale)"""
+        feedback.pushInfo("\n--- AGGREGAZIONE STATISTICHE CAMPIONI ---")
+
+        # Rinomina layer per identificazione
+        stat_layers = {}
+        for key, stat_type in [('area_int', 'stat_area_int'), ('area_parz', 'stat_area_parz'),
+                               ('width', 'stat_width_bbox'), ('height', 'stat_height_bbox')]:
+            stat_layers[key] = processing.run('native:renamelayer', {
+                'INPUT': stats[key]['OUTPUT'],
+                'NAME': stat_type
+            }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Merge statistiche
+        merged_stats = processing.run('native:mergevectorlayers', {
+            'LAYERS': [layer['OUTPUT'] for layer in stat_layers.values()],
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Riorganizza
+        stats_reorganized = processing.run('native:refactorfields', {
+            'INPUT': merged_stats['OUTPUT'],
+            'FIELDS_MAPPING': self.create_field_mapping([
+                (f'"{FieldNames.CAMPIONE}"', FieldNames.CAMPIONE, 10, 0, 0),
+                ('"layer"', 'stat_type', 10, 0, 0),
+                ('"count"', 'count', 2, 0, 0),
+                ('"min"', 'min', 6, 0, 3),
+                ('"max"', 'max', 6, 0, 3),
+                ('"range"', 'range', 6, 0, 3),
+                ('"sum"', 'sum', 6, 0, 3),
+                ('"mean"', 'mean', 6, 0, 3),
+                ('"stddev"', 'stddev', 6, 0, 3)
+            ]),
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        feedback.setCurrentStep(12)
+
+        # Estrai ogni tipo di statistica
+        joins = [
+            ('stat_area_parz', ['count', 'sum'], 'parz_'),
+            ('stat_area_int', ['count', 'sum', 'mean'], 'int_'),
+            ('stat_width_bbox', ['count', 'min', 'max', 'range', 'mean', 'stddev'], 'width_'),
+            ('stat_height_bbox', ['count', 'min', 'max', 'range', 'mean', 'stddev'], 'height_')
+        ]
+        extracted_stats = {}
+        for stat_type, _, _ in joins:
+            extracted_stats[stat_type] = {'OUTPUT': self._filtered_source(
+                stats_reorganized['OUTPUT'], f'"stat_type" = \'{stat_type}\'',
+                context, feedback)}
+
+        # Join sequenziale
+        current_layer = parameters['layer_campioni']
+        for stat_type, fields_to_copy, prefix in joins:
+            current_layer = processing.run('native:joinattributestable', {
+                'INPUT': current_layer,
+                'INPUT_2': extracted_stats[stat_type]['OUTPUT'],
+                'FIELD': FieldNames.CAMPIONE,
+                'FIELD_2': FieldNames.CAMPIONE,
+                'FIELDS_TO_COPY': fields_to_copy,
+                'PREFIX': prefix,
+                'METHOD': 1,
+                'OUTPUT': self._temp_output()
+            }, context=context, feedback=feedback, is_child_algorithm=True)['OUTPUT']
+
+        feedback.setCurrentStep(13)
+
+        # Refactor con conversioni tipo
+        all_stats_final = self._create_final_stats_table(current_layer, context, feedback)
+        feedback.setCurrentStep(14)
+
+        # Calcoli finali
+        final_calcs = self._compute_final_calculations(all_stats_final['OUTPUT'], context, feedback)
+        feedback.setCurrentStep(15)
+
+        # Crea tabella e layer poligonale
+        self._create_output_tables(final_calcs, parameters, context, feedback, results)
+        feedback.setCurrentStep(16)
+
+    def _create_final_stats_table(self, input_layer: str, context, feedback) -> Dict:
+        """Crea la tabella delle statistiche finali con tutti i campi"""
+        c = self.COMPONENTI
+
+        def stddev_campionaria(asse):
+            # statisticsbycategories restituisce la deviazione di popolazione
+            return (f'CASE WHEN to_int("{asse}_count") > 1 THEN to_real("{asse}_stddev") * '
+                    f'sqrt(to_real("{asse}_count") / (to_real("{asse}_count") - 1)) ELSE NULL END')
+
+        field_mapping = self.create_field_mapping([
+            (f'"{FieldNames.SITO}"', FieldNames.SITO, 10, 0, 0),
+            (f'"{FieldNames.AMBIENTE}"', FieldNames.AMBIENTE, 10, 0, 0),
+            (f'"{FieldNames.USM}"', FieldNames.USM, 10, 0, 0),
+            (f'"{FieldNames.CAMPIONE}"', FieldNames.CAMPIONE, 10, 0, 0),
+            (f'to_real("{FieldNames.AREA_CAMPIONE}")', 'area campione', 6, 0, 3),
+            ('to_int("parz_count")', f'num. {c} parziali', 2, 0, 0),
+            ('to_real("parz_sum")', f'totale area {c} parziali', 6, 0, 3),
+            ('to_int("int_count")', f'num. {c} interi', 2, 0, 0),
+            ('to_real("int_sum")', f'totale area {c} interi', 6, 0, 3),
+            ('to_real("int_mean")', f'media area {c} interi', 6, 0, 3),
+            ('to_real("width_min")', 'width_min', 6, 0, 3),
+            ('to_real("width_max")', 'width_max', 6, 0, 3),
+            ('to_real("width_range")', 'width_range', 6, 0, 3),
+            ('to_real("width_mean")', 'width_mean', 6, 0, 3),
+            (stddev_campionaria('width'), 'width_stddev', 6, 0, 3),
+            ('to_real("height_min")', 'height_min', 6, 0, 3),
+            ('to_real("height_max")', 'height_max', 6, 0, 3),
+            ('to_real("height_range")', 'height_range', 6, 0, 3),
+            ('to_real("height_mean")', 'height_mean', 6, 0, 3),
+            (stddev_campionaria('height'), 'height_stddev', 6, 0, 3)
+        ])
+
+        return processing.run('native:refactorfields', {
+            'INPUT': input_layer,
+            'FIELDS_MAPPING': field_mapping,
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+    def _compute_final_calculations(self, input_layer: str, context, feedback) -> str:
+        """Esegue i calcoli finali definiti in CALCOLI_FINALI, in sequenza"""
+        feedback.pushInfo("\n--- CALCOLI FINALI ---")
+
+        current = input_layer
+        for field_name, field_type, formula, _, _ in self.CALCOLI_FINALI:
+            current = processing.run('native:fieldcalculator', {
+                'INPUT': current,
+                'FIELD_NAME': field_name,
+                'FIELD_TYPE': field_type,
+                'FORMULA': formula,
+                'OUTPUT': self._temp_output()
+            }, context=context, feedback=feedback, is_child_algorithm=True)['OUTPUT']
+
+        return current
+
+    @staticmethod
+    def _output_name(field_name: str) -> str:
+        """Nome del campo in output ('num. mattoni interi' -> 'num_mattoni_interi')"""
+        return field_name.replace('. ', '_').replace(' ', '_')
+
+    def _create_output_tables(self, input_layer: str, parameters: Dict,
+                             context, feedback, results: Dict):
+        """Crea le tabelle di output (tabellare e layer poligonale)"""
+        feedback.pushInfo("\n--- CREAZIONE TABELLA ANALISI CAMPIONI ---")
+
+        c = self.COMPONENTI
+        interi = [
+            (f'num. {c} interi', 2, 0),
+            (f'totale area {c} interi', 6, 3),
+            (f'media area {c} interi', 6, 3)
+        ]
+        parziali = [
+            (f'num. {c} parziali', 2, 0),
+            (f'totale area {c} parziali', 6, 3)
+        ]
+        calcolati = [(name, out_type, prec) for name, _, _, out_type, prec in self.CALCOLI_FINALI]
+        dimensioni = [f'{asse}_{stat}' for asse in ('width', 'height')
+                      for stat in ('min', 'max', 'range', 'mean', 'stddev')]
+
+        # Mapping campi finali per tabella
+        table_fields = self.create_field_mapping(
+            [
+                (f'"{FieldNames.SITO}"', FieldNames.SITO, 10, 0, 0),
+                (f'"{FieldNames.AMBIENTE}"', FieldNames.AMBIENTE, 10, 0, 0),
+                (f'"{FieldNames.USM}"', FieldNames.USM, 10, 0, 0),
+                (f'"{FieldNames.CAMPIONE}"', FieldNames.CAMPIONE, 10, 0, 0),
+                ('"area campione"', 'area_campione', 6, 0, 3)
+            ]
+            + [(f'"{name}"', self._output_name(name), t, 0, p) for name, t, p in interi + parziali + calcolati]
+            + [(f'"{name}"', name, 6, 0, 3) for name in dimensioni]
+        )
+
+        table_refactored = processing.run('native:refactorfields', {
+            'INPUT': input_layer,
+            'FIELDS_MAPPING': table_fields,
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Rimuovi geometrie per tabella pura
+        table_final = processing.run('native:dropgeometries', {
+            'INPUT': table_refactored['OUTPUT'],
+            'OUTPUT': parameters['output_campioni_table']
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        results['output_campioni_table'] = table_final['OUTPUT']
+        context.layerToLoadOnCompletionDetails(results['output_campioni_table']).name = self._layer_name("analisi_campioni_table")
+        self.verifica_features(results['output_campioni_table'], context, feedback, "Tabella analisi campioni")
+
+        # Layer poligonale
+        feedback.pushInfo("\n--- CREAZIONE LAYER POLIGONALE CAMPIONI---")
+
+        per_campione = [self._output_name(name) for name, _, _ in interi + parziali + calcolati]
+
+        # Join con layer campioni originale
+        campioni_geo = processing.run('native:joinattributestable', {
+            'INPUT': parameters['layer_campioni'],
+            'INPUT_2': table_final['OUTPUT'],
+            'FIELD': FieldNames.CAMPIONE,
+            'FIELD_2': FieldNames.CAMPIONE,
+            'FIELDS_TO_COPY': per_campione + dimensioni,
+            'DISCARD_NONMATCHING': True,
+            'METHOD': 1,
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Riorganizza campi layer poligonale (parziali prima degli interi)
+        geo_fields = self.create_field_mapping(
+            [
+                ('"fid"', 'fid', 4, 0, 0),
+                (f'"{FieldNames.SITO}"', FieldNames.SITO, 10, 0, 0),
+                (f'"{FieldNames.USM}"', FieldNames.USM, 10, 0, 0),
+                (f'"{FieldNames.AMBIENTE}"', FieldNames.AMBIENTE, 10, 0, 0),
+                (f'"{FieldNames.CAMPIONE}"', FieldNames.CAMPIONE, 10, 0, 0),
+                (f'"{FieldNames.AREA_CAMPIONE}"', 'area_campione', 6, 0, 3)
+            ]
+            + [(f'"{self._output_name(name)}"', self._output_name(name), t, 0, p)
+               for name, t, p in parziali + interi + calcolati]
+            + [(f'"{name}"', name, 6, 0, 3) for name in dimensioni]
+        )
+
+        campioni_final = processing.run('native:refactorfields', {
+            'INPUT': campioni_geo['OUTPUT'],
+            'FIELDS_MAPPING': geo_fields,
+            'OUTPUT': parameters['output_campioni']
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        results['output_campioni'] = campioni_final['OUTPUT']
+        context.layerToLoadOnCompletionDetails(results['output_campioni']).name = self._layer_name("analisi_campioni")
+        self.verifica_features(results['output_campioni'], context, feedback, "Analisi campioni layer poligonale")
+
+    def _log_summary(self, count_interi: int, count_parziali: int, params: Dict,
+                    results: Dict, context, feedback):
+        """Stampa il riepilogo finale dell'elaborazione"""
+        feedback.pushInfo("\n" + "="*70)
+        feedback.pushInfo("ELABORAZIONE COMPLETATA CON SUCCESSO")
+        feedback.pushInfo("="*70)
+
+        feedback.pushInfo("\n[RIEPILOGO ELABORAZIONE]")
+        feedback.pushInfo(f"Componenti totali analizzati: {count_interi + count_parziali}")
+        feedback.pushInfo(f"  - Componenti interi: {count_interi}")
+        feedback.pushInfo(f"  - Componenti parziali: {count_parziali}")
+
+        self._log_filter_summary(params['applica_filtro'], params['tipi'], params['includi_null'], feedback)
+
+        feedback.pushInfo("\n[PARAMETRI RANGE]")
+        feedback.pushInfo(f"Step larghezza: {params['width_step']} m")
+        feedback.pushInfo(f"Step altezza: {params['height_step']} m")
+
+        if self.USA_MODULO:
+            feedback.pushInfo("\n[PARAMETRI UNITÀ DI MISURA]")
+            feedback.pushInfo(f"Valore del modulo: {params['valore_modulo']} m")
+
+        feedback.pushInfo("\n[OUTPUT GENERATI]")
+        for name in results.keys():
+            layer = QgsProcessingUtils.mapLayerFromString(results[name], context)
+            if layer:
+                feedback.pushInfo(f"  * {layer.name()}: {layer.featureCount()} features")
+
+        if self.USA_MODULO:
+            feedback.pushInfo("\n[CAMPI AGGIUNTI AL LAYER RILIEVO]")
+            feedback.pushInfo("  * width_modulo (intero) - Numero di moduli interi nella larghezza - SOLO per superficie='intera'")
+            feedback.pushInfo("  * Δwidth_modulo (decimale, 3 decimali) - Resto della larghezza - SOLO per superficie='intera'")
+            feedback.pushInfo("  * height_modulo (intero) - Numero di moduli interi nell'altezza - SOLO per superficie='intera'")
+            feedback.pushInfo("  * Δheight_modulo (decimale, 3 decimali) - Resto dell'altezza - SOLO per superficie='intera'")
+            feedback.pushInfo("  * Valore NULL per tutti i componenti con superficie != 'intera'")
+
+        feedback.pushInfo("\n" + "="*70)
+
+
+# ============ ANALISI SENZA LAYER CAMPIONI ============
+class AnalisiSenzaCampioneEngine(MatAlgorithmBase):
+    """
+    Analisi quantitativa con il solo layer rilievo (mixin)
+
+    Costanti di classe da impostare nello script:
+        TITOLO: Titolo nel log ('MATTONI', 'COMPONENTI A SECCO / ALTRI MATERIALI')
+        SUFFISSO_LAYER: Suffisso dei nomi dei layer di output
+        STEP_LARGHEZZA, STEP_ALTEZZA: Step di default dei range (m)
+        USA_MODULO: Se aggiungere il parametro modulo e i campi virtuali
+            (calcolati per tutti i componenti)
+    """
+
+    TOTAL_STEPS = 11
+    TITOLO = ''
+    SUFFISSO_LAYER = ''
+    STEP_LARGHEZZA = 0.01
+    STEP_ALTEZZA = 0.01
+    USA_MODULO = False
+
+    def initAlgorithm(self, config=None):
+        """Inizializza i parametri dell'algoritmo"""
+        # Input layer
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            'layer_rilievo',
+            'Layer rilievo (poligoni componenti muratura)',
+            types=[QgsProcessing.TypeVectorPolygon],
+            defaultValue='rilievo'
+        ))
+
+        # Parametri filtro e range
+        self._add_filter_parameters()
+        self._add_range_parameters()
+
+        # Output layers
+        outputs = [
+            ('output_bbox', 'Min oriented bbox', QgsProcessing.TypeVectorPolygon),
+            ('output_rilievo', 'Analisi rilievo', QgsProcessing.TypeVectorPolygon),
+            ('output_statistiche', 'Statistiche aggregate', QgsProcessing.TypeVectorAnyGeometry),
+            ('output_width_range', 'Conteggio range larghezza', QgsProcessing.TypeVectorAnyGeometry),
+            ('output_height_range', 'Conteggio range altezza', QgsProcessing.TypeVectorAnyGeometry)
+        ]
+        for param_name, description, geom_type in outputs:
+            self.addParameter(QgsProcessingParameterFeatureSink(
+                param_name, description, type=geom_type
+            ))
+
+        self._add_range_comparison_parameters()
+        self._add_kde_parameters()
+        self._add_robust_stats_parameters()
+        self._add_report_parameters()
+        self._add_streaming_parameters()
+
+    def _layer_name(self, prefix: str) -> str:
+        """Nome del layer di output per il caricamento nel progetto"""
+        return f"{prefix}_{self.SUFFISSO_LAYER}"
+
+    @profilable('profilo_dettagliato')
+    def processAlgorithm(self, parameters, context, model_feedback):
+        """Algoritmo principale"""
+        feedback = QgsProcessingMultiStepFeedback(self.TOTAL_STEPS, model_feedback)
+        results = {}
+        self._profiler = StageProfiler(self.name(), feedback)
+
+        # ===== STEP 1: VALIDAZIONE INPUT =====
+        self._profiler.lap('VALIDAZIONE INPUT')
+        feedback.setCurrentStep(0)
+        feedback.pushInfo("\n" + "="*70)
+        feedback.pushInfo(f"ANALISI QUANTITATIVA {self.TITOLO} SENZA AREA CAMPIONE - v2.0")
+        feedback.pushInfo("="*70)
+
+        # Validazione layer rilievo
+        rilievo_source = self.parameterAsSource(parameters, 'layer_rilievo', context)
+        required_fields = [
+            FieldNames.FID, FieldNames.TIPO, FieldNames.AREA_COMPONENTE,
+            FieldNames.NUM_COMPONENTE
+        ]
+        self.validate_layer_fields(rilievo_source, required_fields, 'Layer rilievo', feedback)
+        self._load_verbosity(parameters, context)
+        self._load_streaming(parameters, context, feedback)
+
+        # Verifica se esiste il campo superficie
+        existing_fields = [f.name() for f in rilievo_source.fields()]
+        has_superficie_field = FieldNames.SUPERFICIE in existing_fields
+
+        if has_superficie_field:
+            feedback.pushInfo(f"✓ Campo '{FieldNames.SUPERFICIE}' trovato - Verrà applicata la separazione interi/parziali")
+        else:
+            feedback.pushInfo(f"⚠ Campo '{FieldNames.SUPERFICIE}' non trovato - Tutti i componenti saranno utilizzati per le statistiche")
+
+        # Parametri filtro
+        tipo_str = self.parameterAsString(parameters, 'tipo_materiale', context).strip()
+        includi_null = self.parameterAsBool(parameters, 'includi_non_classificati', context)
+        width_step = self.parameterAsDouble(parameters, 'width_range_step', context)
+        height_step = self.parameterAsDouble(parameters, 'height_range_step', context)
+        step_confronto = self.parse_steps(
+            self.parameterAsString(parameters, 'step_confronto', context))
+        valore_modulo = None
+        if self.USA_MODULO:
+            valore_modulo = self.parameterAsDouble(parameters, 'valore_modulo', context)
+
+        # Elabora filtro materiali
+        tipi = self.parse_tipi(tipo_str)
+        applica_filtro = bool(tipi)
+
+        # Tipo e superficie letti una volta sola: conteggi e controlli delle
+        # fasi successive derivano da queste colonne
+        componenti = ComponentTable.from_layer(
+            rilievo_source, [FieldNames.TIPO, FieldNames.SUPERFICIE], as_object=True,
+            chunk_size=self._blocco
+        )
+
+        feedback.pushInfo("\n[PARAMETRI]")
+        if applica_filtro:
+            feedback.pushInfo(f"Filtro materiali: {', '.join(tipi)}")
+            feedback.pushInfo(f"Includi NULL: {'SI' if includi_null else 'NO'}")
+        else:
+            feedback.pushInfo("Filtro materiali: NESSUNO (tutti i materiali)")
+        feedback.pushInfo(f"Step larghezza: {width_step} m")
+        feedback.pushInfo(f"Step altezza: {height_step} m")
+        if step_confronto:
+            feedback.pushInfo(f"Step di confronto: {', '.join(str(x) for x in step_confronto)} m")
+        if self.USA_MODULO:
+            feedback.pushInfo(f"Valore modulo: {valore_modulo} m")
+
+        # ===== STEP 2: APPLICAZIONE FILTRO =====
+        self._profiler.lap('APPLICAZIONE FILTRO')
+        feedback.setCurrentStep(1)
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo("\n--- APPLICAZIONE FILTRO ---")
+
+        if applica_filtro:
+            filter_expr = self.build_filter_expression(tipi, includi_null)
+            feedback.pushInfo(f"Espressione filtro: {filter_expr}")
+
+            rilievo_input = self._filtered_source(parameters['layer_rilievo'], filter_expr,
+                                                  context, feedback)
+            componenti = self.filter_table(componenti, tipi, includi_null)
+            feedback.pushInfo(f"✓ Filtro applicato")
+        else:
+            rilievo_input = parameters['layer_rilievo']
+            feedback.pushInfo("✓ Nessun filtro applicato - elaborazione completa")
+
+        self.verifica_features(rilievo_input, context, feedback, "Rilievo dopo filtro",
+                               tabella=componenti)
+
+        # ===== STEP 3: CALCOLO BOUNDING BOX SU TUTTI I COMPONENTI =====
+        self._profiler.lap('CALCOLO BOUNDING BOX SU TUTTI I COMPONENTI')
+        feedback.setCurrentStep(2)
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo("\n--- CALCOLO BOUNDING BOX ORIENTATI (TUTTI I COMPONENTI) ---")
+
+        if self._processi_bbox > 0 or self._cache_metriche:
+            bbox_source = (QgsProcessingUtils.variantToSource(rilievo_input, context)
+                           if applica_filtro else rilievo_source)
+            bbox = self._oriented_bboxes(bbox_source, context, feedback)
+        else:
+            bbox = processing.run('native:orientedminimumboundingbox', {
+                'INPUT': rilievo_input,
+                'OUTPUT': self._temp_output()
+            }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # Conteggio del provider: un bbox per ogni componente con geometria
+        self.verifica_features(bbox['OUTPUT'], context, feedback, "Bounding box")
+
+        # ===== STEP 4: CONTEGGIO E PREPARAZIONE LAYER PER STATISTICHE =====
+        self._profiler.lap('CONTEGGIO E PREPARAZIONE LAYER PER STATISTICHE')
+        feedback.setCurrentStep(3)
+        if feedback.isCanceled():
+            return {}
+
+        # Conta componenti per tipo dalle colonne gia' in memoria
+        count_totale = len(componenti)
+
+        if has_superficie_field:
+            # Conta interi e parziali
+            count_interi = int(componenti.equals(FieldNames.SUPERFICIE, SurfaceTypes.INTERA).sum())
+            count_parziali = int(componenti.equals(FieldNames.SUPERFICIE, SurfaceTypes.PARZIALE).sum())
+
+            feedback.pushInfo(f"\n[CONTEGGIO COMPONENTI - CON SEPARAZIONE]")
+            feedback.pushInfo(f"Totale componenti: {count_totale}")
+            feedback.pushInfo(f"  - Interi: {count_interi}")
+            feedback.pushInfo(f"  - Parziali: {count_parziali}")
+        else:
+            # Tutti i componenti sono considerati come "interi" per le statistiche
+            count_interi = count_totale
+            count_parziali = 0
+
+            feedback.pushInfo(f"\n[CONTEGGIO COMPONENTI - SENZA SEPARAZIONE]")
+            feedback.pushInfo(f"Totale componenti: {count_totale}")
+            feedback.pushInfo("Tutti i componenti saranno usati per le statistiche")
+
+        # Statistiche sui soli interi: maschera sulla tabella dei componenti
+        # con i bbox, nessun layer estratto
+        filtro_interi = ''
+        if has_superficie_field and count_interi > 0:
+            filtro_interi = f'"{FieldNames.SUPERFICIE}" = \'{SurfaceTypes.INTERA}\''
+            feedback.pushInfo(f"✓ Statistiche calcolate solo su componenti interi ({count_interi})")
+        else:
+            feedback.pushInfo(f"✓ Statistiche calcolate su tutti i componenti ({count_totale})")
+
+        # ===== STEP 5: REFACTOR CAMPI BBOX =====
+        self._profiler.lap('REFACTOR CAMPI BBOX')
+        feedback.setCurrentStep(4)
+        if feedback.isCanceled():
+            return {}
+
+        bbox_fields = self.create_field_mapping([
+            ('"fid"', FieldNames.FID, 4, 0, 0),
+            (f'"{FieldNames.USM}"', FieldNames.USM, 4, 0, 0),
+            (f'"{FieldNames.NUM_COMPONENTE}"', FieldNames.NUM_COMPONENTE, 4, 0, 0),
+            # width_bbox = lato MAGGIORE (lunghezza), height_bbox = lato MINORE
+            # (spessore). Si usano max()/min() invece di affidarsi ai nomi nativi
+            # "height"/"width": l'algoritmo QGIS orientedMinimumBoundingBox
+            # garantisce gia' width<=height in output (vincolo nel sorgente,
+            # qgsinternalgeometryengine.cpp), ma con max/min il mapping resta
+            # corretto anche se quella convenzione cambiasse in futuro.
+            ('max("width", "height")', FieldNames.WIDTH_BBOX, 6, 10, 6),
+            ('min("width", "height")', FieldNames.HEIGHT_BBOX, 6, 10, 6),
+            # L'angolo nativo e' riferito al lato corto ed e' assiale (0-180).
+            # Una rotazione costante (lo stesso +90 per tutti gli elementi)
+            # non altera coerenza R_bar ne' scarti relativi nella statistica
+            # circolare assiale a valle: si conserva quindi l'angolo nativo.
+            ('"angle"', FieldNames.ANGLE_BBOX, 6, 10, 6),
+            ('"perimeter"', FieldNames.PERIMETER_BBOX, 6, 10, 6),
+            # area del rettangolo gia' calcolata con il bbox
+            ('"area"', FieldNames.AREA_BBOX, 6, 10, 6)
+        ])
+
+        # Il bbox conserva gli attributi del componente (usm, num_componente):
+        # nessun join con il rilievo
+        bbox_refactored = processing.run('native:refactorfields', {
+            'INPUT': bbox['OUTPUT'],
+            'FIELDS_MAPPING': bbox_fields,
+            'OUTPUT': parameters['output_bbox']
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        results['output_bbox'] = bbox_refactored['OUTPUT']
+        context.layerToLoadOnCompletionDetails(results['output_bbox']).name = self._layer_name("min_oriented_bbox")
+
+        # ===== STEP 6: JOIN BBOX CON TUTTI I COMPONENTI =====
+        self._profiler.lap('JOIN BBOX CON TUTTI I COMPONENTI')
+        feedback.setCurrentStep(5)
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo("\n--- JOIN DATI BBOX CON TUTTI I COMPONENTI ---")
+
+        bbox_metrics = [
+            FieldNames.WIDTH_BBOX, FieldNames.HEIGHT_BBOX, FieldNames.ANGLE_BBOX,
+            FieldNames.PERIMETER_BBOX, FieldNames.AREA_BBOX
+        ]
+
+        rilievo_with_bbox = processing.run('native:joinattributestable', {
+            'INPUT': rilievo_input,
+            'INPUT_2': bbox_refactored['OUTPUT'],
+            'FIELD': FieldNames.FID,
+            'FIELD_2': FieldNames.FID,
+            'FIELDS_TO_COPY': bbox_metrics,
+            'METHOD': 1,
+            'DISCARD_NONMATCHING': False,
+            'OUTPUT': self._temp_output()
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        # ===== STEP 7: REFACTOR CAMPI FINALI =====
+        self._profiler.lap('REFACTOR CAMPI FINALI')
+        feedback.setCurrentStep(6)
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo("\n--- CREAZIONE LAYER RILIEVO COMPLETO ---")
+
+        # Crea mapping campi base
+        final_fields_list = [
+            ('"fid"', FieldNames.FID, 4, 0, 0),
+            (f'"{FieldNames.USM}"', FieldNames.USM, 4, 0, 0),
+            (f'"{FieldNames.TIPO}"', FieldNames.TIPO, 10, 0, 0)
+        ]
+
+        # Aggiungi campo superficie solo se esiste
+        if has_superficie_field:
+            final_fields_list.append((f'"{FieldNames.SUPERFICIE}"', FieldNames.SUPERFICIE, 10, 0, 0))
+
+        # Aggiungi altri campi
+        final_fields_list.extend([
+            (f'"{FieldNames.AREA_COMPONENTE}"', FieldNames.AREA_COMPONENTE, 6, 10, 6),
+            (f'"{FieldNames.NUM_COMPONENTE}"', FieldNames.NUM_COMPONENTE, 2, 0, 0)
+        ])
+        final_fields_list.extend([(f'"{name}"', name, 6, 10, 6) for name in bbox_metrics])
+
+        final_fields = self.create_field_mapping(final_fields_list)
+
+        rilievo_final = processing.run('native:refactorfields', {
+            'INPUT': rilievo_with_bbox['OUTPUT'],
+            'FIELDS_MAPPING': final_fields,
+            'OUTPUT': parameters['output_rilievo']
+        }, context=context, feedback=feedback, is_child_algorithm=True)
+
+        results['output_rilievo'] = rilievo_final['OUTPUT']
+        context.layerToLoadOnCompletionDetails(results['output_rilievo']).name = self._layer_name("analisi_rilievo")
+
+        if self.USA_MODULO:
+            # ===== AGGIUNTA CAMPI VIRTUALI MODULO (PER TUTTI I COMPONENTI) =====
+            self._profiler.lap('AGGIUNTA CAMPI VIRTUALI MODULO (PER TUTTI I COMPONENTI)')
+            feedback.pushInfo("\n--- AGGIUNTA CAMPI VIRTUALI MODULO ---")
+            layer = self.get_layer_from_source(results['output_rilievo'], context)
+            if layer:
+                self._add_modulo_fields(layer, valore_modulo, False, feedback)
+
+        # ===== STEP 8: CALCOLO STATISTICHE AGGREGATE =====
+        self._profiler.lap('CALCOLO STATISTICHE AGGREGATE')
+        feedback.setCurrentStep(7)
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo("\n--- CALCOLO STATISTICHE AGGREGATE ---")
+
+        # Lo stesso join del rilievo con i bbox alimenta le statistiche (con i
+        # nomi dei campi originali, qualunque sia il formato dell'output)
+        stats_layer = self.get_layer_from_source(rilievo_with_bbox['OUTPUT'], context)
+
+        # Statistiche per campo da una sola lettura colonnare (a blocchi,
+        # con accumulatori combinabili, nell'elaborazione a blocchi)
+        campi_stats = [FieldNames.WIDTH_BBOX, FieldNames.HEIGHT_BBOX, FieldNames.AREA_COMPONENTE]
+        if self._blocco:
+            per_campo = describe_layer(stats_layer, campi_stats, self._blocco,
+                                       expression=filtro_interi)
+        else:
+            table = ComponentTable.from_layer(stats_layer, campi_stats + [FieldNames.SUPERFICIE])
+            if filtro_interi:
+                table = table.take(table.equals(FieldNames.SUPERFICIE, SurfaceTypes.INTERA))
+            per_campo = {campo: describe(table.column(campo)) for campo in campi_stats}
+        stats_width = per_campo[FieldNames.WIDTH_BBOX]
+        stats_height = per_campo[FieldNames.HEIGHT_BBOX]
+        stats_area = per_campo[FieldNames.AREA_COMPONENTE]
+
+        # Prepara dati per la tabella: prima i conteggi, poi le statistiche
+        vuoto = {'min': None, 'max': None, 'range': None, 'mean': None, 'stddev': None}
+        stats_data = [
+            {'parametro': 'Componenti interi', 'count': count_interi, **vuoto},
+            {'parametro': 'Componenti parziali', 'count': count_parziali, **vuoto},
+            {'parametro': 'Totale', 'count': count_totale, **vuoto}
+        ]
+        for parametro, stats_campo in [('Larghezza', stats_width), ('Altezza', stats_height),
+                                       ('Area', stats_area)]:
+            if stats_campo:
+                stats_data.append({'parametro': parametro, **stats_campo})
+
+        self._write_statistics_table(stats_data, parameters, context, results)
+
+        feedback.pushInfo("\n[STATISTICHE AGGREGATE]")
+        for data in stats_data[:3]:  # Solo i conteggi
+            feedback.pushInfo(f"\n{data['parametro']}:")
+            feedback.pushInfo(f"  Count: {data['count']}")
+            if data.get('min') is not None:
+                feedback.pushInfo(f"  Min: {data['min']:.6f}")
+                feedback.pushInfo(f"  Max: {data['max']:.6f}")
+                feedback.pushInfo(f"  Range: {data['range']:.6f}")
+                feedback.pushInfo(f"  Mean: {data['mean']:.6f}")
+                feedback.pushInfo(f"  StdDev: {data['stddev']:.6f}")
+
+        # ===== STEP 9: CALCOLO CAMPI RANGE =====
+        self._profiler.lap('CALCOLO CAMPI RANGE')
+        feedback.setCurrentStep(8)
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo("\n--- CALCOLO CAMPI RANGE ---")
+
+        layer_for_ranges = rilievo_with_bbox['OUTPUT']
+        if filtro_interi:
+            layer_for_ranges = self._filtered_source(layer_for_ranges, filtro_interi,
+                                                     context, feedback)
+        with_both_ranges = self._add_range_fields(
+            layer_for_ranges, width_step, height_step, context, feedback
+        )
+
+        # ===== STEP 10-11: DISTRIBUZIONE RANGE LARGHEZZA E ALTEZZA =====
+        for step, asse, etichetta in [(9, 'width', 'larghezza'), (10, 'height', 'altezza')]:
+            titolo = f'DISTRIBUZIONE RANGE {etichetta.upper()}'
+            self._profiler.lap(titolo)
+            feedback.setCurrentStep(step)
+            if feedback.isCanceled():
+                return {}
+
+            feedback.pushInfo(f"\n--- CALCOLO {titolo} ---")
+
+            range_field = f'{asse}_bbox_range'
+            counts = processing.run('qgis:statisticsbycategories', {
+                'INPUT': with_both_ranges['OUTPUT'],
+                'CATEGORIES_FIELD_NAME': [range_field],
+                'VALUES_FIELD_NAME': '',
+                'OUTPUT': self._temp_output()
+            }, context=context, feedback=feedback, is_child_algorithm=True)
+
+            output_key = f'output_{asse}_range'
+            sorted_counts = processing.run('native:orderbyexpression', {
+                'INPUT': counts['OUTPUT'],
+                'EXPRESSION': range_field,
+                'ASCENDING': True,
+                'OUTPUT': parameters[output_key]
+            }, context=context, feedback=feedback, is_child_algorithm=True)
+
+            results[output_key] = sorted_counts['OUTPUT']
+            context.layerToLoadOnCompletionDetails(results[output_key]).name = self._layer_name(f"conteggio_range_{etichetta}")
+            self.verifica_features(results[output_key], context, feedback, f"Range {etichetta}")
+
+        self._profiler.finish()
+        if step_confronto:
+            self._write_range_comparison(layer_for_ranges, width_step, height_step,
+                                         step_confronto, parameters, context, feedback, results)
+        if parameters.get('output_kde'):
+            self._write_kde(layer_for_ranges, parameters, context, feedback, results)
+        if parameters.get('output_robuste'):
+            self._write_robust_stats(layer_for_ranges, parameters, context, feedback, results)
+
+        # ===== RIEPILOGO FINALE =====
+        self._log_summary(count_interi, count_parziali, applica_filtro, tipi,
+                         includi_null, width_step, height_step, valore_modulo,
+                         results, context, feedback)
+
+        # ===== TEMPI PER FASE =====
+        self._write_stage_report(parameters, context, feedback, results)
+
+        return results
+
+    def _write_statistics_table(self, stats_data: List[Dict], parameters: Dict, context, results: Dict):
+        """Scrive la tabella delle statistiche aggregate"""
+        from qgis.core import QgsFeature, QgsFields, QgsField, QgsWkbTypes
+
+        fields = QgsFields()
+        fields.append(QgsField('parametro', QVariant.String, len=50))
+        fields.append(QgsField('count', QVariant.Int))
+        for name in ('min', 'max', 'range', 'mean', 'stddev'):
+            fields.append(QgsField(name, QVariant.Double, len=10, prec=6))
+
+        (sink, dest_id) = self.parameterAsSink(
+            parameters, 'output_statistiche', context, fields,
+            QgsWkbTypes.NoGeometry
+        )
+
+        for data in stats_data:
+            feat = QgsFeature(fields)
+            feat['parametro'] = data['parametro']
+            feat['count'] = data['count']
+            for name in ('min', 'max', 'range', 'mean', 'stddev'):
+                feat[name] = data.get(name)
+            sink.addFeature(feat)
+
+        results['output_statistiche'] = dest_id
+        context.layerToLoadOnCompletionDetails(results['output_statistiche']).name = self._layer_name("statistiche_aggregate")
+
+    def _log_summary(self, count_interi: int, count_parziali: int, applica_filtro: bool,
+                    tipi: List[str], includi_null: bool, width_step: float, height_step: float,
+                    valore_modulo, results: Dict, context, feedback):
+        """Stampa il riepilogo finale dell'elaborazione"""
+        feedback.pushInfo("\n" + "="*70)
+        feedback.pushInfo("ELABORAZIONE COMPLETATA CON SUCCESSO")
+        feedback.pushInfo("="*70)
+
+        feedback.pushInfo("\n[RIEPILOGO ELABORAZIONE]")
+        feedback.pushInfo(f"Componenti totali analizzati: {count_interi + count_parziali}")
+        feedback.pushInfo(f"  - Componenti interi: {count_interi}")
+        feedback.pushInfo(f"  - Componenti parziali: {count_parziali}")
+
+        self._log_filter_summary(applica_filtro, tipi, includi_null, feedback)
+
+        feedback.pushInfo("\n[PARAMETRI RANGE]")
+        feedback.pushInfo(f"Step larghezza: {width_step} m")
+        feedback.pushInfo(f"Step altezza: {height_step} m")
+
+        if self.USA_MODULO:
+            feedback.pushInfo("\n[PARAMETRI UNITÀ DI MISURA]")
+            feedback.pushInfo(f"Valore del modulo: {valore_modulo} m")
+
+        feedback.pushInfo("\n[OUTPUT GENERATI]")
+        for name in results.keys():
+            layer = self.get_layer_from_source(results[name], context)
+            if layer:
+                feedback.pushInfo(f"  * {layer.name()}: {layer.featureCount()} features")
+
+        if self.USA_MODULO:
+            feedback.pushInfo("\n[CAMPI AGGIUNTI AL LAYER RILIEVO]")
+            feedback.pushInfo("  * width_modulo (intero) - Numero di moduli interi nella larghezza - per TUTTI i componenti")
+            feedback.pushInfo("  * Δwidth_modulo (decimale, 3 decimali) - Resto della larghezza - per TUTTI i componenti")
+            feedback.pushInfo("  * height_modulo (intero) - Numero di moduli interi nell'altezza - per TUTTI i componenti")
+            feedback.pushInfo("  * Δheight_modulo (decimale, 3 decimali) - Resto dell'altezza - per TUTTI i componenti")
+            feedback.pushInfo(f"  * Variabile '@modulo' aggiunta al layer con valore {valore_modulo} m")
+
+        feedback.pushInfo("\n" + "="*70)
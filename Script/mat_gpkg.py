@@ -0,0 +1,575 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Lettura e scrittura diretta dei GeoPackage
+    ----------------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Gli strumenti leggono e scrivono i layer una feature alla volta, tramite
+    QgsFeature e QgsFeatureSink: per i rilievi da centinaia di migliaia di
+    componenti l'I/O pesa quanto i calcoli. Quando ingresso e uscita sono
+    tabelle GeoPackage, questo modulo offre un percorso diretto su SQLite:
+
+      lettura     una sola SELECT dei soli campi richiesti e dei blob WKB
+                  (GpkgTable.read), nell'ordine dei fid;
+      geometrie   intestazioni GeoPackage e struttura WKB percorse una volta
+                  per anello, coordinate estratte in blocco con NumPy
+                  (parse_polygons -> Polygons: coordinate piatte e indici di
+                  inizio di anelli e geometrie), centroidi e bbox vettoriali;
+      scrittura   executemany in un'unica transazione su una tabella gia'
+                  creata da QGIS (GpkgWriter): i trigger dell'indice spaziale
+                  sono sospesi durante l'inserimento e l'R-tree e' ricostruito
+                  una sola volta alla fine.
+
+    Il percorso diretto e' usato solo per layer GeoPackage senza filtri
+    (selezione, filtro del layer, limite di feature) e con geometrie
+    poligonali 2D, Z o M non vuote; in tutti gli altri casi le funzioni
+    restituiscono None e gli strumenti usano la lettura di QGIS. Non applica
+    il controllo delle geometrie non valide del contesto di Processing.
+    qgis e' importato solo dalle funzioni che risolvono i layer: lettura,
+    decodifica e scrittura funzionano (e si provano) anche fuori da QGIS.
+***************************************************************************
+"""
+
+import os
+import sqlite3
+import struct
+from urllib.request import pathname2url
+
+try:
+    from .mat_lazy import lazy_import
+except ImportError:
+    # caricato come script di Processing, fuori dal pacchetto del plugin
+    import sys
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_lazy import lazy_import
+
+np = lazy_import('numpy', globals(), 'np')
+
+# errori del database sollevati da GpkgTable e GpkgWriter
+GpkgError = sqlite3.Error
+
+# byte dell'envelope per indicatore nell'intestazione GeoPackage
+_ENVELOPE = (0, 32, 48, 48, 64)
+_WKB_POLYGON = 3
+_WKB_MULTIPOLYGON = 6
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+# ============ INDIVIDUAZIONE DELLE TABELLE ============
+def _resolve(uri):
+    """(percorso, tabella) di un URI OGR che punta a un GeoPackage, o None"""
+    from qgis.core import QgsProviderRegistry
+    parts = QgsProviderRegistry.instance().decodeUri('ogr', uri)
+    path = parts.get('path') or ''
+    if not path.lower().endswith('.gpkg') or not os.path.isfile(path):
+        return None
+    table = parts.get('layerName') or ''
+    if not table:
+        # senza nome del layer OGR apre la prima tabella: la si accetta
+        # solo se il file ne contiene una sola
+        try:
+            con = GpkgTable.connect(path)
+            try:
+                names = [r[0] for r in con.execute(
+                    "SELECT table_name FROM gpkg_contents WHERE data_type = 'features'")]
+            finally:
+                con.close()
+        except GpkgError:
+            return None
+        if len(names) != 1:
+            return None
+        table = names[0]
+    return path, table
+
+
+def source_table(layer, definition=None):
+    """
+    Tabella GeoPackage di un layer in ingresso, se leggibile direttamente
+
+    Args:
+        layer: Layer risolto dal parametro (parameterAsVectorLayer)
+        definition: Valore grezzo del parametro, per riconoscere le sole
+            feature selezionate, il limite e il filtro delle feature
+
+    Returns:
+        (percorso, tabella) oppure None
+    """
+    from qgis.core import QgsProcessingFeatureSourceDefinition
+    if layer is None or layer.providerType() != 'ogr' or layer.subsetString():
+        return None
+    if isinstance(definition, QgsProcessingFeatureSourceDefinition):
+        if definition.selectedFeaturesOnly:
+            return None
+        if getattr(definition, 'featureLimit', -1) not in (-1, None):
+            return None
+        if getattr(definition, 'filterExpression', ''):
+            return None
+    return _resolve(layer.source())
+
+
+def sink_table(dest_id):
+    """Tabella GeoPackage di un output creato con parameterAsSink, o None"""
+    if not dest_id:
+        return None
+    return _resolve(dest_id)
+
+
+# ============ LETTURA ============
+class GpkgTable:
+    """Tabella di feature di un GeoPackage aperta con sqlite3"""
+
+    def __init__(self, path: str, table: str, con=None):
+        self.path = path
+        self.table = table
+        self.con = con if con is not None else self.connect(path)
+        row = self.con.execute(
+            "SELECT column_name, srs_id FROM gpkg_geometry_columns "
+            "WHERE lower(table_name) = lower(?)", (table,)).fetchone()
+        if row is None:
+            raise GpkgError("Tabella '%s' assente da gpkg_geometry_columns" % table)
+        self.geom, self.srs_id = row
+        info = self.con.execute('PRAGMA table_info(%s)' % _quote(table)).fetchall()
+        pk = [r[1] for r in info if r[5]]
+        if len(pk) != 1:
+            raise GpkgError("Tabella '%s' senza chiave primaria intera" % table)
+        self.pk = pk[0]
+        # campi ordinari, nell'ordine della tabella (come in layer.fields())
+        self.columns = [r[1] for r in info if r[1] not in (self.pk, self.geom)]
+
+    @staticmethod
+    def connect(path: str, readonly: bool = True):
+        """Connessione sqlite3 al file (in sola lettura per default)"""
+        if readonly:
+            uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(path))
+            return sqlite3.connect(uri, uri=True)
+        return sqlite3.connect(path, isolation_level=None)
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def count(self) -> int:
+        return self.con.execute('SELECT COUNT(*) FROM %s' % _quote(self.table)).fetchone()[0]
+
+    def _select(self, names, geometry):
+        cols = [self.pk] + ([self.geom] if geometry else []) + list(names)
+        return 'SELECT %s FROM %s ORDER BY %s' % (
+            ', '.join(_quote(c) for c in cols), _quote(self.table), _quote(self.pk))
+
+    def read(self, names, geometry: bool = True):
+        """
+        Legge fid, campi e blob delle geometrie con una sola SELECT
+
+        Returns:
+            (fid int64, {campo: lista dei valori}, lista dei blob o None)
+        """
+        rows = self.con.execute(self._select(names, geometry)).fetchall()
+        cols = list(zip(*rows)) if rows else [()] * (len(names) + 1 + bool(geometry))
+        fid = np.asarray(cols[0], dtype=np.int64)
+        off = 2 if geometry else 1
+        values = {n: list(cols[off + k]) for k, n in enumerate(names)}
+        return fid, values, (list(cols[1]) if geometry else None)
+
+    def iter_rows(self, size: int):
+        """Righe complete (fid, geometria, campi...) a blocchi di size"""
+        cur = self.con.execute(self._select(self.columns, True))
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows:
+                return
+            yield rows
+
+
+# ============ GEOMETRIE ============
+class Polygons:
+    """
+    Poligoni e multipoligoni in array piatti
+
+    coords: (P, 2) coordinate x, y di tutti i vertici
+    ring_offsets: (R + 1,) inizio di ogni anello in coords
+    geom_offsets: (n + 1,) inizio degli anelli di ogni geometria
+    exterior: (R,) True per gli anelli esterni, False per i buchi
+    """
+
+    def __init__(self, coords, ring_offsets, geom_offsets, exterior):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.geom_offsets = geom_offsets
+        self.exterior = exterior
+
+    def __len__(self) -> int:
+        return int(self.geom_offsets.size - 1)
+
+    def _ids(self):
+        """Anello di ogni vertice e geometria di ogni anello"""
+        n_pts = np.diff(self.ring_offsets)
+        ring_of = np.repeat(np.arange(n_pts.size), n_pts)
+        geom_of = np.repeat(np.arange(len(self)), np.diff(self.geom_offsets))
+        return ring_of, geom_of
+
+    def centroids(self):
+        """
+        Centroidi (n, 2) pesati per area, come QgsGeometry.centroid()
+
+        Formula di Gauss per anello, con le coordinate riferite al primo
+        vertice di ogni geometria (nessuna perdita di cifre con coordinate
+        proiettate grandi); i buchi sottraggono la propria area. Geometrie
+        di area nulla: media dei vertici.
+        """
+        n = len(self)
+        ring_of, geom_of = self._ids()
+        first = self.coords[self.ring_offsets[self.geom_offsets[:-1]]]
+        local = self.coords - first[geom_of[ring_of]]
+        x, y = local[:, 0], local[:, 1]
+        same = ring_of[:-1] == ring_of[1:]
+        r = ring_of[:-1][same]
+        cross = (x[:-1] * y[1:] - x[1:] * y[:-1])[same]
+        n_ring = self.exterior.size
+        a2 = np.bincount(r, cross, n_ring)
+        mx = np.bincount(r, (x[:-1] + x[1:])[same] * cross, n_ring)
+        my = np.bincount(r, (y[:-1] + y[1:])[same] * cross, n_ring)
+        # anelli esterni +|A|, buchi -|A|, qualunque sia il verso
+        s = np.where(self.exterior, 1.0, -1.0) * np.sign(a2)
+        w = np.bincount(geom_of, s * a2 / 2.0, n)
+        cx = np.bincount(geom_of, s * mx / 6.0, n)
+        cy = np.bincount(geom_of, s * my / 6.0, n)
+        out = np.empty((n, 2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[:, 0] = cx / w
+            out[:, 1] = cy / w
+        flat = ~(w != 0)
+        if flat.any():
+            g_pt = geom_of[ring_of]
+            cnt = np.bincount(g_pt, minlength=n)
+            out[flat, 0] = (np.bincount(g_pt, x, n) / cnt)[flat]
+            out[flat, 1] = (np.bincount(g_pt, y, n) / cnt)[flat]
+        return out + first
+
+    def bounds(self):
+        """Bbox (n, 4) di ogni geometria: minx, miny, maxx, maxy"""
+        start = self.ring_offsets[self.geom_offsets[:-1]]
+        lo = np.minimum.reduceat(self.coords, start, axis=0)
+        hi = np.maximum.reduceat(self.coords, start, axis=0)
+        return np.column_stack([lo, hi])
+
+
+def _u32(u8, pos, big):
+    """Interi a 32 bit senza segno agli offset pos, per riga little o big endian"""
+    b = u8[pos[:, None] + np.arange(4)].astype(np.int64)
+    le = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16) | (b[:, 3] << 24)
+    be = b[:, 3] | (b[:, 2] << 8) | (b[:, 1] << 16) | (b[:, 0] << 24)
+    return np.where(big, be, le)
+
+
+def _wkb_type(t):
+    """(tipo base, doppie per vertice; 0 se ignoto) da codici WKB ISO o EWKB"""
+    ewkb = (t & 0xE0000000) != 0
+    base = np.where(ewkb, t & 0x0FFFFFFF, t % 1000)
+    iso = np.array([2, 3, 3, 4, 0])[np.minimum(t // 1000, 4)]
+    dim = np.where(ewkb, 2 + ((t >> 31) & 1) + ((t >> 30) & 1), iso)
+    return base, dim
+
+
+def _parts(u8, pos, geom, part, rings):
+    """
+    Percorre insieme i Polygon WKB che iniziano agli offset pos
+
+    Un giro per indice di anello, vettoriale su tutti i poligoni: aggiunge a
+    rings (geometria, parte, anello, offset delle coordinate, vertici,
+    doppie per vertice, big endian) e ritorna l'offset di fine di ognuno.
+    """
+    big = u8[pos] == 0
+    base, dim = _wkb_type(_u32(u8, pos + 1, big))
+    if np.any(base != _WKB_POLYGON) or np.any(dim == 0):
+        raise ValueError('tipo WKB non supportato')
+    n_rings = _u32(u8, pos + 5, big)
+    # conteggi incompatibili con la lunghezza del buffer: blob corrotto
+    if np.any(n_rings > (u8.size - pos) // 4):
+        raise ValueError('numero di anelli non valido')
+    cur = pos + 9
+    for r in range(int(n_rings.max()) if n_rings.size else 0):
+        on = r < n_rings
+        c = cur[on]
+        n_pts = _u32(u8, c, big[on])
+        rings.append((geom[on], part[on], np.full(c.size, r), c + 4, n_pts,
+                      dim[on], big[on]))
+        cur[on] = c + 4 + 8 * dim[on] * n_pts
+    return cur
+
+
+def _gather_xy(u8, pos, big, chunk=1 << 20):
+    """Coppie di doppie (x, y) agli offset in byte pos, lette a blocchi di vertici"""
+    out = np.empty((pos.size, 2))
+    step = np.arange(16)
+    swap = np.r_[7:-1:-1, 15:7:-1]
+    for a in range(0, pos.size, chunk):
+        raw = u8[pos[a:a + chunk, None] + step]
+        b = big[a:a + chunk]
+        if b.any():
+            raw[b] = raw[b][:, swap]
+        out[a:a + chunk] = raw.view('<f8')
+    return out
+
+
+def parse_polygons(blobs):
+    """
+    Blob GeoPackage di poligoni o multipoligoni -> Polygons
+
+    Intestazioni, codici di tipo e conteggi di parti, anelli e vertici sono
+    letti con operazioni NumPy su tutte le geometrie insieme (un giro per
+    indice di parte e di anello, non per feature); le coordinate di tutti i
+    vertici sono poi estratte con un'unica lettura dal buffer concatenato.
+
+    Returns:
+        Polygons, oppure None se una geometria e' nulla, vuota, malformata
+        o di tipo diverso da Polygon/MultiPolygon (anche con Z o M)
+    """
+    if any(b is None for b in blobs):
+        return None
+    buf = b''.join(blobs)
+    u8 = np.frombuffer(buf, dtype=np.uint8)
+    size = np.fromiter(map(len, blobs), dtype=np.int64, count=len(blobs))
+    end = np.cumsum(size)
+    start = end - size
+    n = size.size
+    try:
+        if np.any(size < 13):
+            return None
+        flags = u8[start + 3]
+        env = (flags >> 1) & 7
+        if np.any(u8[start] != 0x47) or np.any(u8[start + 1] != 0x50) \
+                or np.any(flags & 0x30) or np.any(env >= len(_ENVELOPE)):
+            return None
+        q = start + 8 + np.array(_ENVELOPE)[env]
+        big = u8[q] == 0
+        base, _ = _wkb_type(_u32(u8, q + 1, big))
+        single = base == _WKB_POLYGON
+        if not np.all(single | (base == _WKB_MULTIPOLYGON)):
+            return None
+
+        rings = []
+        geom = np.arange(n)
+        cur = np.empty(n, dtype=np.int64)
+        s = np.flatnonzero(single)
+        cur[s] = _parts(u8, q[s], s, np.zeros(s.size, dtype=np.int64), rings)
+        m = np.flatnonzero(~single)
+        n_parts = _u32(u8, q[m] + 5, big[m])
+        if np.any(n_parts > (u8.size - q[m]) // 9):
+            return None
+        pcur = q[m] + 9
+        for k in range(int(n_parts.max()) if m.size else 0):
+            on = k < n_parts
+            pcur[on] = _parts(u8, pcur[on], geom[m][on], np.full(int(on.sum()), k), rings)
+        cur[m] = pcur
+        # ogni WKB deve terminare esattamente alla fine del proprio blob
+        if not np.array_equal(cur, end):
+            return None
+    except (ValueError, IndexError):
+        return None
+    if not rings:
+        return None
+
+    g, part, r, pos, n_pts, dim, rbig = (np.concatenate(c) for c in zip(*rings))
+    order = np.lexsort((r, part, g))
+    g, r, pos, n_pts, dim, rbig = g[order], r[order], pos[order], n_pts[order], \
+        dim[order], rbig[order]
+    geom_offsets = np.searchsorted(g, np.arange(n + 1))
+    # geometrie senza anelli o con il primo anello vuoto
+    if np.any(np.diff(geom_offsets) == 0) or np.any(n_pts[geom_offsets[:-1]] == 0):
+        return None
+    ring_offsets = np.concatenate([[0], np.cumsum(n_pts)]).astype(np.int64)
+    # offset in byte della x di ogni vertice: inizio anello + passo * indice
+    k = np.arange(ring_offsets[-1]) - np.repeat(ring_offsets[:-1], n_pts)
+    px = np.repeat(pos, n_pts) + 8 * np.repeat(dim, n_pts) * k
+    coords = _gather_xy(u8, px, np.repeat(rbig, n_pts))
+    return Polygons(coords, ring_offsets, geom_offsets.astype(np.int64), r == 0)
+
+
+def read_components(path, table, field_names):
+    """
+    Fid, campi numerici, centroidi e bbox dei componenti di una tabella
+
+    Returns:
+        (fid, {campo: float64 con NaN per i NULL}, centroidi (n, 2),
+        bbox (n, 4)), oppure None se un campo manca o non e' numerico o le
+        geometrie non sono poligoni leggibili
+    """
+    with GpkgTable(path, table) as tab:
+        known = {c.lower(): c for c in tab.columns + [tab.pk]}
+        names = [known.get(n.lower()) for n in field_names]
+        if None in names:
+            return None
+        fid, values, blobs = tab.read(list(dict.fromkeys(names)))
+    polys = parse_polygons(blobs)
+    if polys is None:
+        return None
+    try:
+        cols = {f: np.array(values[n], dtype=np.float64)
+                for f, n in zip(field_names, names)}
+    except (TypeError, ValueError):
+        return None
+    return fid, cols, polys.centroids(), polys.bounds()
+
+
+# ============ SCRITTURA ============
+class GpkgWriter(GpkgTable):
+    """
+    Inserimento in blocco in una tabella GeoPackage esistente
+
+    La tabella e' quella creata (vuota) da QGIS con parameterAsSink, quindi
+    con struttura, indice spaziale e metadati gia' in regola. All'ingresso
+    nel blocco with si apre un'unica transazione e si sospendono i trigger
+    dell'R-tree (usano funzioni spaziali di GDAL, assenti in sqlite3);
+    all'uscita l'R-tree e' ricostruito con le bbox passate a insert,
+    l'estensione in gpkg_contents aggiornata e i trigger ricreati. In caso
+    di errore la transazione e' annullata.
+    """
+
+    def __init__(self, path: str, table: str):
+        super().__init__(path, table, self.connect(path, readonly=False))
+        self.rtree = 'rtree_%s_%s' % (self.table, self.geom)
+        exists = self.con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (self.rtree,)).fetchone()
+        if not exists:
+            self.rtree = None
+        self._triggers = []
+        self._bounds = []
+
+    def __enter__(self):
+        self.con.execute('BEGIN')
+        if self.rtree:
+            # solo i trigger dell'R-tree: quelli del conteggio delle feature
+            # (gpkg_ogr_contents) sono SQL puro e restano attivi
+            self._triggers = [t for t in self.con.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = ?", (self.table,)).fetchall()
+                if t[0].startswith(self.rtree + '_')]
+            for name, _ in self._triggers:
+                self.con.execute('DROP TRIGGER %s' % _quote(name))
+        return self
+
+    def insert(self, rows, bounds=None):
+        """
+        Inserisce righe (fid, blob, campi nell'ordine di columns)
+
+        bounds: (len(rows), 4) minx, miny, maxx, maxy per l'R-tree
+        """
+        rows = self._retag(rows)
+        cols = [self.pk, self.geom] + self.columns
+        self.con.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+            _quote(self.table), ', '.join(_quote(c) for c in cols),
+            ', '.join('?' * len(cols))), rows)
+        if self.rtree and bounds is not None:
+            self._bounds.append((np.fromiter((r[0] for r in rows), dtype=np.int64,
+                                             count=len(rows)), np.asarray(bounds)))
+
+    def _retag(self, rows):
+        """Riporta l'srs_id delle intestazioni a quello della tabella di uscita"""
+        blob = next((r[1] for r in rows if r[1] is not None), None)
+        if blob is None or len(blob) < 8:
+            return rows
+        fmt = '<i' if blob[3] & 1 else '>i'
+        if struct.unpack_from(fmt, blob, 4)[0] == self.srs_id:
+            return rows
+        out = []
+        for r in rows:
+            g = r[1]
+            if g is not None:
+                g = g[:4] + struct.pack('<i' if g[3] & 1 else '>i', self.srs_id) + g[8:]
+            out.append((r[0], g) + tuple(r[2:]))
+        return out
+
+    def _finish(self):
+        if self._bounds:
+            fid = np.concatenate([b[0] for b in self._bounds])
+            box = np.concatenate([b[1] for b in self._bounds])
+            self.con.execute('DELETE FROM %s' % _quote(self.rtree))
+            # colonne dell'R-tree GeoPackage: id, minx, maxx, miny, maxy
+            self.con.executemany(
+                'INSERT INTO %s VALUES (?, ?, ?, ?, ?)' % _quote(self.rtree),
+                zip(fid.tolist(), box[:, 0].tolist(), box[:, 2].tolist(),
+                    box[:, 1].tolist(), box[:, 3].tolist()))
+            self.con.execute(
+                "UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ?, "
+                "last_change = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') "
+                "WHERE lower(table_name) = lower(?)",
+                (float(box[:, 0].min()), float(box[:, 1].min()),
+                 float(box[:, 2].max()), float(box[:, 3].max()), self.table))
+        for _, sql in self._triggers:
+            self.con.execute(sql)
+        has_ogr = self.con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'gpkg_ogr_contents'").fetchone()
+        if has_ogr:
+            self.con.execute(
+                'UPDATE gpkg_ogr_contents SET feature_count = (SELECT COUNT(*) FROM %s) '
+                'WHERE lower(table_name) = lower(?)' % _quote(self.table), (self.table,))
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            if exc_type is None:
+                self._finish()
+                self.con.execute('COMMIT')
+            else:
+                self.con.execute('ROLLBACK')
+        finally:
+            self.close()
+
+
+def copy_with_columns(src, dst, fid, extra, bounds, batch=1000, progress=None):
+    """
+    Copia una tabella GeoPackage in un'altra aggiungendo colonne calcolate
+
+    Args:
+        src: (percorso, tabella) in ingresso
+        dst: (percorso, tabella) in uscita, creata vuota da QGIS con i campi
+            dell'ingresso seguiti da quelli di extra
+        fid: fid dei componenti nell'ordine delle colonne calcolate
+        extra: Coppie (nome del campo, lista dei valori) delle colonne
+            aggiunte, nell'ordine dei campi
+        bounds: (n, 4) bbox dei componenti (per l'R-tree)
+        batch: Righe per executemany
+        progress: Funzione chiamata con la frazione di righe scritte
+
+    Returns:
+        False (senza scrivere nulla) se i campi dell'uscita non corrispondono
+        a quelli attesi, True a scrittura completata
+    """
+    n = len(fid)
+    with GpkgTable(*src) as tin:
+        out = GpkgWriter(*dst)
+        expected = tin.columns + [name for name, _ in extra]
+        if [c.lower() for c in out.columns] != [c.lower() for c in expected]:
+            out.close()
+            return False
+        extra = [values for _, values in extra]
+        idx_by_fid = None
+        with out:
+            done = 0
+            for rows in tin.iter_rows(batch):
+                k = np.arange(done, done + len(rows))
+                ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+                if k[-1] >= n or not np.array_equal(ids, fid[k]):
+                    # ordine diverso dalla lettura: ricerca per fid
+                    if idx_by_fid is None:
+                        idx_by_fid = {f: i for i, f in enumerate(fid.tolist())}
+                    k = np.array([idx_by_fid[f] for f in ids.tolist()], dtype=np.int64)
+                kl = k.tolist()
+                out.insert([r + tuple(col[i] for col in extra) for r, i in zip(rows, kl)],
+                           bounds[k])
+                done += len(rows)
+                if progress is not None:
+                    progress(done / max(n, 1))
+    return True
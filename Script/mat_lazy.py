@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Importazione differita dei moduli pesanti
+    ---------------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    QGIS importa i moduli della suite all'avvio, per registrare gli
+    algoritmi, anche quando MAT non viene usato. numpy e processing servono
+    pero' solo durante l'elaborazione: lazy_import() li sostituisce a livello
+    di modulo con un segnaposto che importa il modulo vero al primo accesso a
+    un suo attributo (di fatto, nel primo processAlgorithm):
+
+        np = lazy_import('numpy', globals(), 'np')
+        processing = lazy_import('processing', globals())
+
+    Al primo accesso il segnaposto rimpiazza se stesso nel namespace del
+    modulo chiamante con il modulo reale: gli accessi successivi (anche nei
+    cicli critici) non passano piu' dal segnaposto e non costano nulla in
+    piu' di un import normale.
+
+    Le annotazioni di tipo che citano il modulo (-> np.ndarray) vanno rese
+    non valutate con 'from __future__ import annotations', altrimenti
+    forzerebbero l'importazione gia' alla definizione delle funzioni.
+***************************************************************************
+"""
+
+import importlib
+import sys
+
+
+class _LazyModule:
+    """Segnaposto di un modulo, importato al primo accesso a un attributo"""
+
+    def __init__(self, name, namespace, alias):
+        self._name = name
+        self._namespace = namespace
+        self._alias = alias
+
+    def _load(self):
+        module = importlib.import_module(self._name)
+        # da qui in avanti il modulo chiamante vede direttamente quello reale
+        if self._namespace.get(self._alias) is self:
+            self._namespace[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<modulo differito '{self._name}'>"
+
+
+def lazy_import(name, namespace, alias=None):
+    """
+    Importazione differita di un modulo
+
+    Args:
+        name: Nome completo del modulo (es. 'numpy')
+        namespace: globals() del modulo chiamante
+        alias: Nome con cui il modulo e' legato nel chiamante (default: name)
+
+    Returns:
+        Il modulo stesso se gia' importato altrove, altrimenti il segnaposto
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name, namespace, alias or name)
@@ -0,0 +1,721 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Calcoli scientifici in NumPy puro
+    -------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Equivalenti in solo NumPy dei pochi strumenti di scikit-learn e SciPy
+    usati dalle Statistiche avanzate, per far girare l'analisi anche dove
+    le due librerie non sono installate (e senza i secondi della loro
+    importazione):
+
+      standard_scaler   z-score come StandardScaler (varianza di
+                        popolazione, scala 1 per le colonne costanti)
+      pca               PCA per SVD con la convenzione di segno di
+                        scikit-learn (svd_flip sulle componenti)
+      ward_linkage      clustering gerarchico di Ward per catena dei vicini
+                        piu' prossimi (nearest-neighbour chain): matrice
+                        di fusione nel formato di scipy.cluster.hierarchy,
+                        memoria O(n) invece della matrice delle distanze
+      fcluster_distance / cut_tree_k
+                        taglio del dendrogramma a una distanza (come
+                        fcluster 'distance') o in k gruppi (come
+                        AgglomerativeClustering)
+      GridIndex         ricerca dei vicini a raggio fisso e k-nearest su
+                        una griglia regolare di celle (al posto di cKDTree)
+      binned_kde        densita' di kernel gaussiana per binnatura lineare e
+                        convoluzione FFT, con banda di Silverman o ISJ
+                        (bandwidth_silverman, bandwidth_isj)
+      fast_mcd          covarianza robusta a determinante minimo (FastMCD,
+                        come MinCovDet) con correzione di consistenza e
+                        ripesatura, per le distanze di Mahalanobis robuste
+
+    I risultati coincidono con quelli delle librerie a meno di
+    arrotondamenti e dell'ordine dei casi di parita' (distanze identiche);
+    Benchmark/benchmark_kernel.py ne misura tempi e concordanza.
+***************************************************************************
+"""
+
+import heapq
+import math
+import os
+import sys
+
+try:
+    from .mat_lazy import lazy_import
+except ImportError:
+    # caricato come script di Processing o dal processo di analisi
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_lazy import lazy_import
+
+np = lazy_import('numpy', globals(), 'np')
+
+
+# --------------------------------------------------------------------------
+#  Standardizzazione e PCA
+# --------------------------------------------------------------------------
+def standard_scaler(X):
+    """z-score per colonna (media 0, varianza di popolazione 1)."""
+    X = np.asarray(X, dtype=float)
+    n = X.shape[0]
+    mean = X.mean(axis=0)
+    var = X.var(axis=0)
+    # colonne costanti (entro l'errore numerico): scala 1, come scikit-learn
+    eps = np.finfo(float).eps
+    costante = var <= n * eps * var + (n * mean * eps) ** 2
+    scale = np.sqrt(var)
+    scale[costante | (scale < 10 * eps)] = 1.0
+    return (X - mean) / scale
+
+
+def pca(X, n_components):
+    """
+    PCA per decomposizione ai valori singolari
+
+    Returns:
+        (punteggi n x n_components, componenti n_components x d,
+         rapporto di varianza spiegata)
+    """
+    X = np.asarray(X, dtype=float)
+    Xc = X - X.mean(axis=0)
+    U, S, Vt = np.linalg.svd(Xc, full_matrices=False)
+    # segno deterministico: in ogni componente il coefficiente di modulo
+    # massimo e' positivo (svd_flip di scikit-learn sulle componenti)
+    col = np.argmax(np.abs(Vt), axis=1)
+    signs = np.sign(Vt[np.arange(Vt.shape[0]), col])
+    signs[signs == 0] = 1.0
+    U *= signs
+    Vt *= signs[:, None]
+    tot = float(np.sum(S ** 2))
+    ratio = (S ** 2) / tot if tot > 0 else np.zeros_like(S)
+    k = n_components
+    return U[:, :k] * S[:k], Vt[:k], ratio[:k]
+
+
+# --------------------------------------------------------------------------
+#  Clustering gerarchico di Ward
+# --------------------------------------------------------------------------
+def ward_linkage(X):
+    """
+    Clustering gerarchico di Ward per catena dei vicini piu' prossimi
+
+    Ogni gruppo e' rappresentato da baricentro e numerosita': la distanza di
+    Ward tra due gruppi a, b e' sqrt(2 na nb / (na + nb)) * |ca - cb|, la
+    stessa altezza di fusione di scipy. Ogni passo della catena calcola le
+    distanze da un solo gruppo a tutti gli altri (O(n) memoria, O(n^2)
+    tempo complessivo).
+
+    Returns:
+        Matrice di fusione (n-1) x 4 nel formato di scipy.cluster.hierarchy
+        (indice a, indice b, altezza, numerosita'), in ordine di altezza
+    """
+    X = np.asarray(X, dtype=float)
+    n = X.shape[0]
+    if n < 2:
+        return np.zeros((0, 4))
+    # stato dei gruppi vivi in array compatti (una riga per coordinata),
+    # ricompattati quando i gruppi vivi scendono sotto la meta'
+    ids = np.arange(n)              # posizione compatta -> indice del gruppo
+    pos = np.arange(n)              # indice del gruppo -> posizione compatta
+    C = np.ascontiguousarray(X.T)
+    size = np.ones(n)
+    vivo = np.ones(n, dtype=bool)
+    nvivi = n
+    fusioni = np.empty((n - 1, 3))
+    chain = []
+
+    def _distanze(p):
+        d2 = np.zeros(len(ids))
+        for row in C:
+            d2 += (row - row[p]) ** 2
+        d2 *= 2.0 * size[p] * size / (size[p] + size)
+        d2[~vivo] = np.inf
+        d2[p] = np.inf
+        return d2
+
+    for step in range(n - 1):
+        if 2 * nvivi < len(ids):
+            keep = np.flatnonzero(vivo)
+            ids, C, size = ids[keep], np.ascontiguousarray(C[:, keep]), size[keep]
+            vivo = np.ones(len(ids), dtype=bool)
+            pos[ids] = np.arange(len(ids))
+        if not chain:
+            chain.append(int(ids[np.argmax(vivo)]))
+        while True:
+            a = chain[-1]
+            d2 = _distanze(pos[a])
+            b = int(ids[np.argmin(d2)])
+            # a parita' si preferisce il predecessore nella catena
+            if len(chain) > 1 and d2[pos[chain[-2]]] <= d2[pos[b]]:
+                b = chain[-2]
+            if len(chain) > 1 and b == chain[-2]:
+                break
+            chain.append(b)
+        chain.pop()
+        chain.pop()
+        x, y = (a, b) if a < b else (b, a)
+        # il gruppo fuso prende il posto di y (come in scipy)
+        px, py = pos[x], pos[y]
+        nx, ny = size[px], size[py]
+        C[:, py] = (nx * C[:, px] + ny * C[:, py]) / (nx + ny)
+        size[py] = nx + ny
+        vivo[px] = False
+        nvivi -= 1
+        fusioni[step] = (x, y, np.sqrt(d2[pos[b]]))
+
+    # ordine di altezza (stabile) e rinumerazione dei gruppi come in scipy:
+    # le foglie sono 0..n-1, il gruppo creato alla fusione i e' n+i
+    order = np.argsort(fusioni[:, 2], kind='mergesort')
+    fusioni = fusioni[order]
+    parent = np.arange(2 * n - 1)
+    nsize = np.concatenate([np.ones(n), np.zeros(n - 1)])
+
+    def _find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    Zlink = np.empty((n - 1, 4))
+    for i, (x, y, h) in enumerate(fusioni):
+        rx, ry = _find(int(x)), _find(int(y))
+        if rx > ry:
+            rx, ry = ry, rx
+        parent[rx] = parent[ry] = n + i
+        nsize[n + i] = nsize[rx] + nsize[ry]
+        Zlink[i] = (rx, ry, h, nsize[n + i])
+    return Zlink
+
+
+def _leaves(Zlink, node, n):
+    """Foglie (osservazioni) sotto un nodo del dendrogramma."""
+    out, stack = [], [node]
+    while stack:
+        v = stack.pop()
+        if v < n:
+            out.append(v)
+        else:
+            row = Zlink[v - n]
+            stack.append(int(row[1]))
+            stack.append(int(row[0]))
+    return out
+
+
+def fcluster_distance(Zlink, t):
+    """
+    Gruppi del dendrogramma tagliato all'altezza t (fcluster 'distance')
+
+    Etichette 0..k-1 numerate come fcluster meno 1: visita dalla radice,
+    in ogni nodo prima i figli interni (sinistro, destro) e poi le foglie.
+    """
+    n = Zlink.shape[0] + 1
+    labels = np.zeros(n, dtype=np.int64)
+    k = 0
+    stack = [2 * n - 2] if n > 1 else [0]
+    while stack:
+        v = stack.pop()
+        if v < n or Zlink[v - n, 2] <= t:
+            labels[_leaves(Zlink, v, n)] = k
+            k += 1
+        else:
+            figli = (int(Zlink[v - n, 0]), int(Zlink[v - n, 1]))
+            ordine = [c for c in figli if c >= n] + [c for c in figli if c < n]
+            stack.extend(reversed(ordine))
+    return labels
+
+
+def cut_tree_k(Zlink, k):
+    """
+    Gruppi ottenuti annullando le ultime k-1 fusioni (k gruppi)
+
+    Etichette numerate come AgglomerativeClustering (heap dei nodi aperti
+    dal piu' alto in giu').
+    """
+    n = Zlink.shape[0] + 1
+    k = max(1, min(int(k), n))
+    nodi = [-(2 * n - 2)] if n > 1 else [0]
+    for _ in range(k - 1):
+        figli = Zlink[-nodi[0] - n]
+        heapq.heappush(nodi, -int(figli[0]))
+        heapq.heappushpop(nodi, -int(figli[1]))
+    labels = np.zeros(n, dtype=np.int64)
+    for lab, v in enumerate(nodi):
+        labels[_leaves(Zlink, -v, n)] = lab
+    return labels
+
+
+# --------------------------------------------------------------------------
+#  Ricerca dei vicini su griglia regolare
+# --------------------------------------------------------------------------
+class GridIndex:
+    """
+    Indice spaziale a griglia regolare sui punti XY (n x 2)
+
+    I punti sono raggruppati per cella; le query lavorano una cella alla
+    volta, confrontando i punti della cella con quelli delle celle vicine
+    in blocchi di dimensione limitata (BLOCCO elementi per matrice delle
+    distanze), quindi la memoria resta contenuta anche con celle affollate.
+    """
+
+    BLOCCO = 2_000_000
+
+    def __init__(self, XY, cell):
+        self.XY = np.asarray(XY, dtype=float)
+        self.n = len(self.XY)
+        self.cell = float(cell) if cell > 0 else 1.0
+        g = np.floor((self.XY - self.XY.min(axis=0)) / self.cell).astype(np.int64)
+        self.gmax = g.max(axis=0) if self.n else np.zeros(2, dtype=np.int64)
+        key = g[:, 0] * (int(self.gmax[1]) + 1) + g[:, 1]
+        order = np.argsort(key, kind='stable')
+        uk, start = np.unique(key[order], return_index=True)
+        end = np.append(start[1:], self.n)
+        self.g = g
+        self.celle = {}
+        for kk, s, e in zip(uk.tolist(), start.tolist(), end.tolist()):
+            self.celle[(kk // (int(self.gmax[1]) + 1), kk % (int(self.gmax[1]) + 1))] = order[s:e]
+
+    @classmethod
+    def for_knn(cls, XY, k):
+        """Indice con celle di circa k punti (densita' media)."""
+        XY = np.asarray(XY, dtype=float)
+        span = XY.max(axis=0) - XY.min(axis=0) if len(XY) else np.zeros(2)
+        area = float(span[0] * span[1])
+        if area <= 0:
+            area = float(max(span.max(), 1.0)) ** 2
+        return cls(XY, np.sqrt(area * max(k, 1) / max(len(XY), 1)))
+
+    def _blocco(self, cx, cy, r):
+        """Indici (ordinati) dei punti nelle celle a distanza di Chebyshev <= r."""
+        x0, x1 = max(cx - r, 0), min(cx + r, int(self.gmax[0]))
+        y0, y1 = max(cy - r, 0), min(cy + r, int(self.gmax[1]))
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.celle):
+            # blocco piu' grande della griglia occupata: si scorrono le celle
+            parti = [pts for (ix, iy), pts in self.celle.items()
+                     if x0 <= ix <= x1 and y0 <= iy <= y1]
+        else:
+            parti = [self.celle[c] for c in
+                     ((ix, iy) for ix in range(x0, x1 + 1) for iy in range(y0, y1 + 1))
+                     if c in self.celle]
+        return np.sort(np.concatenate(parti)) if parti else np.zeros(0, dtype=np.int64)
+
+    def _righe(self, membri, ncand):
+        step = max(1, self.BLOCCO // max(ncand, 1))
+        for s in range(0, len(membri), step):
+            yield membri[s:s + step]
+
+    def query_radius(self, radius):
+        """Vicini entro radius (punto stesso incluso) in forma CSR (ptr, idx)."""
+        r = max(1, int(np.ceil(radius / self.cell)))
+        r2 = radius * radius
+        ball = [None] * self.n
+        for (cx, cy), membri in self.celle.items():
+            cand = self._blocco(cx, cy, r)
+            P = self.XY[cand]
+            for righe in self._righe(membri, len(cand)):
+                D = ((self.XY[righe, None, :] - P[None, :, :]) ** 2).sum(axis=2)
+                rows, cols = np.nonzero(D <= r2)
+                parti = np.split(cand[cols], np.searchsorted(rows, np.arange(1, len(righe))))
+                for i, p in zip(righe.tolist(), parti):
+                    ball[i] = p
+        sizes = np.fromiter((len(b) for b in ball), dtype=np.int64, count=self.n)
+        ptr = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(sizes, out=ptr[1:])
+        idx = np.concatenate(ball).astype(np.int64) if ptr[-1] else np.zeros(0, dtype=np.int64)
+        return ptr, idx
+
+    def query_knn(self, k):
+        """k vicini piu' prossimi di ogni punto (n x k, in ordine di distanza;
+        a parita' di distanza prima l'indice minore)."""
+        k = min(int(k), self.n)
+        out = np.empty((self.n, k), dtype=np.int64)
+        r_max = int(max(self.gmax.max(), 1))
+        for (cx, cy), membri in self.celle.items():
+            resto = membri
+            r = 1
+            while len(resto):
+                cand = self._blocco(cx, cy, r)
+                completo = r >= r_max
+                if len(cand) < k and not completo:
+                    r *= 2
+                    continue
+                P = self.XY[cand]
+                sospesi = []
+                for righe in self._righe(resto, len(cand)):
+                    D = ((self.XY[righe, None, :] - P[None, :, :]) ** 2).sum(axis=2)
+                    order = np.argsort(D, axis=1, kind='stable')[:, :k]
+                    dk = np.take_along_axis(D, order[:, -1:], axis=1)[:, 0]
+                    # esatto se il k-esimo vicino sta entro il blocco di celle:
+                    # ogni punto fuori dista almeno r celle dal punto
+                    ok = completo | (dk <= (r * self.cell) ** 2)
+                    out[righe[ok]] = cand[order[ok]]
+                    sospesi.append(righe[~ok])
+                resto = np.concatenate(sospesi) if sospesi else resto[:0]
+                r *= 2
+        return out
+
+
+# --------------------------------------------------------------------------
+#  Densita' di kernel su griglia (KDE binnata)
+# --------------------------------------------------------------------------
+# punti della griglia usata dalla scelta della banda ISJ
+PUNTI_ISJ = 1024
+
+
+def linear_binning(x, lo, hi, n_points):
+    """
+    Pesi della binnatura lineare di x su n_points punti equispaziati
+
+    Ogni valore divide il suo peso tra i due punti della griglia che lo
+    racchiudono, in proporzione alla vicinanza; i valori fuori da
+    [lo, hi] vanno al punto estremo.
+    """
+    x = np.asarray(x, dtype=float)
+    delta = (hi - lo) / (n_points - 1)
+    pos = np.clip((x - lo) / delta, 0.0, n_points - 1)
+    i = np.minimum(np.floor(pos).astype(np.int64), n_points - 2)
+    f = pos - i
+    return (np.bincount(i, weights=1.0 - f, minlength=n_points)
+            + np.bincount(i + 1, weights=f, minlength=n_points))
+
+
+def _dct2(x):
+    """DCT di tipo II non normalizzata (come scipy.fftpack.dct), via FFT"""
+    n = x.size
+    v = np.concatenate([x[::2], x[1::2][::-1]])
+    k = np.arange(n)
+    return 2.0 * np.real(np.fft.fft(v) * np.exp(-1j * np.pi * k / (2 * n)))
+
+
+def bandwidth_silverman(x):
+    """Banda con la regola di Silverman: 0.9 min(sigma, IQR/1.34) n^(-1/5)"""
+    x = np.asarray(x, dtype=float)
+    n = x.size
+    if n < 2:
+        return 0.0
+    sigma = x.std(ddof=1)
+    q75, q25 = np.percentile(x, [75, 25])
+    spread = min(sigma, (q75 - q25) / 1.34) or sigma
+    return 0.9 * spread * n ** (-0.2)
+
+
+def _isj_fixed_point(t, n, i_sq, a2):
+    """Equazione del punto fisso di Botev et al. (2010), l = 7"""
+    ell = 7
+    f = 2.0 * np.pi ** (2 * ell) * np.sum(i_sq ** ell * a2 * np.exp(-i_sq * np.pi ** 2 * t))
+    for s in range(ell - 1, 1, -1):
+        k0 = np.prod(np.arange(1, 2 * s, 2)) / np.sqrt(2 * np.pi)
+        const = (1 + 0.5 ** (s + 0.5)) / 3.0
+        time = (2 * const * k0 / n / f) ** (2.0 / (3 + 2 * s))
+        f = 2.0 * np.pi ** (2 * s) * np.sum(i_sq ** s * a2 * np.exp(-i_sq * np.pi ** 2 * time))
+    return t - (2.0 * n * np.sqrt(np.pi) * f) ** (-0.4)
+
+
+def bandwidth_isj(x):
+    """
+    Banda Improved Sheather-Jones (Botev, Grotowski e Kroese, 2010)
+
+    Stima la banda ottima per il punto fisso sulla DCT dell'istogramma
+    binnato, senza ipotesi di normalita': adatta alle distribuzioni
+    multimodali (piu' moduli o tipologie nello stesso campione).
+
+    Returns:
+        Banda, None se il punto fisso non ha soluzione (pochi valori
+        distinti): in quel caso conviene la regola di Silverman
+    """
+    x = np.asarray(x, dtype=float)
+    lo, hi = float(x.min()), float(x.max())
+    if hi <= lo:
+        return None
+    margine = (hi - lo) / 10.0
+    lo, hi = lo - margine, hi + margine
+    extent = hi - lo
+    hist = linear_binning(x, lo, hi, PUNTI_ISJ) / x.size
+    a = _dct2(hist)
+    i_sq = np.arange(1, PUNTI_ISJ, dtype=float) ** 2
+    a2 = a[1:] ** 2 / 4.0
+    # numero dei valori, non dei valori distinti (come KDEpy): con misure
+    # arrotondate al millimetro i distinti sono poche centinaia e la banda
+    # risulterebbe molto piu' larga
+    n = x.size
+
+    # radice per bisezione in [0, tol], allargando tol come nell'originale
+    tol = 10e-12 + 0.01 * (min(max(n, 50), 1050) - 50) / 1000
+    with np.errstate(all='ignore'):
+        while tol < 1.0:
+            f_hi = _isj_fixed_point(tol, n, i_sq, a2)
+            if np.isfinite(f_hi) and f_hi > 0:
+                t_lo, t_hi = 0.0, tol
+                for _ in range(100):
+                    t_mid = 0.5 * (t_lo + t_hi)
+                    f_mid = _isj_fixed_point(t_mid, n, i_sq, a2)
+                    if not np.isfinite(f_mid) or f_mid < 0:
+                        t_lo = t_mid
+                    else:
+                        t_hi = t_mid
+                    if t_hi - t_lo <= 1e-14 + 1e-10 * t_hi:
+                        break
+                return float(np.sqrt(0.5 * (t_lo + t_hi)) * extent)
+            tol *= 2.0
+    return None
+
+
+def binned_kde(x, grid_lo, grid_hi, n_points, bandwidth):
+    """
+    Densita' di kernel gaussiana su una griglia regolare
+
+    Binnatura lineare dei valori sulla griglia e convoluzione con il
+    kernel campionato (troncato a 4 bande) tramite FFT: O(n + G log G)
+    invece di O(n G) della somma diretta. Il kernel campionato e'
+    normalizzato sulla griglia (somma per passo = 1): con una banda
+    stretta rispetto al passo i pochi punti del kernel altrimenti non
+    integrano a 1.
+
+    Args:
+        x: Valori
+        grid_lo, grid_hi: Estremi della griglia
+        n_points: Punti della griglia (G)
+        bandwidth: Banda del kernel (deviazione standard)
+
+    Returns:
+        Densita' nei punti della griglia (integrale ~1 se la griglia copre
+        i valori con qualche banda di margine, qualunque sia la banda)
+    """
+    x = np.asarray(x, dtype=float)
+    delta = (grid_hi - grid_lo) / (n_points - 1)
+    weights = linear_binning(x, grid_lo, grid_hi, n_points)
+    span = int(min(n_points - 1, np.ceil(4.0 * bandwidth / delta)))
+    offsets = np.arange(-span, span + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum() * delta
+    size = 1 << int(np.ceil(np.log2(n_points + 2 * span + 1)))
+    conv = np.fft.irfft(np.fft.rfft(weights, size) * np.fft.rfft(kernel, size), size)
+    density = conv[span:span + n_points] / x.size
+    # residui negativi dell'aritmetica della FFT
+    return np.maximum(density, 0.0)
+
+
+# --------------------------------------------------------------------------
+#  Covarianza robusta (FastMCD)
+# --------------------------------------------------------------------------
+# sotto questa dimensione FastMCD lavora su tutti i dati, sopra su sottoinsiemi
+MCD_SOTTOINSIEME = 300
+# punti del campione diviso nei sottoinsiemi
+MCD_CAMPIONE = 1500
+# soluzioni migliori portate al passo successivo
+MCD_MIGLIORI = 10
+# calo minimo del logaritmo del determinante per un altro passo di concentrazione
+TOLLERANZA_MCD = 1e-5
+
+
+def chi2_cdf(x, df):
+    """Funzione di ripartizione del chi quadrato (forma chiusa per df intero)."""
+    if x <= 0:
+        return 0.0
+    if df % 2 == 0:
+        term, total = 1.0, 1.0
+        for k in range(1, df // 2):
+            term *= (x / 2.0) / k
+            total += term
+        return 1.0 - math.exp(-x / 2.0) * total
+    term, total = math.sqrt(x), 0.0
+    for k in range(1, (df - 1) // 2 + 1):
+        total += term
+        term *= x / (2 * k + 1)
+    return math.erf(math.sqrt(x / 2.0)) - math.sqrt(2.0 / math.pi) * math.exp(-x / 2.0) * total
+
+
+def chi2_ppf(q, df):
+    """Quantile del chi quadrato (bisezione su chi2_cdf)."""
+    lo, hi = 0.0, float(df) + 10.0 * math.sqrt(2.0 * df) + 10.0
+    while chi2_cdf(hi, df) < q:
+        hi *= 2.0
+    for _ in range(100):
+        mid = 0.5 * (lo + hi)
+        if chi2_cdf(mid, df) < q:
+            lo = mid
+        else:
+            hi = mid
+    return 0.5 * (lo + hi)
+
+
+def _consistency(df, alpha):
+    """Fattore di consistenza della covarianza della frazione alpha dei punti
+    piu' centrali di una normale (Croux e Haesbroeck 1999)."""
+    return alpha / chi2_cdf(chi2_ppf(alpha, df), df + 2)
+
+
+def _whitening(cov):
+    """Matrici W con cov^-1 = W W^T (pseudoinversa per le covarianze singolari);
+    accetta una pila di covarianze (..., p, p)."""
+    w, v = np.linalg.eigh(cov)
+    tol = np.max(w, axis=-1, keepdims=True) * w.shape[-1] * np.finfo(float).eps
+    inv_sqrt = np.where(w > tol, 1.0 / np.sqrt(np.where(w > tol, w, 1.0)), 0.0)
+    return v * inv_sqrt[..., None, :]
+
+
+def _c_steps(X, loc, cov, h, steps):
+    """
+    Passi di concentrazione di piu' soluzioni insieme
+
+    Ogni passo tiene gli h punti piu' vicini (Mahalanobis) alla soluzione e
+    ne ricalcola media e covarianza: il determinante non puo' crescere.
+    Si ferma prima se nessuna soluzione cambia piu' il sottoinsieme.
+
+    Args:
+        X: Dati (n, p)
+        loc, cov: Soluzioni iniziali (T, p), (T, p, p)
+        h: Punti del sottoinsieme
+        steps: Passi massimi
+
+    Returns:
+        (loc, cov, logdet) dopo i passi
+    """
+    support = None
+    for _ in range(steps):
+        y = np.matmul(X[None, :, :] - loc[:, None, :], _whitening(cov))
+        d2 = np.einsum('tij,tij->ti', y, y)
+        idx = np.sort(np.argpartition(d2, h - 1, axis=1)[:, :h], axis=1)
+        if support is not None and np.array_equal(idx, support):
+            break
+        support = idx
+        S = X[idx]
+        loc = S.mean(axis=1)
+        D = S - loc[:, None, :]
+        cov = np.einsum('thi,thj->tij', D, D) / h
+    return loc, cov, np.linalg.slogdet(cov)[1]
+
+
+def _mahalanobis_sq(XT, loc, cov):
+    """Distanze di Mahalanobis al quadrato dei dati per colonne XT (p, n),
+    con la pseudoinversa se cov e' singolare."""
+    W = _whitening(cov).T
+    y = W @ XT
+    y -= (W @ loc)[:, None]
+    y *= y
+    return y.sum(axis=0)
+
+
+def _concentrate(XT, loc, cov, h, steps):
+    """
+    Passi di concentrazione di una sola soluzione sui dati completi
+
+    Come _c_steps, sui dati per colonne (p, n) e senza le pile di matrici:
+    memoria O(n). Si ferma quando il determinante smette di scendere.
+
+    Returns:
+        (loc, cov, logdet)
+    """
+    logdet = np.inf
+    for _ in range(steps):
+        d2 = _mahalanobis_sq(XT, loc, cov)
+        # soglia dell'h-esima distanza invece degli indici dei punti
+        S = XT[:, d2 <= np.partition(d2, h - 1)[h - 1]]
+        loc = S.mean(axis=1)
+        S -= loc[:, None]
+        cov = S @ S.T / S.shape[1]
+        previous, logdet = logdet, np.linalg.slogdet(cov)[1]
+        if not logdet < previous - TOLLERANZA_MCD:
+            break
+    return loc, cov, logdet
+
+
+def _best(loc, cov, logdet, k):
+    """Le k soluzioni con determinante minore."""
+    order = np.argsort(logdet, kind='stable')[:k]
+    return loc[order], cov[order], logdet[order]
+
+
+def _random_starts(X, n_starts, rng):
+    """Soluzioni iniziali da sottoinsiemi casuali di p + 1 punti."""
+    n, p = X.shape
+    idx = np.argsort(rng.random((n_starts, n)), axis=1)[:, :p + 1]
+    S = X[idx]
+    loc = S.mean(axis=1)
+    D = S - loc[:, None, :]
+    return loc, np.einsum('thi,thj->tij', D, D) / (p + 1)
+
+
+def fast_mcd(X, support_fraction=None, n_trials=500, max_steps=30, seed=0):
+    """
+    Media e covarianza robuste a determinante minimo (FastMCD)
+
+    Algoritmo di Rousseeuw e Van Driessen (1999), come MinCovDet di
+    scikit-learn: la stima MCD e' la media e covarianza degli h punti con
+    determinante della covarianza minimo, trovata con passi di
+    concentrazione (_c_steps) da molte soluzioni iniziali di p + 1 punti.
+    Oltre 2 * MCD_SOTTOINSIEME punti le soluzioni iniziali lavorano su un
+    campione di MCD_CAMPIONE punti diviso in sottoinsiemi disgiunti e solo
+    le MCD_MIGLIORI soluzioni arrivano ai dati completi: il costo e'
+    lineare in n. Le soluzioni sono elaborate insieme come pile di matrici.
+    Il generatore ha un seme fisso: stessi dati, stesso risultato.
+
+    Seguono la correzione di consistenza (_consistency) e la ripesatura
+    sui punti con distanza entro il quantile 0.975 del chi quadrato, come
+    in scikit-learn.
+
+    Args:
+        X: Dati (n, p), senza NaN
+        support_fraction: Frazione h/n (default (n + p + 1) / 2 punti)
+        n_trials: Soluzioni iniziali
+        max_steps: Passi di concentrazione massimi sui dati completi
+        seed: Seme del generatore
+
+    Returns:
+        (media, covarianza, distanze di Mahalanobis al quadrato, maschera
+        dei punti tenuti dalla ripesatura)
+    """
+    X = np.asarray(X, dtype=float)
+    n, p = X.shape
+    if support_fraction is None:
+        h = (n + p + 1) // 2
+    else:
+        h = int(np.ceil(support_fraction * n))
+    h = min(max(h, p + 1), n)
+    rng = np.random.default_rng(seed)
+    XT = np.ascontiguousarray(X.T)
+
+    if n <= 2 * MCD_SOTTOINSIEME:
+        loc, cov = _random_starts(X, n_trials, rng)
+        loc, cov, logdet = _best(*_c_steps(X, loc, cov, h, 2), MCD_MIGLIORI)
+    else:
+        m = min(n, MCD_CAMPIONE)
+        sample = X[rng.choice(n, m, replace=False)]
+        parts = np.array_split(sample, max(1, m // MCD_SOTTOINSIEME))
+        locs, covs = [], []
+        for part in parts:
+            h_part = int(np.ceil(part.shape[0] * h / n))
+            loc, cov = _random_starts(part, max(MCD_MIGLIORI, n_trials // len(parts)), rng)
+            loc, cov, logdet = _best(*_c_steps(part, loc, cov, h_part, 2), MCD_MIGLIORI)
+            locs.append(loc)
+            covs.append(cov)
+        # soluzioni dei sottoinsiemi rifinite sul campione intero
+        loc, cov = np.concatenate(locs), np.concatenate(covs)
+        loc, cov, logdet = _best(*_c_steps(sample, loc, cov, int(np.ceil(m * h / n)), 2),
+                                 MCD_MIGLIORI)
+        # un passo sui dati completi per ciascuna delle migliori
+        fits = [_concentrate(XT, loc[i], cov[i], h, 1) for i in range(loc.shape[0])]
+        loc = np.array([f[0] for f in fits])
+        cov = np.array([f[1] for f in fits])
+        logdet = np.array([f[2] for f in fits])
+
+    i = int(np.argmin(logdet))
+    loc, cov, _ = _concentrate(XT, loc[i], cov[i], h, max_steps)
+
+    # correzione di consistenza della stima grezza
+    cov = cov * _consistency(p, h / n)
+    d2 = _mahalanobis_sq(XT, loc, cov)
+
+    # ripesatura: media e covarianza dei punti entro il quantile 0.975
+    mask = d2 < chi2_ppf(0.975, p)
+    if mask.sum() > p:
+        S = XT[:, mask]
+        loc = S.mean(axis=1)
+        S -= loc[:, None]
+        cov = S @ S.T / S.shape[1] * _consistency(p, 0.975)
+        d2 = _mahalanobis_sq(XT, loc, cov)
+    return loc, cov, d2, mask
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Cartelle e file privati dell'utente
+    ---------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Il processo di analisi (mat_worker) e le fasi memorizzate (mat_cache)
+    tengono tra un'esecuzione e l'altra file di cui si fidano: la chiave e
+    l'indirizzo del processo, gli output delle fasi. In una cartella dal
+    nome prevedibile nella /tmp condivisa un altro utente locale potrebbe
+    crearli per primo (o mettervi un collegamento simbolico) e far leggere
+    all'algoritmo dati suoi. Qui le cartelle stanno invece sotto una base
+    dell'utente:
+
+      processo    $XDG_RUNTIME_DIR (gia' privata, cancellata al logout)
+      cache       $XDG_CACHE_HOME oppure ~/.cache
+      Windows     %LOCALAPPDATA%
+
+    con ripiego su <tmp>/mat_<uid> se la base manca. Ogni cartella creata
+    dal modulo ha modo 0700 ed e' verificata a ogni uso: deve essere una
+    cartella vera (non un collegamento), dell'utente corrente e senza
+    permessi per gruppo e altri; altrimenti PrivateError. I file privati
+    sono creati con O_EXCL|O_NOFOLLOW e modo 0600 e riletti solo se hanno
+    ancora proprietario e modo attesi.
+***************************************************************************
+"""
+
+import os
+import stat
+import tempfile
+
+RADICE = 'MensioAnalysisTools'
+# su Windows i permessi dipendono dagli ACL di %LOCALAPPDATA%, gia' per utente
+POSIX = hasattr(os, 'getuid')
+_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+
+
+class PrivateError(OSError):
+    """Cartella o file privato non sicuro (proprietario, modo o collegamento)"""
+
+
+def _check_dir(path):
+    """Verifica (ed eventualmente restringe) una cartella dell'utente"""
+    if not POSIX:
+        return
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PrivateError("%s non e' una cartella (collegamento simbolico?)" % path)
+    if st.st_uid != os.getuid():
+        raise PrivateError("%s appartiene a un altro utente (uid %d)" % (path, st.st_uid))
+    if st.st_mode & 0o077:
+        # cartella nostra con permessi larghi (es. umask): si restringe
+        os.chmod(path, 0o700)
+
+
+def _base(runtime):
+    if not POSIX:
+        return os.environ.get('LOCALAPPDATA') or None
+    if runtime:
+        base = os.environ.get('XDG_RUNTIME_DIR')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return base if base and os.path.isabs(base) and os.path.isdir(base) else None
+
+
+def private_dir(name, runtime=False):
+    """
+    Cartella privata dell'utente, creata se manca
+
+    Args:
+        name: Sottocartella (es. 'fasi', 'processo')
+        runtime: True per i file di un processo (socket, stato), False per
+            una cache che sopravvive al logout
+
+    Returns:
+        Percorso della cartella
+
+    Raises:
+        PrivateError: una cartella esistente non e' privata dell'utente
+    """
+    base = _base(runtime)
+    if base is None:
+        tag = os.getuid() if POSIX else 'utente'
+        base = os.path.join(tempfile.gettempdir(), 'mat_%s' % tag)
+        _makedir(base)
+    path = base
+    for part in (RADICE, name):
+        path = os.path.join(path, part)
+        _makedir(path)
+    return path
+
+
+def _makedir(path):
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    _check_dir(path)
+
+
+def write_private(path, text):
+    """
+    Scrive un file privato (modo 0600), sostituendo quello esistente
+
+    Il vecchio file e' rimosso e il nuovo creato con O_EXCL|O_NOFOLLOW: un
+    file o un collegamento creato nel frattempo da altri fa fallire la
+    scrittura invece di essere seguito.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _NOFOLLOW, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+        fh.write(text)
+
+
+def read_private(path):
+    """
+    Contenuto di un file privato
+
+    Raises:
+        PrivateError: il file non e' dell'utente o e' leggibile da altri
+        OSError: il file manca o non e' leggibile
+    """
+    fd = os.open(path, os.O_RDONLY | _NOFOLLOW)
+    with os.fdopen(fd, 'r', encoding='utf-8') as fh:
+        if POSIX:
+            st = os.fstat(fh.fileno())
+            if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o600:
+                raise PrivateError("%s non e' un file privato dell'utente" % path)
+        return fh.read()
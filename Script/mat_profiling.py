@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Misura delle fasi di elaborazione
+    --------------------------------------------------------------
+    Modulo di supporto condiviso dagli algoritmi della suite (non e' un
+    algoritmo di Processing). Misura per ogni fase di un processAlgorithm:
+
+      - tempo reale (wall) e tempo CPU del processo;
+      - numero di feature in ingresso e in uscita (se ricavabili);
+      - variazione della memoria residente (RSS) del processo.
+
+    Tre modi d'uso, equivalenti nei risultati:
+
+      * decoratore sui metodi di fase, con il profiler in self._profiler:
+
+            @profiled_stage('SPATIAL JOIN')
+            def _spatial_join(self, parameters, context, feedback): ...
+
+      * context manager per un blocco:
+
+            with profiler.stage('LISA', n_in=n) as rec:
+                ...
+                rec['n_out'] = n_hh
+
+      * marcature sequenziali per funzioni monolitiche: lap() chiude la fase
+        corrente e apre la successiva, finish() chiude l'ultima.
+
+    Al termine, log_summary() stampa nel log una tabella sintetica e write()
+    salva il resoconto completo in JSON o CSV (in base all'estensione).
+
+    Il decoratore profilable() attiva inoltre, tramite un parametro booleano
+    avanzato, la profilazione dettagliata di tutto processAlgorithm: file
+    .pstats di cProfile, pile campionate in formato 'collapsed' (compatibile
+    con py-spy, flamegraph.pl e speedscope) e un JSON con parametri e
+    dimensioni degli input, per analizzare offline un'esecuzione lenta.
+***************************************************************************
+"""
+
+import csv
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_mb():
+    """Memoria residente attuale del processo in MB (None se non misurabile).
+    Usa psutil se presente, altrimenti /proc/self/statm (Linux) e, come
+    ultima risorsa, il picco RSS del modulo resource."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024.0 * 1024.0)
+    try:
+        with open('/proc/self/statm') as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+    except ImportError:
+        return None
+
+
+def count_features(obj, context=None):
+    """Numero di feature di un riferimento a layer: QgsVectorLayer, sorgente,
+    id/percorso di layer (risolto nel contesto), dizionario di risultati
+    di processing.run (chiave 'OUTPUT') o tupla (primo elemento). None se
+    il conteggio non e' ricavabile senza scorrere il layer."""
+    if obj is None:
+        return None
+    if isinstance(obj, tuple):
+        return count_features(obj[0], context) if obj else None
+    if isinstance(obj, dict):
+        return count_features(obj.get('OUTPUT'), context) if 'OUTPUT' in obj else None
+    if isinstance(obj, str):
+        if context is None:
+            return None
+        from qgis.core import QgsProcessingUtils
+        obj = QgsProcessingUtils.mapLayerFromString(obj, context)
+        if obj is None:
+            return None
+    fc = getattr(obj, 'featureCount', None)
+    if fc is None:
+        return None
+    n = fc()
+    return int(n) if n is not None and n >= 0 else None
+
+
+def _find_context(args, kwargs):
+    """Il QgsProcessingContext tra gli argomenti di un metodo di fase."""
+    ctx = kwargs.get('context')
+    if ctx is not None:
+        return ctx
+    for a in args:
+        if type(a).__name__ == 'QgsProcessingContext':
+            return a
+    return None
+
+
+class StageProfiler:
+    """Raccoglie le misure delle fasi di un'elaborazione."""
+
+    FIELDS = ('fase', 'wall_s', 'cpu_s', 'n_in', 'n_out', 'rss_delta_mb', 'rss_mb')
+
+    def __init__(self, algorithm='', feedback=None):
+        self.algorithm = algorithm
+        self.feedback = feedback
+        self.records = []
+        self.meta = {}
+        self._t0 = time.perf_counter()
+        self._c0 = time.process_time()
+        self._lap = None
+
+    # ------------------------------------------------------------------
+    #  Misura
+    # ------------------------------------------------------------------
+    @contextmanager
+    def stage(self, name, n_in=None):
+        """Misura il blocco come fase 'name'. Il dizionario restituito puo'
+        essere completato dal chiamante (ad es. rec['n_out'])."""
+        rec = {'fase': name, 'n_in': n_in, 'n_out': None}
+        rss0 = rss_mb()
+        t0 = time.perf_counter()
+        c0 = time.process_time()
+        try:
+            yield rec
+        finally:
+            rec['wall_s'] = time.perf_counter() - t0
+            rec['cpu_s'] = time.process_time() - c0
+            rss1 = rss_mb()
+            rec['rss_mb'] = rss1
+            rec['rss_delta_mb'] = (rss1 - rss0) if rss0 is not None and rss1 is not None else None
+            self.records.append(rec)
+
+    def lap(self, name, n_in=None):
+        """Chiude la fase aperta con lap() (se c'e') e ne apre una nuova."""
+        self.finish()
+        cm = self.stage(name, n_in)
+        rec = cm.__enter__()
+        self._lap = (cm, rec)
+        return rec
+
+    def finish(self, n_out=None):
+        """Chiude la fase aperta con lap(), registrandone le feature in uscita."""
+        if self._lap is None:
+            return
+        cm, rec = self._lap
+        self._lap = None
+        if n_out is not None:
+            rec['n_out'] = n_out
+        cm.__exit__(None, None, None)
+
+    # ------------------------------------------------------------------
+    #  Resoconto
+    # ------------------------------------------------------------------
+    def report(self):
+        """Resoconto strutturato dell'elaborazione."""
+        self.finish()
+        return {
+            'algoritmo': self.algorithm,
+            'wall_totale_s': time.perf_counter() - self._t0,
+            'cpu_totale_s': time.process_time() - self._c0,
+            'meta': self.meta,
+            'fasi': list(self.records),
+        }
+
+    def log_summary(self, feedback=None):
+        """Stampa nel log la tabella delle fasi ordinate per durata."""
+        feedback = feedback or self.feedback
+        if feedback is None:
+            return
+        rep = self.report()
+        total = rep['wall_totale_s'] or 1e-12
+        feedback.pushInfo("\n[TEMPI PER FASE]")
+        feedback.pushInfo("%-36s %9s %9s %6s %10s %10s %9s" % (
+            'fase', 'wall s', 'cpu s', '%', 'n in', 'n out', 'dRSS MB'))
+        for r in sorted(rep['fasi'], key=lambda r: -r['wall_s']):
+            feedback.pushInfo("%-36s %9.3f %9.3f %5.1f%% %10s %10s %9s" % (
+                r['fase'][:36], r['wall_s'], r['cpu_s'], 100.0 * r['wall_s'] / total,
+                '-' if r['n_in'] is None else r['n_in'],
+                '-' if r['n_out'] is None else r['n_out'],
+                '-' if r['rss_delta_mb'] is None else '%+.1f' % r['rss_delta_mb']))
+        feedback.pushInfo("Totale: %.3f s (CPU %.3f s)" % (
+            rep['wall_totale_s'], rep['cpu_totale_s']))
+
+    def write(self, path):
+        """Salva il resoconto: CSV (una riga per fase) se l'estensione e'
+        .csv, altrimenti JSON."""
+        rep = self.report()
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as fh:
+                w = csv.writer(fh, delimiter=';')
+                w.writerow(('algoritmo',) + self.FIELDS)
+                for r in rep['fasi']:
+                    w.writerow([self.algorithm] + ['' if r.get(k) is None else r.get(k)
+                                                   for k in self.FIELDS])
+        else:
+            with open(path, 'w', encoding='utf-8') as fh:
+                json.dump(rep, fh, indent=2, ensure_ascii=False, default=str)
+        return path
+
+
+def profiled_stage(name):
+    """Decoratore per i metodi di fase: se l'istanza ha un profiler in
+    self._profiler misura la chiamata come fase 'name', con le feature in
+    ingresso dal primo argomento (se e' un layer) e in uscita dal valore
+    restituito. Senza profiler la chiamata non e' alterata."""
+    def deco(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            prof = getattr(self, '_profiler', None)
+            if prof is None:
+                return method(self, *args, **kwargs)
+            context = _find_context(args, kwargs)
+            n_in = None
+            if args and not isinstance(args[0], dict):
+                try:
+                    n_in = count_features(args[0], context)
+                except Exception:
+                    n_in = None
+            with prof.stage(name, n_in) as rec:
+                result = method(self, *args, **kwargs)
+                try:
+                    rec['n_out'] = count_features(result, context)
+                except Exception:
+                    rec['n_out'] = None
+            return result
+        return wrapper
+    return deco
+
+
+# --------------------------------------------------------------------------
+#  Profilazione dettagliata (cProfile + campionamento delle pile)
+# --------------------------------------------------------------------------
+class StackSampler:
+    """Campiona a intervalli regolari la pila di chiamate di un thread e
+    accumula le pile nel formato 'collapsed' (una riga 'f1;f2;...;fn N'),
+    lo stesso di py-spy e di flamegraph.pl / speedscope."""
+
+    def __init__(self, thread_id, interval=0.005):
+        import threading
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mat-stack-sampler',
+                                        daemon=True)
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                               code.co_firstlineno)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as fh:
+            for stack, n in sorted(self.counts.items()):
+                fh.write('%s %d\n' % (stack, n))
+        return path
+
+
+def _json_value(v):
+    """Valore di parametro serializzabile in JSON (stringa per gli oggetti)."""
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, (list, tuple)):
+        return [_json_value(x) for x in v]
+    if isinstance(v, dict):
+        return {str(k): _json_value(x) for k, x in v.items()}
+    return str(v)
+
+
+def output_folder(alg, parameters, context):
+    """Cartella del primo output su file dell'algoritmo; in mancanza (output
+    temporanei o in memoria) la cartella temporanea di Processing."""
+    for d in alg.destinationParameterDefinitions():
+        v = parameters.get(d.name())
+        sink = getattr(v, 'sink', None)
+        if sink is not None:
+            v = sink.staticValue() if hasattr(sink, 'staticValue') else sink
+        if isinstance(v, str) and os.path.isabs(v) and not v.startswith('memory:'):
+            folder = os.path.dirname(v)
+            if os.path.isdir(folder):
+                return folder
+    from qgis.core import QgsProcessingUtils
+    return QgsProcessingUtils.tempFolder()
+
+
+def input_sizes(alg, parameters, context):
+    """Numero di feature di ogni sorgente vettoriale in ingresso."""
+    sizes = {}
+    for d in alg.parameterDefinitions():
+        if d.type() != 'source' or parameters.get(d.name()) in (None, ''):
+            continue
+        try:
+            src = alg.parameterAsSource(parameters, d.name(), context)
+            sizes[d.name()] = src.featureCount() if src is not None else None
+        except Exception:
+            sizes[d.name()] = None
+    return sizes
+
+
+def profilable(param_name):
+    """Decoratore per processAlgorithm: se il parametro booleano 'param_name'
+    e' attivo, l'elaborazione gira sotto cProfile e sotto il campionatore
+    delle pile. Accanto agli output vengono scritti:
+
+      <algoritmo>_<data>.pstats         statistiche cProfile (pstats, snakeviz)
+      <algoritmo>_<data>.collapsed.txt  pile campionate (flamegraph, speedscope)
+      <algoritmo>_<data>.json           parametri, dimensioni degli input,
+                                        ambiente e funzioni piu' costose
+    """
+    def deco(method):
+        @functools.wraps(method)
+        def wrapper(self, parameters, context, feedback):
+            try:
+                active = self.parameterAsBool(parameters, param_name, context)
+            except Exception:
+                active = False
+            if not active:
+                return method(self, parameters, context, feedback)
+
+            import cProfile
+            import datetime
+            import io
+            import platform
+            import pstats
+            import threading
+
+            stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            base = os.path.join(output_folder(self, parameters, context),
+                                '%s_%s' % (self.name(), stamp))
+            meta = {
+                'algoritmo': self.name(),
+                'data': stamp,
+                'parametri': {k: _json_value(v) for k, v in parameters.items()},
+                'dimensioni_input': input_sizes(self, parameters, context),
+                'python': platform.python_version(),
+                'piattaforma': platform.platform(),
+                'cpu': os.cpu_count(),
+            }
+            try:
+                from qgis.core import Qgis
+                meta['qgis'] = Qgis.QGIS_VERSION
+            except ImportError:
+                pass
+            try:
+                import numpy
+                meta['numpy'] = numpy.__version__
+            except ImportError:
+                pass
+
+            profiler = cProfile.Profile()
+            sampler = StackSampler(threading.get_ident())
+            t0 = time.perf_counter()
+            sampler.start()
+            profiler.enable()
+            try:
+                return method(self, parameters, context, feedback)
+            finally:
+                profiler.disable()
+                sampler.stop()
+                meta['wall_s'] = time.perf_counter() - t0
+                try:
+                    profiler.dump_stats(base + '.pstats')
+                    sampler.write(base + '.collapsed.txt')
+                    buf = io.StringIO()
+                    stats = pstats.Stats(profiler, stream=buf)
+                    stats.sort_stats('cumulative').print_stats(30)
+                    meta['funzioni_piu_costose'] = buf.getvalue().splitlines()
+                    with open(base + '.json', 'w', encoding='utf-8') as fh:
+                        json.dump(meta, fh, indent=2, ensure_ascii=False)
+                    feedback.pushInfo("\nProfilazione dettagliata salvata in: %s"
+                                      ".pstats / .collapsed.txt / .json" % base)
+                except OSError as e:
+                    feedback.pushWarning("Impossibile scrivere la profilazione: %s" % e)
+        return wrapper
+    return deco
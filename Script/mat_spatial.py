@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Assegnazione dei componenti ai campioni
+    -------------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Sostituisce native:joinattributesbylocation (intersezione, uno-a-uno)
+    nella fase di spatial join degli strumenti con campione, che copiava il
+    rilievo confrontando ogni componente con i campioni candidati e, per un
+    componente a cavallo di due campioni, ne teneva uno qualsiasi:
+
+      indice      R-tree dei campioni caricato in blocco (QgsSpatialIndex
+                  costruito dall'iteratore, impacchettamento STR),
+                  interrogato con il bbox di ciascun componente;
+      verifica    geometrie dei campioni preparate una sola volta (GEOS) e
+                  test di intersezione sui soli candidati dell'indice;
+      ambiguita'  un componente che interseca piu' campioni va a quello con
+                  l'area di sovrapposizione maggiore (a parita', il primo
+                  nell'ordine del layer campioni).
+
+    Il risultato (SampleIndex.assign) e' un array con la posizione del
+    campione di ciascun componente (NESSUNO se non ne interseca alcuno),
+    allineato ai fid dei componenti: il rilievo e' letto per le sole
+    geometrie e non viene copiato. I campi del campione si leggono da
+    SampleIndex.attributes.
+***************************************************************************
+"""
+
+import os
+
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsSpatialIndex
+from qgis.PyQt.QtCore import QVariant
+
+try:
+    from .mat_lazy import lazy_import
+except ImportError:
+    # caricato come script di Processing, fuori dal pacchetto del plugin
+    import sys
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_lazy import lazy_import
+
+np = lazy_import('numpy', globals(), 'np')
+
+# posizione restituita per i componenti che non intersecano alcun campione
+NESSUNO = -1
+
+
+class SampleIndex:
+    """
+    Campioni indicizzati per l'assegnazione dei componenti
+
+    Attributes:
+        attributes: Valori dei campi richiesti, una lista per campione
+        ambigui: Componenti assegnati per sovrapposizione maggiore
+    """
+
+    def __init__(self, source, field_names, crs=None, transform_context=None,
+                 feedback=None):
+        """
+        Args:
+            source: Layer o sorgente dei campioni
+            field_names: Campi dei campioni da riportare sui componenti
+            crs: Sistema di riferimento dei componenti (se diverso da quello
+                dei campioni le geometrie dei campioni sono riproiettate)
+            transform_context: Contesto delle trasformazioni di coordinate
+            feedback: Feedback per l'annullamento della costruzione
+        """
+        request = QgsFeatureRequest()
+        if crs is not None and crs != source.sourceCrs():
+            request.setDestinationCrs(crs, transform_context)
+
+        fields = source.fields()
+        idx = [fields.lookupField(n) for n in field_names]
+        self.attributes = []
+        self.ambigui = 0
+        self._row = {}
+        self._geometries = []
+        self._engines = []
+        for feat in source.getFeatures(request):
+            if not feat.hasGeometry():
+                continue
+            geom = feat.geometry()
+            engine = QgsGeometry.createGeometryEngine(geom.constGet())
+            engine.prepareGeometry()
+            self._row[feat.id()] = len(self._engines)
+            # la geometria resta referenziata finche' vive il suo motore
+            self._geometries.append(geom)
+            self._engines.append(engine)
+            attrs = feat.attributes()
+            self.attributes.append([attrs[i] if i >= 0 else None for i in idx])
+
+        # costruzione in blocco dall'iteratore: R-tree impacchettato (STR)
+        request.setNoAttributes()
+        self._index = QgsSpatialIndex(source.getFeatures(request), feedback)
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+    def assign(self, source, key: str = '', feedback=None):
+        """
+        Campione di ciascun componente di un layer
+
+        Il layer e' letto per le sole geometrie (e il campo chiave), senza
+        scriverne una copia.
+
+        Args:
+            source: Layer o sorgente dei componenti
+            key: Campo usato come fid (se assente o NULL: id della feature)
+            feedback: Feedback per avanzamento e annullamento
+
+        Returns:
+            Tupla (fids, campioni) di array int64 allineati, una voce per
+            componente nell'ordine del layer: campioni e' la posizione in
+            attributes, NESSUNO se il componente non interseca alcun
+            campione. None se l'elaborazione e' stata annullata.
+        """
+        fields = source.fields()
+        key_idx = fields.lookupField(key) if key else -1
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes([key_idx] if key_idx >= 0 else [])
+
+        total = max(source.featureCount(), 1)
+        fids = []
+        rows = []
+        for i, feat in enumerate(source.getFeatures(request)):
+            if feedback is not None and i % 10000 == 0:
+                if feedback.isCanceled():
+                    return None
+                feedback.setProgress(100.0 * i / total)
+            k = feat.attribute(key_idx) if key_idx >= 0 else None
+            null = k is None or (isinstance(k, QVariant) and k.isNull())
+            fids.append(feat.id() if null else k)
+            rows.append(self._assign_geometry(feat.geometry()) if feat.hasGeometry() else NESSUNO)
+        return np.asarray(fids, dtype=np.int64), np.asarray(rows, dtype=np.int64)
+
+    def _assign_geometry(self, geometry) -> int:
+        """Posizione del campione di una geometria (NESSUNO se nessuno)"""
+        candidates = sorted(self._row[i] for i in self._index.intersects(geometry.boundingBox())
+                            if i in self._row)
+        geom = geometry.constGet()
+        hits = [r for r in candidates if self._engines[r].intersects(geom)]
+        if len(hits) <= 1:
+            return hits[0] if hits else NESSUNO
+
+        # a cavallo di piu' campioni: vince la sovrapposizione maggiore
+        self.ambigui += 1
+        best, best_area = hits[0], -1.0
+        for r in hits:
+            overlap = self._engines[r].intersection(geom)
+            area = overlap.area() if overlap is not None else 0.0
+            if area > best_area:
+                best, best_area = r, area
+        return best
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Kernel statistici sulle colonne
+    -----------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Statistiche vettoriali sugli array NumPy delle colonne, senza QGIS:
+
+      value_counts      conteggio per valore
+      describe          count/min/max/media/deviazione standard/range
+      Moments           accumulatore combinabile delle stesse statistiche,
+                        alimentato a blocchi
+      robust_stats      mediana, quartili, P5/P95, IQR e MAD esatti
+      QuantileSketch    gli stessi quantili approssimati con uno sketch KLL
+                        combinabile, in memoria limitata
+      group_stats       statistiche per categoria in una passata
+      histogram_pyramid conteggi per classe di range a piu' step
+
+    mat_core li importa e li usa sulle colonne lette dai layer
+    (ComponentTable, describe_layer, robust_stats_layer).
+***************************************************************************
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .mat_lazy import lazy_import
+except ImportError:
+    # caricato come script di Processing o dal processo di analisi
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_lazy import lazy_import
+
+np = lazy_import('numpy', globals(), 'np')
+
+
+def value_counts(column: np.ndarray, null_label: str = 'NULL') -> Dict[str, int]:
+    """Conteggio per valore (etichette testuali, NULL come null_label)"""
+    if column.size == 0:
+        return {}
+    if column.dtype == object:
+        labels = np.array([null_label if v is None else str(v) for v in column], dtype=object)
+    elif column.dtype.kind == 'f':
+        labels = np.where(np.isnan(column), null_label, column.astype(str)).astype(object)
+    else:
+        labels = column.astype(str).astype(object)
+    values, counts = np.unique(labels.astype(str), return_counts=True)
+    return {str(v): int(c) for v, c in zip(values, counts)}
+
+
+def describe(values: np.ndarray, ddof: int = 1) -> Dict[str, Any]:
+    """
+    Statistiche descrittive di una colonna numerica (NULL esclusi)
+
+    Deviazione standard campionaria per default (ddof=1, correzione di
+    Bessel), indefinita (None) per meno di ddof+1 valori.
+
+    Returns:
+        Dizionario count/min/max/mean/stddev/range, None se non ci sono valori
+    """
+    v = np.asarray(values, dtype=np.float64)
+    v = v[~np.isnan(v)]
+    n = int(v.size)
+    if n == 0:
+        return None
+    vmin = float(v.min())
+    vmax = float(v.max())
+    mean = float(v.sum() / n)
+    stddev = float(np.sqrt(((v - mean) ** 2).sum() / (n - ddof))) if n > ddof else None
+    return {
+        'count': n,
+        'min': vmin,
+        'max': vmax,
+        'mean': mean,
+        'stddev': stddev,
+        'range': vmax - vmin
+    }
+
+
+class Moments:
+    """
+    Accumulatore combinabile di count, min, max, media e scarti quadratici
+
+    Si alimenta a blocchi (add) e due accumulatori parziali si combinano con
+    merge (aggiornamento a coppie di Chan et al.: piu' stabile di somma e
+    somma dei quadrati), quindi le statistiche di un layer si calcolano un
+    blocco alla volta. result() restituisce lo stesso dizionario di describe().
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, values) -> 'Moments':
+        """Aggiunge un blocco di valori (NULL/NaN esclusi)"""
+        v = np.asarray(values, dtype=np.float64)
+        v = v[~np.isnan(v)]
+        if v.size:
+            blocco = Moments()
+            blocco.count = int(v.size)
+            blocco.mean = float(v.sum() / v.size)
+            blocco.m2 = float(((v - blocco.mean) ** 2).sum())
+            blocco.min = float(v.min())
+            blocco.max = float(v.max())
+            self.merge(blocco)
+        return self
+
+    def merge(self, other: 'Moments') -> 'Moments':
+        """Combina un altro accumulatore in questo"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def result(self, ddof: int = 1) -> Optional[Dict[str, Any]]:
+        """Statistiche come describe(), None se non ci sono valori"""
+        if self.count == 0:
+            return None
+        n = self.count
+        return {
+            'count': n,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'stddev': float(np.sqrt(self.m2 / (n - ddof))) if n > ddof else None,
+            'range': self.max - self.min
+        }
+
+
+# quantili delle statistiche robuste, nell'ordine delle colonne in uscita
+QUANTILI = (('p5', 0.05), ('q1', 0.25), ('mediana', 0.5), ('q3', 0.75), ('p95', 0.95))
+
+
+def _robust_result(n: int, quantile, mad) -> Dict[str, Any]:
+    """Dizionario delle statistiche robuste da una funzione dei quantili"""
+    out = {'count': n}
+    for name, p in QUANTILI:
+        out[name] = float(quantile(p))
+    out['iqr'] = out['q3'] - out['q1']
+    out['mad'] = float(mad(out['mediana']))
+    return out
+
+
+def robust_stats(values: np.ndarray) -> Optional[Dict[str, Any]]:
+    """
+    Mediana, quartili, P5/P95, IQR e MAD esatti di una colonna (NULL esclusi)
+
+    Quantili con interpolazione lineare (come np.percentile), MAD non
+    scalato (mediana degli scarti assoluti dalla mediana). np.partition
+    porta al loro posto solo gli elementi d'ordine necessari: O(n) invece
+    dell'ordinamento completo.
+
+    Returns:
+        Dizionario count/p5/q1/mediana/q3/p95/iqr/mad, None senza valori
+    """
+    v = np.asarray(values, dtype=np.float64)
+    v = v[~np.isnan(v)]
+    n = int(v.size)
+    if n == 0:
+        return None
+
+    def kth(x, probs):
+        pos = [p * (x.size - 1) for p in probs]
+        idx = sorted({int(np.floor(q)) for q in pos} | {int(np.ceil(q)) for q in pos})
+        part = np.partition(x, idx)
+        return [part[int(np.floor(q))] + (q - np.floor(q)) * (part[int(np.ceil(q))] - part[int(np.floor(q))])
+                for q in pos]
+
+    quantili = dict(zip([p for _, p in QUANTILI], kth(v, [p for _, p in QUANTILI])))
+    return _robust_result(n, quantili.__getitem__, lambda med: kth(np.abs(v - med), [0.5])[0])
+
+
+class QuantileSketch:
+    """
+    Sketch combinabile dei quantili (KLL, Karnin, Lang e Liberty 2016)
+
+    Gli elementi stanno in livelli: al livello h ciascuno vale 2**h valori.
+    Quando un livello supera la sua capacita' (k al livello piu' alto,
+    ridotta di 2/3 per ogni livello sotto) viene ordinato e meta' dei suoi
+    elementi, alterni da un'origine casuale, sale al livello successivo.
+    La memoria resta O(k log(n/k)) qualunque sia n e due sketch si
+    combinano con merge, quindi si alimenta un blocco alla volta come
+    Moments; l'errore di rango e' dell'ordine di 1/k.
+    """
+
+    def __init__(self, k: int = 400, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.zeros(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values) -> 'QuantileSketch':
+        """Aggiunge un blocco di valori (NULL/NaN esclusi)"""
+        v = np.asarray(values, dtype=np.float64)
+        v = v[~np.isnan(v)]
+        if v.size:
+            self.levels[0] = np.concatenate([self.levels[0], v])
+            self.count += int(v.size)
+            self._compress()
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Combina un altro sketch in questo"""
+        for h, items in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.zeros(0))
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _capacity(self, h: int) -> int:
+        depth = len(self.levels) - 1 - h
+        return max(2, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self):
+        compressed = True
+        while compressed:
+            compressed = False
+            for h in range(len(self.levels)):
+                items = self.levels[h]
+                if items.size <= self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                items = np.sort(items)
+                # un elemento dispari resta al suo livello
+                keep = items[:items.size % 2]
+                items = items[items.size % 2:]
+                start = int(self._rng.integers(2))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[start::2]])
+                self.levels[h] = keep
+                compressed = True
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h)
+                                  for h, level in enumerate(self.levels)])
+        return items, weights
+
+    @staticmethod
+    def _rank_value(items, weights, p):
+        order = np.argsort(items, kind='stable')
+        cum = np.cumsum(weights[order])
+        pos = min(int(np.searchsorted(cum, p * cum[-1], side='left')), items.size - 1)
+        return items[order][pos]
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Statistiche come robust_stats(), approssimate; None senza valori"""
+        if self.count == 0:
+            return None
+        items, weights = self._weighted()
+        # la MAD usa gli stessi pesi: |x - mediana| e' monotona ai due lati
+        return _robust_result(self.count,
+                              lambda p: self._rank_value(items, weights, p),
+                              lambda med: self._rank_value(np.abs(items - med), weights, 0.5))
+
+
+def group_stats(keys: np.ndarray, values: np.ndarray = None, ddof: int = 0) -> Dict[Any, Dict[str, Any]]:
+    """
+    Statistiche per categoria in una sola passata vettoriale
+
+    Stessi indicatori di qgis:statisticsbycategories (count, min, max,
+    range, sum, mean, stddev di popolazione con ddof=0). Senza valori
+    restituisce i soli conteggi. Le righe con valore NULL non entrano
+    nelle statistiche ma restano nel conteggio della categoria.
+
+    Returns:
+        Dizionario {categoria: statistiche}
+    """
+    keys = np.asarray(keys)
+    if keys.size == 0:
+        return {}
+    if keys.dtype == object:
+        keys = np.array(['NULL' if k is None else str(k) for k in keys])
+    cats, inv, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inv = inv.reshape(-1)
+    out = {}
+    if values is None:
+        for c, n in zip(cats, counts):
+            out[c.item() if hasattr(c, 'item') else c] = {'count': int(n)}
+        return out
+
+    v = np.asarray(values, dtype=np.float64)
+    ok = ~np.isnan(v)
+    g = inv[ok]
+    x = v[ok]
+    k = cats.size
+    n_ok = np.bincount(g, minlength=k)
+    s = np.bincount(g, weights=x, minlength=k)
+    mean = np.divide(s, n_ok, out=np.full(k, np.nan), where=n_ok > 0)
+    dev = x - mean[g]
+    ss = np.bincount(g, weights=dev * dev, minlength=k)
+    den = n_ok - ddof
+    std = np.sqrt(np.divide(ss, den, out=np.full(k, np.nan), where=den > 0))
+    vmin = np.full(k, np.inf)
+    vmax = np.full(k, -np.inf)
+    np.minimum.at(vmin, g, x)
+    np.maximum.at(vmax, g, x)
+
+    for i, c in enumerate(cats):
+        key = c.item() if hasattr(c, 'item') else c
+        if n_ok[i] == 0:
+            out[key] = {'count': int(counts[i]), 'min': None, 'max': None, 'range': None,
+                        'sum': None, 'mean': None, 'stddev': None}
+            continue
+        out[key] = {
+            'count': int(counts[i]),
+            'min': float(vmin[i]),
+            'max': float(vmax[i]),
+            'range': float(vmax[i] - vmin[i]),
+            'sum': float(s[i]),
+            'mean': float(mean[i]),
+            'stddev': None if np.isnan(std[i]) else float(std[i])
+        }
+    return out
+
+
+# decimali a cui si arrotonda valore/quanto prima del floor delle classi di
+# range: assorbe l'errore di rappresentazione sui bordi (0.29/0.001 vale
+# 289.99999999999994), uguale in histogram_pyramid e in range_formula
+DECIMALI_QUANTO = 6
+
+
+def histogram_pyramid(values: np.ndarray, steps: List[float], quantum: float,
+                      groups: np.ndarray = None) -> Dict[float, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Conteggi per classe di range a piu' step da un solo istogramma
+
+    L'istogramma piu' fine ha classi larghe quanto il massimo comune
+    divisore degli step interi; ogni step ne somma le classi adiacenti,
+    senza rileggere i valori. La classe b dello step s copre
+    [b*s*quantum, (b+1)*s*quantum), come range_formula: i valori sono
+    prima portati in quanti arrotondati a DECIMALI_QUANTO, cosi' un valore
+    sul bordo (0.29 con step 0.01) cade nella classe che inizia li'. Uno
+    step che non e' un numero intero di quanti (12.5 per 0.0125 m) ha un
+    istogramma proprio, con la stessa formula. NULL esclusi.
+
+    Args:
+        values: Valori numerici (NaN per i NULL)
+        steps: Step in unita' di quantum (positivi, di norma interi)
+        quantum: Ampiezza dell'unita' (es. 0.001 m)
+        groups: Categoria di ciascun valore (opzionale, es. campione)
+
+    Returns:
+        {step: (categorie, classi, conteggi)} delle sole classi non vuote,
+        ordinate per categoria e classe; categorie None senza groups
+    """
+    v = np.asarray(values, dtype=np.float64)
+    if groups is None:
+        cats = np.array([None], dtype=object)
+        inv = np.zeros(v.size, dtype=np.int64)
+    else:
+        keys = np.asarray(groups)
+        if keys.dtype == object:
+            keys = np.array(['NULL' if k is None else str(k) for k in keys])
+        cats, inv = np.unique(keys, return_inverse=True)
+        inv = inv.reshape(-1).astype(np.int64)
+    ok = ~np.isnan(v)
+    v, inv = v[ok], inv[ok]
+
+    empty = np.zeros(0, dtype=np.int64)
+    if v.size == 0:
+        return {step: (cats[empty], empty, empty) for step in steps}
+
+    def sparse_histogram(bins):
+        # una chiave intera per coppia (categoria, classe), ordinate
+        lo = int(bins.min())
+        span = int(bins.max()) - lo + 1
+        keys, counts = np.unique(inv * span + (bins - lo), return_counts=True)
+        return keys // span, keys % span + lo, counts.astype(np.int64)
+
+    q = np.round(v / quantum, DECIMALI_QUANTO)
+    out = {}
+    whole = [step for step in steps if float(step).is_integer()]
+    if whole:
+        base = int(np.gcd.reduce(np.asarray(whole, dtype=np.int64)))
+        cat_of, fine_bins, counts = sparse_histogram(np.floor(q / base).astype(np.int64))
+        for step in whole:
+            coarse = np.floor_divide(fine_bins, int(step) // base)
+            # chiavi ordinate per (categoria, classe fine): le classi fini della
+            # stessa classe grossa sono contigue e si sommano a blocchi
+            change = (cat_of[1:] != cat_of[:-1]) | (coarse[1:] != coarse[:-1])
+            starts = np.flatnonzero(np.concatenate(([True], change)))
+            out[step] = (cats[cat_of[starts]], coarse[starts],
+                         np.add.reduceat(counts, starts).astype(np.int64))
+    for step in steps:
+        if step not in out:
+            cat_of, bins, counts = sparse_histogram(np.floor(q / step).astype(np.int64))
+            out[step] = (cats[cat_of], bins, counts)
+    return out
+
+
+# ============ UTILITA' COMUNI ============
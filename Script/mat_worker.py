@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    MensioAnalysisTools (MAT) - Processo di analisi persistente
+    ------------------------------------------------------------
+    Modulo di supporto condiviso (non e' un algoritmo di Processing).
+
+    Le Statistiche avanzate usano scikit-learn e SciPy, la cui importazione
+    costa alcuni secondi a ogni nuovo processo (prima esecuzione della
+    sessione, qgis_process, esecuzioni batch). Questo modulo raccoglie i
+    calcoli che ne dipendono in kernel che ricevono e restituiscono solo
+    array NumPy:
+
+      pca        standardizzazione (z-score) + PCA delle variabili lineari
+      vicinato   vicini a raggio fisso (CSR) e k-nearest sui centroidi
+      cluster    clustering gerarchico (Ward) su variabili std + scarto locale
+
+    Ogni kernel ha due implementazioni (backend): 'sklearn', con
+    scikit-learn e SciPy, e 'numpy', con gli equivalenti in NumPy puro di
+    mat_numpy, usata quando le librerie mancano o, a richiesta, sui
+    paramenti piccoli, dove il tempo di importazione delle librerie supera
+    quello del calcolo (choose_backend).
+
+    I kernel girano nel processo di QGIS (run_kernel) oppure, a richiesta,
+    in un processo di analisi persistente che ha gia' caricato lo stack
+    scientifico (AnalysisWorker): il processo e' locale, risponde su un
+    socket Unix (named pipe su Windows) protetto da una chiave casuale e
+    termina da solo dopo un periodo di inattivita'. Indirizzo, chiave e pid
+    sono nel file di stato STATE_NAME, leggibile dal solo utente, cosi' ogni
+    esecuzione successiva (anche da un altro processo QGIS) lo ritrova. Il
+    file e il socket stanno nella cartella privata dell'utente
+    (mat_privato.private_dir, modo 0700 verificato); un file di stato di un
+    altro utente o leggibile da altri e' ignorato. Ogni connessione e'
+    servita da un proprio thread, autenticazione compresa: un client fermo
+    non blocca gli altri e viene chiuso dopo CONN_TIMEOUT secondi di
+    silenzio.
+
+    Il modulo non importa qgis: il processo di analisi e' un Python puro
+    (lo stesso interprete di QGIS), avviato come
+
+        python mat_worker.py --serve
+***************************************************************************
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import (
+    Client, Listener, answer_challenge, deliver_challenge)
+
+try:
+    from .mat_lazy import lazy_import
+    from . import mat_numpy
+    from . import mat_privato
+except ImportError:
+    # caricato come script di Processing o avviato come processo di analisi
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_lazy import lazy_import
+    import mat_numpy
+    import mat_privato
+
+np = lazy_import('numpy', globals(), 'np')
+
+
+STATE_NAME = 'mat_worker.json'
+IDLE_TIMEOUT = 1800.0    # secondi di inattivita' prima dell'uscita del processo
+START_TIMEOUT = 120.0    # attesa massima del primo avvio (import dello stack)
+CONN_TIMEOUT = 600.0     # silenzio massimo di un client prima della chiusura
+
+
+def _state_file():
+    """File di stato nella cartella privata del processo (PrivateError se
+    la cartella non e' sicura)."""
+    return os.path.join(mat_privato.private_dir('processo', runtime=True), STATE_NAME)
+
+SKLEARN = 'sklearn'
+NUMPY = 'numpy'
+# modi di scelta del backend (parametro dell'algoritmo)
+MODO_AUTO = 0            # scikit-learn/SciPy se installati, altrimenti NumPy
+MODO_AUTO_PICCOLI = 1    # come MODO_AUTO, ma NumPy sotto SOGLIA_NUMPY elementi
+MODO_NUMPY = 2           # sempre NumPy
+# sotto questa numerosita' il backend NumPy (senza importazioni) termina prima
+# di scikit-learn/SciPy importazione compresa (Benchmark/benchmark_kernel.py)
+SOGLIA_NUMPY = 5000
+
+
+# --------------------------------------------------------------------------
+#  Kernel (stessi calcoli nel processo di QGIS e nel processo di analisi)
+# --------------------------------------------------------------------------
+def sklearn_available():
+    """scikit-learn e SciPy installati (verifica senza importarli)."""
+    try:
+        return all(importlib.util.find_spec(m) is not None for m in ('sklearn', 'scipy'))
+    except (ImportError, ValueError):
+        return False
+
+
+def choose_backend(modo, n):
+    """Backend dei kernel per un paramento di n elementi."""
+    if modo == MODO_NUMPY or not sklearn_available():
+        return NUMPY
+    # se le librerie sono gia' importate nel processo non c'e' nulla da risparmiare
+    if modo == MODO_AUTO_PICCOLI and n < SOGLIA_NUMPY and 'sklearn' not in sys.modules:
+        return NUMPY
+    return SKLEARN
+
+
+def preload():
+    """Importa lo stack scientifico (ImportError se manca una libreria)."""
+    import sklearn.preprocessing  # noqa: F401
+    import sklearn.decomposition  # noqa: F401
+    import sklearn.cluster  # noqa: F401
+    import scipy.spatial  # noqa: F401
+    import scipy.cluster.hierarchy  # noqa: F401
+
+
+def _kernel_pca(lin, n_components, backend=SKLEARN):
+    if backend == NUMPY:
+        Z = mat_numpy.standard_scaler(lin)
+        pcs, _, ratio = mat_numpy.pca(Z, n_components)
+        return {'Z': Z, 'pcs': pcs, 'explained_variance_ratio': ratio}
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA
+    Z = StandardScaler().fit_transform(lin)
+    pca = PCA(n_components=n_components)
+    pcs = pca.fit_transform(Z)
+    return {'Z': Z, 'pcs': pcs,
+            'explained_variance_ratio': pca.explained_variance_ratio_}
+
+
+def _kernel_vicinato(XY, radius, k, backend=SKLEARN):
+    """Vicini a raggio fisso in forma CSR (rad_ptr, rad_idx) e k vicini
+    piu' prossimi (knn_idx, n x k, il primo e' di norma il punto stesso)."""
+    if backend == NUMPY:
+        rad_ptr, rad_idx = mat_numpy.GridIndex(XY, radius).query_radius(radius)
+        knn_idx = mat_numpy.GridIndex.for_knn(XY, k).query_knn(k)
+        return {'rad_ptr': rad_ptr, 'rad_idx': rad_idx, 'knn_idx': knn_idx}
+    from scipy.spatial import cKDTree
+    tree = cKDTree(XY)
+    # stesso ordine delle query punto per punto (indici non ordinati)
+    ball = tree.query_ball_point(XY, radius, return_sorted=False)
+    sizes = np.fromiter((len(b) for b in ball), dtype=np.int64, count=len(ball))
+    rad_ptr = np.zeros(len(ball) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=rad_ptr[1:])
+    rad_idx = (np.concatenate([np.asarray(b, dtype=np.int64) for b in ball])
+               if rad_ptr[-1] else np.zeros(0, dtype=np.int64))
+    _, knn_idx = tree.query(XY, k=k)
+    knn_idx = np.asarray(knn_idx).reshape(len(XY), -1)
+    return {'rad_ptr': rad_ptr, 'rad_idx': rad_idx, 'knn_idx': knn_idx}
+
+
+def _kernel_cluster(Z, dev, nclusters, backend=SKLEARN):
+    if backend == NUMPY:
+        dev_z = mat_numpy.standard_scaler(dev.reshape(-1, 1))
+        Zlink = mat_numpy.ward_linkage(np.column_stack([Z, dev_z]))
+        if nclusters and nclusters >= 2:
+            return {'labels': mat_numpy.cut_tree_k(Zlink, nclusters), 'auto': False}
+        labels = mat_numpy.fcluster_distance(Zlink, 0.7 * Zlink[:, 2].max())
+        return {'labels': labels, 'auto': True}
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.cluster import AgglomerativeClustering
+    from scipy.cluster.hierarchy import linkage, fcluster
+    dev_z = StandardScaler().fit_transform(dev.reshape(-1, 1))
+    feat_clust = np.column_stack([Z, dev_z])
+
+    if nclusters and nclusters >= 2:
+        model = AgglomerativeClustering(n_clusters=nclusters)
+        return {'labels': model.fit_predict(feat_clust), 'auto': False}
+    # stima automatica: taglio del dendrogramma su distanza di Ward
+    Zlink = linkage(feat_clust, method='ward')
+    # soglia euristica: 0.7 * altezza massima di fusione
+    thr = 0.7 * Zlink[:, 2].max()
+    labels = fcluster(Zlink, t=thr, criterion='distance') - 1
+    return {'labels': labels, 'auto': True}
+
+
+KERNELS = {
+    'pca': _kernel_pca,
+    'vicinato': _kernel_vicinato,
+    'cluster': _kernel_cluster,
+}
+
+
+def run_kernel(name, **kwargs):
+    """Esegue un kernel nel processo corrente."""
+    return KERNELS[name](**kwargs)
+
+
+# --------------------------------------------------------------------------
+#  Processo di analisi (lato server)
+# --------------------------------------------------------------------------
+def _handle(conn, authkey, stato, listener):
+    """Serve un client: autenticazione e richieste fino alla chiusura."""
+    try:
+        deliver_challenge(conn, authkey)
+        answer_challenge(conn, authkey)
+        while conn.poll(CONN_TIMEOUT):
+            try:
+                name, kwargs = conn.recv()
+            except EOFError:
+                break
+            if name == 'ping':
+                conn.send(('ok', os.getpid()))
+            elif name == 'stop':
+                conn.send(('ok', None))
+                stato['fine'] = True
+                listener.close()
+                break
+            else:
+                try:
+                    conn.send(('ok', run_kernel(name, **kwargs)))
+                except Exception as e:
+                    conn.send(('errore', '%s: %s' % (type(e).__name__, e)))
+    except Exception:
+        # chiave errata o connessione interrotta: si ignora il client
+        pass
+    finally:
+        conn.close()
+        with stato['lock']:
+            stato['occupati'] -= 1
+            stato['ultimo'] = time.monotonic()
+
+
+def serve(address, authkey, idle=IDLE_TIMEOUT):
+    """Precarica lo stack e risponde alle richieste fino all'inattivita'."""
+    preload()
+    family = 'AF_PIPE' if sys.platform == 'win32' else 'AF_UNIX'
+    # autenticazione nel thread del client, non in accept
+    listener = Listener(address, family=family)
+    stato = {'ultimo': time.monotonic(), 'occupati': 0, 'fine': False,
+             'lock': threading.Lock()}
+
+    def _watchdog():
+        while True:
+            time.sleep(min(idle, 30.0))
+            with stato['lock']:
+                inattivo = (stato['occupati'] == 0
+                            and time.monotonic() - stato['ultimo'] > idle)
+            if inattivo:
+                listener.close()
+                os._exit(0)
+
+    threading.Thread(target=_watchdog, daemon=True).start()
+
+    while not stato['fine']:
+        try:
+            conn = listener.accept()
+        except OSError:
+            if stato['fine']:
+                return
+            continue
+        with stato['lock']:
+            stato['occupati'] += 1
+        threading.Thread(target=_handle, args=(conn, authkey, stato, listener),
+                         daemon=True).start()
+
+
+# --------------------------------------------------------------------------
+#  Client (lato algoritmo)
+# --------------------------------------------------------------------------
+def _python_executable():
+    """Interprete Python di QGIS (in QGIS sys.executable e' l'eseguibile
+    dell'applicazione, non python)."""
+    exe = sys.executable or ''
+    if os.path.basename(exe).lower().startswith('python'):
+        return exe
+    for cand in (os.path.join(sys.exec_prefix, 'python.exe'),
+                 os.path.join(sys.exec_prefix, 'python3.exe'),
+                 os.path.join(sys.exec_prefix, 'bin', 'python3'),
+                 os.path.join(sys.exec_prefix, 'bin', 'python')):
+        if os.path.isfile(cand):
+            return cand
+    raise RuntimeError("interprete Python non trovato in %s" % sys.exec_prefix)
+
+
+class AnalysisWorker:
+    """Connessione al processo di analisi persistente (avviato se serve)."""
+
+    def __init__(self, state):
+        self.state = state
+
+    @staticmethod
+    def _read_state():
+        """Stato del processo attivo; None se manca, e' illeggibile o non e'
+        un file privato dell'utente (mat_privato.read_private)."""
+        try:
+            state = json.loads(mat_privato.read_private(_state_file()))
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or not {'address', 'key', 'pid'} <= set(state):
+            return None
+        return state
+
+    @staticmethod
+    def _family():
+        return 'AF_PIPE' if sys.platform == 'win32' else 'AF_UNIX'
+
+    def _connect(self):
+        return Client(self.state['address'], family=self._family(),
+                      authkey=bytes.fromhex(self.state['key']))
+
+    def _ping(self):
+        try:
+            with self._connect() as conn:
+                conn.send(('ping', None))
+                return conn.recv()[0] == 'ok'
+        except Exception:
+            return False
+
+    @classmethod
+    def _launch(cls, feedback=None):
+        key = secrets.token_hex(16)
+        token = secrets.token_hex(8)
+        if sys.platform == 'win32':
+            address = r'\\.\pipe\mat_worker_%s' % token
+        else:
+            address = os.path.join(mat_privato.private_dir('processo', runtime=True),
+                                   'mat_worker_%s.sock' % token)
+        env = dict(os.environ, MAT_WORKER_KEY=key)
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = (subprocess.CREATE_NO_WINDOW
+                                       | subprocess.CREATE_NEW_PROCESS_GROUP)
+        else:
+            kwargs['start_new_session'] = True
+        proc = subprocess.Popen(
+            [_python_executable(), os.path.abspath(__file__), '--serve', address],
+            env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, close_fds=True, **kwargs)
+
+        state = {'address': address, 'key': key, 'pid': proc.pid}
+        # file di stato leggibile dal solo utente: contiene la chiave
+        mat_privato.write_private(_state_file(), json.dumps(state))
+
+        if feedback is not None:
+            feedback.pushInfo("Avvio del processo di analisi (pid %d): caricamento "
+                              "di scikit-learn e SciPy..." % proc.pid)
+        worker = cls(state)
+        t_end = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < t_end:
+            if proc.poll() is not None:
+                raise RuntimeError("il processo di analisi e' terminato all'avvio "
+                                   "(codice %s): librerie mancanti?" % proc.returncode)
+            if worker._ping():
+                return worker
+            time.sleep(0.2)
+        proc.kill()
+        raise RuntimeError("il processo di analisi non risponde dopo %.0f s" % START_TIMEOUT)
+
+    @classmethod
+    def connect(cls, feedback=None):
+        """Processo di analisi gia' attivo, oppure uno nuovo."""
+        state = cls._read_state()
+        if state:
+            worker = cls(state)
+            if worker._ping():
+                if feedback is not None:
+                    feedback.pushInfo("Processo di analisi attivo (pid %s)" % state.get('pid'))
+                return worker
+        return cls._launch(feedback)
+
+    def call(self, name, **kwargs):
+        """Esegue un kernel nel processo di analisi."""
+        with self._connect() as conn:
+            conn.send((name, kwargs))
+            esito, valore = conn.recv()
+        if esito != 'ok':
+            raise RuntimeError(valore)
+        return valore
+
+    def stop(self):
+        """Chiede al processo di analisi di terminare."""
+        with self._connect() as conn:
+            conn.send(('stop', None))
+            conn.recv()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Processo di analisi persistente MAT')
+    ap.add_argument('--serve', metavar='INDIRIZZO',
+                    help='avvia il processo di analisi sull\'indirizzo dato')
+    ap.add_argument('--idle', type=float, default=IDLE_TIMEOUT,
+                    help='secondi di inattivita\' prima dell\'uscita')
+    ap.add_argument('--stop', action='store_true',
+                    help='arresta il processo di analisi attivo')
+    args = ap.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, bytes.fromhex(os.environ['MAT_WORKER_KEY']), args.idle)
+        return 0
+    state = AnalysisWorker._read_state()
+    if not state or not AnalysisWorker(state)._ping():
+        print('Nessun processo di analisi attivo')
+        return 1
+    if args.stop:
+        AnalysisWorker(state).stop()
+        print('Processo di analisi %s arrestato' % state.get('pid'))
+    else:
+        print('Processo di analisi attivo: pid %s, %s' % (state.get('pid'), state['address']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
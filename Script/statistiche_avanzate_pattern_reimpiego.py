@@ -69,6 +69,14 @@
       In questo caso lo scarto modulare normalizzato confluisce come QUARTO
       indizio nel reuse_score (oltre a riempimento, Mahalanobis, orientamento).
 
+    Campo aggiunto SOLO se la Mahalanobis robusta e' attiva:
+        - mahal_rob     distanza di Mahalanobis robusta (FastMCD) sulle
+                        variabili lineari std
+      In questo caso e' mahal_rob, non mahal, a entrare nel reuse_score: con
+      la covarianza classica i pezzi di reimpiego gonfiano la covarianza
+      stessa e si mascherano a vicenda; la stima a determinante minimo usa
+      solo la meta' piu' coerente dei componenti.
+
     Inoltre nel log vengono stampati i COEFFICIENTI DI VARIAZIONE (CV = sigma/mu)
     globali e per cluster di lunghezza, spessore, area e fattore di riempimento:
     un CV elevato indica scarsa standardizzazione (approvvigionamento eterogeneo,
@@ -87,7 +95,7 @@
 
 import os
 import math
-import numpy as np
+from array import array
 
 from qgis.PyQt.QtCore import QCoreApplication, QVariant
 from qgis.core import (
@@ -97,15 +105,45 @@ from qgis.core import (
     QgsProcessingParameterField,
     QgsProcessingParameterNumber,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
     QgsProcessingParameterFileDestination,
     QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterDefinition,
     QgsField,
     QgsFields,
     QgsFeature,
+    QgsFeatureRequest,
     QgsFeatureSink,
     QgsWkbTypes,
 )
 
+try:
+    from .mat_profiling import StageProfiler, profilable
+    from .mat_lazy import lazy_import
+    from . import mat_algoritmi
+    from . import mat_gpkg
+    from . import mat_numpy
+    from .mat_worker import (
+        AnalysisWorker, MODO_AUTO, MODO_NUMPY, NUMPY, SOGLIA_NUMPY,
+        choose_backend, preload, run_kernel, sklearn_available)
+except ImportError:
+    # caricato come script di Processing, fuori dal pacchetto del plugin
+    import sys
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    from mat_profiling import StageProfiler, profilable
+    from mat_lazy import lazy_import
+    import mat_algoritmi
+    import mat_gpkg
+    import mat_numpy
+    from mat_worker import (
+        AnalysisWorker, MODO_AUTO, MODO_NUMPY, NUMPY, SOGLIA_NUMPY,
+        choose_backend, preload, run_kernel, sklearn_available)
+
+# numpy serve solo durante l'elaborazione: importato al primo uso
+np = lazy_import('numpy', globals(), 'np')
+
 
 class MasonryPatternAnalysis(QgsProcessingAlgorithm):
 
@@ -119,6 +157,7 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
     KNN = 'KNN'
     NCLUSTERS = 'NCLUSTERS'
     PERMUTATIONS = 'PERMUTATIONS'
+    ROBUST_MAHAL = 'ROBUST_MAHAL'
     DO_METRO = 'DO_METRO'
     MODULE = 'MODULE'
     Q_MIN = 'Q_MIN'
@@ -127,6 +166,14 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
     MC_RUNS = 'MC_RUNS'
     CSV_OUT = 'CSV_OUT'
     OUTPUT = 'OUTPUT'
+    REPORT = 'REPORT'
+    PROFILE = 'PROFILE'
+    WORKER = 'WORKER'
+    BACKEND = 'BACKEND'
+    GPKG_DIRECT = 'GPKG_DIRECT'
+
+    # feature scritte per chiamata al sink
+    OUTPUT_BATCH = 1000
 
     def tr(self, string):
         return QCoreApplication.translate('Processing', string)
@@ -138,38 +185,27 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         return 'statistiche_avanzate_pattern_paramento_reimpiego'
 
     def displayName(self):
-        return 'Statistiche avanzate pattern e reimpiego'
+        return mat_algoritmi.info(self.name()).titolo
 
     def group(self):
-        return 'Analisi quantitative'
+        return mat_algoritmi.gruppo(self.name())
 
     def groupId(self):
-        return 'analisi'
+        return mat_algoritmi.info(self.name()).id_gruppo
 
     def shortHelpString(self):
-        return self.tr(
-            "Analisi statistica di un paramento.\n\n"
-            "PER I MATTONI: lascia disattivata l'analisi metrologica. Calcola "
-            "fattore di riempimento, statistica circolare assiale dell'orientamento "
-            "(raggio fisso + k-nearest), Mahalanobis, PCA, clustering, CV, e LISA "
-            "(Local Moran's I) per individuare hotspot di reimpiego.\n\n"
-            "PER I COMPONENTI A SECCO / ALTRI COMPONENTI (es. blocchi, conci, "
-            "elementi lapidei): attiva anche l'analisi metrologica modulare. Verifica "
-            "un modulo dato (R_bar + Rayleigh) e cerca il modulo ottimale (cosine "
-            "quantogram di Kendall, validato Monte Carlo) su lunghezza e altezza, "
-            "trattate simmetricamente: per questi componenti il modulo e' atteso su "
-            "entrambe. Lo scarto modulare confluisce nel reuse_score. NON usare sui "
-            "mattoni: sono ritagli senza modulo di lunghezza.\n\n"
-            "L'orientamento e il resto modulare sono trattati come variabili circolari."
-        )
+        return self.tr(mat_algoritmi.info(self.name()).aiuto)
 
     def initAlgorithm(self, config=None):
         self.addParameter(QgsProcessingParameterFeatureSource(
             self.INPUT, self.tr('Layer poligonale dei componenti'),
             [QgsProcessing.TypeVectorPolygon]))
+        # non usato dal calcolo: i componenti sono riconosciuti dall'id delle
+        # feature e l'output conserva tutti i campi dell'ingresso. Resta,
+        # facoltativo, per i modelli e gli script che lo impostano.
         self.addParameter(QgsProcessingParameterField(
-            self.FIELD_ID, self.tr('Campo identificativo univoco'),
-            parentLayerParameterName=self.INPUT))
+            self.FIELD_ID, self.tr('Campo identificativo univoco (non usato)'),
+            parentLayerParameterName=self.INPUT, optional=True))
         self.addParameter(QgsProcessingParameterField(
             self.FIELD_LEN, self.tr('Campo lunghezza'),
             parentLayerParameterName=self.INPUT,
@@ -198,6 +234,10 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterNumber(
             self.PERMUTATIONS, self.tr('Permutazioni per significativita\' LISA (0 = nessun test)'),
             type=QgsProcessingParameterNumber.Integer, defaultValue=999, minValue=0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.ROBUST_MAHAL,
+            self.tr('Mahalanobis robusta (FastMCD): campo mahal_rob, usato nel reuse_score'),
+            defaultValue=False))
         # --- analisi metrologica modulare (opzionale: per componenti a secco, non mattoni) ---
         self.addParameter(QgsProcessingParameterBoolean(
             self.DO_METRO,
@@ -223,6 +263,40 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
             'CSV files (*.csv)'))
         self.addParameter(QgsProcessingParameterFeatureSink(
             self.OUTPUT, self.tr('Paramento analizzato')))
+        report = QgsProcessingParameterFileDestination(
+            self.REPORT, self.tr('Resoconto tempi per fase (JSON/CSV, opzionale)'),
+            'JSON (*.json);;CSV (*.csv)', optional=True, createByDefault=False)
+        report.setFlags(report.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(report)
+        profile = QgsProcessingParameterBoolean(
+            self.PROFILE,
+            self.tr('Profilazione dettagliata (cProfile + pile campionate, accanto agli output)'),
+            defaultValue=False)
+        profile.setFlags(profile.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(profile)
+        worker = QgsProcessingParameterBoolean(
+            self.WORKER,
+            self.tr('Usa il processo di analisi persistente (scikit-learn/SciPy gia\' caricati '
+                    'per le esecuzioni successive)'),
+            defaultValue=False)
+        worker.setFlags(worker.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(worker)
+        backend = QgsProcessingParameterEnum(
+            self.BACKEND,
+            self.tr('Implementazione di PCA, ricerca dei vicini e clustering'),
+            options=['scikit-learn/SciPy se installati, altrimenti NumPy integrata',
+                     'NumPy integrata sotto %d componenti, altrimenti come sopra' % SOGLIA_NUMPY,
+                     'sempre NumPy integrata (nessuna dipendenza)'],
+            defaultValue=MODO_AUTO)
+        backend.setFlags(backend.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(backend)
+        direct = QgsProcessingParameterBoolean(
+            self.GPKG_DIRECT,
+            self.tr('Lettura e scrittura diretta dei GeoPackage (SQL in blocco, '
+                    'senza controllo delle geometrie non valide)'),
+            defaultValue=False)
+        direct.setFlags(direct.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(direct)
 
     # ---------- statistica circolare assiale ----------
     @staticmethod
@@ -364,9 +438,78 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         return {'name': name, 'R': R, 'p_ray': p_ray, 'q_best': q_best,
                 'phi': phi, 'qs': qs, 'informative': informative}
 
+    @staticmethod
+    def _kernel_runner(modo, n, use_worker, feedback):
+        """Esecutore dei kernel: implementazione NumPy integrata, processo di
+        analisi persistente se richiesto e disponibile, altrimenti
+        scikit-learn/SciPy nel processo di QGIS."""
+        backend = choose_backend(modo, n)
+        if backend != NUMPY:
+            if use_worker:
+                try:
+                    return AnalysisWorker.connect(feedback).call
+                except Exception as e:
+                    feedback.pushWarning(
+                        "Processo di analisi non disponibile (%s): calcolo nel "
+                        "processo di QGIS." % e)
+            try:
+                preload()
+                return run_kernel
+            except ImportError as e:
+                feedback.pushWarning(
+                    "Librerie non importabili nell'ambiente QGIS (%s): "
+                    "calcolo con l'implementazione NumPy integrata." % str(e))
+        elif modo == MODO_NUMPY:
+            feedback.pushInfo("Calcoli con l'implementazione NumPy integrata.")
+        elif not sklearn_available():
+            feedback.pushInfo("scikit-learn/SciPy non installati: calcoli con "
+                              "l'implementazione NumPy integrata.")
+        else:
+            feedback.pushInfo("Paramento di %d componenti: calcoli con l'implementazione "
+                              "NumPy integrata, senza importare scikit-learn/SciPy." % n)
+
+        def _kernel(name, **kwargs):
+            return run_kernel(name, backend=NUMPY, **kwargs)
+        return _kernel
+
+    # ---------- lettura e scrittura diretta dei GeoPackage ----------
+    @staticmethod
+    def _read_gpkg(gpkg_in, names, source, feedback):
+        """Campi, centroidi e bbox letti con SQL; None se non applicabile"""
+        try:
+            direct = mat_gpkg.read_components(*gpkg_in, names)
+        except mat_gpkg.GpkgError as e:
+            feedback.pushWarning("Lettura diretta del GeoPackage non riuscita: %s" % e)
+            direct = None
+        # i NULL nei campi numerici sono segnalati dalla lettura di QGIS
+        if direct is None or direct[0].size != source.featureCount() \
+                or any(np.isnan(c).any() for c in direct[1].values()):
+            feedback.pushInfo("Lettura diretta non applicabile: si usa la lettura di QGIS.")
+            return None
+        feedback.pushInfo("Lettura diretta dal GeoPackage: %d componenti." % direct[0].size)
+        return direct
+
+    def _write_gpkg(self, gpkg_in, gpkg_out, fid, extra, bounds, feedback, p0, p1):
+        """Copia ingresso + colonne calcolate con SQL in blocco; False se non riesce"""
+        try:
+            ok = mat_gpkg.copy_with_columns(
+                gpkg_in, gpkg_out, fid, extra, bounds, batch=self.OUTPUT_BATCH,
+                progress=lambda f: feedback.setProgress(p0 + int((p1 - p0) * f)))
+        except mat_gpkg.GpkgError as e:
+            feedback.pushWarning("Scrittura diretta nel GeoPackage non riuscita (%s): "
+                                 "si usa la scrittura di QGIS." % e)
+            return False
+        if not ok:
+            feedback.pushInfo("Campi dell'output diversi dall'ingresso: "
+                              "si usa la scrittura di QGIS.")
+            return False
+        feedback.pushInfo("Output scritto direttamente nel GeoPackage: %s" % gpkg_out[0])
+        return True
+
+    @profilable(PROFILE)
     def processAlgorithm(self, parameters, context, feedback):
+        prof = StageProfiler(self.name(), feedback)
         source = self.parameterAsSource(parameters, self.INPUT, context)
-        f_id = self.parameterAsString(parameters, self.FIELD_ID, context)
         f_len = self.parameterAsString(parameters, self.FIELD_LEN, context)
         f_thk = self.parameterAsString(parameters, self.FIELD_THK, context)
         f_area = self.parameterAsString(parameters, self.FIELD_AREA, context)
@@ -375,44 +518,64 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         knn = self.parameterAsInt(parameters, self.KNN, context)
         nclusters = self.parameterAsInt(parameters, self.NCLUSTERS, context)
         permutations = self.parameterAsInt(parameters, self.PERMUTATIONS, context)
+        robust = self.parameterAsBool(parameters, self.ROBUST_MAHAL, context)
         do_metro = self.parameterAsBool(parameters, self.DO_METRO, context)
         module = self.parameterAsDouble(parameters, self.MODULE, context)
         q_min = self.parameterAsDouble(parameters, self.Q_MIN, context)
         q_max = self.parameterAsDouble(parameters, self.Q_MAX, context)
         q_step = self.parameterAsDouble(parameters, self.Q_STEP, context)
         mc_runs = self.parameterAsInt(parameters, self.MC_RUNS, context)
-
-        # --- dipendenze scientifiche ---
-        try:
-            from sklearn.preprocessing import StandardScaler
-            from sklearn.decomposition import PCA
-            from sklearn.cluster import AgglomerativeClustering
-            from scipy.spatial import cKDTree
-            from scipy.cluster.hierarchy import linkage, fcluster
-        except ImportError as e:
-            raise Exception(
-                "Librerie mancanti nell'ambiente QGIS (%s). "
-                "Installa scikit-learn e scipy nel Python di QGIS." % str(e))
-
+        use_worker = self.parameterAsBool(parameters, self.WORKER, context)
+        modo = self.parameterAsEnum(parameters, self.BACKEND, context)
+        gpkg_in = None
+        if self.parameterAsBool(parameters, self.GPKG_DIRECT, context):
+            gpkg_in = mat_gpkg.source_table(
+                self.parameterAsVectorLayer(parameters, self.INPUT, context),
+                parameters.get(self.INPUT))
+            if gpkg_in is None:
+                feedback.pushInfo("L'ingresso non e' una tabella GeoPackage senza filtri: "
+                                  "si usa la lettura di QGIS.")
+
+        prof.lap('LETTURA DATI')
         # --- lettura dati ---
-        feats = list(source.getFeatures())
-        n = len(feats)
+        direct = self._read_gpkg(gpkg_in, [f_len, f_thk, f_area, f_ang],
+                                 source, feedback) if gpkg_in else None
+        if direct is not None:
+            comp_fid, cols, XY, bounds = direct
+            L, T, A = cols[f_len], cols[f_thk], cols[f_area]
+            ANG = cols[f_ang] % 180.0
+            n = comp_fid.size
+        else:
+            # Una sola passata sul source, con i soli campi usati e il
+            # centroide, in array compatti: le feature NON restano in memoria
+            # e vengono rilette in streaming al momento della scrittura.
+            gpkg_in = bounds = None
+            req = QgsFeatureRequest().setSubsetOfAttributes(
+                [f_len, f_thk, f_area, f_ang], source.fields())
+            fids = array('q')
+            L, T, A, ANG = array('d'), array('d'), array('d'), array('d')
+            X, Y = array('d'), array('d')
+            for ft in source.getFeatures(req):
+                fids.append(ft.id())
+                L.append(float(ft[f_len]))
+                T.append(float(ft[f_thk]))
+                A.append(float(ft[f_area]))
+                ANG.append(float(ft[f_ang]) % 180.0)
+                c = ft.geometry().centroid().asPoint()
+                X.append(c.x())
+                Y.append(c.y())
+            n = len(fids)
+            comp_fid = np.array(fids, dtype=np.int64)
+            L = np.array(L); T = np.array(T); A = np.array(A)
+            ANG = np.array(ANG); XY = np.column_stack([np.array(X), np.array(Y)])
+            del fids, X, Y
         if n < 3:
             raise Exception("Servono almeno 3 mattoni per l'analisi.")
 
-        ids, L, T, A, ANG, XY = [], [], [], [], [], []
-        for ft in feats:
-            ids.append(ft[f_id])
-            L.append(float(ft[f_len]))
-            T.append(float(ft[f_thk]))
-            A.append(float(ft[f_area]))
-            ANG.append(float(ft[f_ang]) % 180.0)
-            c = ft.geometry().centroid().asPoint()
-            XY.append((c.x(), c.y()))
-
-        L = np.array(L); T = np.array(T); A = np.array(A)
-        ANG = np.array(ANG); XY = np.array(XY)
+        # --- implementazione dei calcoli scientifici (kernel in mat_worker) ---
+        kernel = self._kernel_runner(modo, n, use_worker, feedback)
 
+        prof.lap('VARIABILI E PCA', n_in=n)
         # --- fattore di riempimento ---
         denom = L * T
         R_fill = np.where(denom > 0, A / denom, np.nan)
@@ -423,15 +586,15 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         med = np.nanmedian(lin, axis=0)
         inds = np.where(np.isnan(lin))
         lin[inds] = np.take(med, inds[1])
-        Z = StandardScaler().fit_transform(lin)
 
-        # --- PCA ---
-        pca = PCA(n_components=min(2, Z.shape[1]))
-        pcs = pca.fit_transform(Z)
+        # --- standardizzazione + PCA ---
+        res = kernel('pca', lin=lin, n_components=min(2, lin.shape[1]))
+        Z = res['Z']
+        pcs = res['pcs']
         PC1 = pcs[:, 0]
         PC2 = pcs[:, 1] if pcs.shape[1] > 1 else np.zeros(n)
         feedback.pushInfo("Varianza spiegata PC1/PC2: %s" %
-                          np.round(pca.explained_variance_ratio_, 3))
+                          np.round(res['explained_variance_ratio'], 3))
 
         # --- distanza di Mahalanobis sulle variabili lineari std ---
         cov = np.cov(Z, rowvar=False)
@@ -449,9 +612,19 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
                           % (glob_mean, glob_R))
         dev_glob = np.array([self._axial_diff(a, glob_mean) for a in ANG])
 
+        # --- distanza robusta: media e covarianza a determinante minimo ---
+        mahal_rob = None
+        if robust:
+            prof.lap('MAHALANOBIS ROBUSTA', n_in=n)
+            _, _, d2_rob, _ = mat_numpy.fast_mcd(Z)
+            mahal_rob = np.sqrt(d2_rob)
+            soglia = mat_numpy.chi2_ppf(0.975, Z.shape[1])
+            feedback.pushInfo("Mahalanobis robusta (FastMCD): %d componenti oltre il "
+                              "quantile 0.975 del chi quadrato (classica: %d)" % (
+                                  int(np.sum(d2_rob >= soglia)), int(np.sum(mahal ** 2 >= soglia))))
+
+        prof.lap('VICINATO SPAZIALE', n_in=n)
         # --- vicinato spaziale sui centroidi ---
-        tree = cKDTree(XY)
-
         if radius <= 0:
             radius = 3.0 * float(np.mean(L))
             feedback.pushInfo("Raggio automatico: %.4f (3xlunghezza media)" % radius)
@@ -467,22 +640,22 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         neigh = [[] for _ in range(n)]
 
         k_query = min(knn + 1, n)  # +1 perche' il primo vicino e' il punto stesso
+        vic = kernel('vicinato', XY=XY, radius=radius, k=k_query)
+        rad_ptr, rad_idx, knn_idx = vic['rad_ptr'], vic['rad_idx'], vic['knn_idx']
 
         for i in range(n):
             if feedback.isCanceled():
                 break
             # --- raggio fisso ---
-            idx_r = tree.query_ball_point(XY[i], radius)
-            idx_r = [j for j in idx_r if j != i]
+            idx_r = rad_idx[rad_ptr[i]:rad_ptr[i + 1]]
+            idx_r = idx_r[idx_r != i]
             n_rad[i] = len(idx_r)
-            if idx_r:
+            if len(idx_r):
                 lm, lR = self._axial_mean(ANG[idx_r])
                 dev_loc_rad[i] = self._axial_diff(ANG[i], lm)
                 disp_loc_rad[i] = 1.0 - lR
             # --- k-nearest ---
-            dists, idx_k = tree.query(XY[i], k=k_query)
-            idx_k = np.atleast_1d(idx_k)
-            idx_k = [j for j in idx_k if j != i][:knn]
+            idx_k = [j for j in knn_idx[i] if j != i][:knn]
             neigh[i] = idx_k  # salvato per il LISA
             if idx_k:
                 lm, lR = self._axial_mean(ANG[idx_k])
@@ -490,23 +663,16 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
                 disp_loc_knn[i] = 1.0 - lR
             feedback.setProgress(int(70.0 * i / n))
 
+        prof.lap('CLUSTERING', n_in=n)
         # --- clustering: variabili lineari std + scarto angolare locale (knn) ---
         dev_for_clust = np.nan_to_num(dev_loc_knn, nan=np.nanmean(dev_loc_knn))
-        dev_z = StandardScaler().fit_transform(dev_for_clust.reshape(-1, 1))
-        feat_clust = np.column_stack([Z, dev_z])
-
-        if nclusters and nclusters >= 2:
-            model = AgglomerativeClustering(n_clusters=nclusters)
-            labels = model.fit_predict(feat_clust)
-        else:
-            # stima automatica: taglio del dendrogramma su distanza di Ward
-            Zlink = linkage(feat_clust, method='ward')
-            # soglia euristica: 0.7 * altezza massima di fusione
-            thr = 0.7 * Zlink[:, 2].max()
-            labels = fcluster(Zlink, t=thr, criterion='distance') - 1
+        res = kernel('cluster', Z=Z, dev=dev_for_clust, nclusters=nclusters)
+        labels = res['labels']
+        if res['auto']:
             feedback.pushInfo("Cluster stimati automaticamente: %d" %
                               len(np.unique(labels)))
 
+        prof.lap('REUSE SCORE E METROLOGIA', n_in=n)
         # --- indicatore sintetico di reimpiego ---
         # convergenza di indizi: bassa R_fill, alto Mahalanobis, alto scarto
         # angolare locale. Ogni componente normalizzata a percentile [0-1].
@@ -516,7 +682,7 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
             return order / (len(x) - 1) if len(x) > 1 else np.zeros_like(x)
 
         low_fill = 1.0 - _rank01(np.nan_to_num(R_fill, nan=np.nanmedian(R_fill)))
-        hi_mahal = _rank01(mahal)
+        hi_mahal = _rank01(mahal_rob if robust else mahal)
         hi_dev = _rank01(np.nan_to_num(dev_loc_knn, nan=0.0))
 
         # --- METROLOGIA MODULARE (opzionale): scarto dal modulo come 4o indizio ---
@@ -572,6 +738,7 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         else:
             reuse_score = (low_fill + hi_mahal + hi_dev) / 3.0
 
+        prof.lap('COEFFICIENTI DI VARIAZIONE', n_in=n)
         # --- coefficiente di variazione (globale e per cluster) ---
         feedback.pushInfo("--- Coefficiente di variazione (CV = sigma/mu) ---")
         feedback.pushInfo("GLOBALE  len=%.3f  thk=%.3f  area=%.3f  R_fill=%.3f" % (
@@ -591,6 +758,7 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         feedback.pushInfo("Nota: CV basso = produzione/posa standardizzata; "
                           "CV alto = eterogeneita' (possibile reimpiego).")
 
+        prof.lap('LISA', n_in=n)
         # --- LISA: Local Moran's I sul reuse_score (vicinato k-nearest) ---
         feedback.pushInfo("--- LISA (Local Moran's I) sul reuse_score ---")
         zr = reuse_score - reuse_score.mean()
@@ -656,6 +824,7 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
         nHH = lisa_clust.count('HH')
         feedback.pushInfo("Hotspot di reimpiego (HH significativi): %d" % nHH)
 
+        prof.lap('SCRITTURA OUTPUT', n_in=n)
         # --- preparazione output ---
         out_fields = QgsFields()
         for fld in source.fields():
@@ -671,6 +840,8 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
             ('lisa_I', QVariant.Double), ('lisa_p', QVariant.Double),
             ('lisa_clust', QVariant.String),
         ]
+        if robust:
+            new_defs.append(('mahal_rob', QVariant.Double))
         if do_metro:
             new_defs += [
                 ('w_phase', QVariant.Double), ('w_resid', QVariant.Double),
@@ -686,35 +857,64 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
             parameters, self.OUTPUT, context, out_fields,
             source.wkbType(), source.sourceCrs())
 
-        for i, ft in enumerate(feats):
+        # colonne aggiunte come liste Python con i NULL gia' risolti (NaN ->
+        # None dove il campo li ammette), nell'ordine di new_defs
+        def _nullable(a):
+            return [None if v != v else v for v in np.asarray(a, dtype=float).tolist()]
+
+        extra_cols = [
+            _nullable(R_fill), mahal.tolist(), PC1.tolist(), PC2.tolist(),
+            np.asarray(dev_glob, dtype=float).tolist(),
+            _nullable(dev_loc_rad), _nullable(disp_loc_rad),
+            np.asarray(n_rad).astype(np.int64).tolist(),
+            _nullable(dev_loc_knn), _nullable(disp_loc_knn),
+            np.asarray(labels).astype(np.int64).tolist(),
+            np.asarray(reuse_score, dtype=float).tolist(),
+            np.asarray(lisa_I, dtype=float).tolist(),
+            _nullable(lisa_p), lisa_clust,
+        ]
+        if robust:
+            extra_cols.append(mahal_rob.tolist())
+        if do_metro:
+            extra_cols += [_nullable(w_phase), _nullable(w_resid),
+                           _nullable(h_phase), _nullable(h_resid)]
+
+        written = False
+        gpkg_out = mat_gpkg.sink_table(dest_id) if gpkg_in else None
+        if gpkg_out:
+            # la tabella creata (vuota) da QGIS va chiusa prima di scriverci
+            del sink
+            written = self._write_gpkg(
+                gpkg_in, gpkg_out, comp_fid,
+                list(zip([nm for nm, _ in new_defs], extra_cols)), bounds,
+                feedback, 85, 100)
+            if not written:
+                (sink, dest_id) = self.parameterAsSink(
+                    parameters, self.OUTPUT, context, out_fields,
+                    source.wkbType(), source.sourceCrs())
+
+        # geometrie e attributi riletti in streaming dal source, scritti a blocchi
+        idx_by_fid = None
+        batch = []
+        for i, ft in enumerate(source.getFeatures() if not written else ()):
+            if i >= n or ft.id() != comp_fid[i]:
+                # ordine di lettura diverso dalla prima passata: si ripiega
+                # sulla ricerca per fid (costruita una sola volta)
+                if idx_by_fid is None:
+                    idx_by_fid = {f: k for k, f in enumerate(comp_fid.tolist())}
+                i = idx_by_fid[ft.id()]
             g = QgsFeature(out_fields)
             g.setGeometry(ft.geometry())
-            attrs = ft.attributes() + [
-                float(R_fill[i]) if not np.isnan(R_fill[i]) else None,
-                float(mahal[i]),
-                float(PC1[i]), float(PC2[i]),
-                float(dev_glob[i]),
-                float(dev_loc_rad[i]) if not np.isnan(dev_loc_rad[i]) else None,
-                float(disp_loc_rad[i]) if not np.isnan(disp_loc_rad[i]) else None,
-                int(n_rad[i]),
-                float(dev_loc_knn[i]) if not np.isnan(dev_loc_knn[i]) else None,
-                float(disp_loc_knn[i]) if not np.isnan(disp_loc_knn[i]) else None,
-                int(labels[i]),
-                float(reuse_score[i]),
-                float(lisa_I[i]),
-                float(lisa_p[i]) if not np.isnan(lisa_p[i]) else None,
-                lisa_clust[i],
-            ]
-            if do_metro:
-                attrs += [
-                    float(w_phase[i]) if not np.isnan(w_phase[i]) else None,
-                    float(w_resid[i]) if not np.isnan(w_resid[i]) else None,
-                    float(h_phase[i]) if not np.isnan(h_phase[i]) else None,
-                    float(h_resid[i]) if not np.isnan(h_resid[i]) else None,
-                ]
+            attrs = ft.attributes()
+            attrs.extend(col[i] for col in extra_cols)
             g.setAttributes(attrs)
-            sink.addFeature(g, QgsFeatureSink.FastInsert)
-            feedback.setProgress(85 + int(15.0 * i / n))
+            batch.append(g)
+            if len(batch) >= self.OUTPUT_BATCH:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                batch = []
+                feedback.setProgress(85 + int(15.0 * i / n))
+        if batch:
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
 
         # --- CSV del quantogram (prodotto solo se metrologia attiva) ---
         if do_metro and metro_results:
@@ -732,5 +932,12 @@ class MasonryPatternAnalysis(QgsProcessingAlgorithm):
                 except OSError as e:
                     feedback.pushWarning("Impossibile scrivere il CSV: %s" % str(e))
 
+        prof.finish(n_out=n)
         feedback.pushInfo("Analisi completata su %d componenti." % n)
-        return {self.OUTPUT: dest_id}
+        prof.log_summary(feedback)
+        results = {self.OUTPUT: dest_id}
+        report_path = self.parameterAsFileOutput(parameters, self.REPORT, context)
+        if report_path:
+            results[self.REPORT] = prof.write(report_path)
+            feedback.pushInfo("Resoconto tempi per fase salvato in: %s" % report_path)
+        return results
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+Test dei moduli di supporto che non dipendono da QGIS (mat_numpy,
+mat_stats, mat_gpkg). Si lanciano dalla radice del repository con:
+
+    python -m pytest -q tests
+
+scipy e scikit-learn servono solo come riferimento: i test che li usano
+vengono saltati se mancano.
+"""
+
+import os
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Script')
+if SCRIPT not in sys.path:
+    sys.path.insert(0, SCRIPT)
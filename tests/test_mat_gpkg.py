@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import struct
+
+import numpy as np
+import pytest
+
+import mat_gpkg
+
+
+def _ring(pts, fmt, z):
+    out = struct.pack(fmt + 'I', len(pts))
+    for x, y in pts:
+        out += struct.pack(fmt + ('ddd' if z else 'dd'), *((x, y, 7.0) if z else (x, y)))
+    return out
+
+
+def _polygon(rings, big=False, z=None):
+    """WKB di un Polygon; z: None (2D), 'iso' (1003) o 'ewkb' (flag Z)"""
+    fmt = '>' if big else '<'
+    code = {None: 3, 'iso': 1003, 'ewkb': 0x80000003}[z]
+    return (struct.pack('B', 0 if big else 1) + struct.pack(fmt + 'I', code)
+            + struct.pack(fmt + 'I', len(rings))
+            + b''.join(_ring(r, fmt, z) for r in rings))
+
+
+def _multipolygon(polygons, big=False):
+    fmt = '>' if big else '<'
+    return (struct.pack('B', 0 if big else 1) + struct.pack(fmt + 'I', 6)
+            + struct.pack(fmt + 'I', len(polygons)) + b''.join(polygons))
+
+
+def _gpkg(wkb, envelope=1):
+    """Intestazione GeoPackage (little endian) con envelope xy (1) o nessuno (0)"""
+    flags = 0x01 | (envelope << 1)
+    header = b'GP' + bytes([0, flags]) + struct.pack('<i', 3004)
+    return header + b'\0' * (32 if envelope else 0) + wkb
+
+
+def _square(x0, y0, side):
+    return [(x0, y0), (x0 + side, y0), (x0 + side, y0 + side), (x0, y0 + side), (x0, y0)]
+
+
+def test_poligono_con_buco():
+    outer, hole = _square(0, 0, 4), _square(1, 1, 1)[::-1]
+    polys = mat_gpkg.parse_polygons([_gpkg(_polygon([outer, hole]))])
+    assert len(polys) == 1
+    assert polys.geom_offsets.tolist() == [0, 2]
+    assert polys.ring_offsets.tolist() == [0, 5, 10]
+    assert polys.exterior.tolist() == [True, False]
+    assert np.array_equal(polys.coords, np.array(outer + hole, dtype=float))
+    # area 16 - 1: il buco sposta il baricentro verso (2, 2) + (2 - 1.5) / 15
+    assert np.allclose(polys.centroids(), [[2 + 0.5 / 15, 2 + 0.5 / 15]])
+    assert np.allclose(polys.bounds(), [[0, 0, 4, 4]])
+
+
+def test_multipoligono_e_poligoni_insieme():
+    a, b = _square(0, 0, 1), _square(10, 0, 2)
+    blobs = [_gpkg(_multipolygon([_polygon([a]), _polygon([b])])),
+             _gpkg(_polygon([_square(5, 5, 2)]), envelope=0)]
+    polys = mat_gpkg.parse_polygons(blobs)
+    assert len(polys) == 2
+    assert polys.geom_offsets.tolist() == [0, 2, 3]
+    assert polys.exterior.tolist() == [True, True, True]
+    # baricentro pesato per area: (0.5 * 1 + 11 * 4) / 5
+    assert np.allclose(polys.centroids(), [[44.5 / 5, (0.5 + 4) / 5], [6, 6]])
+    assert np.allclose(polys.bounds(), [[0, 0, 12, 2], [5, 5, 7, 7]])
+
+
+@pytest.mark.parametrize('big', [False, True])
+@pytest.mark.parametrize('z', [None, 'iso', 'ewkb'])
+def test_big_endian_e_z(big, z):
+    outer, hole = _square(100, 200, 3), _square(101, 201, 1)
+    blobs = [_gpkg(_polygon([outer, hole], big=big, z=z)),
+             _gpkg(_multipolygon([_polygon([outer], big=big, z=z)], big=big))]
+    polys = mat_gpkg.parse_polygons(blobs)
+    assert polys is not None
+    assert np.array_equal(polys.coords, np.array(outer + hole + outer, dtype=float))
+    assert polys.geom_offsets.tolist() == [0, 2, 3]
+
+
+def test_geometrie_non_gestite():
+    square = _polygon([_square(0, 0, 1)])
+    line = b'\x01' + struct.pack('<II', 2, 2) + struct.pack('<4d', 0, 0, 1, 1)
+    assert mat_gpkg.parse_polygons([_gpkg(square), None]) is None
+    assert mat_gpkg.parse_polygons([_gpkg(line)]) is None
+    assert mat_gpkg.parse_polygons([_gpkg(square)[:-8]]) is None
+    assert mat_gpkg.parse_polygons([_gpkg(square) + b'\0']) is None
+    assert mat_gpkg.parse_polygons([_gpkg(_polygon([]))]) is None
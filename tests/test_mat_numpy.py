@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import mat_numpy
+
+
+def _punti(n, seed=0, d=2):
+    return np.random.default_rng(seed).normal(size=(n, d)) * [1.0, 0.5, 2.0][:d]
+
+
+# --------------------------------------------------------------------------
+#  Standardizzazione, PCA e clustering di Ward
+# --------------------------------------------------------------------------
+def test_standard_scaler_come_sklearn():
+    preprocessing = pytest.importorskip('sklearn.preprocessing')
+    X = _punti(200, d=3)
+    X[:, 1] = 4.2  # colonna costante: scala 1
+    expected = preprocessing.StandardScaler().fit_transform(X)
+    assert np.allclose(mat_numpy.standard_scaler(X), expected)
+
+
+def test_pca_come_sklearn():
+    decomposition = pytest.importorskip('sklearn.decomposition')
+    X = _punti(300, seed=2, d=3)
+    ref = decomposition.PCA(n_components=2, svd_solver='full').fit(X)
+    scores, comps, ratio = mat_numpy.pca(X, 2)
+    assert np.allclose(ratio, ref.explained_variance_ratio_)
+    assert np.allclose(np.abs(comps), np.abs(ref.components_))
+    assert np.allclose(np.abs(scores), np.abs(ref.transform(X)))
+
+
+@pytest.mark.parametrize('n', [2, 3, 50, 400])
+def test_ward_linkage_come_scipy(n):
+    hierarchy = pytest.importorskip('scipy.cluster.hierarchy')
+    X = _punti(n, seed=n, d=3)
+    Z = mat_numpy.ward_linkage(X)
+    expected = hierarchy.linkage(X, method='ward')
+    assert np.allclose(Z[:, 2], expected[:, 2])
+    assert np.array_equal(Z[:, [0, 1, 3]], expected[:, [0, 1, 3]])
+
+
+@pytest.mark.parametrize('t', [0.5, 2.0, 6.0])
+def test_fcluster_distance_come_scipy(t):
+    hierarchy = pytest.importorskip('scipy.cluster.hierarchy')
+    X = _punti(300, seed=5)
+    Z = hierarchy.linkage(X, method='ward')
+    labels = mat_numpy.fcluster_distance(Z, t)
+    assert np.array_equal(labels + 1, hierarchy.fcluster(Z, t, criterion='distance'))
+
+
+@pytest.mark.parametrize('k', [1, 2, 5, 12])
+def test_cut_tree_k_come_agglomerative(k):
+    cluster = pytest.importorskip('sklearn.cluster')
+    X = _punti(250, seed=7)
+    labels = mat_numpy.cut_tree_k(mat_numpy.ward_linkage(X), k)
+    expected = cluster.AgglomerativeClustering(n_clusters=k, linkage='ward').fit(X).labels_
+    assert np.array_equal(labels, expected)
+
+
+# --------------------------------------------------------------------------
+#  Vicini su griglia regolare
+# --------------------------------------------------------------------------
+@pytest.mark.parametrize('radius', [0.05, 0.3, 1.5])
+def test_grid_index_raggio_come_ckdtree(radius):
+    spatial = pytest.importorskip('scipy.spatial')
+    XY = _punti(2000, seed=11)
+    ptr, idx = mat_numpy.GridIndex(XY, radius).query_radius(radius)
+    expected = spatial.cKDTree(XY).query_ball_point(XY, radius)
+    for i, ball in enumerate(expected):
+        assert sorted(idx[ptr[i]:ptr[i + 1]].tolist()) == sorted(ball)
+
+
+@pytest.mark.parametrize('k', [1, 8, 30])
+def test_grid_index_knn_come_ckdtree(k):
+    spatial = pytest.importorskip('scipy.spatial')
+    XY = _punti(3000, seed=13)
+    # addensamento: celle molto piu' piene della media
+    XY[:500] *= 0.01
+    nn = mat_numpy.GridIndex.for_knn(XY, k).query_knn(k)
+    dist, expected = spatial.cKDTree(XY).query(XY, k)
+    dist = dist.reshape(len(XY), -1)
+    got = np.sqrt(((XY[:, None, :] - XY[nn]) ** 2).sum(axis=2))
+    assert np.allclose(got, dist)
+    assert np.array_equal(nn, expected.reshape(len(XY), -1))
+
+
+# --------------------------------------------------------------------------
+#  Densita' di kernel
+# --------------------------------------------------------------------------
+@pytest.mark.parametrize('fraction', [0.05, 0.2, 0.5, 1.0, 3.0])
+def test_binned_kde_integra_a_uno(fraction):
+    # banda anche molto piu' stretta del passo della griglia
+    x = np.random.default_rng(0).normal(0.25, 0.01, 300)
+    delta = 1.0 / 511
+    density = mat_numpy.binned_kde(x, 0.0, 1.0, 512, fraction * delta)
+    assert density.sum() * delta == pytest.approx(1.0, abs=1e-9)
+
+
+def test_binned_kde_come_somma_diretta():
+    x = np.random.default_rng(1).normal(0.3, 0.02, 500)
+    grid = np.linspace(0.2, 0.4, 512)
+    h = 0.004
+    direct = np.exp(-0.5 * ((grid[:, None] - x[None, :]) / h) ** 2).sum(axis=1)
+    direct /= x.size * h * np.sqrt(2 * np.pi)
+    density = mat_numpy.binned_kde(x, 0.2, 0.4, 512, h)
+    assert np.max(np.abs(density - direct)) < 1e-2 * direct.max()
+
+
+def _silverman_normale(x):
+    return 1.06 * x.std() * x.size ** -0.2
+
+
+def test_bandwidth_isj_normale():
+    # su dati normali ISJ stima la banda ottima, vicina alla regola normale
+    x = np.random.default_rng(4).normal(0.2, 0.05, 20000)
+    assert mat_numpy.bandwidth_isj(x) == pytest.approx(_silverman_normale(x), rel=0.1)
+
+
+def test_bandwidth_isj_misure_arrotondate():
+    # misure al millimetro: pochi valori distinti, ma la banda resta quella
+    # dei valori esatti (N e' il numero dei valori, non dei distinti)
+    x = np.random.default_rng(5).normal(0.2, 0.02, 200000)
+    esatta = mat_numpy.bandwidth_isj(x)
+    arrotondata = mat_numpy.bandwidth_isj(np.round(x, 3))
+    assert arrotondata == pytest.approx(esatta, rel=0.05)
+    assert arrotondata == pytest.approx(_silverman_normale(x), rel=0.1)
+
+
+def test_bandwidth_isj_bimodale_piu_stretta_di_silverman():
+    rng = np.random.default_rng(6)
+    x = np.concatenate([rng.normal(0.0, 1.0, 5000), rng.normal(6.0, 1.0, 5000)])
+    assert mat_numpy.bandwidth_isj(x) < 0.5 * _silverman_normale(x)
+
+
+# --------------------------------------------------------------------------
+#  Covarianza robusta (FastMCD)
+# --------------------------------------------------------------------------
+@pytest.mark.parametrize('df', [1, 2, 3, 4, 7])
+def test_chi2_come_scipy(df):
+    stats = pytest.importorskip('scipy.stats')
+    for x in [0.01, 0.5, 2.0, 9.0, 30.0]:
+        assert mat_numpy.chi2_cdf(x, df) == pytest.approx(stats.chi2.cdf(x, df), abs=1e-12)
+    for q in [0.5, 0.9, 0.975, 0.999]:
+        assert mat_numpy.chi2_ppf(q, df) == pytest.approx(stats.chi2.ppf(q, df), rel=1e-9)
+
+
+def _contaminati(n, p, seed):
+    """Dati correlati con un 10% di pezzi anomali spostati in blocco"""
+    rng = np.random.default_rng(seed)
+    A = rng.normal(size=(p, p))
+    X = rng.normal(size=(n, p)) @ A
+    k = n // 10
+    X[:k] += 6.0 * np.abs(A).sum(axis=0)
+    return X, k
+
+
+@pytest.mark.parametrize('n, p', [(120, 2), (400, 3), (600, 4), (2000, 3)])
+def test_fast_mcd_come_mincovdet(n, p):
+    covariance = pytest.importorskip('sklearn.covariance')
+    X, k = _contaminati(n, p, seed=n)
+    soglia = mat_numpy.chi2_ppf(0.975, p)
+    _, _, d2, _ = mat_numpy.fast_mcd(X)
+    ref = covariance.MinCovDet(random_state=0).fit(X).mahalanobis(X) > soglia
+    # soluzioni iniziali casuali diverse: stesso ottimo a meno di pochi
+    # punti sul bordo della soglia
+    flag = d2 > soglia
+    assert flag[:k].all() and ref[:k].all()
+    assert np.mean(flag == ref) >= 0.98
+
+
+def test_fast_mcd_anomali_su_molti_punti():
+    covariance = pytest.importorskip('sklearn.covariance')
+    X, k = _contaminati(20_000, 3, seed=9)
+    _, _, d2, _ = mat_numpy.fast_mcd(X)
+    soglia = mat_numpy.chi2_ppf(0.975, 3)
+    flag = d2 > soglia
+    ref = covariance.MinCovDet(random_state=0).fit(X).mahalanobis(X) > soglia
+    # tutti i pezzi anomali piantati, e quasi ovunque le stesse segnalazioni
+    assert flag[:k].all()
+    assert np.mean(flag == ref) > 0.995
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from mat_stats import (DECIMALI_QUANTO, QUANTILI, QuantileSketch, histogram_pyramid,
+                       robust_stats)
+
+QUANTO = 0.001
+
+
+def _range_bin(value, units):
+    """Classe di range_formula: floor(round(valore/quanto, 6)/unita')"""
+    return int(np.floor(np.round(value / QUANTO, DECIMALI_QUANTO) / units))
+
+
+@pytest.mark.parametrize('units', [1, 2, 4, 10, 25])
+def test_histogram_pyramid_bordi_delle_classi(units):
+    # valori esattamente sui bordi delle classi, scritti come li salva il
+    # campo a 3 decimali (0.29 e' 0.28999999999999998 in binario)
+    k = np.arange(0, 400)
+    on_edge = np.array([float('%.3f' % (b * units * QUANTO)) for b in k])
+    below = np.array([float('%.3f' % ((b * units - 1) * QUANTO)) for b in k[1:]])
+    values = np.concatenate([on_edge, below])
+
+    pyramid = histogram_pyramid(values, sorted({1, units}), QUANTO)
+    _, bins, counts = pyramid[units]
+    got = dict(zip(bins.tolist(), counts.tolist()))
+
+    expected = {}
+    for v in values:
+        b = _range_bin(v, units)
+        expected[b] = expected.get(b, 0) + 1
+    assert got == expected
+    # ogni valore sul bordo apre la propria classe
+    assert [_range_bin(v, units) for v in on_edge] == k.tolist()
+
+
+def test_histogram_pyramid_esempio_029():
+    # 0.29/0.01 = 28.999999999999996: senza arrotondamento finiva nella classe 28
+    _, bins, counts = histogram_pyramid(np.array([0.29]), [10], QUANTO)[10]
+    assert bins.tolist() == [29] and counts.tolist() == [1]
+
+
+def test_histogram_pyramid_step_coerenti_e_gruppi():
+    rng = np.random.default_rng(3)
+    values = np.round(rng.uniform(0.05, 0.6, 5000), 3)
+    values[::97] = np.nan
+    groups = rng.choice(['A', 'B', 'C'], values.size)
+    steps = [2, 4, 10, 30]
+    pyramid = histogram_pyramid(values, steps, QUANTO, groups)
+    ok = ~np.isnan(values)
+    for step in steps:
+        cats, bins, counts = pyramid[step]
+        assert counts.sum() == ok.sum()
+        ref = np.floor(np.round(values[ok] / QUANTO, DECIMALI_QUANTO) / step)
+        for cat, b, n in zip(cats, bins, counts):
+            assert n == np.count_nonzero((groups[ok] == cat) & (ref == b))
+
+
+def test_histogram_pyramid_step_non_intero_come_range_formula():
+    # step 0.0125 m: range_formula usa 12.5 quanti, non lo step arrotondato al mm
+    rng = np.random.default_rng(5)
+    values = np.concatenate([np.round(rng.uniform(0.01, 0.4, 3000), 3),
+                             np.round(np.arange(1, 30) * 0.025, 3)])
+    units = round(0.0125 / QUANTO, DECIMALI_QUANTO)
+    pyramid = histogram_pyramid(values, [10, units], QUANTO)
+
+    _, bins, counts = pyramid[units]
+    expected = {}
+    for v in values:
+        b = _range_bin(v, units)
+        expected[b] = expected.get(b, 0) + 1
+    assert dict(zip(bins.tolist(), counts.tolist())) == expected
+    # 0.025 apre la classe 2 (0.025 - 0.0375); con 13 mm cadrebbe nella 1
+    assert _range_bin(0.025, units) == 2 and _range_bin(0.025, 13) == 1
+    # lo step intero nella stessa chiamata resta quello della piramide
+    _, bins10, counts10 = pyramid[10]
+    assert counts10.sum() == values.size
+    assert bins10.tolist() == sorted({_range_bin(v, 10) for v in values})
+
+
+# --------------------------------------------------------------------------
+#  Statistiche robuste e sketch KLL
+# --------------------------------------------------------------------------
+def test_robust_stats_come_numpy():
+    v = np.random.default_rng(0).lognormal(size=1001)
+    v[::50] = np.nan
+    out = robust_stats(v)
+    x = v[~np.isnan(v)]
+    for name, p in QUANTILI:
+        assert out[name] == pytest.approx(np.percentile(x, 100 * p))
+    assert out['mad'] == pytest.approx(np.median(np.abs(x - np.median(x))))
+    assert out['count'] == x.size
+
+
+def _rank_error(sorted_x, value, p):
+    lo = np.searchsorted(sorted_x, value, side='left')
+    hi = np.searchsorted(sorted_x, value, side='right')
+    target = p * sorted_x.size
+    # distanza del rango di value (un intervallo, con i duplicati) dal rango p
+    return max(lo - target, target - hi, 0) / sorted_x.size
+
+
+@pytest.mark.parametrize('k', [200, 400])
+def test_quantile_sketch_errore_di_rango(k):
+    rng = np.random.default_rng(k)
+    x = np.concatenate([rng.normal(0.3, 0.05, 150_000), rng.exponential(0.1, 50_000)])
+    rng.shuffle(x)
+    # due sketch alimentati a blocchi e poi combinati, come per i campioni
+    a, b = QuantileSketch(k, seed=1), QuantileSketch(k, seed=2)
+    for chunk in np.array_split(x[:120_000], 12):
+        a.add(chunk)
+    for chunk in np.array_split(x[120_000:], 7):
+        b.add(chunk)
+    sketch = a.merge(b)
+    assert sketch.count == x.size
+    # memoria O(k log(n/k)), non O(n)
+    assert sum(level.size for level in sketch.levels) < 4 * k
+
+    # errore di rango di KLL al 99%: circa 2.7/k (1.33% con k = 200)
+    s = np.sort(x)
+    out = sketch.result()
+    for name, p in QUANTILI:
+        assert _rank_error(s, out[name], p) <= 3.0 / k, name
+    mad = np.sort(np.abs(x - out['mediana']))
+    assert _rank_error(mad, out['mad'], 0.5) <= 6.0 / k